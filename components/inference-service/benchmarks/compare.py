@@ -0,0 +1,101 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compares the results of two benchmark runs written by `benchmarks.run`.
+
+Example:
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+from typing import Iterator, List, Optional, Tuple
+
+# Metrics as (name, path into the results, whether higher values are better).
+METRICS = [
+    ("throughput_rps", ("throughput_rps",), True),
+    ("peak_rss_bytes", ("peak_rss_bytes",), False),
+    ("written_bytes_per_request", ("written_bytes_per_request",), False),
+] + [
+    (f'{path}.{stat}', ("latency_seconds", path, stat), False)
+    for path in ("total", "upload", "watch", "output")
+    for stat in ("p50", "p99")
+]
+
+
+def lookup(results: dict, path: Tuple[str, ...]) -> Optional[float]:
+    for key in path:
+        if not isinstance(results, dict) or results.get(key) is None:
+            return None
+        results = results[key]
+    return results
+
+
+def compare(baseline: dict, candidate: dict) -> Iterator[Tuple[str, float, float, float, bool]]:
+    """Compares the metrics of two benchmark results.
+
+    Args:
+        baseline (dict): Results of the baseline run
+        candidate (dict): Results of the candidate run
+
+    Yields:
+        Tuple[str, float, float, float, bool]: Name, baseline value, candidate value, relative change
+        and whether higher values are better, of each metric present in both results
+    """
+    for name, path, higher_is_better in METRICS:
+        old = lookup(baseline["results"], path)
+        new = lookup(candidate["results"], path)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        yield name, old, new, change, higher_is_better
+
+
+def main(argv: Optional[List[str]] = None):
+    """Driver method that prints the comparison of two benchmark results, and exits with status 1
+    if a metric of the candidate regressed by more than the threshold
+    """
+    parser = argparse.ArgumentParser(description="Compare two MONAI Inference Service benchmark results")
+    parser.add_argument('baseline', type=str, help="JSON results of the baseline run")
+    parser.add_argument('candidate', type=str, help="JSON results of the candidate run")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Relative change beyond which a metric is reported as a regression")
+    parser.add_argument('--min-latency-change', type=float, default=0.005,
+                        help="Change in seconds below which a latency is not reported as a regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    if baseline["config"] != candidate["config"]:
+        print('Warning: the runs have different configurations', file=sys.stderr)
+
+    print(f'baseline {baseline.get("commit") or baseline.get("label")}, '
+          f'candidate {candidate.get("commit") or candidate.get("label")}')
+
+    regressions = []
+    for name, old, new, change, higher_is_better in compare(baseline, candidate):
+        regressed = (-change if higher_is_better else change) > args.threshold
+        if name.endswith(('.p50', '.p99')) and abs(new - old) < args.min_latency_change:
+            # Sub-millisecond phases vary by multiples of themselves between runs.
+            regressed = False
+        if regressed:
+            regressions.append(name)
+        print(f'{name:>28} {old:14.4f} {new:14.4f} {change:+8.1%}{"  REGRESSION" if regressed else ""}')
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
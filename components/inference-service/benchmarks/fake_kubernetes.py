@@ -0,0 +1,404 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import queue
+import random
+import time
+from threading import Lock, Thread
+from typing import Dict, List, Optional
+
+from kubernetes.client import ApiClient, models
+from kubernetes.client.rest import ApiException
+
+from monaiinference.handler.kubernetes import (ENV_MONAI_INPUTPATH, ENV_MONAI_OUTPUTPATH, MAP,
+                                               WARM_POD_CONTROL_MOUNT_PATH, WARM_POD_DONE_FILE, WARM_POD_READY_FILE,
+                                               WARM_POD_STARTED_FILE, WARM_POD_TRIGGER_FILE)
+
+CHUNK_SIZE = 1024 * 1024
+CONTROL_POLLING_TIME = 0.01
+FAKE_IMAGE_ID = "docker-pullable://benchmark/map@sha256:" + "0" * 64
+FAKE_NODE_NAME = "benchmark-node"
+IMAGE_PULL_BACK_OFF = "ImagePullBackOff"
+WATCH_POLLING_TIME = 0.05
+
+
+class FakeCoreV1Api:
+    """Stand-in for `kubernetes.client.CoreV1Api` which keeps Persistent Volumes, Persistent Volume Claims
+    and pods in memory. Pods go through the Pending and Running phases for configurable durations and
+    write synthetic output files into the output directory they mount from the payload host path."""
+
+    def __init__(self, host_path: str, pending_seconds: float = 0.05, running_seconds: float = 0.2,
+                 failure_rate: float = 0.0, image_pull_back_off_rate: float = 0.0,
+                 output_files: int = 1, output_file_size: int = 1024, multi_case: bool = False, seed: int = 0,
+                 case_seconds: float = 0.0):
+        """Constructor of the FakeCoreV1Api class
+
+        Args:
+            host_path (str): Payload host path of MONAI Inference Service, used for claims it did not create
+            pending_seconds (float, optional): Time a pod spends in the Pending phase. Defaults to 0.05.
+            running_seconds (float, optional): Time a pod spends in the Running phase. Defaults to 0.2.
+            failure_rate (float, optional): Fraction of MAP runs which fail. Defaults to 0.0.
+            image_pull_back_off_rate (float, optional): Fraction of pods which stay Pending in
+            ImagePullBackOff. Defaults to 0.0.
+            output_files (int, optional): Number of output files written by each MAP run. Defaults to 1.
+            output_file_size (int, optional): Size in bytes of each output file. Defaults to 1024.
+            multi_case (bool, optional): Write the output files of each sub-directory of the input directory
+            into the output sub-directory of the same name, like a MAP which processes batches. Defaults to False.
+            seed (int, optional): Seed of the failure and back off decisions. Defaults to 0.
+            case_seconds (float, optional): Additional running time of a multi-case MAP run per sub-directory
+            of its input directory, so that the run time grows with its input. Defaults to 0.0.
+        """
+        self.host_path = host_path
+        self.pending_seconds = pending_seconds
+        self.running_seconds = running_seconds
+        self.failure_rate = failure_rate
+        self.image_pull_back_off_rate = image_pull_back_off_rate
+        self.output_files = output_files
+        self.output_file_size = output_file_size
+        self.multi_case = multi_case
+        self.case_seconds = case_seconds
+
+        # Bytes of output files written on behalf of MAP runs, which are not written by MONAI Inference Service.
+        self.bytes_written = 0
+        self.calls: Dict[str, int] = {}
+
+        self._random = random.Random(seed)
+        self._api_client = ApiClient()
+        self._lock = Lock()
+        self._pods: Dict[str, models.V1Pod] = {}
+        self._persistent_volumes: Dict[str, models.V1PersistentVolume] = {}
+        self._persistent_volume_claims: Dict[str, models.V1PersistentVolumeClaim] = {}
+        self._watchers: List[queue.Queue] = []
+        self._resource_version = 0
+
+    def create_persistent_volume(self, body: models.V1PersistentVolume, **kwargs):
+        self.__count('create_persistent_volume')
+        self.__create(self._persistent_volumes, body)
+
+    def delete_persistent_volume(self, name: str, **kwargs):
+        self.__count('delete_persistent_volume')
+        self.__delete(self._persistent_volumes, name)
+
+    def create_namespaced_persistent_volume_claim(self, namespace: str, body: models.V1PersistentVolumeClaim,
+                                                  **kwargs):
+        self.__count('create_namespaced_persistent_volume_claim')
+        self.__create(self._persistent_volume_claims, body)
+
+    def read_namespaced_persistent_volume_claim(self, name: str, namespace: str, **kwargs):
+        self.__count('read_namespaced_persistent_volume_claim')
+        with self._lock:
+            claim = self._persistent_volume_claims.get(name)
+        if claim is None:
+            # Claims created outside of MONAI Inference Service, such as by the Helm chart, are assumed to exist.
+            claim = models.V1PersistentVolumeClaim(metadata=models.V1ObjectMeta(name=name))
+        return claim
+
+    def delete_namespaced_persistent_volume_claim(self, name: str, namespace: str, **kwargs):
+        self.__count('delete_namespaced_persistent_volume_claim')
+        self.__delete(self._persistent_volume_claims, name)
+
+    def list_persistent_volume(self, **kwargs) -> models.V1PersistentVolumeList:
+        self.__count('list_persistent_volume')
+        return models.V1PersistentVolumeList(
+            items=self.__select(self._persistent_volumes, kwargs.get('label_selector')))
+
+    def list_namespaced_persistent_volume_claim(self, namespace: str,
+                                                **kwargs) -> models.V1PersistentVolumeClaimList:
+        self.__count('list_namespaced_persistent_volume_claim')
+        return models.V1PersistentVolumeClaimList(
+            items=self.__select(self._persistent_volume_claims, kwargs.get('label_selector')))
+
+    def create_namespaced_pod(self, namespace: str, body: models.V1Pod, **kwargs):
+        self.__count('create_namespaced_pod')
+        body.spec.node_name = FAKE_NODE_NAME
+        body.status = models.V1PodStatus(phase="Pending")
+        self.__create(self._pods, body)
+        self.__publish("ADDED", body)
+        Thread(target=self.__run_pod, args=(body,), daemon=True).start()
+
+    def read_namespaced_pod(self, name: str, namespace: str, **kwargs) -> models.V1Pod:
+        self.__count('read_namespaced_pod')
+        with self._lock:
+            pod = self._pods.get(name)
+        if pod is None:
+            raise ApiException(status=404, reason="NotFound")
+        return pod
+
+    def delete_namespaced_pod(self, name: str, namespace: str, **kwargs):
+        self.__count('delete_namespaced_pod')
+        pod = self.__delete(self._pods, name)
+        self.__publish("DELETED", pod)
+
+    def list_namespaced_pod(self, namespace: str, **kwargs):
+        """List or watch pods
+
+        :return: V1PodList
+        """
+        # The return type in the docstring above is read by `kubernetes.watch.Watch` to deserialize events.
+        self.__count('list_namespaced_pod')
+        return self.__list_pods(kwargs.get('field_selector', '').partition('metadata.name=')[2], **kwargs)
+
+    def list_pod_for_all_namespaces(self, **kwargs):
+        """List or watch pods
+
+        :return: V1PodList
+        """
+        self.__count('list_pod_for_all_namespaces')
+        return self.__list_pods('', **kwargs)
+
+    def list_node(self, **kwargs):
+        """List or watch nodes, a single node which never changes
+
+        :return: V1NodeList
+        """
+        self.__count('list_node')
+        if kwargs.get('watch'):
+            return _WatchResponse(self, queue.Queue(), '', kwargs.get('timeout_seconds', 30))
+
+        node = models.V1Node(
+            metadata=models.V1ObjectMeta(name=FAKE_NODE_NAME),
+            spec=models.V1NodeSpec(),
+            status=models.V1NodeStatus(allocatable={"cpu": "64", "memory": "256Gi", "nvidia.com/gpu": "8"}))
+        return models.V1NodeList(metadata=models.V1ListMeta(resource_version=str(self._resource_version)),
+                                 items=[node])
+
+    def serialize_event(self, event_type: str, pod: models.V1Pod) -> bytes:
+        return (json.dumps({"type": event_type, "object": self._api_client.sanitize_for_serialization(pod)})
+                + "\n").encode('utf-8')
+
+    def remove_watcher(self, events: queue.Queue):
+        with self._lock:
+            if events in self._watchers:
+                self._watchers.remove(events)
+
+    def __list_pods(self, name: str, **kwargs):
+        required = self.__parse_selector(kwargs.get('label_selector'))
+        with self._lock:
+            pods = [pod for pod in self._pods.values()
+                    if (not name or pod.metadata.name == name) and self.__matches(pod, required)]
+            if not kwargs.get('watch'):
+                return models.V1PodList(metadata=models.V1ListMeta(resource_version=str(self._resource_version)),
+                                        items=pods)
+
+            events = queue.Queue()
+            self._watchers.append(events)
+
+        if 'resource_version' not in kwargs:
+            for pod in pods:
+                events.put(("ADDED", pod))
+
+        return _WatchResponse(self, events, name, kwargs.get('timeout_seconds', 30))
+
+    def __select(self, objects: dict, label_selector: Optional[str]) -> list:
+        required = self.__parse_selector(label_selector)
+        with self._lock:
+            return [body for body in objects.values() if self.__matches(body, required)]
+
+    @staticmethod
+    def __parse_selector(label_selector: Optional[str]) -> Dict[str, str]:
+        # Only equality selectors, such as `key=value,other=value`, are supported.
+        return dict(term.split('=', 1) for term in (label_selector or '').split(',') if term)
+
+    @staticmethod
+    def __matches(body, required: Dict[str, str]) -> bool:
+        labels = body.metadata.labels or {}
+        return all(labels.get(key) == value for key, value in required.items())
+
+    def __count(self, call: str):
+        with self._lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+
+    def __create(self, objects: dict, body):
+        with self._lock:
+            if body.metadata.name in objects:
+                raise ApiException(status=409, reason="AlreadyExists")
+            self._resource_version += 1
+            body.metadata.resource_version = str(self._resource_version)
+            objects[body.metadata.name] = body
+
+    def __delete(self, objects: dict, name: str):
+        with self._lock:
+            body = objects.pop(name, None)
+        if body is None:
+            raise ApiException(status=404, reason="NotFound")
+        return body
+
+    def __publish(self, event_type: str, pod: models.V1Pod):
+        with self._lock:
+            watchers = list(self._watchers)
+        for events in watchers:
+            events.put((event_type, pod))
+
+    def __exists(self, pod: models.V1Pod) -> bool:
+        with self._lock:
+            return self._pods.get(pod.metadata.name) is pod
+
+    def __set_phase(self, pod: models.V1Pod, phase: str, waiting_reason: str = None):
+        if waiting_reason is not None:
+            state = models.V1ContainerState(waiting=models.V1ContainerStateWaiting(reason=waiting_reason))
+            image_id = ""
+        elif phase == "Running":
+            state = models.V1ContainerState(running=models.V1ContainerStateRunning())
+            image_id = FAKE_IMAGE_ID
+        elif phase in ("Succeeded", "Failed"):
+            state = models.V1ContainerState(terminated=models.V1ContainerStateTerminated(
+                exit_code=0 if phase == "Succeeded" else 1))
+            image_id = FAKE_IMAGE_ID
+        else:
+            state = models.V1ContainerState()
+            image_id = FAKE_IMAGE_ID
+
+        with self._lock:
+            self._resource_version += 1
+            pod.metadata.resource_version = str(self._resource_version)
+            pod.status = models.V1PodStatus(phase=phase, container_statuses=[models.V1ContainerStatus(
+                name=MAP, image=pod.spec.containers[0].image, image_id=image_id, ready=waiting_reason is None,
+                restart_count=0, state=state)])
+
+        self.__publish("MODIFIED", pod)
+
+    def __mount_paths(self, pod: models.V1Pod) -> Dict[str, str]:
+        # Resolve the host path of each volume mount of the MAP container, through its claim and volume.
+        host_path = self.host_path
+        host_path_volumes = {}
+        for volume in pod.spec.volumes:
+            if volume.host_path is not None:
+                host_path_volumes[volume.name] = volume.host_path.path
+            if volume.persistent_volume_claim is None:
+                continue
+            with self._lock:
+                claim = self._persistent_volume_claims.get(volume.persistent_volume_claim.claim_name)
+                volume_name = claim.spec.volume_name if claim is not None and claim.spec is not None else None
+                persistent_volume = self._persistent_volumes.get(volume_name)
+            if persistent_volume is not None:
+                host_path = persistent_volume.spec.host_path.path
+
+        mount_paths = {mount.mount_path: os.path.join(host_path, mount.sub_path)
+                       for mount in pod.spec.containers[0].volume_mounts if mount.sub_path}
+        # Input references are mounted from host path volumes as a whole.
+        mount_paths.update({mount.mount_path: host_path_volumes[mount.name]
+                            for mount in pod.spec.containers[0].volume_mounts
+                            if not mount.sub_path and mount.name in host_path_volumes})
+        return mount_paths
+
+    def __write_outputs(self, output_path: str):
+        os.makedirs(output_path, exist_ok=True)
+        chunk = b'\0' * min(self.output_file_size, CHUNK_SIZE)
+        for i in range(self.output_files):
+            with open(os.path.join(output_path, f'output-{i}.bin'), 'wb') as f:
+                remaining = self.output_file_size
+                while remaining > 0:
+                    remaining -= f.write(chunk[:remaining])
+
+        with self._lock:
+            self.bytes_written += self.output_files * self.output_file_size
+
+    def __run_map(self, pod: models.V1Pod, mount_paths: Dict[str, str]) -> bool:
+        # Simulate one run of the MAP entrypoint, returns whether it succeeded.
+        time.sleep(self.running_seconds)
+        if not self.__exists(pod):
+            # A deleted pod writes nothing more into payload directories which may have been deleted meanwhile.
+            return False
+        env = {env.name: env.value for env in pod.spec.containers[0].env}
+        output_path = mount_paths[os.path.join("/", env[ENV_MONAI_OUTPUTPATH])]
+        if self.multi_case:
+            input_path = mount_paths[os.path.join("/", env[ENV_MONAI_INPUTPATH])]
+            for case in os.listdir(input_path):
+                time.sleep(self.case_seconds)
+                if not self.__exists(pod):
+                    return False
+                self.__write_outputs(os.path.join(output_path, case))
+        else:
+            self.__write_outputs(output_path)
+        with self._lock:
+            return self._random.random() >= self.failure_rate
+
+    def __run_pod(self, pod: models.V1Pod):
+        time.sleep(self.pending_seconds)
+        if not self.__exists(pod):
+            return
+
+        with self._lock:
+            back_off = self._random.random() < self.image_pull_back_off_rate
+        if back_off:
+            self.__set_phase(pod, "Pending", IMAGE_PULL_BACK_OFF)
+            return
+
+        self.__set_phase(pod, "Running")
+        if not pod.spec.volumes:
+            # Pre-pull pods only start their container from the MAP image, and exit.
+            self.__set_phase(pod, "Succeeded")
+            return
+
+        mount_paths = self.__mount_paths(pod)
+
+        if WARM_POD_CONTROL_MOUNT_PATH in mount_paths:
+            self.__run_warm_pod(pod, mount_paths, mount_paths[WARM_POD_CONTROL_MOUNT_PATH])
+            return
+
+        succeeded = self.__run_map(pod, mount_paths)
+        if self.__exists(pod):
+            self.__set_phase(pod, "Succeeded" if succeeded else "Failed")
+
+    def __run_warm_pod(self, pod: models.V1Pod, mount_paths: Dict[str, str], control_path: str):
+        # Follow the trigger file protocol of the command built for warm pods by KubernetesHandler.
+        open(os.path.join(control_path, WARM_POD_READY_FILE), 'w').close()
+        trigger_path = os.path.join(control_path, WARM_POD_TRIGGER_FILE)
+        started_path = os.path.join(control_path, WARM_POD_STARTED_FILE)
+        done_path = os.path.join(control_path, WARM_POD_DONE_FILE)
+        last_run = None
+
+        while self.__exists(pod):
+            try:
+                with open(trigger_path) as f:
+                    run = f.read().strip()
+            except FileNotFoundError:
+                run = None
+
+            if run and run != last_run:
+                with open(f'{started_path}.tmp', 'w') as f:
+                    f.write(run)
+                os.replace(f'{started_path}.tmp', started_path)
+                exit_code = 0 if self.__run_map(pod, mount_paths) else 1
+                with open(f'{done_path}.tmp', 'w') as f:
+                    f.write(f'{run} {exit_code}')
+                os.replace(f'{done_path}.tmp', done_path)
+                last_run = run
+
+            time.sleep(CONTROL_POLLING_TIME)
+
+
+class _WatchResponse:
+    """Response of a watch request, in the form read by `kubernetes.watch.Watch`."""
+
+    def __init__(self, api: FakeCoreV1Api, events: queue.Queue, name: str, timeout_seconds: float):
+        self._api = api
+        self._events = events
+        self._name = name
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def stream(self, amt=None, decode_content=False):
+        while time.monotonic() < self._deadline:
+            try:
+                event_type, pod = self._events.get(timeout=WATCH_POLLING_TIME)
+            except queue.Empty:
+                continue
+
+            if not self._name or pod.metadata.name == self._name:
+                yield self._api.serialize_event(event_type, pod)
+
+    def close(self):
+        self._api.remove_watcher(self._events)
+
+    def release_conn(self):
+        pass
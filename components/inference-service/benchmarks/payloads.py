@@ -0,0 +1,82 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import random
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+# Named input payload profiles as (total size in bytes, number of files).
+PAYLOAD_PROFILES = {
+    "tiny": (16 * 1024, 1),
+    "many-small": (64 * 1024 * 1024, 8192),
+    "few-large": (1024 * 1024 * 1024, 4),
+    "huge": (4 * 1024 * 1024 * 1024, 16),
+}
+
+SIZE_SUFFIXES = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(size: str) -> int:
+    """Parses a size in bytes with an optional K, M or G suffix, for example `512K` or `2G`.
+
+    Args:
+        size (str): Size to parse
+
+    Returns:
+        int: Size in bytes
+    """
+    size = size.strip().upper().rstrip('B')
+    suffix = size[-1:] if size[-1:] in SIZE_SUFFIXES else ""
+    return int(float(size[:len(size) - len(suffix)]) * SIZE_SUFFIXES[suffix])
+
+
+def write_input_zip(path: str, total_size: int, file_count: int, compressible: bool = False, seed: int = 0) -> int:
+    """Writes a synthetic input payload .zip file of files with DICOM-like names, one chunk at a time,
+    so that multi-Gigabyte payloads can be generated in bounded memory.
+
+    Args:
+        path (str): Path of the .zip file
+        total_size (int): Total uncompressed size in bytes of the files in the payload
+        file_count (int): Number of files in the payload
+        compressible (bool, optional): Fill files with compressible data, instead of random data. Defaults to False.
+        seed (int, optional): Seed of the random data. Defaults to 0.
+
+    Returns:
+        int: Size in bytes of the .zip file
+    """
+    file_count = max(file_count, 1)
+    file_size, remainder = divmod(total_size, file_count)
+    rng = random.Random(seed)
+    # Random data is drawn once and rotated, which is incompressible but much cheaper than fresh random bytes.
+    if compressible:
+        pattern = (b'MONAI' * (CHUNK_SIZE // 5 + 1))[:CHUNK_SIZE]
+    else:
+        pattern = rng.getrandbits(CHUNK_SIZE * 8).to_bytes(CHUNK_SIZE, 'little')
+    compression = zipfile.ZIP_DEFLATED if compressible else zipfile.ZIP_STORED
+
+    with zipfile.ZipFile(path, 'w', compression, allowZip64=True) as zip_file:
+        for i in range(file_count):
+            size = file_size + (1 if i < remainder else 0)
+            zip_info = zipfile.ZipInfo(f'series-{i // 512:04d}/instance-{i:06d}.dcm')
+            zip_info.compress_type = compression
+            zip_info.file_size = size
+
+            with zip_file.open(zip_info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+                offset = rng.randrange(CHUNK_SIZE)
+                while size > 0:
+                    chunk = pattern[offset:offset + min(size, CHUNK_SIZE - offset)]
+                    dst.write(chunk)
+                    size -= len(chunk)
+                    offset = 0
+
+    return os.path.getsize(path)
@@ -0,0 +1,486 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Offline benchmark of MONAI Inference Service.
+
+Serves the MIS application in-process on a local port, against a fake Kubernetes core API,
+and sends synthetic input payloads to the `/upload/` endpoint from concurrent clients.
+
+Example:
+    python -m benchmarks.run --profile many-small --requests 50 --concurrency 8 --output results.json
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import resource
+import shlex
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+
+import uvicorn
+
+from benchmarks.fake_kubernetes import FakeCoreV1Api
+from benchmarks.payloads import PAYLOAD_PROFILES, parse_size, write_input_zip
+from monaiinference.handler.metrics import (PHASE_EXTRACT, PHASE_HASH, PHASE_POD_CREATE, PHASE_POD_DELETE,
+                                            PHASE_POD_PENDING, PHASE_POD_RUNNING, PHASE_QUEUE, PHASE_UPLOAD)
+from monaiinference.main import create_app, parse_args
+
+CHUNK_SIZE = 1024 * 1024
+LOCALHOST = "127.0.0.1"
+MAP_INPUT_PATH = "/var/monai/input"
+MAP_OUTPUT_PATH = "/var/monai/output"
+RESULTS_SCHEMA_VERSION = 1
+RSS_SAMPLING_TIME = 0.05
+UPLOAD_PHASES = (PHASE_HASH, PHASE_UPLOAD, PHASE_EXTRACT)
+WAIT_TIME_FOR_WARM_POOL = 60
+WATCH_PHASES = (PHASE_QUEUE, PHASE_POD_CREATE, PHASE_POD_PENDING, PHASE_POD_RUNNING, PHASE_POD_DELETE)
+
+
+class RequestResult:
+    """Class that defines object to store the measurements of one inference request"""
+
+    def __init__(self):
+        """Constructor of the RequestResult class"""
+        self.status_code = None
+        self.total_seconds = None
+        self.send_seconds = None
+        self.output_seconds = None
+        self.output_bytes = 0
+        self.server_phases: Dict[str, float] = {}
+
+    @property
+    def upload_seconds(self) -> float:
+        """Time to send the input payload and for MIS to store and extract it."""
+        return self.send_seconds + sum(self.server_phases.get(phase, 0.0) for phase in UPLOAD_PHASES)
+
+    @property
+    def watch_seconds(self) -> float:
+        """Time from the end of the upload until the MAP pod completed and was deleted."""
+        return sum(self.server_phases.get(phase, 0.0) for phase in WATCH_PHASES)
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Parses a `Server-Timing` header into the duration in seconds of each phase.
+
+    Args:
+        header (Optional[str]): Value of the header
+
+    Returns:
+        Dict[str, float]: Duration in seconds of each phase
+    """
+    phases = {}
+    for entry in (header or "").split(','):
+        name, _, params = entry.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if name and key == 'dur':
+                phases[name] = float(value) / 1000
+
+    return phases
+
+
+def send_request(port: int, zip_path: str) -> RequestResult:
+    """Sends an input payload to the `/upload/` endpoint, streaming it from disk, and reads the output
+    payload without storing it.
+
+    Args:
+        port (int): Port of MONAI Inference Service
+        zip_path (str): Path of the input payload .zip file
+
+    Returns:
+        RequestResult: Measurements of the request
+    """
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="input.zip"\r\n'
+            f'Content-Type: application/zip\r\n\r\n').encode('utf-8')
+    tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    result = RequestResult()
+
+    connection = http.client.HTTPConnection(LOCALHOST, port)
+    start = time.monotonic()
+    try:
+        connection.putrequest('POST', '/upload/')
+        connection.putheader('Content-Type', f'multipart/form-data; boundary={boundary}')
+        connection.putheader('Content-Length', str(len(head) + os.path.getsize(zip_path) + len(tail)))
+        connection.endheaders()
+        connection.send(head)
+        with open(zip_path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                connection.send(chunk)
+        connection.send(tail)
+        result.send_seconds = time.monotonic() - start
+
+        response = connection.getresponse()
+        headers_received = time.monotonic()
+        result.status_code = response.status
+        result.server_phases = parse_server_timing(response.getheader('Server-Timing'))
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            result.output_bytes += len(chunk)
+    finally:
+        connection.close()
+
+    end = time.monotonic()
+    result.output_seconds = end - headers_received
+    result.total_seconds = end - start
+
+    return result
+
+
+def summarize(values: List[float]) -> Optional[dict]:
+    """Summarizes measurements by their mean, median, 90th and 99th percentiles and maximum.
+
+    Args:
+        values (List[float]): Measurements
+
+    Returns:
+        Optional[dict]: Summary of the measurements, None if there are none
+    """
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    def percentile(p: float) -> float:
+        # Nearest-rank percentile, which is always one of the measurements.
+        return values[max(int(-(-p * len(values) // 100)) - 1, 0)]
+
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p99": percentile(99),
+        "max": values[-1],
+    }
+
+
+def read_io_counters() -> Dict[str, int]:
+    """Reads the I/O counters of this process, empty if they are not available on this platform.
+
+    Returns:
+        Dict[str, int]: Counters from /proc/self/io, such as `wchar` and `write_bytes`
+    """
+    try:
+        with open('/proc/self/io') as f:
+            return {key: int(value) for key, _, value in (line.partition(':') for line in f)}
+    except OSError:
+        return {}
+
+
+def read_rss() -> int:
+    """Reads the resident set size of this process.
+
+    Returns:
+        int: Resident set size in bytes, or the peak resident set size if the current one is not available
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class RssSampler:
+    """Class that samples the resident set size of this process in the background and keeps its peak"""
+
+    def __init__(self):
+        """Constructor of the RssSampler class"""
+        self.baseline = read_rss()
+        self.peak = self.baseline
+        self._stopped = Event()
+        self._thread = Thread(target=self.__sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def __sample(self):
+        while not self._stopped.wait(RSS_SAMPLING_TIME):
+            self.peak = max(self.peak, read_rss())
+
+
+def git_commit() -> Optional[str]:
+    """Returns the commit of the working tree, None if it is not a git repository."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(app) -> Tuple[uvicorn.Server, Thread, int]:
+    """Serves an application on a free local port in a background thread.
+
+    Args:
+        app (FastAPI): Application to serve
+
+    Returns:
+        Tuple[uvicorn.Server, Thread, int]: The server, the thread which runs it and the port it listens on
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((LOCALHOST, 0))
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", log_config=None))
+    thread = Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    return server, thread, sock.getsockname()[1]
+
+
+def wait_for_warm_pool(app):
+    # Requests are only measured once all pre-started pods are ready, so that the pool starts in its steady state.
+    warm_pool = app.state.warm_pool
+    if warm_pool is None:
+        return
+
+    deadline = time.monotonic() + WAIT_TIME_FOR_WARM_POOL
+    while (warm_pool.stats["idle"] < warm_pool.stats["size"] and time.monotonic() < deadline):
+        time.sleep(0.1)
+
+
+def run_benchmark(options: argparse.Namespace) -> dict:
+    """Runs a benchmark and returns its results.
+
+    Args:
+        options (argparse.Namespace): Options returned by `parse_options`
+
+    Returns:
+        dict: Configuration and results of the benchmark
+    """
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix='mis-benchmark-')
+    host_path = os.path.join(work_dir, 'payload')
+    os.makedirs(host_path, exist_ok=True)
+
+    try:
+        input_size, input_files = PAYLOAD_PROFILES[options.profile]
+        input_size = parse_size(options.input_size) if options.input_size else input_size
+        input_files = options.input_files or input_files
+        zip_path = os.path.join(work_dir, 'input.zip')
+        zip_size = write_input_zip(zip_path, input_size, input_files, options.compressible)
+
+        fake_api = FakeCoreV1Api(host_path, options.pending_seconds, options.running_seconds,
+                                 options.failure_rate, options.image_pull_back_off_rate,
+                                 options.output_files, parse_size(options.output_size), options.multi_case,
+                                 case_seconds=options.case_seconds)
+
+        mis_args = parse_args([
+            '--map-urn', 'benchmark/map:latest', '--map-entrypoint', '/bin/true',
+            '--map-cpu', '1', '--map-memory', '256', '--map-gpu', '0',
+            '--map-input-path', MAP_INPUT_PATH, '--map-output-path', MAP_OUTPUT_PATH,
+            '--payload-host-path', host_path,
+            '--max-concurrent-requests', str(options.concurrency),
+        ] + (['--map-multi-case'] if options.multi_case else []) + shlex.split(options.mis_args))
+        app = create_app(mis_args, fake_api)
+        server, server_thread, port = start_server(app)
+
+        try:
+            wait_for_warm_pool(app)
+
+            io_before = read_io_counters()
+            output_written_before = fake_api.bytes_written
+            sampler = RssSampler()
+            sampler.start()
+
+            start = time.monotonic()
+            with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+                results = list(executor.map(lambda _: send_request(port, zip_path), range(options.requests)))
+            wall_seconds = time.monotonic() - start
+
+            sampler.stop()
+            io_after = read_io_counters()
+            map_written = fake_api.bytes_written - output_written_before
+        finally:
+            # Shutdown handlers of the application delete remaining pods and volumes.
+            server.should_exit = True
+            server_thread.join()
+    finally:
+        if not options.keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def io_delta(counter: str, exclude: int = 0) -> Optional[float]:
+        if counter not in io_before or counter not in io_after:
+            return None
+        return max(io_after[counter] - io_before[counter] - exclude, 0) / options.requests
+
+    succeeded = [r for r in results if r.status_code == 200]
+    status_codes = {}
+    for r in results:
+        status_codes[str(r.status_code)] = status_codes.get(str(r.status_code), 0) + 1
+
+    server_phases = sorted({phase for r in succeeded for phase in r.server_phases})
+
+    return {
+        "schema": RESULTS_SCHEMA_VERSION,
+        "label": options.label,
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "config": {
+            "profile": options.profile,
+            "input_size_bytes": input_size,
+            "input_files": input_files,
+            "input_zip_bytes": zip_size,
+            "compressible": options.compressible,
+            "requests": options.requests,
+            "concurrency": options.concurrency,
+            "pending_seconds": options.pending_seconds,
+            "running_seconds": options.running_seconds,
+            "case_seconds": options.case_seconds,
+            "failure_rate": options.failure_rate,
+            "image_pull_back_off_rate": options.image_pull_back_off_rate,
+            "output_files": options.output_files,
+            "output_file_size_bytes": parse_size(options.output_size),
+            "mis_args": options.mis_args,
+        },
+        "results": {
+            "requests": len(results),
+            "succeeded": len(succeeded),
+            "status_codes": status_codes,
+            "wall_seconds": wall_seconds,
+            "throughput_rps": len(succeeded) / wall_seconds if wall_seconds > 0 else None,
+            "latency_seconds": {
+                "total": summarize([r.total_seconds for r in succeeded]),
+                "upload": summarize([r.upload_seconds for r in succeeded]),
+                "watch": summarize([r.watch_seconds for r in succeeded]),
+                "output": summarize([r.output_seconds for r in succeeded]),
+            },
+            "server_phases_seconds": {phase: summarize([r.server_phases[phase] for r in succeeded
+                                                        if phase in r.server_phases])
+                                      for phase in server_phases},
+            "output_bytes_per_request": (sum(r.output_bytes for r in succeeded) / len(succeeded)
+                                         if succeeded else None),
+            "peak_rss_bytes": sampler.peak,
+            "rss_increase_bytes": sampler.peak - sampler.baseline,
+            # Bytes passed to write calls, and bytes which reached storage, excluding outputs of simulated MAP runs.
+            "written_bytes_per_request": io_delta('wchar', map_written),
+            "storage_write_bytes_per_request": io_delta('write_bytes'),
+            "kubernetes_calls": dict(fake_api.calls),
+        },
+    }
+
+
+def print_summary(report: dict):
+    """Prints the main results of a benchmark in a human readable form to standard error.
+
+    Args:
+        report (dict): Results returned by `run_benchmark`
+    """
+    results = report["results"]
+    lines = [f'{results["succeeded"]}/{results["requests"]} requests succeeded in {results["wall_seconds"]:.2f} s, '
+             f'status codes {results["status_codes"]}']
+    if results["throughput_rps"] is not None:
+        lines.append(f'throughput {results["throughput_rps"]:.2f} requests/s')
+    for path, summary in results["latency_seconds"].items():
+        if summary is not None:
+            lines.append(f'{path:>8}: p50 {summary["p50"] * 1000:9.1f} ms  p99 {summary["p99"] * 1000:9.1f} ms')
+    lines.append(f'peak RSS {results["peak_rss_bytes"] / 2 ** 20:.1f} MiB '
+                 f'(+{results["rss_increase_bytes"] / 2 ** 20:.1f} MiB)')
+    if results["written_bytes_per_request"] is not None:
+        lines.append(f'written {results["written_bytes_per_request"] / 2 ** 20:.2f} MiB/request')
+
+    print('\n'.join(lines), file=sys.stderr)
+
+
+def parse_options(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses the options of the benchmark
+
+    Args:
+        argv (Optional[List[str]], optional): Arguments to parse. Defaults to the command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed options
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmark of MONAI Inference Service")
+    parser.add_argument('--label', type=str, default=None, help="Name of the run, stored in the results")
+    parser.add_argument('--profile', type=str, default="tiny", choices=sorted(PAYLOAD_PROFILES),
+                        help="Named input payload size and file count")
+    parser.add_argument('--input-size', type=str, default=None,
+                        help="Total size of the input payload files, for example 512K or 2G, overrides the profile")
+    parser.add_argument('--input-files', type=int, default=None,
+                        help="Number of files in the input payload, overrides the profile")
+    parser.add_argument('--compressible', action='store_true',
+                        help="Fill input files with compressible data instead of random data")
+    parser.add_argument('--requests', type=int, default=20, help="Number of inference requests")
+    parser.add_argument('--concurrency', type=int, default=4, help="Number of concurrent clients")
+    parser.add_argument('--pending-seconds', type=float, default=0.05, help="Time fake MAP pods spend pending")
+    parser.add_argument('--running-seconds', type=float, default=0.2, help="Time fake MAP pods spend running")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of fake MAP runs which fail")
+    parser.add_argument('--image-pull-back-off-rate', type=float, default=0.0,
+                        help="Fraction of fake MAP pods which stay pending in ImagePullBackOff")
+    parser.add_argument('--output-files', type=int, default=1, help="Number of files written by fake MAP runs")
+    parser.add_argument('--output-size', type=str, default="1M",
+                        help="Size of each file written by fake MAP runs, for example 512K")
+    parser.add_argument('--multi-case', action='store_true',
+                        help="Run a MAP which processes several requests in one run, "
+                        "batching is enabled through --mis-args \"--batch-max-size <size>\"")
+    parser.add_argument('--case-seconds', type=float, default=0.0,
+                        help="Additional time a multi-case fake MAP run spends per input sub-directory, "
+                        "which shows the speedup of sharding through --mis-args \"--shard-max <shards>\"")
+    parser.add_argument('--mis-args', type=str, default="",
+                        help="Additional arguments of MONAI Inference Service, for example \"--warm-pool-size 2\"")
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help="Directory of the payload host path and the input payload, defaults to a temporary one")
+    parser.add_argument('--keep-work-dir', action='store_true', help="Keep the work directory after the run")
+    parser.add_argument('--output', type=str, default=None,
+                        help="Path of the JSON results file, defaults to standard output")
+
+    options = parser.parse_args(argv)
+    if (options.requests < 1 or options.concurrency < 1):
+        raise Exception('Number of requests and concurrency can not be less than 1')
+
+    return options
+
+
+def main(argv: Optional[List[str]] = None):
+    """Driver method that runs a benchmark and writes its results
+    """
+    options = parse_options(argv)
+    report = run_benchmark(options)
+    print_summary(report)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sends each study of a directory to MONAI Inference Service and writes its output payload.
+
+Example:
+    python examples/example.py http://10.97.138.32:8000 studies/ outputs/
+"""
+
+import sys
+
+from monaiinference.client import InferenceClient, list_studies
+
+
+def main():
+    url, input_dir, output_dir = sys.argv[1:4]
+    with InferenceClient(url, max_in_flight=4) as client:
+        for result in client.infer_many(list_studies(input_dir, output_dir, client.output_format)):
+            print(f'{result.input_path}: {result.output_path if result.succeeded else result.error}')
+
+
+if __name__ == "__main__":
+    main()
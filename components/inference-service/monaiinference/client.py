@@ -0,0 +1,872 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Client of MONAI Inference Service.
+
+Sends the input payloads of inference requests and writes their output payloads to disk. Directories are
+streamed as .tar or .zip files while they are read, without writing a temporary archive, and existing
+.zip or .tar files are streamed as they are, or sent in parallel chunks through the `/uploads` endpoints.
+Requests share a pool of keep-alive connections, and requests rejected with a `Retry-After` header are
+sent again once it has passed.
+
+Example:
+    mis-client --url http://10.97.138.32:8000 --output-dir outputs --in-flight 8 studies/
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Tuple, Union
+
+import httpx
+
+CHUNK_CHECKSUM_HEADER = "X-Chunk-Checksum"
+CLIENT_ID_HEADER = "X-Client-ID"
+INPUT_FORMAT_TAR = "tar"
+INPUT_FORMAT_ZIP = "zip"
+OUTPUT_FORMAT_TAR = "tar"
+OUTPUT_FORMAT_ZIP = "zip"
+MEGABYTE = 1024 * 1024
+READ_SIZE = MEGABYTE
+RETRY_STATUS_CODES = (429, 503)
+# Delay in seconds before the first retry of a request which failed without a Retry-After header, doubled each time.
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 30.0
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+TAR_EXTENSIONS = (".tar",)
+ZIP_EXTENSIONS = (".zip",)
+
+
+class ClientError(Exception):
+    """Raised when an inference request fails, with the HTTP status code and detail returned by MIS."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class InferenceResult:
+    """Class that defines object to store the outcome and measurements of one inference request"""
+
+    def __init__(self, input_path: str, output_path: str):
+        """Constructor of the InferenceResult class
+
+        Args:
+            input_path (str): Path of the input payload directory or file
+            output_path (str): Path of the output payload file
+        """
+        self.input_path = input_path
+        self.output_path = output_path
+        self.status_code = None
+        self.content_type = None
+        self.seconds = 0.0
+        self.sent_bytes = 0
+        self.received_bytes = 0
+        self.retries = 0
+        self.error = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.status_code == 200
+
+    def to_dict(self) -> dict:
+        return {
+            "input_path": self.input_path,
+            "output_path": self.output_path,
+            "status_code": self.status_code,
+            "content_type": self.content_type,
+            "seconds": self.seconds,
+            "sent_bytes": self.sent_bytes,
+            "received_bytes": self.received_bytes,
+            "retries": self.retries,
+            "error": self.error,
+        }
+
+
+class _ChunkWriter(io.RawIOBase):
+    # Unseekable file object which collects what is written into it, so that a .zip file is written with data
+    # descriptors and its bytes can be sent as soon as they are compressed.
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def list_input_files(directory: str) -> Iterator[Tuple[str, str]]:
+    """Lists the files of an input payload directory in a stable order, so that the same directory is always
+    sent as the same archive and its results can be served from the inference result cache.
+
+    Args:
+        directory (str): Path of the input payload directory
+
+    Returns:
+        Iterator[Tuple[str, str]]: Absolute path and archive name of each file
+    """
+    directory = os.path.abspath(directory)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            abs_path = os.path.join(root, name)
+            yield abs_path, os.path.relpath(abs_path, directory).replace(os.sep, '/')
+
+
+def generate_tar(directory: str, read_size: int = READ_SIZE) -> Iterator[bytes]:
+    """Generates an uncompressed .tar file of a directory while its files are read, holding at most one
+    read of a file in memory.
+
+    Args:
+        directory (str): Path of the input payload directory
+        read_size (int, optional): Size in bytes of each read of a file. Defaults to 1 Megabyte.
+
+    Returns:
+        Iterator[bytes]: Consecutive parts of the .tar file
+    """
+    for abs_path, name in list_input_files(directory):
+        with open(abs_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            info = tarfile.TarInfo(name)
+            info.size = stat.st_size
+            info.mtime = int(stat.st_mtime)
+            info.mode = stat.st_mode & 0o777
+            yield info.tobuf(tarfile.PAX_FORMAT)
+
+            remaining = info.size
+            while remaining > 0:
+                chunk = f.read(min(read_size, remaining))
+                if not chunk:
+                    raise ClientError(f'File {abs_path} was truncated while it was sent')
+                remaining -= len(chunk)
+                yield chunk
+
+        padding = -info.size % TAR_BLOCK_SIZE
+        if padding:
+            yield b'\0' * padding
+
+    # End of archive marker of two empty blocks.
+    yield b'\0' * (2 * TAR_BLOCK_SIZE)
+
+
+def generate_zip(directory: str, compress: bool = True, read_size: int = READ_SIZE) -> Iterator[bytes]:
+    """Generates a .zip file of a directory while its files are read and compressed, holding at most one
+    read of a file in memory.
+
+    Args:
+        directory (str): Path of the input payload directory
+        compress (bool, optional): Compress files with DEFLATE, False stores them uncompressed. Defaults to True.
+        read_size (int, optional): Size in bytes of each read of a file. Defaults to 1 Megabyte.
+
+    Returns:
+        Iterator[bytes]: Consecutive parts of the .zip file
+    """
+    writer = _ChunkWriter()
+    with zipfile.ZipFile(writer, 'w') as zf:
+        for abs_path, name in list_input_files(directory):
+            # Members keep the time of their file, so that the same directory is sent as the same .zip file.
+            info = zipfile.ZipInfo.from_file(abs_path, name)
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            # The size of a streamed member is not known in advance, so each member may exceed 4 GB.
+            with open(abs_path, 'rb') as src, zf.open(info, 'w', force_zip64=True) as dest:
+                for chunk in iter(lambda: src.read(read_size), b''):
+                    dest.write(chunk)
+                    data = writer.take()
+                    if data:
+                        yield data
+            data = writer.take()
+            if data:
+                yield data
+
+    yield writer.take()
+
+
+def generate_file(path: str, read_size: int = READ_SIZE) -> Iterator[bytes]:
+    """Generates the content of a file while it is read.
+
+    Args:
+        path (str): Path of the file
+        read_size (int, optional): Size in bytes of each read. Defaults to 1 Megabyte.
+
+    Returns:
+        Iterator[bytes]: Consecutive parts of the file
+    """
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(read_size), b''):
+            yield chunk
+
+
+def read_chunk(path: str, offset: int, size: int) -> Tuple[bytes, str]:
+    """Reads one chunk of a file sent through the `/uploads` endpoints.
+
+    Args:
+        path (str): Path of the file
+        offset (int): Offset in bytes of the chunk
+        size (int): Size in bytes of the chunk
+
+    Returns:
+        Tuple[bytes, str]: Content and hexadecimal SHA-256 checksum of the chunk
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+class _BaseClient:
+    # Options and request construction shared by the synchronous and asynchronous clients.
+
+    def __init__(self, url: str, map_name: Optional[str] = None, max_in_flight: int = 4,
+                 input_format: str = INPUT_FORMAT_TAR, output_format: str = OUTPUT_FORMAT_ZIP,
+                 priority: Optional[str] = None, client_id: Optional[str] = None, max_retries: int = 5,
+                 chunked_upload_size: int = 0, upload_concurrency: int = 4, zip_compress: bool = True,
+                 connect_timeout: float = 10.0, timeout: Optional[float] = None,
+                 transport: Optional[Union[httpx.BaseTransport, httpx.AsyncBaseTransport]] = None):
+        if (max_in_flight < 1):
+            raise ValueError(f'Maximum in flight value can not be less than 1, provided value is \"{max_in_flight}\"')
+        if input_format not in (INPUT_FORMAT_TAR, INPUT_FORMAT_ZIP):
+            raise ValueError(f'Input format must be {INPUT_FORMAT_TAR} or {INPUT_FORMAT_ZIP}, '
+                             f'provided value is \"{input_format}\"')
+        if output_format not in (OUTPUT_FORMAT_ZIP, OUTPUT_FORMAT_TAR):
+            raise ValueError(f'Output format must be {OUTPUT_FORMAT_ZIP} or {OUTPUT_FORMAT_TAR}, '
+                             f'provided value is \"{output_format}\"')
+        if (upload_concurrency < 1):
+            raise ValueError(f'Upload concurrency value can not be less than 1, '
+                             f'provided value is \"{upload_concurrency}\"')
+
+        self.url = url.rstrip('/')
+        self.map_name = map_name
+        self.max_in_flight = max_in_flight
+        self.input_format = input_format
+        self.output_format = output_format
+        self.priority = priority
+        self.max_retries = max_retries
+        self.chunked_upload_size = chunked_upload_size * MEGABYTE
+        self.upload_concurrency = upload_concurrency
+        self.zip_compress = zip_compress
+
+        self._headers = {CLIENT_ID_HEADER: client_id} if client_id else {}
+        # Each request in flight holds one connection, besides the chunks of chunked uploads.
+        max_connections = max_in_flight * (upload_concurrency if chunked_upload_size > 0 else 1)
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        # Inference requests hold their connection until the MAP has run, so there is no read timeout by default.
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._transport = transport
+
+    def _infer_path(self) -> str:
+        return f'/maps/{self.map_name}/infer' if self.map_name else '/upload/'
+
+    def _commit_path(self, upload_id: str) -> str:
+        return (f'/maps/{self.map_name}/uploads/{upload_id}/commit' if self.map_name else
+                f'/uploads/{upload_id}/commit')
+
+    def _params(self, **params) -> dict:
+        params["output"] = self.output_format
+        if self.priority:
+            params["priority"] = self.priority
+        return params
+
+    def _is_chunked(self, input_path: str) -> bool:
+        return (self.chunked_upload_size > 0 and os.path.isfile(input_path) and
+                os.path.getsize(input_path) >= self.chunked_upload_size)
+
+    def _body(self, input_path: str) -> Tuple[Iterator[bytes], dict]:
+        # Returns a new body of an inference request, since each attempt sends it again.
+        if os.path.isdir(input_path):
+            if self.input_format == INPUT_FORMAT_TAR:
+                return generate_tar(input_path), {"Content-Type": "application/x-tar"}
+            return self._multipart(generate_zip(input_path, self.zip_compress), 'input.zip',
+                                   'application/zip')
+
+        name = os.path.basename(input_path)
+        if name.lower().endswith(TAR_EXTENSIONS):
+            return generate_file(input_path), {"Content-Type": "application/x-tar"}
+        if name.lower().endswith(ZIP_EXTENSIONS):
+            return self._multipart(generate_file(input_path), name, 'application/zip')
+        raise ClientError(f'Input payload must be a directory, a .zip file or a .tar file, '
+                          f'provided value is \"{input_path}\"')
+
+    @staticmethod
+    def _multipart(chunks: Iterator[bytes], filename: str, content_type: str) -> Tuple[Iterator[bytes], dict]:
+        boundary = uuid.uuid4().hex
+
+        def generate() -> Iterator[bytes]:
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+            yield from chunks
+            yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        return generate(), {"Content-Type": f'multipart/form-data; boundary={boundary}'}
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        # Returns the time to wait before sending a request again, None if it is not sent again.
+        if attempt >= self.max_retries:
+            return None
+        if response is not None:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return None
+            try:
+                return max(float(response.headers.get("Retry-After", "")), 0.0)
+            except ValueError:
+                pass
+        return min(RETRY_BACKOFF * 2 ** attempt, MAX_RETRY_BACKOFF)
+
+    @staticmethod
+    def _error(response: httpx.Response) -> ClientError:
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        return ClientError(f'Request failed with status code {response.status_code}: {detail}', response.status_code)
+
+
+class InferenceClient(_BaseClient):
+    """Class that sends inference requests to MONAI Inference Service from threads, over a pool of keep-alive
+    connections. Each request waits for its output payload, and many requests are sent at once through
+    `infer_many`."""
+
+    def __init__(self, url: str, **kwargs):
+        """Constructor of the InferenceClient class
+
+        Args:
+            url (str): Base URL of MIS, for example `http://10.97.138.32:8000`
+            map_name (Optional[str], optional): Name of the registered MAP which runs the requests.
+            Defaults to the default MAP.
+            max_in_flight (int, optional): Maximum number of requests sent by `infer_many` at once. Defaults to 4.
+            input_format (str, optional): Format in which directories are sent, `tar`, which MIS extracts as it
+            is received, or `zip`. Defaults to `tar`.
+            output_format (str, optional): Format of the output payload, `zip` or uncompressed `tar`.
+            Defaults to `zip`.
+            priority (Optional[str], optional): Priority class of the requests. Defaults to the default priority
+            class of MIS.
+            client_id (Optional[str], optional): Identifier of the client under admission control.
+            Defaults to the address of the client.
+            max_retries (int, optional): Number of times a request rejected with HTTP error code 429 or 503, or
+            whose connection failed, is sent again. Defaults to 5.
+            chunked_upload_size (int, optional): Minimum size in Megabytes of a .zip or .tar file sent in parallel
+            chunks through the `/uploads` endpoints, 0 to stream all files in one request. Defaults to 0.
+            upload_concurrency (int, optional): Number of chunks of one chunked upload sent at once. Defaults to 4.
+            zip_compress (bool, optional): Compress the files of directories sent as .zip files. Defaults to True.
+            connect_timeout (float, optional): Time in seconds to establish a connection. Defaults to 10.
+            timeout (Optional[float], optional): Time in seconds to wait for each read and write of a request.
+            Defaults to None, which waits for inference to complete however long it takes.
+            transport (Optional[httpx.BaseTransport], optional): Transport which sends the requests instead of the
+            pool of connections, such as one serving them in-process. Defaults to None.
+        """
+        super().__init__(url, **kwargs)
+        self._client = httpx.Client(base_url=self.url, headers=self._headers, limits=self._limits,
+                                    timeout=self._timeout, transport=self._transport)
+
+    def __enter__(self) -> 'InferenceClient':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the connections of the client."""
+        self._client.close()
+
+    def infer(self, input_path: str, output_path: str) -> InferenceResult:
+        """Run an inference request and write its output payload to a file as it is received.
+
+        Args:
+            input_path (str): Path of the input payload directory, .zip file or .tar file
+            output_path (str): Path of the output payload file
+
+        Returns:
+            InferenceResult: Outcome and measurements of the request
+
+        Raises:
+            ClientError: If the request failed.
+        """
+        result = InferenceResult(input_path, output_path)
+        start = time.monotonic()
+        try:
+            if self._is_chunked(input_path):
+                upload_id = self.__upload_chunks(input_path, result)
+                try:
+                    self.__send(result, self._commit_path(upload_id), self._params(wait="true"))
+                except BaseException:
+                    self.__discard_upload(upload_id)
+                    raise
+            else:
+                self.__send(result, self._infer_path(), self._params(), input_path)
+        finally:
+            result.seconds = time.monotonic() - start
+        return result
+
+    def infer_many(self, requests: Iterable[Tuple[str, str]]) -> Iterator[InferenceResult]:
+        """Run inference requests, at most `max_in_flight` at once, and return their results as they complete.
+        Failed requests do not stop the others, and carry their error.
+
+        Args:
+            requests (Iterable[Tuple[str, str]]): Input payload path and output payload path of each request
+
+        Returns:
+            Iterator[InferenceResult]: Results in the order in which the requests completed
+        """
+        def run(input_path: str, output_path: str) -> InferenceResult:
+            try:
+                return self.infer(input_path, output_path)
+            except (ClientError, httpx.HTTPError, OSError) as e:
+                result = InferenceResult(input_path, output_path)
+                result.status_code = getattr(e, "status_code", None)
+                result.error = str(e)
+                return result
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='MIS_Client') as executor:
+            futures = [executor.submit(run, input_path, output_path) for input_path, output_path in requests]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def __send(self, result: InferenceResult, path: str, params: dict, input_path: Optional[str] = None):
+        for attempt in range(self.max_retries + 1):
+            content, headers = self._body(input_path) if input_path is not None else (None, {})
+            counted = _CountingIterator(content) if content is not None else None
+            try:
+                with self._client.stream("POST", path, params=params, content=counted, headers=headers) as response:
+                    delay = self._retry_delay(attempt, response)
+                    if delay is None:
+                        result.status_code = response.status_code
+                        if response.status_code != 200:
+                            response.read()
+                            raise self._error(response)
+                        result.content_type = response.headers.get("content-type")
+                        self.__write(response, result)
+                        return
+                    response.read()
+            except httpx.TransportError:
+                # Connections which are closed while a rejected request is still sending its body end up here.
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            finally:
+                if counted is not None:
+                    result.sent_bytes += counted.count
+
+            result.retries += 1
+            time.sleep(delay)
+
+    @staticmethod
+    def __write(response: httpx.Response, result: InferenceResult):
+        os.makedirs(os.path.dirname(os.path.abspath(result.output_path)), exist_ok=True)
+        with open(result.output_path, 'wb') as f:
+            for chunk in response.iter_bytes(READ_SIZE):
+                f.write(chunk)
+                result.received_bytes += len(chunk)
+
+    def __upload_chunks(self, input_path: str, result: InferenceResult) -> str:
+        response = self._client.post('/uploads', json={"size": os.path.getsize(input_path),
+                                                       "filename": os.path.basename(input_path)})
+        if response.status_code != 201:
+            raise self._error(response)
+        upload = response.json()
+
+        def send_chunk(index: int):
+            data, checksum = read_chunk(input_path, index * upload["chunk_size"], upload["chunk_size"])
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self._client.put(f'/uploads/{upload["id"]}/chunks/{index}', content=data,
+                                                headers={CHUNK_CHECKSUM_HEADER: checksum})
+                except httpx.TransportError:
+                    response = None
+                if response is not None and response.status_code == 200:
+                    return len(data)
+                # Chunks which failed are sent again, including those which were corrupted on the way.
+                delay = self._retry_delay(attempt)
+                if delay is None or (response is not None and response.status_code in (404, 409)):
+                    raise self._error(response) if response is not None else ClientError(
+                        f'Chunk {index} of upload {upload["id"]} could not be sent')
+                time.sleep(delay)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.upload_concurrency) as executor:
+                futures = [executor.submit(send_chunk, index) for index in range(upload["chunks"])]
+                try:
+                    result.sent_bytes += sum(future.result() for future in futures)
+                except BaseException:
+                    # Chunks which are not being sent yet are not sent once one has failed.
+                    for future in futures:
+                        future.cancel()
+                    raise
+        except BaseException:
+            self.__discard_upload(upload["id"])
+            raise
+        return upload["id"]
+
+    def __discard_upload(self, upload_id: str):
+        try:
+            self._client.delete(f'/uploads/{upload_id}')
+        except httpx.HTTPError:
+            pass
+
+
+class AsyncInferenceClient(_BaseClient):
+    """Class that sends inference requests to MONAI Inference Service from coroutines of an event loop, over a
+    pool of keep-alive connections. Files are read and written in the default executor of the event loop."""
+
+    def __init__(self, url: str, **kwargs):
+        """Constructor of the AsyncInferenceClient class
+
+        Args:
+            url (str): Base URL of MIS, for example `http://10.97.138.32:8000`
+            **kwargs: Options of `InferenceClient`, with an `httpx.AsyncBaseTransport` as transport
+        """
+        super().__init__(url, **kwargs)
+        self._client = httpx.AsyncClient(base_url=self.url, headers=self._headers, limits=self._limits,
+                                         timeout=self._timeout, transport=self._transport)
+
+    async def __aenter__(self) -> 'AsyncInferenceClient':
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Close the connections of the client."""
+        await self._client.aclose()
+
+    async def infer(self, input_path: str, output_path: str) -> InferenceResult:
+        """Run an inference request and write its output payload to a file as it is received.
+
+        Args:
+            input_path (str): Path of the input payload directory, .zip file or .tar file
+            output_path (str): Path of the output payload file
+
+        Returns:
+            InferenceResult: Outcome and measurements of the request
+
+        Raises:
+            ClientError: If the request failed.
+        """
+        result = InferenceResult(input_path, output_path)
+        start = time.monotonic()
+        try:
+            if self._is_chunked(input_path):
+                upload_id = await self.__upload_chunks(input_path, result)
+                try:
+                    await self.__send(result, self._commit_path(upload_id), self._params(wait="true"))
+                except BaseException:
+                    await self.__discard_upload(upload_id)
+                    raise
+            else:
+                await self.__send(result, self._infer_path(), self._params(), input_path)
+        finally:
+            result.seconds = time.monotonic() - start
+        return result
+
+    async def infer_many(self, requests: Iterable[Tuple[str, str]]) -> AsyncIterator[InferenceResult]:
+        """Run inference requests, at most `max_in_flight` at once, and return their results as they complete.
+        Failed requests do not stop the others, and carry their error.
+
+        Args:
+            requests (Iterable[Tuple[str, str]]): Input payload path and output payload path of each request
+
+        Returns:
+            AsyncIterator[InferenceResult]: Results in the order in which the requests completed
+        """
+        slots = asyncio.Semaphore(self.max_in_flight)
+
+        async def run(input_path: str, output_path: str) -> InferenceResult:
+            async with slots:
+                try:
+                    return await self.infer(input_path, output_path)
+                except (ClientError, httpx.HTTPError, OSError) as e:
+                    result = InferenceResult(input_path, output_path)
+                    result.status_code = getattr(e, "status_code", None)
+                    result.error = str(e)
+                    return result
+
+        tasks = [asyncio.ensure_future(run(input_path, output_path)) for input_path, output_path in requests]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def __send(self, result: InferenceResult, path: str, params: dict, input_path: Optional[str] = None):
+        for attempt in range(self.max_retries + 1):
+            content, headers = self._body(input_path) if input_path is not None else (None, {})
+            counted = _CountingIterator(content) if content is not None else None
+            try:
+                async with self._client.stream("POST", path, params=params, headers=headers,
+                                               content=_read_async(counted) if counted is not None else None
+                                               ) as response:
+                    delay = self._retry_delay(attempt, response)
+                    if delay is None:
+                        result.status_code = response.status_code
+                        if response.status_code != 200:
+                            await response.aread()
+                            raise self._error(response)
+                        result.content_type = response.headers.get("content-type")
+                        await self.__write(response, result)
+                        return
+                    await response.aread()
+            except httpx.TransportError:
+                delay = self._retry_delay(attempt)
+                if delay is None:
+                    raise
+            finally:
+                if counted is not None:
+                    result.sent_bytes += counted.count
+
+            result.retries += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def __write(response: httpx.Response, result: InferenceResult):
+        loop = asyncio.get_running_loop()
+        os.makedirs(os.path.dirname(os.path.abspath(result.output_path)), exist_ok=True)
+        f = await loop.run_in_executor(None, open, result.output_path, 'wb')
+        try:
+            async for chunk in response.aiter_bytes(READ_SIZE):
+                await loop.run_in_executor(None, f.write, chunk)
+                result.received_bytes += len(chunk)
+        finally:
+            await loop.run_in_executor(None, f.close)
+
+    async def __upload_chunks(self, input_path: str, result: InferenceResult) -> str:
+        response = await self._client.post('/uploads', json={"size": os.path.getsize(input_path),
+                                                             "filename": os.path.basename(input_path)})
+        if response.status_code != 201:
+            raise self._error(response)
+        upload = response.json()
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.upload_concurrency)
+
+        async def send_chunk(index: int) -> int:
+            async with slots:
+                data, checksum = await loop.run_in_executor(None, read_chunk, input_path,
+                                                            index * upload["chunk_size"], upload["chunk_size"])
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await self._client.put(f'/uploads/{upload["id"]}/chunks/{index}', content=data,
+                                                          headers={CHUNK_CHECKSUM_HEADER: checksum})
+                    except httpx.TransportError:
+                        response = None
+                    if response is not None and response.status_code == 200:
+                        return len(data)
+                    delay = self._retry_delay(attempt)
+                    if delay is None or (response is not None and response.status_code in (404, 409)):
+                        raise self._error(response) if response is not None else ClientError(
+                            f'Chunk {index} of upload {upload["id"]} could not be sent')
+                    await asyncio.sleep(delay)
+
+        tasks = [asyncio.ensure_future(send_chunk(index)) for index in range(upload["chunks"])]
+        try:
+            result.sent_bytes += sum(await asyncio.gather(*tasks))
+        except BaseException:
+            # Chunks still being sent are cancelled before the upload is discarded.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.__discard_upload(upload["id"])
+            raise
+        return upload["id"]
+
+    async def __discard_upload(self, upload_id: str):
+        try:
+            await self._client.delete(f'/uploads/{upload_id}')
+        except httpx.HTTPError:
+            pass
+
+
+class _CountingIterator:
+    # Iterator over the body of a request which counts the bytes sent.
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self.count = 0
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._chunks:
+            self.count += len(chunk)
+            yield chunk
+
+
+async def _read_async(chunks: Iterable[bytes]) -> AsyncIterator[bytes]:
+    # Files of the body are read and compressed in the default executor, so that they do not block the event loop.
+    loop = asyncio.get_running_loop()
+    iterator = iter(chunks)
+    while True:
+        chunk = await loop.run_in_executor(None, next, iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def list_studies(input_dir: str, output_dir: str, output_format: str) -> List[Tuple[str, str]]:
+    """Lists the input payloads of a bulk submission, which are the sub-directories, .zip files and .tar files
+    of a directory, and the path of the output payload file of each of them.
+
+    Args:
+        input_dir (str): Path of the directory of input payloads
+        output_dir (str): Path of the directory of output payload files
+        output_format (str): Format of the output payloads, `zip` or `tar`
+
+    Returns:
+        List[Tuple[str, str]]: Input payload path and output payload path of each study
+    """
+    studies = []
+    for name in sorted(os.listdir(input_dir)):
+        path = os.path.join(input_dir, name)
+        stem, extension = os.path.splitext(name)
+        if os.path.isdir(path):
+            stem = name
+        elif extension.lower() not in TAR_EXTENSIONS + ZIP_EXTENSIONS:
+            continue
+        studies.append((path, os.path.join(output_dir, f'{stem}.{output_format}')))
+    return studies
+
+
+def summarize(results: List[InferenceResult], seconds: float) -> dict:
+    """Summarizes the throughput and latency of a bulk submission
+
+    Args:
+        results (List[InferenceResult]): Results of the inference requests
+        seconds (float): Time in seconds from the first request until the last result was received
+
+    Returns:
+        dict: Counts, throughput and latency percentiles
+    """
+    latencies = sorted(result.seconds for result in results if result.succeeded)
+
+    def percentile(p: float) -> Optional[float]:
+        if not latencies:
+            return None
+        return latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)]
+
+    sent_bytes = sum(result.sent_bytes for result in results)
+    received_bytes = sum(result.received_bytes for result in results)
+    return {
+        "studies": len(results),
+        "succeeded": sum(1 for result in results if result.succeeded),
+        "failed": sum(1 for result in results if not result.succeeded),
+        "retries": sum(result.retries for result in results),
+        "seconds": seconds,
+        "studies_per_second": len(results) / seconds if seconds > 0 else None,
+        "sent_megabytes_per_second": sent_bytes / MEGABYTE / seconds if seconds > 0 else None,
+        "received_megabytes_per_second": received_bytes / MEGABYTE / seconds if seconds > 0 else None,
+        "latency_p50_seconds": percentile(50),
+        "latency_p95_seconds": percentile(95),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses the arguments of a bulk submission
+
+    Args:
+        argv (Optional[List[str]], optional): Arguments to parse. Defaults to the command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Submits the studies of a directory to MONAI Inference Service")
+    parser.add_argument('input_dir', type=str,
+                        help="Directory whose sub-directories, .zip files and .tar files are the input payloads")
+    parser.add_argument('--url', type=str, default="http://localhost:8000", help="Base URL of MONAI Inference Service")
+    parser.add_argument('--output-dir', type=str, default="outputs",
+                        help="Directory of the output payload files, one per study named after it")
+    parser.add_argument('--map', type=str, default=None, help="Name of the registered MAP, defaults to the default MAP")
+    parser.add_argument('--in-flight', type=int, default=4, help="Maximum number of studies sent at once")
+    parser.add_argument('--input-format', type=str, default=INPUT_FORMAT_TAR,
+                        choices=(INPUT_FORMAT_TAR, INPUT_FORMAT_ZIP), help="Format in which directories are sent")
+    parser.add_argument('--output-format', type=str, default=OUTPUT_FORMAT_ZIP,
+                        choices=(OUTPUT_FORMAT_ZIP, OUTPUT_FORMAT_TAR), help="Format of the output payloads")
+    parser.add_argument('--priority', type=str, default=None, help="Priority class of the requests")
+    parser.add_argument('--client-id', type=str, default=None, help="Identifier of the client under admission control")
+    parser.add_argument('--retries', type=int, default=5,
+                        help="Number of times a rejected request, or one whose connection failed, is sent again")
+    parser.add_argument('--chunked-upload-size', type=int, default=0,
+                        help="Minimum size in Megabytes of a .zip or .tar file sent in parallel chunks, "
+                        "0 streams all files in one request")
+    parser.add_argument('--upload-concurrency', type=int, default=4,
+                        help="Number of chunks of one chunked upload sent at once")
+    parser.add_argument('--asyncio', action='store_true', help="Send requests from an asyncio event loop")
+    parser.add_argument('--json', action='store_true', help="Print the results and summary as JSON")
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.input_dir):
+        raise Exception(f'Input directory value must be a directory, provided value is \"{args.input_dir}\"')
+    if (args.retries < 0):
+        raise Exception(f'Retries value can not be less than 0, provided value is \"{args.retries}\"')
+    if (args.chunked_upload_size < 0):
+        raise Exception(f'Chunked upload size value can not be less than 0, '
+                        f'provided value is \"{args.chunked_upload_size}\"')
+
+    return args
+
+
+def main(argv: Optional[List[str]] = None):
+    """Driver method that submits the studies of a directory and reports the throughput
+    """
+    args = parse_args(argv)
+    studies = list_studies(args.input_dir, args.output_dir, args.output_format)
+    options = dict(map_name=args.map, max_in_flight=args.in_flight, input_format=args.input_format,
+                   output_format=args.output_format, priority=args.priority, client_id=args.client_id,
+                   max_retries=args.retries, chunked_upload_size=args.chunked_upload_size,
+                   upload_concurrency=args.upload_concurrency)
+    results = []
+
+    def report(result: InferenceResult):
+        results.append(result)
+        if not args.json:
+            outcome = "ok" if result.succeeded else f'failed: {result.error}'
+            print(f'{result.input_path}: {outcome} in {result.seconds:.2f}s, '
+                  f'{result.sent_bytes / MEGABYTE:.1f} MB sent, {result.received_bytes / MEGABYTE:.1f} MB received')
+
+    async def run_async():
+        async with AsyncInferenceClient(args.url, **options) as async_client:
+            async for result in async_client.infer_many(studies):
+                report(result)
+
+    start = time.monotonic()
+    if args.asyncio:
+        asyncio.run(run_async())
+    else:
+        with InferenceClient(args.url, **options) as inference_client:
+            for result in inference_client.infer_many(studies):
+                report(result)
+    summary = summarize(results, time.monotonic() - start)
+
+    if args.json:
+        json.dump({"results": [result.to_dict() for result in results], "summary": summary}, sys.stdout, indent=2)
+        print()
+    else:
+        print(f'{summary["succeeded"]} of {summary["studies"]} studies succeeded in {summary["seconds"]:.2f}s, '
+              f'{summary["studies_per_second"] or 0:.2f} studies/s, '
+              f'{summary["sent_megabytes_per_second"] or 0:.1f} MB/s sent, '
+              f'{summary["received_megabytes_per_second"] or 0:.1f} MB/s received, '
+              f'p50 {summary["latency_p50_seconds"] or 0:.2f}s, p95 {summary["latency_p95_seconds"] or 0:.2f}s')
+
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
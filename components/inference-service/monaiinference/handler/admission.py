@@ -0,0 +1,379 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import math
+import time
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Optional, Tuple
+
+from kubernetes import client, watch
+from kubernetes.client.rest import ApiException
+from kubernetes.utils import parse_quantity
+
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.metrics import record_admission_rejection
+from monaiinference.handler.scheduler import RequestScheduler
+
+GPU_RESOURCE = "nvidia.com/gpu"
+HTTP_STATUS_GONE = 410
+HTTP_STATUS_TOO_MANY_REQUESTS = 429
+HTTP_STATUS_SERVICE_UNAVAILABLE = 503
+# Retry-After in seconds while the duration of inference requests is not known yet.
+DEFAULT_RETRY_AFTER = 5
+TERMINAL_POD_PHASES = ("Succeeded", "Failed")
+WATCH_TIMEOUT = 300
+WATCH_RETRY_TIME = 1
+
+REASON_CAPACITY = "capacity"
+REASON_CLIENT_SHARE = "client_share"
+REASON_QUEUE = "queue"
+REASON_UPLOAD_SIZE = "upload_size"
+
+logger = logging.getLogger('MIS_Admission')
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when an inference request is rejected before its input payload is uploaded."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class ClusterCapacity:
+    """Class that keeps the allocatable and requested resources of the nodes of the cluster, following
+    nodes and pods through the Kubernetes watch API, so that free capacity is known without listing them
+    for every inference request."""
+
+    def __init__(self, kubernetes_core_client: client.CoreV1Api):
+        """Constructor of the ClusterCapacity class
+
+        Args:
+            kubernetes_core_client (client.CoreV1Api): Kubernetes client used to watch nodes and pods
+        """
+        self._kubernetes_core_client = kubernetes_core_client
+        self._lock = Lock()
+        self._stopped = Event()
+        # Node name to allocatable (cpu, memory, gpu), for schedulable nodes.
+        self._nodes: Dict[str, Tuple[float, float, float]] = {}
+        # Pod UID to node name and requested (cpu, memory, gpu), for scheduled pods which have not terminated.
+        self._pods: Dict[str, Tuple[str, Tuple[float, float, float]]] = {}
+        self._synced = {"nodes": Event(), "pods": Event()}
+
+    def start(self):
+        """Start following nodes and pods."""
+        Thread(target=self.__follow, args=("nodes", self._kubernetes_core_client.list_node, self.__update_node),
+               name='MIS_NodeInformer', daemon=True).start()
+        Thread(target=self.__follow, args=("pods", self._kubernetes_core_client.list_pod_for_all_namespaces,
+                                           self.__update_pod),
+               name='MIS_PodInformer', daemon=True).start()
+
+    def shutdown(self):
+        """Stop following nodes and pods."""
+        self._stopped.set()
+
+    @property
+    def synced(self) -> bool:
+        return all(event.is_set() for event in self._synced.values())
+
+    def free_pods(self, config: ServerConfig) -> Optional[int]:
+        """Number of MAP pods which fit into the free capacity of the schedulable nodes of the cluster,
+        given the CPU, memory and GPU limits of the MAP container.
+
+        Args:
+            config (ServerConfig): Configuration of the MAP
+
+        Returns:
+            Optional[int]: Number of MAP pods, None until nodes and pods have been listed.
+        """
+        if not self.synced:
+            return None
+
+        cpu = float(parse_quantity(str(config.map_cpu)))
+        memory = float(parse_quantity(str(config.map_memory) + "Mi"))
+        gpu = float(parse_quantity(str(config.map_gpu)))
+
+        with self._lock:
+            free = dict(self._nodes)
+            for node_name, requests in self._pods.values():
+                if node_name in free:
+                    free[node_name] = tuple(a - r for a, r in zip(free[node_name], requests))
+
+        pods = 0
+        for free_cpu, free_memory, free_gpu in free.values():
+            node_pods = min(free_cpu // cpu, free_memory // memory)
+            if (gpu > 0):
+                node_pods = min(node_pods, free_gpu // gpu)
+            pods += max(int(node_pods), 0)
+
+        return pods
+
+    def __follow(self, kind: str, list_function: Callable, update: Callable):
+        # List objects, then watch them from the resource version of the list. A watch which ends is resumed,
+        # an expired resource version lists the objects again.
+        resource_version = None
+        while not self._stopped.is_set():
+            object_watch = watch.Watch()
+            try:
+                if resource_version is None:
+                    object_list = list_function()
+                    with self._lock:
+                        self.__reset(kind)
+                        for item in object_list.items:
+                            update("ADDED", item)
+                    resource_version = object_list.metadata.resource_version
+                    self._synced[kind].set()
+                    logger.info(f'Listed {len(object_list.items)} {kind}')
+
+                for event in object_watch.stream(list_function, resource_version=resource_version,
+                                                 timeout_seconds=WATCH_TIMEOUT):
+                    with self._lock:
+                        update(event['type'], event['object'])
+                    resource_version = event['object'].metadata.resource_version
+                    if self._stopped.is_set():
+                        break
+            except ApiException as e:
+                if (e.status != HTTP_STATUS_GONE):
+                    logger.error(e, exc_info=True)
+                    time.sleep(WATCH_RETRY_TIME)
+                resource_version = None
+            except Exception as e:
+                logger.warning(f'Watch of {kind} interrupted, listing {kind} again: {e}')
+                resource_version = None
+                time.sleep(WATCH_RETRY_TIME)
+            finally:
+                object_watch.stop()
+
+    def __reset(self, kind: str):
+        # Must be called with the lock held.
+        if kind == "nodes":
+            self._nodes.clear()
+        else:
+            self._pods.clear()
+
+    def __update_node(self, event_type: str, node: client.V1Node):
+        # Must be called with the lock held.
+        name = node.metadata.name if node.metadata is not None else None
+        if (event_type == "DELETED" or (node.spec is not None and node.spec.unschedulable)):
+            self._nodes.pop(name, None)
+            return
+
+        allocatable = (node.status.allocatable if node.status is not None else None) or {}
+        self._nodes[name] = (float(parse_quantity(allocatable.get("cpu", "0"))),
+                             float(parse_quantity(allocatable.get("memory", "0"))),
+                             float(parse_quantity(allocatable.get(GPU_RESOURCE, "0"))))
+
+    def __update_pod(self, event_type: str, pod: client.V1Pod):
+        # Must be called with the lock held. Pods which are not scheduled yet do not use the capacity of a node.
+        uid = pod.metadata.uid or f'{pod.metadata.namespace}/{pod.metadata.name}'
+        node_name = pod.spec.node_name if pod.spec is not None else None
+        phase = pod.status.phase if pod.status is not None else None
+        if (event_type == "DELETED" or node_name is None or phase in TERMINAL_POD_PHASES):
+            self._pods.pop(uid, None)
+            return
+
+        requested = [0.0, 0.0, 0.0]
+        for container in pod.spec.containers or []:
+            resources = container.resources
+            # Containers with limits only are assigned requests equal to their limits.
+            requests = ((resources.requests or resources.limits) if resources is not None else None) or {}
+            for i, resource in enumerate(("cpu", "memory", GPU_RESOURCE)):
+                if resource in requests:
+                    requested[i] += float(parse_quantity(requests[resource]))
+        self._pods[uid] = (node_name, tuple(requested))
+
+
+class AdmissionTicket:
+    """Admission of an inference request, held until the request has returned and its job has finished."""
+
+    def __init__(self, controller: 'AdmissionController', client_id: str, upload_size: int):
+        self.client_id = client_id
+        self.upload_size = upload_size
+        self._controller = controller
+        self._holds = 1
+        self._uploading = True
+
+    def upload_finished(self):
+        """Stop counting the upload size of the request against the upload size limit."""
+        self._controller._release(self, upload=True)
+
+    def hold(self) -> Callable[[], None]:
+        """Keep the request admitted until the returned function is called, such as when its job finishes.
+
+        Returns:
+            Callable[[], None]: Function which releases the hold
+        """
+        with self._controller._lock:
+            self._holds += 1
+        return lambda: self._controller._release(self)
+
+    def release(self):
+        """Release the request, once it has returned."""
+        self._controller._release(self)
+
+
+class AdmissionController:
+    """Class that rejects inference requests before their input payload is uploaded, when they would not be
+    serviced in time: when the request queue is full or its estimated wait exceeds the queue timeout, when the
+    cluster has no capacity for a MAP pod, when too many bytes are being uploaded, or when a client holds more
+    than its share of the request slots and queue. Rejections carry the expected time until a retry succeeds."""
+
+    def __init__(self, scheduler: RequestScheduler, capacity: Optional[ClusterCapacity],
+                 max_upload_size: int = 0, max_client_share: float = 1.0):
+        """Constructor of the AdmissionController class
+
+        Args:
+            scheduler (RequestScheduler): Scheduler which hands out the request slots
+            capacity (Optional[ClusterCapacity]): Free capacity of the cluster, None to not check it
+            max_upload_size (int, optional): Maximum total size in Megabytes of the input payloads being
+            uploaded, 0 for no limit. Defaults to 0.
+            max_client_share (float, optional): Maximum fraction of the request slots and queue held by the
+            requests of one client. Defaults to 1.0.
+        """
+        self._scheduler = scheduler
+        self._capacity = capacity
+        self._max_upload_size = max_upload_size * 1024 * 1024
+        self._max_client_share = max_client_share
+        self._lock = Lock()
+        self._admitted = 0
+        self._uploads = 0
+        self._upload_size = 0
+        self._clients: Dict[str, int] = {}
+
+    @property
+    def stats(self) -> dict:
+        """Statistics of the admitted requests."""
+        with self._lock:
+            return {
+                "admitted": self._admitted,
+                "uploads": self._uploads,
+                "upload_bytes": self._upload_size,
+                "clients": dict(self._clients),
+            }
+
+    def admit(self, client_id: str, upload_size: int, config: ServerConfig,
+              idle_warm_pods: int = 0, priority: float = 0) -> AdmissionTicket:
+        """Admit an inference request, or reject it with the time after which a retry is expected to succeed.
+
+        Args:
+            client_id (str): Identifier of the client, such as its address
+            upload_size (int): Size in bytes of the request body, 0 if unknown
+            config (ServerConfig): Configuration of the MAP which runs the request
+            idle_warm_pods (int, optional): Number of idle pre-started pods of the MAP. Defaults to 0.
+            priority (float, optional): Priority level of the request, which is only queued behind requests
+            of higher or equal priority. Defaults to 0.
+
+        Returns:
+            AdmissionTicket: Admission of the request, to be released once it has returned
+
+        Raises:
+            AdmissionRejectedError: With status 429 if the client exceeds its share, 503 if the server is overloaded.
+        """
+        try:
+            return self.__admit(client_id, upload_size, config, idle_warm_pods, priority)
+        except AdmissionRejectedError as e:
+            record_admission_rejection(e.reason)
+            logger.info(f'Request of {client_id} rejected, retry after {e.retry_after} seconds: {e}')
+            raise
+
+    def retry_after(self) -> int:
+        """Expected time in seconds until a request slot becomes free."""
+        return self.__retry_after(1)
+
+    def __admit(self, client_id: str, upload_size: int, config: ServerConfig, idle_warm_pods: int,
+                priority: float) -> AdmissionTicket:
+        max_slots = self._scheduler.max_slots
+        free_slots = max_slots - self._scheduler.in_flight
+        # Queued requests of lower priority are displaced or overtaken by the request.
+        queue_depth = self._scheduler.waiting_ahead(priority)
+
+        with self._lock:
+            # Requests still uploading take a slot or queue entry once their upload is extracted.
+            ahead = queue_depth + self._uploads
+            capacity = max_slots + self._scheduler.max_queue_size
+
+            client_requests = self._clients.get(client_id, 0)
+            client_limit = max(int(capacity * self._max_client_share), 1)
+            if (self._max_client_share < 1 and client_requests >= client_limit):
+                raise AdmissionRejectedError(
+                    f'Client has {client_requests} requests in progress, the limit is {client_limit}',
+                    HTTP_STATUS_TOO_MANY_REQUESTS, self.__retry_after(math.ceil(client_requests / max_slots)),
+                    REASON_CLIENT_SHARE)
+
+            waiting = ahead - free_slots + 1
+            if (waiting > self._scheduler.max_queue_size):
+                raise AdmissionRejectedError(
+                    f'Request queue is full ({ahead} requests waiting or uploading)',
+                    HTTP_STATUS_SERVICE_UNAVAILABLE,
+                    self.__retry_after(math.ceil((waiting - self._scheduler.max_queue_size) / max_slots)),
+                    REASON_QUEUE)
+
+            mean_hold_time = self._scheduler.mean_hold_time
+            if (waiting > 0 and mean_hold_time is not None):
+                estimated_wait = math.ceil(waiting / max_slots) * mean_hold_time
+                if (estimated_wait > self._scheduler.queue_timeout):
+                    raise AdmissionRejectedError(
+                        f'Estimated wait of {estimated_wait:.0f} seconds exceeds the queue timeout',
+                        HTTP_STATUS_SERVICE_UNAVAILABLE,
+                        max(math.ceil(estimated_wait - self._scheduler.queue_timeout), 1), REASON_QUEUE)
+
+            if (self._max_upload_size > 0 and self._upload_size > 0 and
+                    self._upload_size + upload_size > self._max_upload_size):
+                raise AdmissionRejectedError(
+                    f'{self._upload_size // (1024 * 1024)} MB of input payloads are being uploaded, '
+                    f'the limit is {self._max_upload_size // (1024 * 1024)} MB',
+                    HTTP_STATUS_SERVICE_UNAVAILABLE, self.__retry_after(1), REASON_UPLOAD_SIZE)
+
+        # A request which gets a slot right away needs room for a new MAP pod, unless a pre-started pod is idle.
+        if (self._capacity is not None and waiting <= 0 and idle_warm_pods == 0):
+            free_pods = self._capacity.free_pods(config)
+            if (free_pods is not None and free_pods < 1):
+                raise AdmissionRejectedError(
+                    'Cluster has no free capacity for the MAP pod', HTTP_STATUS_SERVICE_UNAVAILABLE,
+                    self.__retry_after(1), REASON_CAPACITY)
+
+        with self._lock:
+            self._admitted += 1
+            self._uploads += 1
+            self._upload_size += upload_size
+            self._clients[client_id] = self._clients.get(client_id, 0) + 1
+
+        return AdmissionTicket(self, client_id, upload_size)
+
+    def __retry_after(self, rounds: int) -> int:
+        # Time for the given number of rounds of requests to complete in all slots.
+        mean_hold_time = self._scheduler.mean_hold_time
+        if mean_hold_time is None:
+            return DEFAULT_RETRY_AFTER
+        return max(math.ceil(rounds * mean_hold_time), 1)
+
+    def _release(self, ticket: AdmissionTicket, upload: bool = False):
+        with self._lock:
+            if ticket._uploading and (upload or ticket._holds == 1):
+                ticket._uploading = False
+                self._uploads -= 1
+                self._upload_size -= ticket.upload_size
+            if upload:
+                return
+
+            ticket._holds -= 1
+            if ticket._holds > 0:
+                return
+
+            self._admitted -= 1
+            remaining = self._clients.get(ticket.client_id, 0) - 1
+            if remaining > 0:
+                self._clients[ticket.client_id] = remaining
+            else:
+                self._clients.pop(ticket.client_id, None)
@@ -0,0 +1,137 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import time
+from threading import Condition
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger('MIS_Batching')
+
+
+class BatchCollector:
+    """Class that groups inference requests which arrive within a time window into batches run by one MAP pod.
+    The first request of a batch collects it, later requests join it until it is full or the window has passed."""
+
+    def __init__(self, max_size: int, max_wait: float):
+        """Constructor of the BatchCollector class
+
+        Args:
+            max_size (int): Maximum number of requests in a batch
+            max_wait (float): Maximum time in seconds the first request of a batch waits for further requests
+        """
+        self._max_size = max_size
+        self._max_wait = max_wait
+        self._condition = Condition()
+        self._open_batch = None
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size
+
+    @property
+    def max_wait(self) -> float:
+        return self._max_wait
+
+    def join(self, item: Any) -> Optional[List[Any]]:
+        """Add a request to the open batch, or open a new batch if there is none.
+
+        Args:
+            item (Any): Request to add
+
+        Returns:
+            Optional[List[Any]]: Requests of the batch, once it is closed, if the request opened the batch.
+            None if the request joined a batch opened by another request, which runs it.
+        """
+        with self._condition:
+            if self.__add(item):
+                return None
+
+            batch = self.__open(item, self._condition.notify_all)
+            deadline = time.monotonic() + self._max_wait
+            while self._open_batch is batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._open_batch = None
+                    break
+                self._condition.wait(remaining)
+
+        logger.info(f'Closed batch of {len(batch.items)} requests')
+        return batch.items
+
+    async def join_async(self, item: Any) -> Optional[List[Any]]:
+        """Add a request to the open batch, or open a new batch if there is none, as a coroutine of the
+        running event loop. The request which opens a batch waits for it without holding a thread.
+
+        Args:
+            item (Any): Request to add
+
+        Returns:
+            Optional[List[Any]]: Requests of the batch, once it is closed, if the request opened the batch.
+            None if the request joined a batch opened by another request, which runs it.
+        """
+        loop = asyncio.get_running_loop()
+        full = loop.create_future()
+
+        def set_full():
+            if not full.done():
+                full.set_result(None)
+
+        with self._condition:
+            if self.__add(item):
+                return None
+
+            # Requests which fill the batch may join it from other threads.
+            batch = self.__open(item, lambda: loop.call_soon_threadsafe(set_full))
+            wait = self._open_batch is batch
+
+        try:
+            if wait:
+                await asyncio.wait_for(full, self._max_wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # Also closed when the waiting request is cancelled, so that later requests open a new batch.
+            with self._condition:
+                if self._open_batch is batch:
+                    self._open_batch = None
+
+        logger.info(f'Closed batch of {len(batch.items)} requests')
+        return batch.items
+
+    def __add(self, item: Any) -> bool:
+        # Must be called with the condition held. Adds the request to the open batch, if there is one,
+        # and wakes up the request which opened the batch once the batch is full.
+        batch = self._open_batch
+        if batch is None:
+            return False
+
+        batch.items.append(item)
+        if len(batch.items) >= self._max_size:
+            self._open_batch = None
+            batch.on_full()
+        return True
+
+    def __open(self, item: Any, on_full: Callable[[], None]) -> "_Batch":
+        # Must be called with the condition held. A batch of one request is closed right away.
+        batch = _Batch(item, on_full)
+        if self._max_size > 1:
+            self._open_batch = batch
+        return batch
+
+
+class _Batch:
+    """Requests of a batch, with the function which wakes up the request that opened it once it is full."""
+
+    def __init__(self, item: Any, on_full: Callable[[], None]):
+        self.items = [item]
+        self.on_full = on_full
@@ -0,0 +1,206 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import List, Optional
+
+from monaiinference.handler.reaper import PayloadReaper
+
+MEGABYTE = 1024 * 1024
+
+logger = logging.getLogger('MIS_Cache')
+
+
+class CacheEntry:
+    """Class that defines object to store the size and age of a cached result"""
+
+    def __init__(self, size: int):
+        """Constructor of the CacheEntry class
+
+        Args:
+            size (int): Size in bytes of the cached output payload .zip file
+        """
+        self.size = size
+        self.created_at = time.monotonic()
+
+
+class ResultCache:
+    """Class that stores output payload .zip files on disk, keyed on the content of the input payload
+    and the MAP which produced them, and evicts them in least recently used order."""
+
+    def __init__(self, cache_path: str, max_size: int, ttl: float, reaper: Optional[PayloadReaper] = None):
+        """Constructor of the ResultCache class
+
+        Args:
+            cache_path (str): Absolute path of the directory which stores cached results
+            max_size (int): Maximum total size in Megabytes of cached results
+            ttl (float): Time in seconds after which a cached result expires, 0 for no limit
+            reaper (Optional[PayloadReaper], optional): Reaper which deletes the results of a previous run in the
+            background. Defaults to None, in which case they are deleted right away.
+        """
+        self._cache_path = cache_path
+        self._max_size = max_size * MEGABYTE
+        self._ttl = ttl
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+        # Results of a previous run are not indexed, so they are removed. The reaper moves them out of the way
+        # in constant time, so that startup does not wait for a large cache to be deleted.
+        if reaper is not None:
+            reaper.discard(self._cache_path)
+        else:
+            shutil.rmtree(self._cache_path, ignore_errors=True)
+        Path(self._cache_path).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(payload_digest: str, map_urn: str, map_image_id: Optional[str],
+                 map_entrypoint: List[str], map_model_source: Optional[str] = None,
+                 map_model_checksum: Optional[str] = None) -> Optional[str]:
+        """Derive the cache key of an inference request.
+
+        Args:
+            payload_digest (str): SHA-256 digest of the input payload .zip file
+            map_urn (str): MAP Container <image>:<tag>
+            map_image_id (Optional[str]): Image ID, including digest, the MAP image resolved to
+            map_entrypoint (List[str]): Entry point command of the MAP Container
+            map_model_source (Optional[str], optional): Source the model of the MAP is fetched from,
+            None if the model is part of the MAP image. Defaults to None.
+            map_model_checksum (Optional[str], optional): Expected SHA-256 checksum of the model of the MAP.
+            Defaults to None.
+
+        Returns:
+            Optional[str]: Cache key, None if the image digest of the MAP is not known yet.
+        """
+        if not map_image_id:
+            return None
+
+        digest = hashlib.sha256()
+        # MAPs which run the same image with different models produce different results for the same input.
+        for part in [payload_digest, map_urn, map_image_id] + list(map_entrypoint) + [
+                map_model_source or "", map_model_checksum or ""]:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+
+        return digest.hexdigest()
+
+    @property
+    def stats(self) -> dict:
+        """Statistics of the cache, including hit and miss counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_size_bytes": self._max_size,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def lookup(self, key: Optional[str], target_path: str) -> bool:
+        """Look up a cached result and link it to a target path.
+
+        Args:
+            key (Optional[str]): Cache key returned by `make_key`
+            target_path (str): Path at which the cached output payload .zip file is made available
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        with self._lock:
+            self.__evict_expired()
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                self._misses += 1
+                return False
+
+            # Link while holding the lock, so that the entry can not be evicted in between.
+            self.__link(self.__entry_path(key), target_path)
+            self._entries.move_to_end(key)
+            self._hits += 1
+
+        logger.info(f'Cache hit for {key}')
+        return True
+
+    def store(self, key: Optional[str], source_path: str):
+        """Store an output payload .zip file in the cache.
+
+        Args:
+            key (Optional[str]): Cache key returned by `make_key`, the result is not stored if None
+            source_path (str): Path of the output payload .zip file
+        """
+        if key is None:
+            return
+
+        size = os.path.getsize(source_path)
+        if (size > self._max_size):
+            logger.info(f'Result of {size} bytes exceeds cache size, not storing {key}')
+            return
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            self.__link(source_path, self.__entry_path(key))
+            self._entries[key] = CacheEntry(size)
+            self._size += size
+
+            self.__evict_expired()
+            while (self._size > self._max_size):
+                self.__remove(next(iter(self._entries)))
+
+        logger.info(f'Stored {size} bytes in cache for {key}')
+
+    def purge(self):
+        """Remove all cached results."""
+        with self._lock:
+            for key in list(self._entries):
+                self.__remove(key)
+
+        logger.info('Purged cache')
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self._cache_path, f'{key}.zip')
+
+    @staticmethod
+    def __link(source_path: str, target_path: str):
+        # Hard links avoid copying results, a copy is made if both paths are on different file systems.
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)
+
+    def __remove(self, key: str):
+        # Must be called with the lock held.
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        try:
+            os.remove(self.__entry_path(key))
+        except OSError as e:
+            logger.error(e, exc_info=True)
+
+    def __evict_expired(self):
+        # Must be called with the lock held. Entries are ordered by last use, not by age, so all are checked.
+        if (self._ttl <= 0):
+            return
+
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if now - entry.created_at > self._ttl]:
+            self.__remove(key)
@@ -0,0 +1,363 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import struct
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 1024 * 1024
+# Chunks read ahead of the chunk being written, per worker.
+READ_AHEAD_PER_WORKER = 4
+
+# Records of the .zip file format, see section 4.3 of the APPNOTE.TXT specification.
+LOCAL_FILE_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_FILE_HEADER_SIGNATURE = 0x04034b50
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+DATA_DESCRIPTOR_ZIP64 = struct.Struct('<IIQQ')
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+CENTRAL_DIRECTORY_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+CENTRAL_DIRECTORY_HEADER_SIGNATURE = 0x02014b50
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054b50
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct('<IQHHIIQQQQ')
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06064b50
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR = struct.Struct('<IIQI')
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = 0x07064b50
+ZIP64_EXTRA_FIELD_ID = 0x0001
+# Members whose sizes or offset may exceed the limit are written with ZIP64 fields, like ZipFile does.
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+# Sizes and checksum of a member follow its data in a data descriptor.
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8_NAME = 0x800
+
+
+class ParallelZipCodec:
+    """Class that extracts and compresses the members of .zip files on a pool of threads.
+    zlib releases the GIL while it inflates, deflates and computes checksums, so the threads
+    run in parallel without the cost of copying payloads between processes."""
+
+    def __init__(self, workers: int):
+        """Constructor of the ParallelZipCodec class
+
+        Args:
+            workers (int): Number of threads which extract or compress members in parallel
+        """
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='MIS_Codec')
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def shutdown(self):
+        """Stop the threads of the codec."""
+        self._executor.shutdown(wait=False)
+
+    def map(self, function: Callable, items: Iterable):
+        """Call a function on each item in parallel, and wait until all calls have returned.
+        Calls which have not started when a call raises an exception are skipped.
+
+        Args:
+            function (Callable): Function called with each item, for example to extract one member
+            items (Iterable): Items to call the function on
+
+        Raises:
+            Exception: The first exception raised by a call.
+        """
+        futures = [self._executor.submit(function, item) for item in items]
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+
+        for future in not_done:
+            future.cancel()
+        wait(not_done)
+
+        for future in futures:
+            if future.done() and not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+
+    def write_members(self, members: Iterable[Tuple[str, zipfile.ZipInfo]], compress_level: int) -> Iterator[bytes]:
+        """Write files as a .zip file, deflating chunks of the files in parallel while the previous chunks
+        are written in order. Each chunk is deflated on its own and flushed to a byte boundary,
+        so that the chunks of a member concatenate into one valid DEFLATE stream.
+
+        Args:
+            members (Iterable[Tuple[str, zipfile.ZipInfo]]): Path of each file, with the member it is written as.
+            Members are either `ZIP_DEFLATED` or `ZIP_STORED`.
+            compress_level (int): DEFLATE compression level of the `ZIP_DEFLATED` members
+
+        Yields:
+            bytes: Bytes of the .zip file, once per chunk
+        """
+        writer = ZipStreamWriter()
+        pending = deque()
+        max_pending = self._workers * READ_AHEAD_PER_WORKER
+
+        for item in self.__read_members(members, compress_level):
+            pending.append(item)
+            while len(pending) > max_pending:
+                data = self.__write_item(writer, pending.popleft())
+                if data:
+                    yield data
+
+        while pending:
+            data = self.__write_item(writer, pending.popleft())
+            if data:
+                yield data
+
+        yield writer.close()
+
+    def __read_members(self, members: Iterable[Tuple[str, zipfile.ZipInfo]], compress_level: int) -> Iterator[tuple]:
+        # Yields a start item per member, followed by an item per chunk with the chunk deflated
+        # in the background, and an end item. Each chunk is read one chunk ahead to find the last one.
+        for file_path, zip_info in members:
+            deflated = zip_info.compress_type == zipfile.ZIP_DEFLATED
+            yield ("start", zip_info)
+
+            chunks = 0
+            with open(file_path, 'rb') as src:
+                chunk = src.read(CHUNK_SIZE)
+                while chunk:
+                    next_chunk = src.read(CHUNK_SIZE)
+                    future = (self._executor.submit(_deflate_chunk, chunk, compress_level, not next_chunk)
+                              if deflated else None)
+                    yield ("chunk", chunk, future)
+                    chunks += 1
+                    chunk = next_chunk
+
+            # The last chunk finishes the DEFLATE stream, empty members still need an empty final block.
+            yield ("end", _deflate_chunk(b'', compress_level, True) if deflated and not chunks else b'')
+
+    @staticmethod
+    def __write_item(writer: "ZipStreamWriter", item: tuple) -> bytes:
+        # Writes one item of `__read_members`, returns the bytes of the .zip file it adds.
+        if item[0] == "start":
+            return writer.start_member(item[1])
+        if item[0] == "chunk":
+            _, chunk, future = item
+            return writer.write(chunk, future.result() if future is not None else None)
+        return writer.end_member(item[1])
+
+
+def write_members(members: Iterable[Tuple[str, zipfile.ZipInfo]], compress_level: int) -> Iterator[bytes]:
+    """Write files as a .zip file one chunk at a time, on the calling thread.
+
+    Args:
+        members (Iterable[Tuple[str, zipfile.ZipInfo]]): Path of each file, with the member it is written as.
+        Members are either `ZIP_DEFLATED` or `ZIP_STORED`.
+        compress_level (int): DEFLATE compression level of the `ZIP_DEFLATED` members
+
+    Yields:
+        bytes: Bytes of the .zip file, once per chunk
+    """
+    writer = ZipStreamWriter()
+    for file_path, zip_info in members:
+        compressor = None
+        if zip_info.compress_type == zipfile.ZIP_DEFLATED:
+            compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        yield writer.start_member(zip_info)
+
+        with open(file_path, 'rb') as src:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                data = writer.write(chunk, compressor.compress(chunk) if compressor is not None else None)
+                if data:
+                    yield data
+
+        yield writer.end_member(compressor.flush() if compressor is not None else b'')
+
+    yield writer.close()
+
+
+class _Entry:
+    """Fields of a member written by ZipStreamWriter, which are repeated in the central directory."""
+
+    def __init__(self, zip_info: zipfile.ZipInfo, offset: int):
+        self.zip_info = zip_info
+        self.offset = offset
+        self.zip64 = zip_info.file_size * 1.05 > ZIP64_LIMIT
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+
+class ZipStreamWriter:
+    """Class that writes a .zip file as a stream of bytes, without seeking back into the bytes already written.
+    The checksum and sizes of each member are computed while its data is written, and follow the data in a
+    data descriptor. The central directory is written from them once all members are written."""
+
+    def __init__(self):
+        """Constructor of the ZipStreamWriter class"""
+        self._offset = 0
+        self._entries: List[_Entry] = []
+        self._entry: Optional[_Entry] = None
+
+    def start_member(self, zip_info: zipfile.ZipInfo) -> bytes:
+        """Start a member of the .zip file.
+
+        Args:
+            zip_info (zipfile.ZipInfo): Name, time, attributes and compression type of the member. The file
+            size, such as set by `ZipInfo.from_file`, decides whether the member is written with ZIP64 fields.
+
+        Raises:
+            ValueError: If the compression type is neither `ZIP_DEFLATED` nor `ZIP_STORED`.
+
+        Returns:
+            bytes: Local file header of the member
+        """
+        if zip_info.compress_type not in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            raise ValueError(f'Compression type {zip_info.compress_type} of member {zip_info.filename} '
+                             f'is not supported')
+
+        entry = _Entry(zip_info, self._offset)
+        name, flags = _encode_name(zip_info.filename)
+        dos_time, dos_date = _dos_date_time(zip_info.date_time)
+        # Sizes are not known yet, the ZIP64 extra field only tells readers that the data descriptor has 8 byte sizes.
+        extra = struct.pack('<HHQQ', ZIP64_EXTRA_FIELD_ID, 16, 0, 0) if entry.zip64 else b''
+        size = ZIP64_MARKER if entry.zip64 else 0
+        header = LOCAL_FILE_HEADER.pack(LOCAL_FILE_HEADER_SIGNATURE, ZIP64_VERSION if entry.zip64 else ZIP_VERSION,
+                                        flags, zip_info.compress_type, dos_time, dos_date, 0, size, size,
+                                        len(name), len(extra))
+
+        self._entry = entry
+        return self.__emit(header + name + extra)
+
+    def write(self, data: bytes, compressed: Optional[bytes] = None) -> bytes:
+        """Write a chunk of the member being written.
+
+        Args:
+            data (bytes): Chunk of the file, from which the checksum and the file size are computed
+            compressed (Optional[bytes], optional): Compressed form of the chunk for a `ZIP_DEFLATED` member,
+            which may be empty while the compressor buffers its input. Defaults to None.
+
+        Returns:
+            bytes: Data of the member, to be appended to the .zip file
+        """
+        entry = self._entry
+        if entry.zip_info.compress_type == zipfile.ZIP_STORED:
+            compressed = data
+        entry.crc = zlib.crc32(data, entry.crc)
+        entry.file_size += len(data)
+        entry.compress_size += len(compressed)
+        return self.__emit(compressed)
+
+    def end_member(self, compressed: bytes = b'') -> bytes:
+        """Finish the member being written.
+
+        Args:
+            compressed (bytes, optional): Remaining compressed data of a `ZIP_DEFLATED` member, such as the final
+            flush of its compressor. Defaults to b''.
+
+        Raises:
+            zipfile.LargeZipFile: If the member exceeds the size of a member without ZIP64 fields.
+
+        Returns:
+            bytes: Remaining data and data descriptor of the member
+        """
+        entry = self._entry
+        entry.compress_size += len(compressed)
+        if not entry.zip64 and max(entry.file_size, entry.compress_size) > ZIP64_LIMIT:
+            raise zipfile.LargeZipFile(f'Member {entry.zip_info.filename} grew larger than its file size')
+
+        if entry.zip64:
+            descriptor = DATA_DESCRIPTOR_ZIP64.pack(DATA_DESCRIPTOR_SIGNATURE, entry.crc, entry.compress_size,
+                                                    entry.file_size)
+        else:
+            descriptor = DATA_DESCRIPTOR.pack(DATA_DESCRIPTOR_SIGNATURE, entry.crc, entry.compress_size,
+                                              entry.file_size)
+
+        self._entries.append(entry)
+        self._entry = None
+        return self.__emit(compressed + descriptor)
+
+    def close(self) -> bytes:
+        """Finish the .zip file.
+
+        Returns:
+            bytes: Central directory and end of central directory record of the .zip file
+        """
+        directory_offset = self._offset
+        directory = b''.join(self.__central_directory_header(entry) for entry in self._entries)
+        self.__emit(directory)
+
+        count = len(self._entries)
+        records = b''
+        if count >= ZIP64_COUNT_LIMIT or len(directory) > ZIP64_LIMIT or directory_offset > ZIP64_LIMIT:
+            records += ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE, ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12, ZIP64_VERSION,
+                ZIP64_VERSION, 0, 0, count, count, len(directory), directory_offset)
+            records += ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR.pack(
+                ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE, 0, self._offset, 1)
+            count = min(count, ZIP64_COUNT_LIMIT)
+            directory_offset = min(directory_offset, ZIP64_MARKER)
+
+        records += END_OF_CENTRAL_DIRECTORY.pack(END_OF_CENTRAL_DIRECTORY_SIGNATURE, 0, 0, count, count,
+                                                 min(len(directory), ZIP64_MARKER), directory_offset, 0)
+        return directory + self.__emit(records)
+
+    def __emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        return data
+
+    @staticmethod
+    def __central_directory_header(entry: _Entry) -> bytes:
+        zip_info = entry.zip_info
+        name, flags = _encode_name(zip_info.filename)
+        dos_time, dos_date = _dos_date_time(zip_info.date_time)
+
+        # Fields which do not fit are replaced by the marker, and follow in the ZIP64 extra field in this order.
+        zip64_fields = []
+        file_size, compress_size, offset = entry.file_size, entry.compress_size, entry.offset
+        if entry.zip64 or file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT:
+            zip64_fields += [file_size, compress_size]
+            file_size = compress_size = ZIP64_MARKER
+        if offset > ZIP64_LIMIT:
+            zip64_fields.append(offset)
+            offset = ZIP64_MARKER
+        extra = b''
+        if zip64_fields:
+            extra = struct.pack(f'<HH{len(zip64_fields)}Q', ZIP64_EXTRA_FIELD_ID, 8 * len(zip64_fields),
+                                *zip64_fields)
+
+        version = ZIP64_VERSION if zip64_fields else ZIP_VERSION
+        header = CENTRAL_DIRECTORY_HEADER.pack(CENTRAL_DIRECTORY_HEADER_SIGNATURE,
+                                               zip_info.create_system << 8 | version, version, flags,
+                                               zip_info.compress_type, dos_time, dos_date, entry.crc,
+                                               compress_size, file_size, len(name), len(extra), 0, 0, 0,
+                                               zip_info.external_attr, offset)
+        return header + name + extra
+
+
+def _encode_name(name: str) -> Tuple[bytes, int]:
+    # Names which are not ASCII are encoded as UTF-8, which is flagged in the header.
+    try:
+        return name.encode('ascii'), FLAG_DATA_DESCRIPTOR
+    except UnicodeEncodeError:
+        return name.encode('utf-8'), FLAG_DATA_DESCRIPTOR | FLAG_UTF8_NAME
+
+
+def _dos_date_time(date_time: tuple) -> Tuple[int, int]:
+    year, month, day, hour, minute, second = date_time
+    return hour << 11 | minute << 5 | second // 2, (year - 1980) << 9 | month << 5 | day
+
+
+def _deflate_chunk(data: bytes, level: int, last: bool) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
@@ -9,13 +9,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import Optional
+
 
 class ServerConfig:
     """Class that defines object to store MONAI Inference configuration specifications"""
 
     def __init__(self, map_urn: str, map_entrypoint: str, map_cpu: int, map_memory: int,
                  map_gpu: int, map_input_path: str, map_output_path: str, map_model_path: str,
-                 payload_host_path: str):
+                 payload_host_path: str, map_timeout: Optional[float] = None,
+                 map_multi_case: bool = False, map_pending_timeout: Optional[float] = None,
+                 map_model_source: Optional[str] = None, map_model_checksum: Optional[str] = None):
         """Constructor for Payload Provider class
 
         Args:
@@ -28,6 +32,16 @@ class ServerConfig:
             map_output_path (str): Output directory path of MAP Container
             map_model_path (str): Model directory path of MAP Container
             payload_host_path (str): Host path of payload directory
+            map_timeout (Optional[float], optional): Maximum time in seconds a MAP pod is given to run once
+            it has started, None for the default of the Kubernetes handler. Defaults to None.
+            map_multi_case (bool, optional): MAP Container processes several inference requests in one run,
+            each in a sub-directory of its input and output directory. Defaults to False.
+            map_pending_timeout (Optional[float], optional): Maximum time in seconds a MAP pod is given to be
+            scheduled and pull its image, None for the default of the Kubernetes handler. Defaults to None.
+            map_model_source (Optional[str], optional): Path or URL of the model file of the MAP, fetched into
+            the model cache and mounted read-only at the model path. Defaults to None.
+            map_model_checksum (Optional[str], optional): SHA-256 checksum the model file is verified against.
+            Defaults to None.
         """
         self.map_urn = map_urn
         self.map_entrypoint = map_entrypoint
@@ -38,3 +52,8 @@ class ServerConfig:
         self.map_output_path = map_output_path
         self.map_model_path = map_model_path
         self.payload_host_path = payload_host_path
+        self.map_timeout = map_timeout
+        self.map_multi_case = map_multi_case
+        self.map_pending_timeout = map_pending_timeout
+        self.map_model_source = map_model_source
+        self.map_model_checksum = map_model_checksum
@@ -0,0 +1,888 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import enum
+import logging
+import time
+import uuid
+from concurrent.futures import Executor
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Tuple, Union
+
+from fastapi import File, UploadFile
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from monaiinference.handler.batching import BatchCollector
+from monaiinference.handler.cache import ResultCache
+from monaiinference.handler.kubernetes import KubernetesHandler, PodStatus
+from monaiinference.handler.metrics import (PHASE_BATCH, PHASE_POD_RUNNING, PHASE_QUEUE, PHASE_SHARD, PHASE_STREAM,
+                                            RequestTimings, log_request, record_batch_size, record_outcome,
+                                            record_queue_wait)
+from monaiinference.handler.modelcache import ModelCacheError
+from monaiinference.handler.payload import (OUTPUT_FORMAT_ZIP, InputReference, InputStream, InvalidPayloadError,
+                                            PayloadProvider)
+from monaiinference.handler.pool import WarmPodPool
+from monaiinference.handler.scheduler import (DEFAULT_PRIORITY_CLASS_NAME, PriorityClass, RequestScheduler,
+                                              SchedulerError)
+from monaiinference.handler.sharding import ShardPolicy
+
+EVICTION_INTERVAL = 5
+OUTCOME_CACHED = "Cached"
+OUTCOME_CANCELLED = "Cancelled"
+OUTCOME_ERROR = "Error"
+OUTCOME_REJECTED = "Rejected"
+# Pods still pending or running once they are watched have timed out, and are killed without a grace period.
+TIMED_OUT_POD_STATUSES = (PodStatus.Pending, PodStatus.Running)
+
+logger = logging.getLogger('MIS_Jobs')
+
+
+class JobPhase(enum.Enum):
+    Queued = 1,
+    Pending = 2,
+    Running = 3,
+    Succeeded = 4,
+    Failed = 5,
+    Cancelled = 6
+
+
+class Job:
+    """Class that defines object to store the state and timing of an inference job"""
+
+    def __init__(self, job_id: str, priority: Optional[PriorityClass] = None):
+        """Constructor of the Job class
+
+        Args:
+            job_id (str): Unique identifier of the job, also used as its payload identifier
+            priority (Optional[PriorityClass], optional): Priority class of the job. Defaults to a class
+            of level 0.
+        """
+        self.job_id = job_id
+        self.priority = priority or PriorityClass(DEFAULT_PRIORITY_CLASS_NAME, 0)
+        self.phase = JobPhase.Queued
+        self.status_code = None
+        self.detail = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.running_at = None
+        self.finished_at = None
+        self.result_retrieved = False
+        self.cancelled = Event()
+        self.done = Event()
+        self.done_callbacks: List[Callable[[], None]] = []
+        self.pod_payload_id = None
+        self.shard_ids: List[str] = []
+        self.shards = 0
+        self.payload_digest = None
+        self.input_size = None
+        self.input_reference = None
+        self.cached = False
+        self.archived = False
+        self.outcome = None
+        self.reported = False
+        self.timings = RequestTimings()
+        self.stream_started_at = None
+
+    def to_dict(self) -> dict:
+        """Returns phase and timing information of the job
+
+        Returns:
+            dict: Phase, error detail, timestamps and phase durations in seconds of the job
+        """
+        def duration(start, end):
+            if start is None:
+                return None
+            return (end if end is not None else time.time()) - start
+
+        return {
+            "id": self.job_id,
+            "phase": self.phase.name,
+            "priority": self.priority.name,
+            "detail": self.detail,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "running_at": self.running_at,
+            "finished_at": self.finished_at,
+            "queued_seconds": duration(self.created_at, self.started_at or self.finished_at),
+            "pending_seconds": duration(self.started_at, self.running_at or self.finished_at),
+            "running_seconds": duration(self.running_at, self.finished_at),
+            "total_seconds": duration(self.created_at, self.finished_at),
+            "result_retrieved": self.result_retrieved,
+            "cached": self.cached,
+            "shards": self.shards,
+            "phases": self.timings.to_dict(),
+        }
+
+
+class JobManager:
+    """Class that runs inference jobs in the background and keeps their state and results
+    until they are retrieved or expire."""
+
+    def __init__(self, kubernetes_handler: KubernetesHandler, payload_provider: PayloadProvider,
+                 scheduler: RequestScheduler, warm_pool: Optional[WarmPodPool], result_ttl: float,
+                 result_cache: Optional[ResultCache] = None, batch_collector: Optional[BatchCollector] = None,
+                 shard_policy: Optional[ShardPolicy] = None):
+        """Constructor of the JobManager class
+
+        Args:
+            kubernetes_handler (KubernetesHandler): Handler used to run MAP pods
+            payload_provider (PayloadProvider): Provider of the payload directories of the jobs
+            scheduler (RequestScheduler): Scheduler which bounds the number of jobs running in parallel
+            warm_pool (Optional[WarmPodPool]): Pool of pre-started MAP pods, None if disabled
+            result_ttl (float): Time in seconds after which a finished job and its result are deleted
+            result_cache (Optional[ResultCache], optional): Cache of results of previous jobs,
+            None if disabled. Defaults to None.
+            batch_collector (Optional[BatchCollector], optional): Collector which groups jobs into batches
+            run by one MAP pod, None if batching is disabled. Defaults to None.
+            shard_policy (Optional[ShardPolicy], optional): Policy which splits the input payload of a job
+            across several MAP pods, None if sharding is disabled. Defaults to None.
+        """
+        self._kubernetes_handler = kubernetes_handler
+        self._payload_provider = payload_provider
+        self._scheduler = scheduler
+        self._warm_pool = warm_pool
+        self._result_ttl = result_ttl
+        self._result_cache = result_cache
+        self._batch_collector = batch_collector
+        self._shard_policy = shard_policy
+
+        self._jobs = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        # Queued jobs of `submit_async`, referenced until they obtain a slot.
+        self._queue_tasks = set()
+
+    @property
+    def kubernetes_handler(self) -> KubernetesHandler:
+        return self._kubernetes_handler
+
+    @property
+    def unfinished_jobs(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done.is_set())
+
+    @property
+    def idle_warm_pods(self) -> int:
+        return self._warm_pool.idle_pods if self._warm_pool is not None else 0
+
+    def start(self):
+        """Start the thread which evicts expired jobs."""
+        Thread(target=self.__evict_expired_jobs, daemon=True).start()
+
+    def shutdown(self):
+        """Stop evicting jobs and delete the payloads of all jobs."""
+        self._stopped.set()
+        with self._lock:
+            jobs = list(self._jobs.values())
+            self._jobs.clear()
+
+        for job in jobs:
+            job.cancelled.set()
+            self._payload_provider.delete_payload(job.job_id)
+
+    def submit(self, file: Union[UploadFile, InputStream, InputReference] = File(...),
+               priority: Optional[PriorityClass] = None) -> Job:
+        """Upload the input payload of a new job and queue the job for execution.
+
+        Args:
+            file (Union[UploadFile, InputStream, InputReference], optional): .zip or .tar file provided by user
+            to be moved and extracted in shared volume directory for input payloads, .tar stream extracted as it
+            is read, or directory referenced by its host path. Defaults to File(...).
+            priority (Optional[PriorityClass], optional): Priority class of the job. Defaults to a class of level 0.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = self.__upload(file, priority)
+        if not job.done.is_set():
+            target = self.__run_job if self._batch_collector is None else self.__collect_batch
+            Thread(target=target, args=(job,), daemon=True).start()
+
+        return job
+
+    async def submit_async(self, file: Union[UploadFile, InputStream, InputReference],
+                           executor: Optional[Executor] = None, priority: Optional[PriorityClass] = None) -> Job:
+        """Upload the input payload of a new job in an executor and queue the job for execution.
+        The job waits for a slot as a coroutine of the running event loop, and only obtains a thread
+        to run its MAP pod once it has a slot.
+
+        Args:
+            file (Union[UploadFile, InputStream, InputReference]): .zip or .tar file provided by user to be
+            moved and extracted in shared volume directory for input payloads, .tar stream extracted as it
+            is read, or directory referenced by its host path.
+            executor (Optional[Executor], optional): Executor of the payload upload and extraction.
+            Defaults to the default executor of the event loop.
+            priority (Optional[PriorityClass], optional): Priority class of the job. Defaults to a class of level 0.
+
+        Returns:
+            Job: The queued job.
+        """
+        job = await asyncio.get_running_loop().run_in_executor(executor, self.__upload, file, priority)
+        if not job.done.is_set():
+            # Jobs wait for their batch as well, only the first job of a batch then waits for a slot for the batch.
+            task = asyncio.ensure_future(self.__queue_job(job) if self._batch_collector is None else
+                                         self.__queue_batch(job))
+            self._queue_tasks.add(task)
+            task.add_done_callback(self._queue_tasks.discard)
+
+        return job
+
+    async def wait(self, job: Job):
+        """Wait until a job has finished, as a coroutine of the running event loop instead of a thread.
+
+        Args:
+            job (Job): Submitted job
+        """
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def set_finished():
+            if not finished.done():
+                finished.set_result(None)
+
+        with self._lock:
+            if job.done.is_set():
+                return
+            job.done_callbacks.append(lambda: loop.call_soon_threadsafe(set_finished))
+
+        await finished
+
+    def add_done_callback(self, job: Job, callback: Callable[[], None]):
+        """Call a function once a job has finished, right away if it has already finished.
+
+        Args:
+            job (Job): Submitted job
+            callback (Callable[[], None]): Function to call, from the thread which finishes the job
+        """
+        with self._lock:
+            if not job.done.is_set():
+                job.done_callbacks.append(callback)
+                return
+
+        callback()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job.
+
+        Args:
+            job_id (str): Identifier of the job
+
+        Returns:
+            Optional[Job]: The job, None if it does not exist or has been evicted.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stream_result(self, job: Job, delete_job: bool = False,
+                      output_format: str = OUTPUT_FORMAT_ZIP) -> Optional[StreamingResponse]:
+        """Stream the output payload of a succeeded job. The payload is deleted once it has been streamed.
+
+        Args:
+            job (Job): Succeeded job
+            delete_job (bool, optional): Also forget the job once its result has been streamed. Defaults to False.
+            output_format (str, optional): Either `zip` or `tar`. Results served from the cache are
+            always streamed as the cached .zip file. Defaults to `zip`.
+
+        Returns:
+            Optional[StreamingResponse]: Stream of the output payload, None if the result has already been retrieved.
+        """
+        with self._lock:
+            if job.result_retrieved:
+                return None
+            job.result_retrieved = True
+
+        if job.archived and (output_format == OUTPUT_FORMAT_ZIP or job.cached):
+            response = self._payload_provider.stream_output_archive(job.job_id)
+        else:
+            response = self._payload_provider.stream_output_payload(job.job_id, job.timings, output_format)
+        # Headers are sent before the body, so phases of streaming the result are only logged.
+        response.headers['Server-Timing'] = job.timings.server_timing()
+        response.background = BackgroundTask(self.__delete_result, job, delete_job)
+        job.stream_started_at = time.monotonic()
+
+        return response
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a job, deleting its pod if it is running, and forget it along with its payload.
+
+        Args:
+            job_id (str): Identifier of the job
+
+        Returns:
+            Optional[Job]: The cancelled job, None if it does not exist.
+        """
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return None
+
+            job.cancelled.set()
+            pod_payload_ids = list(job.shard_ids) or ([job.pod_payload_id] if job.pod_payload_id is not None else [])
+            finished = job.done.is_set()
+            if not finished:
+                self.__finish(job, JobPhase.Cancelled, 499, "Job was cancelled", OUTCOME_CANCELLED)
+
+        if pod_payload_ids and not finished:
+            # The job thread notices the deletion of the pods and deletes the payload when it ends.
+            for pod_payload_id in pod_payload_ids:
+                self._kubernetes_handler.delete_kubernetes_pod(pod_payload_id)
+        elif finished:
+            self._payload_provider.delete_payload(job.job_id)
+
+        with self._lock:
+            self.__report(job)
+        logger.info(f'Job {job_id} cancelled')
+
+        return job
+
+    def delete(self, job: Job):
+        """Forget a finished job and delete its payload.
+
+        Args:
+            job (Job): Finished job
+        """
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+
+        self._payload_provider.delete_payload(job.job_id)
+
+    def __upload(self, file: Union[UploadFile, InputStream, InputReference],
+                 priority: Optional[PriorityClass] = None) -> Job:
+        # Upload the input payload of a new job, which is finished if its result is found in the cache.
+        # Referenced inputs are not cached, since their files may change under the same path.
+        job = Job(uuid.uuid4().hex, priority)
+
+        if isinstance(file, InputReference):
+            self.__reference(job, file)
+        else:
+            if self._result_cache is not None and not isinstance(file, InputStream):
+                job.payload_digest = self._payload_provider.hash_input_payload(file, job.timings)
+                if self.__lookup_cached_result(job):
+                    return job
+
+            try:
+                job.input_size = self._payload_provider.upload_input_payload(job.job_id, file, job.timings)
+            except Exception:
+                self._payload_provider.delete_payload(job.job_id)
+                raise
+
+            # Streams are hashed while they are extracted, so their result is only looked up once they are read.
+            if self._result_cache is not None and isinstance(file, InputStream):
+                job.payload_digest = file.digest
+                if self.__lookup_cached_result(job):
+                    return job
+
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+        logger.info(f'Job {job.job_id} queued with priority {job.priority.name}')
+        return job
+
+    def __reference(self, job: Job, reference: InputReference):
+        # Batches move the input directory of each job into the batch, which a mounted directory can not be.
+        if self._batch_collector is not None:
+            raise InvalidPayloadError('Input payloads of a MAP which batches requests can not be referenced by path')
+
+        job.input_reference, job.input_size = self._payload_provider.resolve_input_reference(reference)
+        self._payload_provider.prepare_payload_directory(job.job_id)
+
+    def __cache_key(self, job: Job) -> Optional[str]:
+        config = self._kubernetes_handler.config
+        return ResultCache.make_key(job.payload_digest, config.map_urn, self._kubernetes_handler.map_image_id,
+                                    config.map_entrypoint, config.map_model_source, config.map_model_checksum)
+
+    def __lookup_cached_result(self, job: Job) -> bool:
+        # A cached result is linked into the payload directory of the job, which completes without a pod.
+        self._payload_provider.prepare_payload_directory(job.job_id)
+        if not self._result_cache.lookup(self.__cache_key(job),
+                                         self._payload_provider.get_output_archive_path(job.job_id)):
+            return False
+
+        with self._lock:
+            job.cached = True
+            job.archived = True
+            self.__finish(job, JobPhase.Succeeded, outcome=OUTCOME_CACHED)
+            self._jobs[job.job_id] = job
+
+        logger.info(f'Job {job.job_id} completed from cache')
+        return True
+
+    def __store_cached_result(self, job: Job):
+        # The stored .zip file is also the result of the job, so that the output is compressed only once.
+        try:
+            archive_path = self._payload_provider.write_output_payload(job.job_id, job.timings)
+            job.archived = True
+            self._result_cache.store(self.__cache_key(job), archive_path)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+
+    def __delete_result(self, job: Job, delete_job: bool):
+        job.timings.record(PHASE_STREAM, time.monotonic() - job.stream_started_at)
+        with self._lock:
+            self.__report(job)
+
+        if delete_job:
+            self.delete(job)
+        else:
+            self._payload_provider.delete_payload(job.job_id)
+
+    def __finish(self, job: Job, phase: JobPhase, status_code: int = None, detail: str = None,
+                 outcome: str = None):
+        # Must be called with the lock held. The first phase set on a job is final.
+        if job.done.is_set():
+            return
+
+        job.phase = phase
+        job.status_code = status_code
+        job.detail = detail
+        job.outcome = outcome or phase.name
+        job.finished_at = time.time()
+        job.done.set()
+        for callback in job.done_callbacks:
+            callback()
+        job.done_callbacks.clear()
+
+        record_outcome(job.outcome)
+        # Succeeded jobs are reported once their result has been streamed, which adds further phases.
+        if (phase is not JobPhase.Succeeded):
+            self.__report(job)
+
+    def __report(self, job: Job):
+        # Must be called with the lock held. Writes the phase breakdown of a finished job once.
+        if job.reported or not job.done.is_set():
+            return
+
+        job.reported = True
+        log_request(job.job_id, job.outcome, job.timings, status_code=job.status_code)
+
+    def __set_pod_status(self, job: Job, pod_status: PodStatus):
+        with self._lock:
+            if (pod_status is PodStatus.Running and job.running_at is None and not job.done.is_set()):
+                job.phase = JobPhase.Running
+                job.running_at = time.time()
+
+    def __finish_with_pod_status(self, job: Job, pod_status: PodStatus):
+        # Must be called with the lock held.
+        if (pod_status is PodStatus.Pending):
+            logger.error("Request timed out since MAP container's pod was in pending state after timeout")
+            self.__finish(job, JobPhase.Failed, 500,
+                          "Request timed out since MAP container's pod was in pending state after timeout",
+                          pod_status.name)
+        elif (pod_status is PodStatus.Running):
+            logger.error("Request timed out since MAP container's pod was in running state after timeout")
+            self.__finish(job, JobPhase.Failed, 500,
+                          "Request timed out since MAP container's pod was in running state after timeout",
+                          pod_status.name)
+        elif (pod_status is PodStatus.Failed):
+            logger.info("Request failed since MAP container's pod failed")
+            self.__finish(job, JobPhase.Failed, 500, "Request failed since MAP container's pod failed")
+        elif (pod_status is PodStatus.Succeeded):
+            logger.info("MAP container's pod completed")
+            self.__finish(job, JobPhase.Succeeded)
+
+    def __reject(self, job: Job, error: SchedulerError):
+        logger.info(f'Job {job.job_id} rejected: {error}')
+        with self._lock:
+            self.__finish(job, JobPhase.Failed, 503, str(error), OUTCOME_REJECTED)
+        self.__delete_cancelled(job)
+
+    def __run_job(self, job: Job):
+        queued_at = time.monotonic()
+        try:
+            with job.timings.phase(PHASE_QUEUE):
+                slot = self._scheduler.acquire(job.priority.level)
+        except SchedulerError as e:
+            self.__reject(job, e)
+            return
+        finally:
+            record_queue_wait(job.priority.name, time.monotonic() - queued_at)
+
+        self.__run_job_in_slot(job, slot)
+
+    async def __queue_job(self, job: Job):
+        queued_at = time.monotonic()
+        try:
+            with job.timings.phase(PHASE_QUEUE):
+                slot = await self._scheduler.acquire_async(job.priority.level)
+        except SchedulerError as e:
+            self.__reject(job, e)
+            return
+        except asyncio.CancelledError:
+            # Queued jobs are cancelled along with the event loop when the server shuts down.
+            with self._lock:
+                self.__finish(job, JobPhase.Failed, 503, "Request was not run since the server is shutting down",
+                              OUTCOME_REJECTED)
+            raise
+        finally:
+            record_queue_wait(job.priority.name, time.monotonic() - queued_at)
+
+        Thread(target=self.__run_job_in_slot, args=(job, slot), daemon=True).start()
+
+    def __run_job_in_slot(self, job: Job, slot: int):
+        logger.info(f'Job {job.job_id} acquired slot {slot}')
+        warm_pod = None
+        pod_status = None
+        shards = []
+        shard_slots = []
+
+        try:
+            shards, shard_slots = self.__split_job(job)
+            with self._lock:
+                # Checked under the lock, so that a concurrent cancel either sees no pod or the pod to delete.
+                if job.cancelled.is_set():
+                    return
+
+                # Warm pods mount the input directory of their own payload, not a referenced directory or a shard.
+                warm_pod = (self._warm_pool.acquire() if (self._warm_pool is not None and
+                                                          job.input_reference is None and not shards) else None)
+                job.phase = JobPhase.Pending
+                job.started_at = time.time()
+                job.shard_ids = [shard_id for shard_id, _ in shards]
+                job.shards = len(shards)
+                if not shards:
+                    job.pod_payload_id = warm_pod.payload_id if warm_pod is not None else job.job_id
+
+            if shards:
+                with job.timings.phase(PHASE_POD_RUNNING):
+                    pod_status = self.__run_shards(job, shards)
+                if (pod_status is PodStatus.Succeeded):
+                    with job.timings.phase(PHASE_SHARD):
+                        self._payload_provider.merge_output_payloads(job.shard_ids, job.job_id)
+            elif warm_pod is not None:
+                self._payload_provider.move_input_payload(job.job_id, warm_pod.payload_id)
+                self.__set_pod_status(job, PodStatus.Running)
+                with job.timings.phase(PHASE_POD_RUNNING):
+                    pod_status = self._warm_pool.run(warm_pod, job.input_size)
+                self._payload_provider.move_output_payload(warm_pod.payload_id, job.job_id)
+            else:
+                self._kubernetes_handler.create_kubernetes_pod(
+                    job.job_id, timings=job.timings, input_host_path=job.input_reference,
+                    priority_class_name=job.priority.pod_priority_class_name)
+
+                try:
+                    pod_status = self._kubernetes_handler.watch_kubernetes_pod(
+                        job.job_id, lambda status: self.__set_pod_status(job, status), job.timings, job.input_size)
+                finally:
+                    self._kubernetes_handler.delete_kubernetes_pod(job.job_id, job.timings,
+                                                                   force=pod_status in TIMED_OUT_POD_STATUSES)
+
+            if (pod_status is PodStatus.Succeeded and job.payload_digest is not None):
+                self.__store_cached_result(job)
+
+            with self._lock:
+                self.__finish_with_pod_status(job, pod_status)
+        except ModelCacheError as e:
+            logger.error(e)
+            with self._lock:
+                self.__finish(job, JobPhase.Failed, 500,
+                              "Request failed since the model of the MAP could not be fetched", OUTCOME_ERROR)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            with self._lock:
+                self.__finish(job, JobPhase.Failed, 500, "Request failed since MAP container's pod could not be run",
+                              OUTCOME_ERROR)
+        finally:
+            if warm_pod is not None:
+                self._warm_pool.release(warm_pod, pod_status)
+            for shard_slot in shard_slots:
+                self._scheduler.release(shard_slot)
+            logger.info(f'Releasing slot {slot}')
+            self._scheduler.release(slot)
+
+            with self._lock:
+                job.pod_payload_id = None
+                job.shard_ids = []
+            for shard_id, _ in shards:
+                self._payload_provider.delete_payload(shard_id)
+
+            self.__delete_cancelled(job)
+
+    def __split_job(self, job: Job) -> Tuple[List[Tuple[str, int]], List[int]]:
+        # Split the input of a job into one shard per slot which is free right away, up to the maximum number of
+        # shards, so that sharding uses idle capacity without holding back queued requests.
+        # Returns the identifier and input size of each shard, and the slots taken besides the slot of the job.
+        if (self._shard_policy is None or job.input_reference is not None or
+                not self._shard_policy.applies(job.input_size)):
+            return [], []
+
+        shard_slots = []
+        while (len(shard_slots) < self._shard_policy.max_shards - 1):
+            shard_slot = self._scheduler.try_acquire()
+            if shard_slot is None:
+                break
+            shard_slots.append(shard_slot)
+        if not shard_slots:
+            return [], []
+
+        shards = []
+        try:
+            shard_ids = [f'{job.job_id}-shard-{i}' for i in range(len(shard_slots) + 1)]
+            with job.timings.phase(PHASE_SHARD):
+                shards = self._payload_provider.split_input_payload(job.job_id, shard_ids, self._shard_policy.rule)
+        finally:
+            # Slots beyond the number of shards the input could be split into are returned right away.
+            for shard_slot in shard_slots[max(len(shards) - 1, 0):]:
+                self._scheduler.release(shard_slot)
+
+        if shards:
+            logger.info(f'Job {job.job_id} split into {len(shards)} shards')
+        return shards, shard_slots[:max(len(shards) - 1, 0)]
+
+    def __run_shards(self, job: Job, shards: List[Tuple[str, int]]) -> PodStatus:
+        # Run one MAP pod per shard in parallel. The pod of a failed shard is run again up to the retries
+        # of the shard policy, and once a shard has failed for good the pods of the other shards are deleted.
+        # Returns Succeeded if all shards succeeded, otherwise the status of the first shard which failed.
+        failure = []
+        failure_lock = Lock()
+
+        def fail(shard_id: str, status: PodStatus):
+            with failure_lock:
+                if failure:
+                    return
+                failure.append(status)
+            logger.info(f'Shard {shard_id} of job {job.job_id} failed with pod status {status}')
+            for other_id, _ in shards:
+                if (other_id != shard_id):
+                    self._kubernetes_handler.delete_kubernetes_pod(other_id)
+
+        def run_shard(shard_id: str, input_size: int):
+            status = None
+            for attempt in range(self._shard_policy.max_retries + 1):
+                if failure or job.cancelled.is_set():
+                    return
+                if attempt > 0:
+                    logger.info(f'Retrying shard {shard_id} of job {job.job_id} after pod status {status}')
+                    self._payload_provider.discard_output_payload(shard_id)
+
+                status = None
+                try:
+                    self._kubernetes_handler.create_kubernetes_pod(
+                        shard_id, priority_class_name=job.priority.pod_priority_class_name)
+                    try:
+                        status = self._kubernetes_handler.watch_kubernetes_pod(
+                            shard_id, lambda pod_status: self.__set_pod_status(job, pod_status), None, input_size)
+                    finally:
+                        self._kubernetes_handler.delete_kubernetes_pod(shard_id,
+                                                                       force=status in TIMED_OUT_POD_STATUSES)
+                except Exception as e:
+                    logger.error(e, exc_info=True)
+
+                if (status is PodStatus.Succeeded):
+                    return
+
+            fail(shard_id, status or PodStatus.Failed)
+
+        # The first shard runs in the thread of the job, which holds the slot of the job, and each further shard
+        # in a thread of its own, which holds one of the slots taken for the shards.
+        threads = [Thread(target=run_shard, args=shard, daemon=True) for shard in shards[1:]]
+        for thread in threads:
+            thread.start()
+        run_shard(*shards[0])
+        for thread in threads:
+            thread.join()
+
+        if failure:
+            return failure[0]
+        # Shards skipped because the job was cancelled did not succeed.
+        return PodStatus.Failed if job.cancelled.is_set() else PodStatus.Succeeded
+
+    def __collect_batch(self, job: Job):
+        with job.timings.phase(PHASE_BATCH):
+            jobs = self._batch_collector.join(job)
+
+        # Jobs which joined a batch opened by another job are run by the thread of that job.
+        if jobs is not None:
+            self.__run_batch(jobs)
+
+    async def __queue_batch(self, job: Job):
+        try:
+            with job.timings.phase(PHASE_BATCH):
+                jobs = await self._batch_collector.join_async(job)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.__finish(job, JobPhase.Failed, 503, "Request was not run since the server is shutting down",
+                              OUTCOME_REJECTED)
+            raise
+
+        # Jobs which joined a batch opened by another job are run along with that job.
+        if jobs is None:
+            return
+
+        batch_timings = RequestTimings(observe=False)
+        record_batch_size(len(jobs))
+        priority = self.__batch_priority(jobs)
+        queued_at = time.monotonic()
+        try:
+            with batch_timings.phase(PHASE_QUEUE):
+                slot = await self._scheduler.acquire_async(priority.level)
+        except SchedulerError as e:
+            self.__reject_batch(jobs, batch_timings, e)
+            return
+        except asyncio.CancelledError:
+            with self._lock:
+                for batch_job in jobs:
+                    self.__finish(batch_job, JobPhase.Failed, 503,
+                                  "Request was not run since the server is shutting down", OUTCOME_REJECTED)
+            raise
+        finally:
+            for batch_job in jobs:
+                record_queue_wait(batch_job.priority.name, time.monotonic() - queued_at)
+
+        Thread(target=self.__run_batch_in_slot, args=(jobs, slot, batch_timings), daemon=True).start()
+
+    def __run_batch(self, jobs: List[Job]):
+        batch_timings = RequestTimings(observe=False)
+        record_batch_size(len(jobs))
+        priority = self.__batch_priority(jobs)
+        queued_at = time.monotonic()
+        try:
+            with batch_timings.phase(PHASE_QUEUE):
+                slot = self._scheduler.acquire(priority.level)
+        except SchedulerError as e:
+            self.__reject_batch(jobs, batch_timings, e)
+            return
+        finally:
+            for job in jobs:
+                record_queue_wait(job.priority.name, time.monotonic() - queued_at)
+
+        self.__run_batch_in_slot(jobs, slot, batch_timings)
+
+    @staticmethod
+    def __batch_priority(jobs: List[Job]) -> PriorityClass:
+        # A batch is scheduled with the highest priority of its jobs.
+        return max((job.priority for job in jobs), key=lambda job_priority: job_priority.level)
+
+    @staticmethod
+    def __record_batch_timings(job: Job, batch_timings: RequestTimings):
+        # Must be called with the lock held, right before the job is finished.
+        if not job.done.is_set():
+            for phase, seconds in batch_timings.to_dict().items():
+                job.timings.record(phase, seconds)
+
+    def __reject_batch(self, jobs: List[Job], batch_timings: RequestTimings, error: SchedulerError):
+        logger.info(f'Batch of {len(jobs)} jobs rejected: {error}')
+        with self._lock:
+            for job in jobs:
+                self.__record_batch_timings(job, batch_timings)
+                self.__finish(job, JobPhase.Failed, 503, str(error), OUTCOME_REJECTED)
+        for job in jobs:
+            self.__delete_cancelled(job)
+
+    def __run_batch_in_slot(self, jobs: List[Job], slot: int, batch_timings: RequestTimings):
+        # Run one MAP pod over the input payloads of all jobs, each in a sub-directory named after the job.
+        # Jobs of a batch do not record the pod, so that cancelling one job leaves the pod of the others running.
+        # Phases of the batch are recorded once, and added to the timings of each job when it finishes.
+        priority = self.__batch_priority(jobs)
+        batch_id = f'batch-{uuid.uuid4().hex}'
+        logger.info(f'Batch {batch_id} of {len(jobs)} jobs acquired slot {slot}')
+        warm_pod = None
+        pod_status = None
+        running_jobs = []
+
+        try:
+            with self._lock:
+                running_jobs = [job for job in jobs if not job.cancelled.is_set()]
+                if not running_jobs:
+                    return
+
+                warm_pod = self._warm_pool.acquire() if self._warm_pool is not None else None
+                for job in running_jobs:
+                    job.phase = JobPhase.Pending
+                    job.started_at = time.time()
+
+            pod_payload_id = warm_pod.payload_id if warm_pod is not None else batch_id
+            self._payload_provider.move_input_payloads_to_batch([job.job_id for job in running_jobs],
+                                                                pod_payload_id)
+
+            def set_pod_status(status: PodStatus):
+                for job in running_jobs:
+                    self.__set_pod_status(job, status)
+
+            # The run time of a batch is learned against the total size of its inputs.
+            input_size = sum(job.input_size or 0 for job in running_jobs)
+            if warm_pod is not None:
+                set_pod_status(PodStatus.Running)
+                with batch_timings.phase(PHASE_POD_RUNNING):
+                    pod_status = self._warm_pool.run(warm_pod, input_size)
+            else:
+                self._kubernetes_handler.create_kubernetes_pod(
+                    pod_payload_id, timings=batch_timings, priority_class_name=priority.pod_priority_class_name)
+
+                try:
+                    pod_status = self._kubernetes_handler.watch_kubernetes_pod(pod_payload_id, set_pod_status,
+                                                                               batch_timings, input_size)
+                finally:
+                    self._kubernetes_handler.delete_kubernetes_pod(pod_payload_id, batch_timings,
+                                                                   force=pod_status in TIMED_OUT_POD_STATUSES)
+
+            missing_outputs = set()
+            if (pod_status is PodStatus.Succeeded):
+                for job in running_jobs:
+                    if not self._payload_provider.move_output_payload_from_batch(pod_payload_id, job.job_id):
+                        missing_outputs.add(job.job_id)
+                    elif self._result_cache is not None:
+                        self.__store_cached_result(job)
+
+            with self._lock:
+                for job in running_jobs:
+                    self.__record_batch_timings(job, batch_timings)
+                    if job.job_id in missing_outputs:
+                        logger.error(f'MAP container wrote no output sub-directory for job {job.job_id}')
+                        self.__finish(job, JobPhase.Failed, 500,
+                                      "Request failed since MAP container wrote no output for it in its batch")
+                    else:
+                        self.__finish_with_pod_status(job, pod_status)
+        except ModelCacheError as e:
+            logger.error(e)
+            with self._lock:
+                for job in running_jobs:
+                    self.__record_batch_timings(job, batch_timings)
+                    self.__finish(job, JobPhase.Failed, 500,
+                                  "Request failed since the model of the MAP could not be fetched", OUTCOME_ERROR)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+            with self._lock:
+                for job in running_jobs:
+                    self.__record_batch_timings(job, batch_timings)
+                    self.__finish(job, JobPhase.Failed, 500,
+                                  "Request failed since MAP container's pod could not be run", OUTCOME_ERROR)
+        finally:
+            if warm_pod is not None:
+                self._warm_pool.release(warm_pod, pod_status)
+            else:
+                self._payload_provider.delete_payload(batch_id)
+            logger.info(f'Releasing slot {slot}')
+            self._scheduler.release(slot)
+
+            for job in jobs:
+                self.__delete_cancelled(job)
+
+    def __delete_cancelled(self, job: Job):
+        # Payloads of jobs cancelled while they ran are deleted once the job thread is done with them.
+        if job.cancelled.is_set():
+            self._payload_provider.delete_payload(job.job_id)
+
+    def __evict_expired_jobs(self):
+        # Forget finished jobs older than the result TTL and delete their payloads.
+        while not self._stopped.wait(EVICTION_INTERVAL):
+            now = time.time()
+            with self._lock:
+                expired = [job for job in self._jobs.values()
+                           if job.done.is_set() and now - job.finished_at > self._result_ttl]
+                for job in expired:
+                    self._jobs.pop(job.job_id)
+                    self.__report(job)
+
+            for job in expired:
+                logger.info(f'Job {job.job_id} expired')
+                self._payload_provider.delete_payload(job.job_id)
@@ -11,55 +11,204 @@
 
 import enum
 import logging
+import math
 import os
+import shlex
 import time
 from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 from monaiinference.handler.config import ServerConfig
-
-from kubernetes import client
+from monaiinference.handler.metrics import (PHASE_POD_CREATE, PHASE_POD_DELETE, PHASE_POD_PENDING,
+                                            PHASE_POD_RUNNING, POD_START_COLD, RequestTimings, record_pod_start,
+                                            time_phase)
+from monaiinference.handler.modelcache import ModelCache
+from monaiinference.handler.reconcile import ResourceOwner
+from monaiinference.handler.timeouts import AdaptiveTimeout
+
+from kubernetes import client, watch
 from kubernetes.client import models
+from kubernetes.client.rest import ApiException
+from kubernetes.utils import parse_quantity
 
 API_VERSION_FOR_PODS = "v1"
 API_VERSION_FOR_PERSISTENT_VOLUME = "v1"
 API_VERSION_FOR_PERSISTENT_VOLUME_CLAIM = "v1"
 DEFAULT_NAMESPACE = "default"
 DEFAULT_STORAGE_SPACE = "10Gi"
+DIRECTORY = "Directory"
 DIRECTORY_OR_CREATE = "DirectoryOrCreate"
+HTTP_STATUS_CONFLICT = 409
+HTTP_STATUS_GONE = 410
 ENV_MONAI_INPUTPATH="MONAI_INPUTPATH"
 ENV_MONAI_OUTPUTPATH="MONAI_OUTPUTPATH"
 ENV_MONAI_MODELPATH="MONAI_MODELPATH"
 IF_NOT_PRESENT = "IfNotPresent"
+INPUT_REFERENCE_VOLUME_NAME = "monai-input-reference"
 MAP = "map"
+MODEL_CACHE_VOLUME_NAME = "monai-model-cache"
 MONAI = "monai"
 POD = "Pod"
 POD_NAME = "monai-pod"
+POD_WATCH_MODE_POLL = "poll"
+POD_WATCH_MODE_WATCH = "watch"
 PERSISTENT_VOLUME = "PersistentVolume"
 PERSISTENT_VOLUME_CLAIM = "PersistentVolumeClaim"
 PERSISTENT_VOLUME_CLAIM_NAME = "monai-volume-claim"
 PERSISTENT_VOLUME_NAME = "monai-volume"
+POLLING_TIME = 1
 READ_WRITE_ONCE = "ReadWriteOnce"
 RESTART_POLICY_NEVER = "Never"
 STORAGE = "storage"
 STORAGE_CLASS_NAME = "monai-storage-class"
+TERMINAL_WAITING_REASONS = ("CrashLoopBackOff", "CreateContainerConfigError", "ErrImagePull",
+                            "ImagePullBackOff", "InvalidImageName")
+VOLUME_LIFECYCLE_PER_REQUEST = "per-request"
+VOLUME_LIFECYCLE_SHARED = "shared"
+WARM_POD_CONTROL_MOUNT_PATH = "/var/run/monai/control"
+WARM_POD_CONTROL_SUB_PATH = "control"
+WARM_POD_DONE_FILE = "done"
+WARM_POD_READY_FILE = "ready"
+WARM_POD_STARTED_FILE = "started"
+WARM_POD_TRIGGER_FILE = "trigger"
 WAIT_TIME_FOR_POD_COMPLETION = 50
+WAIT_TIME_FOR_POD_PENDING = 50
+WATCH_REQUEST_TIMEOUT_MARGIN = 5
 
 logger = logging.getLogger('MIS_Kubernetes')
 
 
+def map_pods_on_node(node: models.V1Node, config: ServerConfig) -> int:
+    """Number of MAP pods which fit into the allocatable capacity of a node, given the CPU, memory
+    and GPU limits of the MAP container
+
+    Args:
+        node (models.V1Node): Node of the cluster
+        config (ServerConfig): Configuration of the MAP
+
+    Returns:
+        int: Number of MAP pods, 0 if the node is unschedulable.
+    """
+    if (node.spec is not None and node.spec.unschedulable):
+        return 0
+
+    cpu = parse_quantity(str(config.map_cpu))
+    memory = parse_quantity(str(config.map_memory) + "Mi")
+    gpu = parse_quantity(str(config.map_gpu))
+
+    allocatable = (node.status.allocatable if node.status is not None else None) or {}
+    node_pods = min(parse_quantity(allocatable.get("cpu", "0")) // cpu,
+                    parse_quantity(allocatable.get("memory", "0")) // memory)
+    if (gpu > 0):
+        node_pods = min(node_pods, parse_quantity(allocatable.get("nvidia.com/gpu", "0")) // gpu)
+
+    return int(node_pods)
+
+
+class PodStatus(enum.Enum):
+    Pending = 1,
+    Running = 2,
+    Succeeded = 3,
+    Failed = 4
+
+
 class KubernetesHandler:
     """Class to handle interactions with kubernetes for fulflling an inference request."""
 
-    def __init__(self, config: ServerConfig):
+    def __init__(self, config: ServerConfig, pod_watch_mode: str = POD_WATCH_MODE_WATCH,
+                 volume_lifecycle: str = VOLUME_LIFECYCLE_PER_REQUEST, volume_claim_name: Optional[str] = None,
+                 kubernetes_core_client: Optional[client.CoreV1Api] = None,
+                 ready_nodes: Optional[Callable[[str], List[str]]] = None,
+                 adaptive_timeout: Optional[AdaptiveTimeout] = None, model_cache: Optional[ModelCache] = None,
+                 owner: Optional[ResourceOwner] = None):
         """Constructor of the base KubernetesHandler class
 
         Args:
             config (ServerConfig): Instance of ServerConfig class with MONAI Inference
             configuration specifications
+            pod_watch_mode (str, optional): Either `watch` to follow pod status through the
+            Kubernetes watch API, or `poll` to read the pod status every second. Defaults to `watch`.
+            volume_lifecycle (str, optional): Either `per-request` to create a Persistent Volume and
+            Persistent Volume Claim for each pod, or `shared` to provision them once through
+            `provision_volume` and mount the payload directory of each pod as a sub path.
+            Defaults to `per-request`.
+            volume_claim_name (Optional[str], optional): Name of an existing Persistent Volume Claim
+            on the payload host path, adopted instead of provisioning one in `shared` mode. Defaults to None.
+            kubernetes_core_client (Optional[client.CoreV1Api], optional): Client of the Kubernetes core API.
+            Defaults to a client created from the loaded Kubernetes configuration.
+            ready_nodes (Optional[Callable[[str], List[str]]], optional): Returns the names of the nodes on
+            which an image has been pulled, which MAP pods prefer. Defaults to None.
+            adaptive_timeout (Optional[AdaptiveTimeout], optional): Run times of the MAP, which shorten the time
+            a MAP pod is given to run below the configured timeout once enough runs were seen. Defaults to None.
+            model_cache (Optional[ModelCache], optional): Cache from which the model of the MAP is mounted
+            read-only at its model path, if the MAP has a model source. Defaults to None.
+            owner (Optional[ResourceOwner], optional): Owner whose labels are stamped on the created pods,
+            Persistent Volumes and Persistent Volume Claims, and which tracks the payloads whose resources are
+            in use, so that stale resources are found by its reconciler. Defaults to None.
         """
         # Initialize kubernetes client and handler configuration.
-        self.kubernetes_core_client = client.CoreV1Api()
+        self.kubernetes_core_client = kubernetes_core_client or client.CoreV1Api()
         self.config = config
+        self.pod_watch_mode = pod_watch_mode
+        self.volume_lifecycle = volume_lifecycle
+        self.volume_claim_name = volume_claim_name
+        self.ready_nodes = ready_nodes
+        self.adaptive_timeout = adaptive_timeout
+        self.model_cache = model_cache
+        self.owner = owner
+        # Payload identifiers of the pods which hold the model of the MAP in the model cache.
+        self._model_users: Set[str] = set()
+        self._model_lock = Lock()
+        # Time each new pod was created at, until it is seen running.
+        self._created_at: Dict[str, float] = {}
+        self._created_lock = Lock()
+        # Whether the shared Persistent Volume and Persistent Volume Claim were created by this handler.
+        self._owns_volume = False
+        self._owns_volume_claim = False
+        # Image ID, including digest, of the MAP image last reported by a MAP pod.
+        self.map_image_id = None
+
+    @property
+    def pending_timeout(self) -> float:
+        # Maximum time in seconds a MAP pod is given to be scheduled and pull its image.
+        return self.config.map_pending_timeout or WAIT_TIME_FOR_POD_PENDING
+
+    def running_timeout(self, input_size: Optional[int] = None) -> float:
+        """Maximum time in seconds a MAP pod is given to run once it has started. With adaptive timeouts,
+        this is derived from the run times of inputs of similar size, and never exceeds the configured timeout.
+        Inputs of a size whose runs time out too often are given the configured timeout.
+
+        Args:
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+
+        Returns:
+            float: Time in seconds
+        """
+        timeout = self.config.map_timeout or WAIT_TIME_FOR_POD_COMPLETION
+        adaptive_timeout = self.adaptive_timeout.timeout(input_size) if self.adaptive_timeout is not None else None
+        return min(adaptive_timeout, timeout) if adaptive_timeout is not None else timeout
+
+    def record_run_time(self, seconds: float, input_size: Optional[int] = None):
+        """Record the run time of a MAP pod which completed successfully, from which adaptive timeouts are derived.
+
+        Args:
+            seconds (float): Time in seconds the MAP pod was running
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+        """
+        if self.adaptive_timeout is not None:
+            self.adaptive_timeout.record(seconds, input_size)
+
+    def record_run_timeout(self, seconds: float, input_size: Optional[int] = None):
+        """Record the run time of a MAP pod which was still running at its deadline, so that adaptive timeouts
+        of inputs of its size are widened rather than only learned from runs which completed.
+
+        Args:
+            seconds (float): Time in seconds the MAP pod was running until it timed out
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+        """
+        if self.adaptive_timeout is not None:
+            self.adaptive_timeout.record_timeout(seconds, input_size)
 
     def __build_resources_requests(self) -> models.V1ResourceRequirements:
         # Derive CPU, memory(in Megabytes) and GPU limits for container from handler configuration.
@@ -72,17 +221,71 @@ class KubernetesHandler:
         resources = models.V1ResourceRequirements(limits=limits)
         return resources
 
-    def __build_container_template(self) -> models.V1Container:
+    @staticmethod
+    def __pod_name(payload_id: str) -> str:
+        return f'{POD_NAME}-{payload_id}'
+
+    @staticmethod
+    def __persistent_volume_name(payload_id: Optional[str]) -> str:
+        return PERSISTENT_VOLUME_NAME if payload_id is None else f'{PERSISTENT_VOLUME_NAME}-{payload_id}'
+
+    def __persistent_volume_claim_name(self, payload_id: Optional[str]) -> str:
+        if payload_id is None:
+            return self.volume_claim_name or PERSISTENT_VOLUME_CLAIM_NAME
+        return f'{PERSISTENT_VOLUME_CLAIM_NAME}-{payload_id}'
+
+    def __labels(self, labels: dict, payload_id: Optional[str]) -> dict:
+        if self.owner is not None:
+            labels.update(self.owner.labels(payload_id))
+        return labels
+
+    def __is_shared_volume(self) -> bool:
+        return self.volume_lifecycle == VOLUME_LIFECYCLE_SHARED
+
+    def __volume_sub_path(self, payload_id: str, sub_path: str) -> str:
+        # The shared volume holds the payload directories of all pods, per-request volumes only one.
+        if self.__is_shared_volume():
+            return Path(payload_id, sub_path).as_posix()
+        return sub_path
+
+    def __build_warm_pod_command(self) -> list:
+        # Wrap the MAP entrypoint in a loop which runs it once per new run number written to the
+        # trigger file, and reports "<run number> <exit code>" through the done file.
+        control = WARM_POD_CONTROL_MOUNT_PATH
+        entrypoint = " ".join(shlex.quote(arg) for arg in self.config.map_entrypoint)
+        script = (
+            f'touch {control}/{WARM_POD_READY_FILE}; last=""; '
+            f'while true; do '
+            f'if [ -f {control}/{WARM_POD_TRIGGER_FILE} ]; then '
+            f'run=$(cat {control}/{WARM_POD_TRIGGER_FILE}); '
+            f'if [ -n "$run" ] && [ "$run" != "$last" ]; then '
+            f'echo "$run" > {control}/{WARM_POD_STARTED_FILE}.tmp; '
+            f'mv {control}/{WARM_POD_STARTED_FILE}.tmp {control}/{WARM_POD_STARTED_FILE}; '
+            f'{entrypoint}; echo "$run $?" > {control}/{WARM_POD_DONE_FILE}.tmp; '
+            f'mv {control}/{WARM_POD_DONE_FILE}.tmp {control}/{WARM_POD_DONE_FILE}; last="$run"; '
+            f'fi; fi; sleep 0.1; done'
+        )
+        return ["/bin/sh", "-c", script]
+
+    def __build_container_template(self, payload_id: str, warm: bool, input_host_path: Optional[str] = None,
+                                   model_host_path: Optional[str] = None) -> models.V1Container:
         # Derive container POSIX input path for defining input mount.
         input_path = Path(os.path.join("/", self.config.map_input_path)).as_posix()
 
-        # Define input volume mount.
-        input_mount = models.V1VolumeMount(
-            name=PERSISTENT_VOLUME_CLAIM_NAME,
-            mount_path=input_path,
-            sub_path=input_path[1:],
-            read_only=True
-        )
+        # Define input volume mount, of the referenced host directory instead of the payload if there is one.
+        if input_host_path is not None:
+            input_mount = models.V1VolumeMount(
+                name=INPUT_REFERENCE_VOLUME_NAME,
+                mount_path=input_path,
+                read_only=True
+            )
+        else:
+            input_mount = models.V1VolumeMount(
+                name=PERSISTENT_VOLUME_CLAIM_NAME,
+                mount_path=input_path,
+                sub_path=self.__volume_sub_path(payload_id, input_path[1:]),
+                read_only=True
+            )
 
         # Derive container POSIX output path for defining output mount.
         output_path = Path(os.path.join("/", self.config.map_output_path)).as_posix()
@@ -91,7 +294,7 @@ class KubernetesHandler:
         output_mount = models.V1VolumeMount(
             name=PERSISTENT_VOLUME_CLAIM_NAME,
             mount_path=output_path,
-            sub_path=output_path[1:],
+            sub_path=self.__volume_sub_path(payload_id, output_path[1:]),
         )
 
         # Build Shared Memory volume mount.
@@ -101,6 +304,26 @@ class KubernetesHandler:
             read_only=False
         )
 
+        volume_mounts = [input_mount, output_mount, shared_memory_volume_mount]
+        command = self.config.map_entrypoint
+
+        if warm:
+            # Define control volume mount used to trigger runs of a warm pod.
+            volume_mounts.append(models.V1VolumeMount(
+                name=PERSISTENT_VOLUME_CLAIM_NAME,
+                mount_path=WARM_POD_CONTROL_MOUNT_PATH,
+                sub_path=self.__volume_sub_path(payload_id, WARM_POD_CONTROL_SUB_PATH),
+            ))
+            command = self.__build_warm_pod_command()
+
+        if model_host_path is not None:
+            # Define model volume mount, of the model directory in the model cache.
+            volume_mounts.append(models.V1VolumeMount(
+                name=MODEL_CACHE_VOLUME_NAME,
+                mount_path=Path(os.path.join("/", self.config.map_model_path)).as_posix(),
+                read_only=True
+            ))
+
         input_env = models.V1EnvVar(name=ENV_MONAI_INPUTPATH, value=self.config.map_input_path)
         output_env = models.V1EnvVar(name=ENV_MONAI_OUTPUTPATH, value=self.config.map_output_path)
         model_env = models.V1EnvVar(name=ENV_MONAI_MODELPATH, value=self.config.map_model_path)
@@ -109,28 +332,32 @@ class KubernetesHandler:
         container = models.V1Container(
             name=MAP,
             image=self.config.map_urn,
-            command=self.config.map_entrypoint,
+            command=command,
             image_pull_policy=IF_NOT_PRESENT,
             env=[input_env, output_env, model_env],
             resources=self.__build_resources_requests(),
-            volume_mounts=[input_mount, output_mount, shared_memory_volume_mount]
+            volume_mounts=volume_mounts
         )
 
         return container
 
-    def __build_kubernetes_pod(self) -> models.V1Pod:
-        container = self.__build_container_template()
+    def __build_kubernetes_pod(self, payload_id: str, warm: bool, input_host_path: Optional[str] = None,
+                               priority_class_name: Optional[str] = None,
+                               model_host_path: Optional[str] = None) -> models.V1Pod:
+        container = self.__build_container_template(payload_id, warm, input_host_path, model_host_path)
+        pod_name = self.__pod_name(payload_id)
+        claim_name = self.__persistent_volume_claim_name(None if self.__is_shared_volume() else payload_id)
 
         # Build pod object.
         pod = models.V1Pod(
             api_version=API_VERSION_FOR_PODS,
             kind=POD,
             metadata=models.V1ObjectMeta(
-                name=POD_NAME,
-                labels={
-                    "pod-name": POD_NAME,
+                name=pod_name,
+                labels=self.__labels({
+                    "pod-name": pod_name,
                     "pod-type": MONAI
-                }
+                }, payload_id)
             ),
             spec=models.V1PodSpec(
                 containers=[container],
@@ -139,7 +366,7 @@ class KubernetesHandler:
                     models.V1Volume(
                         name=PERSISTENT_VOLUME_CLAIM_NAME,
                         persistent_volume_claim=models.V1PersistentVolumeClaimVolumeSource(
-                            claim_name=PERSISTENT_VOLUME_CLAIM_NAME,
+                            claim_name=claim_name,
                         ),
                     ),
                     models.V1Volume(
@@ -149,21 +376,70 @@ class KubernetesHandler:
                             medium="Memory",
                         )
                     )
-                ]
+                ],
+                affinity=self.__build_affinity(),
+                priority_class_name=priority_class_name
             )
         )
 
+        if input_host_path is not None:
+            pod.spec.volumes.append(models.V1Volume(
+                name=INPUT_REFERENCE_VOLUME_NAME,
+                host_path=models.V1HostPathVolumeSource(
+                    path=input_host_path,
+                    type=DIRECTORY,
+                ),
+            ))
+
+        if model_host_path is not None:
+            pod.spec.volumes.append(models.V1Volume(
+                name=MODEL_CACHE_VOLUME_NAME,
+                host_path=models.V1HostPathVolumeSource(
+                    path=model_host_path,
+                    type=DIRECTORY,
+                ),
+            ))
+
         return pod
 
-    def __build_kubernetes_persistent_volume(self) -> models.V1PersistentVolume:
+    def __build_affinity(self) -> Optional[models.V1Affinity]:
+        # Prefer nodes which already hold the MAP image, so that the pod does not wait for the image to be pulled.
+        nodes = self.ready_nodes(self.config.map_urn) if self.ready_nodes is not None else []
+        if not nodes:
+            return None
+
+        return models.V1Affinity(
+            node_affinity=models.V1NodeAffinity(
+                preferred_during_scheduling_ignored_during_execution=[
+                    models.V1PreferredSchedulingTerm(
+                        weight=100,
+                        preference=models.V1NodeSelectorTerm(
+                            match_fields=[
+                                models.V1NodeSelectorRequirement(
+                                    key="metadata.name",
+                                    operator="In",
+                                    values=sorted(nodes),
+                                )
+                            ]
+                        )
+                    )
+                ]
+            )
+        )
+
+    def __build_kubernetes_persistent_volume(self, payload_id: Optional[str]) -> models.V1PersistentVolume:
+        host_path = self.config.payload_host_path
+        if payload_id is not None:
+            host_path = os.path.join(host_path, payload_id)
+
         persistent_volume = models.V1PersistentVolume(
             api_version=API_VERSION_FOR_PERSISTENT_VOLUME,
             kind=PERSISTENT_VOLUME,
             metadata=models.V1ObjectMeta(
-                name=PERSISTENT_VOLUME_NAME,
-                labels={
+                name=self.__persistent_volume_name(payload_id),
+                labels=self.__labels({
                     "volume-type": MONAI
-                }
+                }, payload_id)
             ),
             spec=models.V1PersistentVolumeSpec(
                 access_modes=[READ_WRITE_ONCE],
@@ -171,7 +447,7 @@ class KubernetesHandler:
                     STORAGE: DEFAULT_STORAGE_SPACE,
                 },
                 host_path=models.V1HostPathVolumeSource(
-                    path=self.config.payload_host_path,
+                    path=host_path,
                     type=DIRECTORY_OR_CREATE,
                 ),
                 storage_class_name=STORAGE_CLASS_NAME,
@@ -180,15 +456,15 @@ class KubernetesHandler:
 
         return persistent_volume
 
-    def __build_kubernetes_persistent_volume_claim(self) -> models.V1PersistentVolumeClaim:
+    def __build_kubernetes_persistent_volume_claim(self, payload_id: Optional[str]) -> models.V1PersistentVolumeClaim:
         persistent_volume_claim = models.V1PersistentVolumeClaim(
             api_version=API_VERSION_FOR_PERSISTENT_VOLUME_CLAIM,
             kind=PERSISTENT_VOLUME_CLAIM,
             metadata=models.V1ObjectMeta(
-                name=PERSISTENT_VOLUME_CLAIM_NAME,
-                labels={
+                name=self.__persistent_volume_claim_name(payload_id),
+                labels=self.__labels({
                     "volume-claim-type": MONAI
-                }
+                }, payload_id)
             ),
             spec=models.V1PersistentVolumeClaimSpec(
                 access_modes=[READ_WRITE_ONCE],
@@ -198,18 +474,156 @@ class KubernetesHandler:
                     }
                 ),
                 storage_class_name=STORAGE_CLASS_NAME,
+                # Bind explicitly, since all payload volumes share the same storage class.
+                volume_name=self.__persistent_volume_name(payload_id),
             )
         )
 
         return persistent_volume_claim
 
-    def create_kubernetes_pod(self):
-        """Create a kubernetes pod and the Persistent Volume and Persistent Volume Claim needed by the pod.
+    def provision_volume(self):
+        """Provision the Persistent Volume and Persistent Volume Claim shared by all pods, in `shared`
+        volume lifecycle mode. An existing Persistent Volume Claim is adopted if `volume_claim_name` is set,
+        or if one was left behind by a previous run.
         """
+        if not self.__is_shared_volume():
+            return
+
+        pvc_name = self.__persistent_volume_claim_name(None)
+        if self.volume_claim_name is not None:
+            # Fail at startup rather than on the first request if the claim does not exist.
+            self.kubernetes_core_client.read_namespaced_persistent_volume_claim(
+                name=pvc_name, namespace=DEFAULT_NAMESPACE)
+            logger.info(f'Adopted Persistent Volume Claim {pvc_name}')
+            return
+
+        created_pv = self.__create_or_adopt(
+            self.kubernetes_core_client.create_persistent_volume,
+            self.__build_kubernetes_persistent_volume(None))
+
+        try:
+            created_pvc = self.__create_or_adopt(
+                lambda body: self.kubernetes_core_client.create_namespaced_persistent_volume_claim(
+                    namespace=DEFAULT_NAMESPACE, body=body),
+                self.__build_kubernetes_persistent_volume_claim(None))
+        except Exception:
+            if created_pv:
+                self.kubernetes_core_client.delete_persistent_volume(name=self.__persistent_volume_name(None))
+            raise
+
+        self._owns_volume = created_pv
+        self._owns_volume_claim = created_pvc
+
+    def release_volume(self):
+        """Delete the shared Persistent Volume Claim and Persistent Volume, if they were created by
+        `provision_volume`. Adopted volumes are left in place.
+        """
+        pvc_name = self.__persistent_volume_claim_name(None)
+        pv_name = self.__persistent_volume_name(None)
+
+        if self._owns_volume_claim:
+            self._owns_volume_claim = False
+            try:
+                self.kubernetes_core_client.delete_namespaced_persistent_volume_claim(
+                    namespace=DEFAULT_NAMESPACE, name=pvc_name)
+                logger.info(f'Deleted Persistent Volume Claim {pvc_name}')
+            except Exception as e:
+                logger.error(e, exc_info=True)
+
+        if self._owns_volume:
+            self._owns_volume = False
+            try:
+                self.kubernetes_core_client.delete_persistent_volume(name=pv_name)
+                logger.info(f'Deleted Persistent Volume {pv_name}')
+            except Exception as e:
+                logger.error(e, exc_info=True)
+
+    @staticmethod
+    def __create_or_adopt(create: Callable, body) -> bool:
+        # Create a Kubernetes object, or reuse the one of the same name left behind by a previous run.
+        # Returns whether the object was created.
+        try:
+            create(body)
+            logger.info(f'Created {body.kind} {body.metadata.name}')
+            return True
+        except ApiException as e:
+            if (e.status != HTTP_STATUS_CONFLICT):
+                logger.error(e, exc_info=True)
+                raise e
+
+        logger.info(f'Adopted existing {body.kind} {body.metadata.name}')
+        return False
+
+    def create_kubernetes_pod(self, payload_id: str, warm: bool = False, timings: Optional[RequestTimings] = None,
+                              input_host_path: Optional[str] = None, priority_class_name: Optional[str] = None):
+        """Create a kubernetes pod and, in `per-request` volume lifecycle mode, the Persistent Volume
+        and Persistent Volume Claim needed by the pod.
+
+        Args:
+            payload_id (str): Identifier of the payload directory, within the payload host path,
+            which is mounted by the pod
+            warm (bool, optional): Create a long running pod which runs the MAP entrypoint each time
+            it is triggered through its control directory. Defaults to False.
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
+            input_host_path (Optional[str], optional): Host directory mounted read-only as the input directory
+            of the MAP, instead of the input directory of the payload. Defaults to None.
+            priority_class_name (Optional[str], optional): Kubernetes PriorityClass of the pod. Defaults to None.
+
+        Raises:
+            ModelCacheError: If the model of the MAP is not cached and can not be fetched.
+        """
+        # Tracked before any resource exists, so that the reconciler never sees resources being created as stale.
+        if self.owner is not None:
+            self.owner.track(payload_id)
+        try:
+            model_host_path = self.__acquire_model(payload_id, timings)
+            try:
+                if not warm:
+                    with self._created_lock:
+                        self._created_at[payload_id] = time.monotonic()
+                with time_phase(timings, PHASE_POD_CREATE):
+                    self.__create_kubernetes_pod(payload_id, warm, input_host_path, priority_class_name,
+                                                 model_host_path)
+            except Exception:
+                self.__release_model(payload_id)
+                with self._created_lock:
+                    self._created_at.pop(payload_id, None)
+                raise
+        except Exception:
+            if self.owner is not None:
+                self.owner.untrack(payload_id)
+            raise
+
+    def __acquire_model(self, payload_id: str, timings: Optional[RequestTimings]) -> Optional[str]:
+        # Returns the host path of the model directory mounted by the pod, None if the MAP has no cached model.
+        if self.model_cache is None or not self.config.map_model_source:
+            return None
+
+        model_host_path = self.model_cache.acquire(self.config, timings)
+        with self._model_lock:
+            self._model_users.add(payload_id)
+        return model_host_path
+
+    def __release_model(self, payload_id: str):
+        # Pods may be deleted more than once, the model is released once per pod.
+        with self._model_lock:
+            if payload_id not in self._model_users:
+                return
+            self._model_users.discard(payload_id)
+        self.model_cache.release(self.config)
+
+    def __create_kubernetes_pod(self, payload_id: str, warm: bool, input_host_path: Optional[str],
+                                priority_class_name: Optional[str], model_host_path: Optional[str]):
+        if self.__is_shared_volume():
+            self.__create_pod(payload_id, warm, input_host_path, priority_class_name, model_host_path)
+            return
+
+        pv_name = self.__persistent_volume_name(payload_id)
+        pvc_name = self.__persistent_volume_claim_name(payload_id)
 
         try:
             # Create a Kubernetes Persistent Volume.
-            pv = self.__build_kubernetes_persistent_volume()
+            pv = self.__build_kubernetes_persistent_volume(payload_id)
             self.kubernetes_core_client.create_persistent_volume(pv)
             logger.info(f'Created Persistent Volume {pv.metadata.name}')
         except Exception as e:
@@ -218,17 +632,28 @@ class KubernetesHandler:
 
         try:
             # Create a Kubernetes Persistent Volume Claim.
-            pvc = self.__build_kubernetes_persistent_volume_claim()
+            pvc = self.__build_kubernetes_persistent_volume_claim(payload_id)
             self.kubernetes_core_client.create_namespaced_persistent_volume_claim(namespace=DEFAULT_NAMESPACE, body=pvc)
             logger.info(f'Created Persistent Volume Claim {pvc.metadata.name}')
         except Exception as e:
             logger.error(e, exc_info=True)
-            self.kubernetes_core_client.delete_persistent_volume(name=PERSISTENT_VOLUME_NAME)
+            self.kubernetes_core_client.delete_persistent_volume(name=pv_name)
+            raise e
+
+        try:
+            self.__create_pod(payload_id, warm, input_host_path, priority_class_name, model_host_path)
+        except Exception as e:
+            self.kubernetes_core_client.delete_namespaced_persistent_volume_claim(
+                namespace=DEFAULT_NAMESPACE, name=pvc_name)
+            self.kubernetes_core_client.delete_persistent_volume(name=pv_name)
             raise e
 
+    def __create_pod(self, payload_id: str, warm: bool, input_host_path: Optional[str] = None,
+                     priority_class_name: Optional[str] = None, model_host_path: Optional[str] = None):
         try:
             # Create a Kubernetes Pod.
-            pod = self.__build_kubernetes_pod()
+            pod = self.__build_kubernetes_pod(payload_id, warm, input_host_path, priority_class_name,
+                                              model_host_path)
             self.kubernetes_core_client.create_namespaced_pod(
                 namespace=DEFAULT_NAMESPACE,
                 body=pod
@@ -236,91 +661,278 @@ class KubernetesHandler:
 
             logger.info(f'Created pod {pod.metadata.name}')
         except Exception as e:
-            self.kubernetes_core_client.delete_namespaced_persistent_volume_claim(
-                namespace=DEFAULT_NAMESPACE, name=PERSISTENT_VOLUME_CLAIM_NAME)
-            self.kubernetes_core_client.delete_persistent_volume(name=PERSISTENT_VOLUME_NAME)
             logger.error(e, exc_info=True)
             raise e
 
-    def delete_kubernetes_pod(self):
-        """Delete a kubernetes pod and the Persistent Volume and Persistent Volume Claim created for the pod.
+    def delete_kubernetes_pod(self, payload_id: str, timings: Optional[RequestTimings] = None, force: bool = False):
+        """Delete a kubernetes pod and, in `per-request` volume lifecycle mode, the Persistent Volume
+        and Persistent Volume Claim created for the pod.
+
+        Args:
+            payload_id (str): Identifier of the payload directory the pod was created for
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
+            force (bool, optional): Kill the containers of the pod right away, without a grace period,
+            for pods which timed out. Defaults to False.
         """
+        with time_phase(timings, PHASE_POD_DELETE):
+            self.__delete_kubernetes_pod(payload_id, force)
+        self.__release_model(payload_id)
+        with self._created_lock:
+            self._created_at.pop(payload_id, None)
+        # Resources whose deletion failed are left to the reconciler.
+        if self.owner is not None:
+            self.owner.untrack(payload_id)
+
+    def __delete_kubernetes_pod(self, payload_id: str, force: bool = False):
+        pod_name = self.__pod_name(payload_id)
+        pv_name = self.__persistent_volume_name(payload_id)
+        pvc_name = self.__persistent_volume_claim_name(payload_id)
 
         # Delete the Kubernetes Pod, Persistent Volume Claim and Persistent Volume.
         try:
-            self.kubernetes_core_client.delete_namespaced_pod(name=POD_NAME, namespace=DEFAULT_NAMESPACE)
-            logger.info(f'Deleted pod {POD_NAME}')
+            if force:
+                self.kubernetes_core_client.delete_namespaced_pod(name=pod_name, namespace=DEFAULT_NAMESPACE,
+                                                                  grace_period_seconds=0)
+            else:
+                self.kubernetes_core_client.delete_namespaced_pod(name=pod_name, namespace=DEFAULT_NAMESPACE)
+            logger.info(f'Deleted pod {pod_name}')
         except Exception as e:
             logger.error(e, exc_info=True)
 
+        if self.__is_shared_volume():
+            return
+
         try:
             self.kubernetes_core_client.delete_namespaced_persistent_volume_claim(
-                namespace=DEFAULT_NAMESPACE, name=PERSISTENT_VOLUME_CLAIM_NAME)
-            logger.info(f'Deleted Persistent Volume Claim {PERSISTENT_VOLUME_CLAIM_NAME}')
+                namespace=DEFAULT_NAMESPACE, name=pvc_name)
+            logger.info(f'Deleted Persistent Volume Claim {pvc_name}')
         except Exception as e:
             logger.error(e, exc_info=True)
 
         try:
-            self.kubernetes_core_client.delete_persistent_volume(name=PERSISTENT_VOLUME_NAME)
-            logger.info(f'Deleted Persistent Volume {PERSISTENT_VOLUME_NAME}')
+            self.kubernetes_core_client.delete_persistent_volume(name=pv_name)
+            logger.info(f'Deleted Persistent Volume {pv_name}')
         except Exception as e:
             logger.error(e, exc_info=True)
 
-    def watch_kubernetes_pod(self):
-        """Watch the status of kubernetes pod until it completes or it times out.
+    def __evaluate_pod(self, pod: models.V1Pod) -> Tuple[PodStatus, bool]:
+        # Map the reported state of a pod to a PodStatus, and whether the pod reached a terminal state.
+        # A pod waiting on one of the TERMINAL_WAITING_REASONS will not make progress on its own,
+        # so it is reported as terminal along with its current status.
+        if (pod.status is None):
+            return PodStatus.Pending, False
+
+        self.__record_image_id(pod)
+        pod_status = pod.status.phase
+
+        if (pod_status == "Pending"):
+            status = PodStatus.Pending
+        elif (pod_status == "Running"):
+            status = PodStatus.Running
+        elif (pod_status == "Succeeded"):
+            return PodStatus.Succeeded, True
+        elif (pod_status == "Failed"):
+            return PodStatus.Failed, True
+        else:
+            logger.warning(f'Unknown pod status {pod_status}')
+            return PodStatus.Pending, False
+
+        for container_status in (pod.status.container_statuses or []):
+            waiting = container_status.state.waiting if container_status.state is not None else None
+            if (waiting is not None and waiting.reason in TERMINAL_WAITING_REASONS):
+                logger.warning(f'Pod {pod.metadata.name} in {pod_status} State: {waiting.reason}')
+                return status, True
+
+        return status, False
+
+    def __record_image_id(self, pod: models.V1Pod):
+        # Remember the digest the MAP image reference resolved to on the node which ran the pod.
+        for container_status in (pod.status.container_statuses or []):
+            if (container_status.name == MAP and container_status.image_id):
+                if (container_status.image_id != self.map_image_id):
+                    logger.info(f'MAP image {self.config.map_urn} resolved to {container_status.image_id}')
+                self.map_image_id = container_status.image_id
+
+    def watch_kubernetes_pod(self, payload_id: str,
+                             status_callback: Optional[Callable[[PodStatus], None]] = None,
+                             timings: Optional[RequestTimings] = None, input_size: Optional[int] = None):
+        """Watch the status of kubernetes pod until it completes or it times out. The pod is given the
+        pending timeout to start, and the running timeout from the time it starts to complete.
+
+        Args:
+            payload_id (str): Identifier of the payload directory the pod was created for
+            status_callback (Callable[[PodStatus], None], optional): Called with the status of the pod
+            each time it changes. Defaults to None.
+            timings (Optional[RequestTimings], optional): Timings of the request, which records the time
+            the pod spent pending and running. Defaults to None.
+            input_size (Optional[int], optional): Size in bytes of the input payload of the pod, from which
+            the running timeout is derived in adaptive mode. Defaults to None.
 
         Returns:
             PodStatus: Enum which denotes a pod status.
         """
-        polling_time = 1
-        current_sleep_time = 0
+        start_time = time.monotonic()
+        running_time = None
+        deadline = start_time + self.pending_timeout
+        pod_name = self.__pod_name(payload_id)
+        with self._created_lock:
+            created_at = self._created_at.pop(payload_id, None)
+
+        def on_status(status: PodStatus):
+            nonlocal running_time, deadline
+            if (status is not PodStatus.Pending and running_time is None):
+                running_time = time.monotonic()
+                deadline = running_time + self.running_timeout(input_size)
+                if created_at is not None:
+                    record_pod_start(POD_START_COLD, running_time - created_at)
+            if status_callback is not None:
+                status_callback(status)
+
+        def get_deadline() -> float:
+            return deadline
+
+        if (self.pod_watch_mode == POD_WATCH_MODE_POLL):
+            status = self.__poll_kubernetes_pod(pod_name, on_status, get_deadline)
+        else:
+            status = self.__stream_kubernetes_pod(pod_name, on_status, get_deadline)
+
+        end_time = time.monotonic()
+        if (status is PodStatus.Succeeded and running_time is not None):
+            self.record_run_time(end_time - running_time, input_size)
+        elif (status is PodStatus.Running and running_time is not None):
+            self.record_run_timeout(end_time - running_time, input_size)
+        if timings is not None:
+            # A pod which completed between two status reports is counted as running from its first report.
+            timings.record(PHASE_POD_PENDING, (running_time or end_time) - start_time)
+            if running_time is not None:
+                timings.record(PHASE_POD_RUNNING, end_time - running_time)
+
+        logger.info(f'Pod status is {status} after {end_time - start_time:.3f} seconds')
+
+        return status
+
+    def __stream_kubernetes_pod(self, pod_name: str, status_callback, deadline: Callable[[], float]) -> PodStatus:
+        # Stream events of the pod from the Kubernetes watch API until it reaches a terminal state.
+        # If the pod does not complete within timeout, return last reported status(Pending/Running) of pod.
+        # A watch which ends before timeout is resumed from the last seen resource version, a watch which fails
+        # is retried while the pod is read once per attempt, so that the pod is followed if it can not be watched.
         status = PodStatus.Pending
+        resource_version = None
+
+        while (time.monotonic() < deadline()):
+            watch_deadline = deadline()
+            remaining = watch_deadline - time.monotonic()
+            pod_watch = watch.Watch()
+            kwargs = {
+                "namespace": DEFAULT_NAMESPACE,
+                "field_selector": f'metadata.name={pod_name}',
+                "timeout_seconds": max(int(math.ceil(remaining)), 1),
+                "_request_timeout": remaining + WATCH_REQUEST_TIMEOUT_MARGIN,
+            }
+            if resource_version is not None:
+                kwargs["resource_version"] = resource_version
+
+            try:
+                for event in pod_watch.stream(self.kubernetes_core_client.list_namespaced_pod, **kwargs):
+                    pod = event['object']
+                    resource_version = pod.metadata.resource_version
+
+                    if (event['type'] == "DELETED"):
+                        logger.warning(f'Pod {pod_name} was deleted before completion')
+                        pod_watch.stop()
+                        return PodStatus.Failed
+
+                    previous_status = status
+                    status, done = self.__evaluate_pod(pod)
+                    if (status_callback is not None and status is not previous_status):
+                        status_callback(status)
+
+                    if done:
+                        pod_watch.stop()
+                        return status
+
+                    # The deadline moves when the pod starts, a watch which would outlast it is resumed with
+                    # the new timeout. A watch which ends before it is resumed once it ends.
+                    if (time.monotonic() >= deadline() or deadline() < watch_deadline):
+                        break
+            except ApiException as e:
+                resource_version = None
+                if (e.status == HTTP_STATUS_GONE):
+                    # Resource version is too old, restart from the current state of the pod.
+                    logger.info(f'Watch of pod {pod_name} expired, restarting watch')
+                    continue
+                logger.error(e, exc_info=True)
+            except Exception as e:
+                logger.warning(f'Watch of pod {pod_name} interrupted, resuming watch: {e}')
+            else:
+                continue
+            finally:
+                pod_watch.stop()
+
+            # While the watch fails, the pod is polled in between attempts to watch it again.
+            try:
+                status, done = self.__read_kubernetes_pod(pod_name, status, status_callback)
+                if done:
+                    return status
+            except Exception as e:
+                logger.warning(f'Pod {pod_name} could not be read: {e}')
+            time.sleep(min(POLLING_TIME, max(deadline() - time.monotonic(), 0)))
+
+        return status
 
-        # Check every `polling_time` seconds if pod has completed(successfully/failed).
+    def __poll_kubernetes_pod(self, pod_name: str, status_callback, deadline: Callable[[], float]) -> PodStatus:
+        # Check every `POLLING_TIME` seconds if pod has completed(successfully/failed).
         # If Pod does not complete within timeout, return last reported status(Pending/Running) of pod.
-        # If pod is in a pending state with ImagePullBackOff error, then quit checking for pod status
-        # and return error along with Pending status.
+        status = PodStatus.Pending
 
-        while (current_sleep_time < WAIT_TIME_FOR_POD_COMPLETION):
-            pod = self.kubernetes_core_client.read_namespaced_pod(name=POD_NAME, namespace=DEFAULT_NAMESPACE)
-            if (pod.status is None):
-                continue
+        while (time.monotonic() < deadline()):
+            status, done = self.__read_kubernetes_pod(pod_name, status, status_callback)
+            if done:
+                break
 
-            pod_status = pod.status.phase
+            time.sleep(min(POLLING_TIME, max(deadline() - time.monotonic(), 0)))
 
-            if (pod_status == "Pending"):
-                status = PodStatus.Pending
+        return status
 
-                container_statuses = pod.status.container_statuses
-                if (container_statuses is None):
-                    continue
+    def __read_kubernetes_pod(self, pod_name: str, status: PodStatus, status_callback) -> Tuple[PodStatus, bool]:
+        # Read the pod once and report its status if it differs from the last reported status.
+        # Returns the status of the pod, and whether the pod reached a terminal state.
+        pod = self.kubernetes_core_client.read_namespaced_pod(name=pod_name, namespace=DEFAULT_NAMESPACE)
+        previous_status = status
+        status, done = self.__evaluate_pod(pod)
+        if (status_callback is not None and status is not previous_status):
+            status_callback(status)
 
-                container_status = container_statuses[0]
-                if (container_status.state.waiting is not None and
-                        container_status.state.waiting.reason == "ImagePullBackOff"):
-                    logger.warning(f'Pod {POD_NAME} in Pending State: Image Pull Back Off')
-                    break
-            elif (pod_status == "Running"):
-                status = PodStatus.Running
-            elif (pod_status == "Succeeded"):
-                status = PodStatus.Succeeded
-                break
-            elif (pod_status == "Failed"):
-                status = PodStatus.Failed
-                break
-            else:
-                logger.warning(f'Unknown pod status {pod.status.phase}')
+        return status, done
+
+    def get_kubernetes_pod_phase(self, payload_id: str) -> Optional[str]:
+        """Read the phase of a kubernetes pod.
 
-            time.sleep(polling_time)
-            current_sleep_time += polling_time
+        Args:
+            payload_id (str): Identifier of the payload directory the pod was created for
 
-        logger.info(f'Pod status is {status} after {current_sleep_time} seconds')
+        Returns:
+            Optional[str]: Phase of the pod, None if the pod has not reported a status yet.
+        """
+        pod = self.kubernetes_core_client.read_namespaced_pod(name=self.__pod_name(payload_id),
+                                                              namespace=DEFAULT_NAMESPACE)
+        if (pod.status is None):
+            return None
 
-        return status
+        self.__record_image_id(pod)
+        return pod.status.phase
 
+    def get_max_concurrent_pods(self) -> int:
+        """Derive the number of MAP pods which fit into the allocatable capacity of the schedulable
+        nodes of the cluster, given the CPU, memory and GPU limits of the MAP container.
 
-class PodStatus(enum.Enum):
-    Pending = 1,
-    Running = 2,
-    Succeeded = 3,
-    Failed = 4
+        Returns:
+            int: Number of MAP pods which can run in parallel, at least 1.
+        """
+        max_pods = 0
+        for node in self.kubernetes_core_client.list_node().items:
+            max_pods += map_pods_on_node(node, self.config)
+
+        logger.info(f'Cluster capacity allows {max_pods} concurrent MAP pods')
+
+        return max(max_pods, 1)
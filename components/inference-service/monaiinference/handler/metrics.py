@@ -0,0 +1,205 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+PHASE_BATCH = "batch"
+PHASE_COMPRESS = "compress"
+PHASE_EXTRACT = "extract"
+PHASE_HASH = "hash"
+PHASE_MODEL = "model"
+PHASE_POD_CREATE = "pod_create"
+PHASE_POD_DELETE = "pod_delete"
+PHASE_POD_PENDING = "pod_pending"
+PHASE_POD_RUNNING = "pod_running"
+PHASE_QUEUE = "queue"
+PHASE_SHARD = "shard"
+PHASE_STREAM = "stream"
+PHASE_UPLOAD = "upload"
+
+PAYLOAD_INPUT = "input"
+PAYLOAD_OUTPUT = "output"
+
+POD_START_COLD = "cold"
+POD_START_WARM = "warm"
+
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 300)
+PAYLOAD_BUCKETS = tuple(1024 * 4 ** i for i in range(13))
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+PHASE_DURATION = Histogram('mis_phase_duration_seconds', 'Duration of the phases of inference requests',
+                           ['phase'], buckets=PHASE_BUCKETS)
+REQUESTS = Counter('mis_requests_total', 'Inference requests by outcome', ['outcome'])
+ADMISSION_REJECTIONS = Counter('mis_admission_rejections_total',
+                               'Inference requests rejected before their upload, by reason', ['reason'])
+PAYLOAD_SIZE = Histogram('mis_payload_bytes', 'Size of extracted input payloads and output payload .zip files',
+                         ['direction'], buckets=PAYLOAD_BUCKETS)
+QUEUE_DEPTH = Gauge('mis_queue_depth', 'Inference requests waiting for a free slot')
+QUEUE_WAIT = Histogram('mis_queue_wait_seconds', 'Time inference requests waited for a free slot, by priority class',
+                       ['priority'], buckets=PHASE_BUCKETS)
+BATCH_SIZE = Histogram('mis_batch_size', 'Number of inference requests run by one MAP pod in batching mode',
+                       buckets=BATCH_BUCKETS)
+POD_START = Histogram('mis_pod_start_seconds',
+                      'Time until a MAP pod starts to run an inference request, in a new (cold) or pre-started '
+                      '(warm) pod', ['start'], buckets=PHASE_BUCKETS)
+IN_FLIGHT = Gauge('mis_in_flight_pods', 'Inference requests holding a slot to run a MAP pod')
+TRASH_BACKLOG = Gauge('mis_payload_trash_backlog',
+                      'Discarded payload directories waiting to be deleted in the background')
+RECONCILED_RESOURCES = Counter('mis_reconciled_resources_total',
+                               'Stale pods, Persistent Volumes and Persistent Volume Claims deleted, by kind',
+                               ['kind'])
+
+logger = logging.getLogger('MIS_Metrics')
+
+
+class RequestTimings:
+    """Class that records the duration of each phase of an inference request, both into the phase
+    histogram and into a per-request breakdown."""
+
+    def __init__(self, observe: bool = True):
+        """Constructor of the RequestTimings class
+
+        Args:
+            observe (bool, optional): Record phases into the phase histogram. Timings shared by several
+            requests are not, and are recorded into the timings of each request instead. Defaults to True.
+        """
+        self._phases = OrderedDict()
+        self._observe = observe
+
+    def record(self, phase: str, seconds: float):
+        """Record the duration of a phase. Durations of repeated phases are added up.
+
+        Args:
+            phase (str): Name of the phase
+            seconds (float): Duration of the phase in seconds
+        """
+        if self._observe:
+            PHASE_DURATION.labels(phase).observe(seconds)
+        self._phases[phase] = self._phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase: str):
+        """Context manager which records the time spent in its body as the duration of a phase.
+
+        Args:
+            phase (str): Name of the phase
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(phase, time.monotonic() - start)
+
+    def to_dict(self) -> dict:
+        """Returns the recorded phases
+
+        Returns:
+            dict: Duration in seconds of each recorded phase, in the order the phases were first recorded
+        """
+        return dict(self._phases)
+
+    def server_timing(self) -> str:
+        """Returns the recorded phases as the value of a `Server-Timing` HTTP header
+
+        Returns:
+            str: Comma separated phases with their duration in milliseconds
+        """
+        return ", ".join(f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in self._phases.items())
+
+
+def time_phase(timings: Optional[RequestTimings], phase: str):
+    """Context manager which records the duration of a phase, or does nothing if timings is None.
+
+    Args:
+        timings (Optional[RequestTimings]): Timings of the request the phase belongs to
+        phase (str): Name of the phase
+    """
+    return timings.phase(phase) if timings is not None else nullcontext()
+
+
+def record_payload_size(direction: str, size: int):
+    """Record the size of a payload.
+
+    Args:
+        direction (str): Either `input` for extracted input payloads or `output` for output payload .zip files
+        size (int): Size of the payload in bytes
+    """
+    PAYLOAD_SIZE.labels(direction).observe(size)
+
+
+def record_admission_rejection(reason: str):
+    """Count an inference request rejected by admission control.
+
+    Args:
+        reason (str): Reason of the rejection
+    """
+    ADMISSION_REJECTIONS.labels(reason).inc()
+
+
+def record_queue_wait(priority: str, seconds: float):
+    """Record the time an inference request waited for a free slot.
+
+    Args:
+        priority (str): Name of the priority class of the request
+        seconds (float): Time waited in seconds, including waits which ended in a rejection
+    """
+    QUEUE_WAIT.labels(priority).observe(seconds)
+
+
+def record_pod_start(start: str, seconds: float):
+    """Record the time until a MAP pod started to run an inference request.
+
+    Args:
+        start (str): Either `cold` for a new pod, from its creation until it is running,
+        or `warm` for a pre-started pod, from its acquisition until it picked up the trigger of the run
+        seconds (float): Time in seconds until the MAP started
+    """
+    POD_START.labels(start).observe(seconds)
+
+
+def record_batch_size(size: int):
+    """Record the number of inference requests run by one MAP pod in batching mode.
+
+    Args:
+        size (int): Number of requests in the batch
+    """
+    BATCH_SIZE.observe(size)
+
+
+def record_outcome(outcome: str):
+    """Count an inference request by its outcome.
+
+    Args:
+        outcome (str): Outcome of the request, the name of the final `PodStatus` of its MAP pod,
+        or one of `Cached`, `Rejected`, `Cancelled` and `Error`
+    """
+    REQUESTS.labels(outcome).inc()
+
+
+def log_request(request_id: str, outcome: str, timings: RequestTimings, **fields):
+    """Write the phase breakdown of an inference request as a single structured log line.
+
+    Args:
+        request_id (str): Identifier of the request
+        outcome (str): Outcome of the request, as counted by `record_outcome`
+        timings (RequestTimings): Recorded phases of the request
+        **fields: Additional fields of the log line
+    """
+    logger.info(json.dumps({"request_id": request_id, "outcome": outcome,
+                            "phases": {phase: round(seconds, 6) for phase, seconds in timings.to_dict().items()},
+                            **fields}))
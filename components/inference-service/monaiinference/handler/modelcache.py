@@ -0,0 +1,428 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tarfile
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.metrics import PHASE_MODEL, RequestTimings, time_phase
+
+CHECKSUM_PATTERN = re.compile(r'^[0-9a-fA-F]{64}$')
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+MEGABYTE = 1024 * 1024
+METADATA_SUFFIX = ".json"
+# Models are fetched and extracted into temporary directories, which are moved into place once complete.
+TEMP_PREFIX = ".tmp-"
+# Sources with these extensions are extracted, any other source is kept as a single file, such as a
+# TorchScript model, which must not be extracted even though it is a .zip file.
+TAR_EXTENSIONS = (".tar", ".tar.gz", ".tgz")
+URL_SCHEMES = ("http", "https", "file")
+ZIP_EXTENSIONS = (".zip",)
+# Time in seconds between attempts to warm models which could not be fetched.
+WARM_RETRY_INTERVAL = 60
+
+logger = logging.getLogger('MIS_ModelCache')
+
+
+class ModelCacheError(Exception):
+    """Raised when a model can not be fetched, verified or extracted into the model cache."""
+
+
+class ModelEntry:
+    """Class that defines object to store the size and users of a cached model"""
+
+    def __init__(self, source: str, checksum: str, size: int):
+        """Constructor of the ModelEntry class
+
+        Args:
+            source (str): Path or URL the model was fetched from
+            checksum (str): SHA-256 checksum of the fetched model file
+            size (int): Size in bytes of the extracted model directory
+        """
+        self.source = source
+        self.checksum = checksum
+        self.size = size
+        # Number of MAP pods which mount the model, which is not evicted while it is in use.
+        self.users = 0
+
+
+class ModelCache:
+    """Class that keeps the models of MAPs in a host directory which MAP pods mount read-only at their model
+    path, so that MAP pods neither download their model nor carry it in their image. Each model version is
+    fetched once, verified by its SHA-256 checksum, and kept across restarts until it is evicted in least
+    recently used order to stay within a disk budget."""
+
+    def __init__(self, cache_path: str, max_size: int, retry_interval: float = WARM_RETRY_INTERVAL):
+        """Constructor of the ModelCache class
+
+        Args:
+            cache_path (str): Absolute path of the directory which stores cached models, which must be the same
+            on the host as in the container of MONAI Inference Service
+            max_size (int): Maximum total size in Megabytes of cached models, 0 for no limit
+            retry_interval (float, optional): Time in seconds between attempts to warm models which could not
+            be fetched. Defaults to 60.
+        """
+        self._cache_path = cache_path
+        self._max_size = max_size * MEGABYTE
+        self._retry_interval = retry_interval
+
+        self._entries: Dict[str, ModelEntry] = OrderedDict()
+        self._size = 0
+        self._lock = Lock()
+        # One lock per model, so that concurrent MAP pods of a model wait for it to be fetched once.
+        self._fetch_locks: Dict[str, Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._warm_configs: List[ServerConfig] = []
+        self._wakeup = Event()
+        self._stopped = Event()
+
+        os.makedirs(self._cache_path, exist_ok=True)
+        self.__load()
+
+    @staticmethod
+    def make_key(config: ServerConfig) -> Optional[str]:
+        """Derive the cache key of the model of a MAP. Models with a checksum are keyed on it, so that MAPs
+        which fetch the same model from different sources share it.
+
+        Args:
+            config (ServerConfig): Configuration of the MAP
+
+        Returns:
+            Optional[str]: Cache key, None if the MAP has no model source.
+        """
+        if not config.map_model_source:
+            return None
+        if config.map_model_checksum:
+            return config.map_model_checksum.lower()
+        return hashlib.sha256(config.map_model_source.encode('utf-8')).hexdigest()
+
+    @property
+    def stats(self) -> dict:
+        """Statistics of the cache, including hit and miss counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_size_bytes": self._max_size,
+                "in_use": sum(1 for entry in self._entries.values() if entry.users > 0),
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def is_cached(self, config: ServerConfig) -> bool:
+        """Returns whether the model of a MAP is cached, or the MAP has no model source
+
+        Args:
+            config (ServerConfig): Configuration of the MAP
+
+        Returns:
+            bool: True if a MAP pod of the MAP can mount its model right away
+        """
+        key = self.make_key(config)
+        with self._lock:
+            return key is None or key in self._entries
+
+    def acquire(self, config: ServerConfig, timings: Optional[RequestTimings] = None) -> Optional[str]:
+        """Fetch the model of a MAP into the cache unless it is cached, and keep it from being evicted until
+        it is released.
+
+        Args:
+            config (ServerConfig): Configuration of the MAP
+            timings (Optional[RequestTimings], optional): Timings of the request, which records the time
+            spent fetching the model. Defaults to None.
+
+        Returns:
+            Optional[str]: Path of the model directory, to mount read-only at the model path of the MAP,
+            None if the MAP has no model source.
+
+        Raises:
+            ModelCacheError: If the model can not be fetched, does not match its checksum or can not be extracted.
+        """
+        key = self.make_key(config)
+        if key is None:
+            return None
+
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(key, Lock())
+
+        with fetch_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.__use(key, entry)
+                    self._hits += 1
+                    return self.__entry_path(key)
+                self._misses += 1
+
+            with time_phase(timings, PHASE_MODEL):
+                entry = self.__fetch(key, config.map_model_source, config.map_model_checksum)
+
+            with self._lock:
+                self._entries[key] = entry
+                self._size += entry.size
+                self.__use(key, entry)
+                evicted = self.__evict()
+
+        self.__delete(evicted)
+        return self.__entry_path(key)
+
+    def release(self, config: ServerConfig):
+        """Release the model of a MAP acquired through `acquire`, once the MAP pod which mounted it is deleted.
+
+        Args:
+            config (ServerConfig): Configuration of the MAP
+        """
+        key = self.make_key(config)
+        with self._lock:
+            entry = self._entries.get(key) if key is not None else None
+            if entry is None:
+                return
+            entry.users = max(entry.users - 1, 0)
+            # Models in use may have kept the cache above its budget.
+            evicted = self.__evict()
+
+        self.__delete(evicted)
+
+    def purge(self):
+        """Remove all cached models which are not in use."""
+        with self._lock:
+            evicted = [self.__remove(key) for key, entry in list(self._entries.items()) if entry.users == 0]
+
+        self.__delete(evicted)
+        logger.info('Purged model cache')
+
+    def set_models(self, configs: List[ServerConfig]):
+        """Warm the cache with the models of MAPs in the background, so that the first inference requests
+        of a MAP do not wait for its model to be fetched.
+
+        Args:
+            configs (List[ServerConfig]): Configurations of the MAPs
+        """
+        with self._lock:
+            self._warm_configs = [config for config in configs if config.map_model_source]
+        self._wakeup.set()
+
+    def start(self):
+        """Start warming the cache with the models set through `set_models`."""
+        Thread(target=self.__run, name='MIS_ModelCache', daemon=True).start()
+
+    def shutdown(self):
+        """Stop warming the cache."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def __run(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                configs = list(self._warm_configs)
+
+            failed = False
+            for config in configs:
+                if self._stopped.is_set():
+                    return
+                if self.is_cached(config):
+                    continue
+                try:
+                    self.acquire(config)
+                    self.release(config)
+                except Exception as e:
+                    logger.error(f'Failed to warm model {config.map_model_source}, retrying later: {e}')
+                    failed = True
+
+            self._wakeup.wait(self._retry_interval if failed else None)
+            self._wakeup.clear()
+
+    def __load(self):
+        # Index the models kept by a previous run, and remove partial downloads and models without metadata.
+        loaded = []
+        for name in os.listdir(self._cache_path):
+            path = os.path.join(self._cache_path, name)
+            if name.startswith(TEMP_PREFIX):
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            if not name.endswith(METADATA_SUFFIX):
+                if not os.path.exists(path + METADATA_SUFFIX):
+                    shutil.rmtree(path, ignore_errors=True)
+                continue
+
+            key = name[:-len(METADATA_SUFFIX)]
+            try:
+                with open(path) as f:
+                    metadata = json.load(f)
+                if not os.path.isdir(self.__entry_path(key)):
+                    raise ValueError(f'Model directory of {key} is missing')
+                entry = ModelEntry(metadata["source"], metadata["checksum"], int(metadata["size"]))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f'Discarding cached model {key}: {e}')
+                os.remove(path)
+                shutil.rmtree(self.__entry_path(key), ignore_errors=True)
+                continue
+            # The metadata file is touched each time the model is used, which orders models by last use.
+            loaded.append((os.path.getmtime(path), key, entry))
+
+        with self._lock:
+            for _, key, entry in sorted(loaded, key=lambda item: item[0]):
+                self._entries[key] = entry
+                self._size += entry.size
+            evicted = self.__evict()
+
+        self.__delete(evicted)
+        if loaded:
+            logger.info(f'Loaded {len(self._entries)} cached models of {self._size} bytes')
+
+    def __entry_path(self, key: str) -> str:
+        return os.path.join(self._cache_path, key)
+
+    def __use(self, key: str, entry: ModelEntry):
+        # Must be called with the lock held.
+        entry.users += 1
+        self._entries.move_to_end(key)
+        try:
+            os.utime(self.__entry_path(key) + METADATA_SUFFIX)
+        except OSError as e:
+            logger.warning(f'Failed to record use of cached model {key}: {e}')
+
+    def __evict(self) -> List[str]:
+        # Must be called with the lock held. Evicts unused models in least recently used order until the cache
+        # is within its budget, and returns the directories to delete once the lock is released.
+        evicted = []
+        if (self._max_size <= 0):
+            return evicted
+
+        for key in list(self._entries):
+            if (self._size <= self._max_size):
+                break
+            if (self._entries[key].users == 0):
+                evicted.append(self.__remove(key))
+
+        if (self._size > self._max_size):
+            logger.warning(f'Cached models in use take {self._size} bytes, exceeding the model cache size')
+        return evicted
+
+    def __remove(self, key: str) -> str:
+        # Must be called with the lock held. The model directory is moved aside, so that it is deleted without
+        # holding the lock while a new version of the same model can be fetched.
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+        removed_path = os.path.join(self._cache_path, f'{TEMP_PREFIX}{key}-{uuid.uuid4().hex}')
+        try:
+            os.remove(self.__entry_path(key) + METADATA_SUFFIX)
+            os.rename(self.__entry_path(key), removed_path)
+        except OSError as e:
+            logger.error(e, exc_info=True)
+
+        logger.info(f'Evicted cached model {key} of {entry.size} bytes')
+        return removed_path
+
+    @staticmethod
+    def __delete(paths: List[str]):
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def __fetch(self, key: str, source: str, checksum: Optional[str]) -> ModelEntry:
+        # Download or copy the model file, verify its checksum and extract it into the model directory.
+        temp_path = os.path.join(self._cache_path, f'{TEMP_PREFIX}{key}-{uuid.uuid4().hex}')
+        os.makedirs(temp_path)
+        start_time = time.monotonic()
+
+        try:
+            file_name = os.path.basename(urlparse(source).path if self.__is_url(source) else source) or "model"
+            download_path = os.path.join(temp_path, file_name)
+            digest = self.__download(source, download_path)
+            if checksum and digest != checksum.lower():
+                raise ModelCacheError(f'Model {source} has checksum {digest}, expected {checksum.lower()}')
+
+            model_path = os.path.join(temp_path, "model")
+            os.makedirs(model_path)
+            self.__unpack(download_path, file_name, model_path)
+
+            size = 0
+            for dir_path, dir_names, file_names in os.walk(model_path):
+                # MAP containers may run as any user, and only read their model.
+                os.chmod(dir_path, 0o755)
+                for name in file_names:
+                    os.chmod(os.path.join(dir_path, name), 0o644)
+                    size += os.path.getsize(os.path.join(dir_path, name))
+
+            entry = ModelEntry(source, digest, size)
+            os.rename(model_path, self.__entry_path(key))
+            with open(self.__entry_path(key) + METADATA_SUFFIX, 'w') as f:
+                json.dump({"source": source, "checksum": digest, "size": size}, f)
+        except ModelCacheError:
+            raise
+        except Exception as e:
+            raise ModelCacheError(f'Failed to fetch model {source}: {e}') from e
+        finally:
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+        logger.info(f'Cached model {source} of {size} bytes in {time.monotonic() - start_time:.3f} seconds')
+        return entry
+
+    @staticmethod
+    def __is_url(source: str) -> bool:
+        return urlparse(source).scheme in URL_SCHEMES
+
+    def __download(self, source: str, target_path: str) -> str:
+        # Returns the SHA-256 checksum of the model file, computed as it is written.
+        digest = hashlib.sha256()
+        src = urlopen(source, timeout=DOWNLOAD_TIMEOUT) if self.__is_url(source) else open(source, 'rb')
+        with src, open(target_path, 'wb') as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+
+        return digest.hexdigest()
+
+    @staticmethod
+    def __unpack(file_path: str, file_name: str, model_path: str):
+        lower_name = file_name.lower()
+        root = os.path.realpath(model_path)
+
+        def check_member(name: str):
+            # Archive members must not escape the model directory.
+            member_path = os.path.realpath(os.path.join(root, name))
+            if os.path.commonpath([root, member_path]) != root:
+                raise ModelCacheError(f'Model archive {file_name} has a member outside of its root: {name}')
+
+        if lower_name.endswith(ZIP_EXTENSIONS):
+            with zipfile.ZipFile(file_path) as zip_file:
+                for name in zip_file.namelist():
+                    check_member(name)
+                zip_file.extractall(model_path)
+        elif lower_name.endswith(TAR_EXTENSIONS):
+            with tarfile.open(file_path, 'r:*') as tar_file:
+                members = []
+                for member in tar_file.getmembers():
+                    check_member(member.name)
+                    # Links and devices are skipped, a model consists of regular files and directories.
+                    if member.isfile() or member.isdir():
+                        members.append(member)
+                tar_file.extractall(model_path, members=members)
+        else:
+            os.rename(file_path, os.path.join(model_path, file_name))
@@ -9,104 +9,812 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import hashlib
+import io
 import logging
 import os
 import shutil
+import tarfile
+import time
 import zipfile
 from pathlib import Path
+from threading import Lock
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
 
 from fastapi import File, UploadFile
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+
+from monaiinference.handler.codec import ParallelZipCodec, write_members
+from monaiinference.handler.metrics import (PAYLOAD_INPUT, PAYLOAD_OUTPUT, PHASE_COMPRESS, PHASE_EXTRACT, PHASE_HASH,
+                                            PHASE_UPLOAD, RequestTimings, record_payload_size, time_phase)
+from monaiinference.handler.reaper import PayloadReaper
+from monaiinference.handler.sharding import SHARD_RULE_SUBDIRECTORY, ShardPolicy
+
+CHUNK_SIZE = 1024 * 1024
+COMPRESSED_FILE_EXTENSIONS = ('.7z', '.bz2', '.gz', '.jp2', '.jpeg', '.jpg', '.png', '.xz', '.zip')
+MEGABYTE = 1024 * 1024
+OUTPUT_FORMAT_TAR = 'tar'
+OUTPUT_FORMAT_ZIP = 'zip'
+OUTPUT_TAR_NAME = 'output.tar'
+OUTPUT_ZIP_NAME = 'output.zip'
+# Prefix of the output sub-directory of each shard, when the outputs of the shards of a payload overlap.
+SHARD_OUTPUT_PREFIX = 'shard-'
+TAR_CONTENT_TYPES = ('application/tar', 'application/x-tar')
 
 logger = logging.getLogger('MIS_Payload')
 
 
+class InvalidPayloadError(Exception):
+    """Raised when an input payload is not a valid .zip file or contains unsafe member paths."""
+
+
+class PayloadTooLargeError(Exception):
+    """Raised when an input payload exceeds the configured size or member count limits."""
+
+
+class InputStream(io.RawIOBase):
+    """Uncompressed .tar input payload which is extracted while it is read from the body of a request.
+    It is read from a thread outside of the event loop, each read waiting for the next chunk of the body
+    on the event loop, so that the body is never written to disk or held in memory as a whole."""
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop, filename: str = 'input.tar'):
+        """Constructor of the InputStream class
+
+        Args:
+            chunks (AsyncIterator[bytes]): Chunks of the body of the request
+            loop (asyncio.AbstractEventLoop): Event loop which receives the body
+            filename (str, optional): Name of the payload in log messages. Defaults to 'input.tar'.
+        """
+        self.filename = filename
+        self._chunks = chunks
+        self._loop = loop
+        self._pending = b''
+        self._digest = hashlib.sha256()
+        self._finished = False
+
+    @property
+    def digest(self) -> str:
+        """Hexadecimal SHA-256 digest of the bytes read so far, of the whole payload once it is extracted."""
+        return self._digest.hexdigest()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._pending and not self._finished:
+            try:
+                self._pending = asyncio.run_coroutine_threadsafe(self._chunks.__anext__(), self._loop).result()
+            except StopAsyncIteration:
+                self._finished = True
+
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        self._digest.update(self._pending[:size])
+        self._pending = self._pending[size:]
+        return size
+
+
+class InputReference:
+    """Input payload referenced by the path of a directory under an allowed host path, which the
+    MAP pod mounts read-only as its input directory instead of a copy of the files."""
+
+    def __init__(self, path: str):
+        """Constructor of the InputReference class
+
+        Args:
+            path (str): Absolute path of the directory, on the host and in the MIS container
+        """
+        self.path = path
+
+
 class PayloadProvider:
     """Class to handle interactions with payload I/O and Monai Inference Service
     shared volumes"""
 
-    def __init__(self, host_path: str, input_path: str, output_path: str):
+    def __init__(self, host_path: str, input_path: str, output_path: str,
+                 max_input_size: int = 0, max_input_files: int = 0, output_compression_level: int = 6,
+                 clean_host_path: bool = True, codec: Optional[ParallelZipCodec] = None,
+                 reaper: Optional[PayloadReaper] = None, input_roots: Optional[List[str]] = None):
         """Constructor for Payload Provider class
 
         Args:
             host_path (str): Absolute path of shared volume for payloads
             input_path (str): Relative path of input sub-directory within shared volume for payloads
             output_path (str): Relative path of input sub-directory within shared volume for payloads
+            max_input_size (int, optional): Maximum total size in Megabytes of an extracted input payload,
+            0 for no limit. Defaults to 0.
+            max_input_files (int, optional): Maximum number of members of an input payload .zip file,
+            0 for no limit. Defaults to 0.
+            output_compression_level (int, optional): DEFLATE compression level from 1 to 9 of the
+            output payload .zip file, 0 to store files uncompressed. Defaults to 6.
+            clean_host_path (bool, optional): Delete leftover payloads in the shared volume. Providers which
+            share the volume with another provider leave it to that provider. Defaults to True.
+            codec (Optional[ParallelZipCodec], optional): Codec which extracts and compresses members of
+            payloads in parallel, None to process them one at a time. Defaults to None.
+            reaper (Optional[PayloadReaper], optional): Reaper which deletes discarded payloads in the background,
+            None to delete them before returning. Defaults to None.
+            input_roots (Optional[List[str]], optional): Host paths under which directories may be referenced as
+            input payloads, None to only accept uploaded input payloads. Defaults to None.
         """
         self._host_path = host_path
         self._input_path = input_path.strip('/')
         self._output_path = output_path.strip('/')
+        self._max_input_size = max_input_size * MEGABYTE
+        self._max_input_files = max_input_files
+        self._output_compression_level = output_compression_level
+        self._codec = codec
+        self._reaper = reaper
+        self._input_roots = [os.path.realpath(root) for root in input_roots or []]
+
+        if clean_host_path:
+            self.discard_directory_content(self._host_path)
+
+    def prepare_payload_directory(self, payload_id: str):
+        """Creates input and output directories of a payload, writable by the MAP container
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+        """
+        for path in (self._input_path, self._output_path):
+            abs_path = Path(os.path.join(self._host_path, payload_id, path))
+            abs_path.mkdir(parents=True, exist_ok=True)
+            os.chmod(abs_path, 0o777)
+
+    def get_payload_path(self, payload_id: str) -> str:
+        """Returns absolute path of a payload directory within the shared volume
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+
+        Returns:
+            str: Absolute path of the payload directory
+        """
+        return os.path.join(self._host_path, payload_id)
+
+    def delete_payload(self, payload_id: str):
+        """Deletes a payload directory and all of its content from the shared volume
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+        """
+        if self._reaper is not None:
+            self._reaper.discard(os.path.join(self._host_path, payload_id))
+        else:
+            shutil.rmtree(os.path.join(self._host_path, payload_id), ignore_errors=True)
+        logger.info(f'Deleted payload {payload_id}')
+
+    def move_input_payload(self, source_id: str, target_id: str):
+        """Moves the content of the input directory of a payload into the input directory of another payload
+
+        Args:
+            source_id (str): Identifier of the payload directory the input is moved from
+            target_id (str): Identifier of the payload directory the input is moved to
+        """
+        self.__move_directory_content(os.path.join(self._host_path, source_id, self._input_path),
+                                      os.path.join(self._host_path, target_id, self._input_path))
+
+    def move_output_payload(self, source_id: str, target_id: str):
+        """Moves the content of the output directory of a payload into the output directory of another payload
+
+        Args:
+            source_id (str): Identifier of the payload directory the output is moved from
+            target_id (str): Identifier of the payload directory the output is moved to
+        """
+        self.__move_directory_content(os.path.join(self._host_path, source_id, self._output_path),
+                                      os.path.join(self._host_path, target_id, self._output_path))
+
+    def move_input_payloads_to_batch(self, source_ids: List[str], batch_id: str):
+        """Moves the input directories of several payloads into sub-directories, named after each payload,
+        of the input directory of a batch payload. Content left in the batch payload by a previous run is deleted.
+
+        Args:
+            source_ids (List[str]): Identifiers of the payload directories the inputs are moved from
+            batch_id (str): Identifier of the payload directory mounted by the MAP pod of the batch
+        """
+        self.prepare_payload_directory(batch_id)
+        abs_input_path = os.path.join(self._host_path, batch_id, self._input_path)
+        self.discard_directory_content(abs_input_path)
+        self.discard_directory_content(os.path.join(self._host_path, batch_id, self._output_path))
+
+        for source_id in source_ids:
+            os.rename(os.path.join(self._host_path, source_id, self._input_path),
+                      os.path.join(abs_input_path, source_id))
+
+    def move_output_payload_from_batch(self, batch_id: str, target_id: str) -> bool:
+        """Moves the content of the sub-directory named after a payload, of the output directory of a batch
+        payload, into the output directory of the payload
+
+        Args:
+            batch_id (str): Identifier of the payload directory mounted by the MAP pod of the batch
+            target_id (str): Identifier of the payload directory the output is moved to
+
+        Returns:
+            bool: True if the MAP wrote an output sub-directory for the payload, False otherwise
+        """
+        source_path = os.path.join(self._host_path, batch_id, self._output_path, target_id)
+        if not os.path.isdir(source_path):
+            return False
+
+        self.__move_directory_content(source_path, os.path.join(self._host_path, target_id, self._output_path))
+        return True
+
+    def split_input_payload(self, payload_id: str, shard_ids: List[str], rule: str) -> List[Tuple[str, int]]:
+        """Moves the input directory content of a payload into the input directories of shard payloads,
+        so that the shards are of similar size
+
+        Args:
+            payload_id (str): Identifier of the payload directory the input is moved from
+            shard_ids (List[str]): Identifiers of the payload directories of the shards, at most one of
+            which is created for each unit of the input
+            rule (str): Either `subdirectory`, which keeps each top-level entry of the input in one shard,
+            or `size`, which spreads the files of the input individually, keeping their relative paths
+
+        Returns:
+            List[Tuple[str, int]]: Identifier and input size in bytes of each created shard, empty if the input
+            has fewer than two units, in which case it is left in place.
+        """
+        abs_input_path = os.path.join(self._host_path, payload_id, self._input_path)
+        if (rule == SHARD_RULE_SUBDIRECTORY):
+            units = [(f, self.__directory_size(os.path.join(abs_input_path, f))) for f in os.listdir(abs_input_path)]
+        else:
+            units = []
+            for root, _, files in os.walk(abs_input_path):
+                for f in files:
+                    abs_file_path = os.path.join(root, f)
+                    units.append((os.path.relpath(abs_file_path, abs_input_path), os.lstat(abs_file_path).st_size))
+
+        if len(units) < 2:
+            return []
+
+        shards = []
+        for shard_id, (paths, size) in zip(shard_ids, ShardPolicy.balance(units, len(shard_ids))):
+            self.prepare_payload_directory(shard_id)
+            shard_input_path = os.path.join(self._host_path, shard_id, self._input_path)
+            for path in paths:
+                target_path = os.path.join(shard_input_path, path)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.rename(os.path.join(abs_input_path, path), target_path)
+            shards.append((shard_id, size))
+
+        return shards
+
+    def merge_output_payloads(self, shard_ids: List[str], target_id: str) -> bool:
+        """Moves the output directory content of shard payloads into the output directory of a payload.
+        Directories written by several shards are merged. If several shards wrote an output file of the same
+        path, the output of each shard is instead moved into its own sub-directory, named `shard-<index>`
+        after the position of the shard in `shard_ids`, so that no output is lost.
+
+        Args:
+            shard_ids (List[str]): Identifiers of the payload directories of the shards
+            target_id (str): Identifier of the payload directory the outputs are moved to
+
+        Returns:
+            bool: True if the outputs were merged, False if they were moved into one sub-directory per shard
+        """
+        abs_output_path = os.path.join(self._host_path, target_id, self._output_path)
+        self.discard_directory_content(abs_output_path)
+        shard_output_paths = [os.path.join(self._host_path, shard_id, self._output_path) for shard_id in shard_ids]
+
+        # Overlaps are found before anything is moved, so that the output is either merged or separated as a whole.
+        files = set()
+        directories = set()
+        overlapping = False
+        for shard_output_path in shard_output_paths:
+            shard_files, shard_directories = self.__output_entries(shard_output_path)
+            if (shard_files & (files | directories)) or (shard_directories & files):
+                overlapping = True
+                break
+            files |= shard_files
+            directories |= shard_directories
+
+        if not overlapping:
+            for shard_output_path in shard_output_paths:
+                self.__merge_directory(shard_output_path, abs_output_path)
+            return True
+
+        logger.warning(f'Several shards of payload {target_id} wrote the same output, '
+                       f'moving the output of each shard into its own sub-directory')
+        for index, shard_output_path in enumerate(shard_output_paths):
+            shard_target_path = os.path.join(abs_output_path, f'{SHARD_OUTPUT_PREFIX}{index}')
+            os.makedirs(shard_target_path)
+            self.__merge_directory(shard_output_path, shard_target_path)
+        return False
+
+    def discard_input_payload(self, payload_id: str):
+        """Deletes the content of the input directory of a payload, such as once the MAP has run over it
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+        """
+        self.discard_directory_content(os.path.join(self._host_path, payload_id, self._input_path))
+
+    def discard_output_payload(self, payload_id: str):
+        """Deletes the content of the output directory of a payload, such as before the MAP runs again
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+        """
+        self.discard_directory_content(os.path.join(self._host_path, payload_id, self._output_path))
+
+    @staticmethod
+    def __directory_size(path: str) -> int:
+        if not os.path.isdir(path) or os.path.islink(path):
+            return os.lstat(path).st_size
+        return sum(os.lstat(os.path.join(root, f)).st_size for root, _, files in os.walk(path) for f in files)
+
+    @staticmethod
+    def __output_entries(path: str) -> Tuple[set, set]:
+        # Relative paths of the files, including links, and of the directories under an output directory.
+        files = set()
+        directories = set()
+        for root, dir_names, file_names in os.walk(path):
+            relative_root = os.path.relpath(root, path)
+            for name in dir_names:
+                # Links to directories are moved as they are, like files.
+                entries = files if os.path.islink(os.path.join(root, name)) else directories
+                entries.add(os.path.normpath(os.path.join(relative_root, name)))
+            for name in file_names:
+                files.add(os.path.normpath(os.path.join(relative_root, name)))
+        return files, directories
+
+    @staticmethod
+    def __merge_directory(source_path: str, target_path: str):
+        # Entries missing from the target are moved as a whole, directories present in both are merged.
+        for f in os.listdir(source_path):
+            source_entry = os.path.join(source_path, f)
+            target_entry = os.path.join(target_path, f)
+            if not os.path.lexists(target_entry):
+                os.rename(source_entry, target_entry)
+            else:
+                PayloadProvider.__merge_directory(source_entry, target_entry)
+
+    def __move_directory_content(self, source_path: str, target_path: str):
+        # Entries are renamed one by one, since the target directory itself may be mounted into a pod.
+        self.discard_directory_content(target_path)
+        for f in os.listdir(source_path):
+            os.rename(os.path.join(source_path, f), os.path.join(target_path, f))
 
-        PayloadProvider.clean_directory(self._host_path)
+    @staticmethod
+    def hash_input_payload(file: UploadFile=File(...), timings: Optional[RequestTimings] = None) -> str:
+        """Computes the SHA-256 digest of an input payload .zip file, reading it in fixed-size chunks
 
-        abs_input_path = Path(os.path.join(self._host_path, self._input_path))
-        abs_input_path.mkdir(parents=True, exist_ok=True)
-        os.chmod(abs_input_path, 0o777)
+        Args:
+            file (UploadFile, optional): .zip file provided by user. Defaults to File(...).
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
 
-        abs_output_path = Path(os.path.join(self._host_path, self._output_path))
-        abs_output_path.mkdir(parents=True, exist_ok=True)
-        os.chmod(abs_output_path, 0o777)
+        Returns:
+            str: Hexadecimal SHA-256 digest of the file
+        """
+        digest = hashlib.sha256()
+        with time_phase(timings, PHASE_HASH):
+            file.file.seek(0)
+            while True:
+                chunk = file.file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+            file.file.seek(0)
 
+        return digest.hexdigest()
 
-    def upload_input_payload(self, file: UploadFile=File(...)):
-        """Uploads and extracts input payload .zip provided by user to input folder within MIS container
+    def upload_input_payload(self, payload_id: str, file: Union[UploadFile, InputStream] = File(...),
+                             timings: Optional[RequestTimings] = None) -> int:
+        """Uploads and extracts input payload .zip or .tar provided by user to input folder within MIS container
 
         Args:
-            file (UploadFile, optional): .zip file provided by user to be moved
-            and extracted in shared volume directory for input payloads. Defaults to File(...).
+            payload_id (str): Identifier of the payload directory within the shared volume
+            file (Union[UploadFile, InputStream], optional): .zip or .tar file provided by user to be moved
+            and extracted in shared volume directory for input payloads, or .tar stream extracted as it is
+            read. Defaults to File(...).
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
+
+        Returns:
+            int: Total size in bytes of the extracted files.
         """
+        self.prepare_payload_directory(payload_id)
 
-        abs_input_path = os.path.join(self._host_path, self._input_path)
+        abs_input_path = os.path.join(self._host_path, payload_id, self._input_path)
         # Clean input payload directory of any lingering content
-        PayloadProvider.clean_directory(abs_input_path)
+        self.discard_directory_content(abs_input_path)
 
-        abs_output_path = os.path.join(self._host_path, self._output_path)
+        abs_output_path = os.path.join(self._host_path, payload_id, self._output_path)
         # Clean output payload directory of any lingering content
-        PayloadProvider.clean_directory(abs_output_path)
+        self.discard_directory_content(abs_output_path)
+
+        if isinstance(file, InputStream) or PayloadProvider.is_tar(file.filename, file.content_type):
+            return self.__upload_tar(file, abs_input_path, timings)
 
-        # Read contents of .zip file arguement and write it to input payload folder
-        target_path = f'{abs_input_path}/{file.filename}'
-        f = open(f'{target_path}', 'wb')
-        content = file.file.read()
-        f.write(content)
-        f.close()
+        # Extract the upload directly when its spooled file can be read randomly, otherwise
+        # copy it in fixed-size chunks into the payload folder first, so memory use stays bounded.
+        source = file.file
+        target_path = None
+        if not (hasattr(source, 'seekable') and source.seekable()):
+            target_path = os.path.join(self._host_path, payload_id, 'input.zip')
+            with time_phase(timings, PHASE_UPLOAD), open(target_path, 'wb') as f:
+                shutil.copyfileobj(source, f, CHUNK_SIZE)
+            source = target_path
+        else:
+            source.seek(0)
 
-        # Extract contents of .zip into input payload folder
-        with zipfile.ZipFile(target_path, 'r') as zip_ref:
-            zip_ref.extractall(abs_input_path)
+        try:
+            with time_phase(timings, PHASE_EXTRACT):
+                extracted_size, extracted_files = self.__extract_zip(source, abs_input_path)
+        except Exception:
+            self.discard_directory_content(abs_input_path)
+            raise
+        finally:
+            # Remove compressed input payload .zip file
+            if target_path is not None:
+                os.remove(target_path)
 
-        # Remove compressed input payload .zip file
-        os.remove(target_path)
+        record_payload_size(PAYLOAD_INPUT, extracted_size)
+        logger.info(f'Extracted {extracted_files} files ({extracted_size} bytes) of {file.filename} '
+                    f'into {abs_input_path}')
+        return extracted_size
 
-        logger.info(f'Extracted {target_path} into {abs_input_path}')
+    @staticmethod
+    def is_tar(filename: Optional[str], content_type: Optional[str]) -> bool:
+        """Returns whether an uploaded file is a .tar file, from its name or content type
 
-    def stream_output_payload(self) -> FileResponse:
-        """Compresses output payload directory and returns .zip as FileResponse object
+        Args:
+            filename (Optional[str]): Name of the file
+            content_type (Optional[str]): Content type of the file
+
+        Returns:
+            bool: True for .tar files
+        """
+        return ((filename or '').lower().endswith('.tar') or
+                (content_type or '').split(';')[0].strip().lower() in TAR_CONTENT_TYPES)
+
+    def resolve_input_reference(self, reference: InputReference) -> Tuple[str, int]:
+        """Validates a referenced input payload against the allowed host paths
+
+        Args:
+            reference (InputReference): Input payload referenced by its path
+
+        Returns:
+            Tuple[str, int]: Absolute path of the referenced directory, with symbolic links resolved,
+            and the total size in bytes of its files.
+
+        Raises:
+            InvalidPayloadError: If the path is not a directory under one of the allowed host paths.
+        """
+        if not self._input_roots:
+            raise InvalidPayloadError('Input payloads can not be referenced by path, no input roots are configured')
+
+        path = os.path.realpath(reference.path) if os.path.isabs(reference.path) else None
+        if (path is None or not os.path.isdir(path) or
+                not any(os.path.commonpath([root, path]) == root for root in self._input_roots)):
+            raise InvalidPayloadError(f'Input payload path {reference.path} is not a directory under '
+                                      f'one of the input roots')
+
+        # Sizes are only read for adaptive timeouts, the files are neither copied nor limited.
+        size = 0
+        for root_dir, _, files in os.walk(path):
+            for f in files:
+                try:
+                    size += os.stat(os.path.join(root_dir, f)).st_size
+                except OSError:
+                    pass
+
+        logger.info(f'Referenced input payload {path} ({size} bytes)')
+        return path, size
+
+    def __upload_tar(self, file: Union[UploadFile, InputStream], abs_input_path: str,
+                     timings: Optional[RequestTimings]) -> int:
+        source = file if isinstance(file, InputStream) else file.file
+        if not isinstance(file, InputStream):
+            source.seek(0)
+
+        try:
+            # A stream is received while it is extracted, so both count as extraction time.
+            with time_phase(timings, PHASE_EXTRACT):
+                extracted_size, extracted_files = self.__extract_tar(source, abs_input_path)
+        except Exception:
+            self.discard_directory_content(abs_input_path)
+            raise
+
+        record_payload_size(PAYLOAD_INPUT, extracted_size)
+        logger.info(f'Extracted {extracted_files} files ({extracted_size} bytes) of {file.filename} '
+                    f'into {abs_input_path}')
+        return extracted_size
+
+    def __extract_tar(self, source, abs_input_path: str) -> Tuple[int, int]:
+        # Members are read in order from a non-seekable stream, so each member is validated and extracted
+        # before the next one is read. Links and special files are rejected rather than recreated.
+        root_path = os.path.realpath(abs_input_path)
+        extracted_size = 0
+        extracted_files = 0
+
+        try:
+            with tarfile.open(fileobj=source, mode='r|') as tar:
+                for member in tar:
+                    extracted_files += 1
+                    if (self._max_input_files > 0 and extracted_files > self._max_input_files):
+                        raise PayloadTooLargeError(
+                            f'Input payload has more than {self._max_input_files} members')
+
+                    member_path = os.path.realpath(os.path.join(root_path, member.name))
+                    if (os.path.commonpath([root_path, member_path]) != root_path or
+                            (member_path == root_path and not member.isdir())):
+                        raise InvalidPayloadError(f'Input payload member {member.name} is outside of '
+                                                  f'the input directory')
+                    if not (member.isfile() or member.isdir()):
+                        raise InvalidPayloadError(f'Input payload member {member.name} is not a file or directory')
+
+                    # Members may conflict with each other, such as a file followed by a directory of the same name.
+                    try:
+                        if member.isdir():
+                            os.makedirs(member_path, exist_ok=True)
+                            continue
+
+                        os.makedirs(os.path.dirname(member_path), exist_ok=True)
+                        dst = open(member_path, 'wb')
+                    except OSError as e:
+                        raise InvalidPayloadError(f'Input payload member {member.name} can not be created: '
+                                                  f'{e.strerror}') from e
+
+                    src = tar.extractfile(member)
+                    with dst:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+
+                            extracted_size += len(chunk)
+                            if self._max_input_size > 0 and extracted_size > self._max_input_size:
+                                raise PayloadTooLargeError(
+                                    f'Extracted input payload exceeds {self._max_input_size // MEGABYTE} MB')
+                            dst.write(chunk)
+        except tarfile.TarError as e:
+            raise InvalidPayloadError(f'Input payload is not a valid .tar file: {e}') from e
+
+        return extracted_size, extracted_files
+
+    def __extract_zip(self, source, abs_input_path: str) -> Tuple[int, int]:
+        # Extract members one chunk at a time, validating member paths and enforcing limits
+        # on the bytes actually written rather than on the sizes declared in the .zip file.
+        root_path = os.path.realpath(abs_input_path)
+        extracted_size = 0
+        size_lock = Lock()
+        open_lock = Lock()
+
+        def extract_member(item: Tuple[zipfile.ZipInfo, str]):
+            nonlocal extracted_size
+            member, member_path = item
+
+            # Members share the file object of the .zip file, which is only safe to open and close one at a time.
+            try:
+                dst = open(member_path, 'wb')
+            except OSError as e:
+                raise InvalidPayloadError(f'Input payload member {member.filename} can not be created: '
+                                          f'{e.strerror}') from e
+
+            with open_lock:
+                src = zip_ref.open(member)
+            try:
+                with dst:
+                    while True:
+                        chunk = src.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+
+                        with size_lock:
+                            extracted_size += len(chunk)
+                            too_large = self._max_input_size > 0 and extracted_size > self._max_input_size
+                        if too_large:
+                            raise PayloadTooLargeError(
+                                f'Extracted input payload exceeds {self._max_input_size // MEGABYTE} MB')
+                        dst.write(chunk)
+            finally:
+                with open_lock:
+                    src.close()
+
+        try:
+            with zipfile.ZipFile(source, 'r') as zip_ref:
+                members = zip_ref.infolist()
+                if (self._max_input_files > 0 and len(members) > self._max_input_files):
+                    raise PayloadTooLargeError(
+                        f'Input payload has {len(members)} members, the limit is {self._max_input_files}')
+
+                # All member paths are validated before the first member is extracted.
+                file_members = []
+                for member in members:
+                    member_path = os.path.realpath(os.path.join(root_path, member.filename))
+                    if (os.path.commonpath([root_path, member_path]) != root_path or
+                            (member_path == root_path and not member.is_dir())):
+                        raise InvalidPayloadError(f'Input payload member {member.filename} is outside of '
+                                                  f'the input directory')
+
+                    # Members may conflict with each other, such as a file followed by a directory of the same name.
+                    try:
+                        if member.is_dir():
+                            os.makedirs(member_path, exist_ok=True)
+                            continue
+
+                        os.makedirs(os.path.dirname(member_path), exist_ok=True)
+                    except OSError as e:
+                        raise InvalidPayloadError(f'Input payload member {member.filename} can not be created: '
+                                                  f'{e.strerror}') from e
+                    file_members.append((member, member_path))
+
+                if self._codec is not None and len(file_members) > 1:
+                    self._codec.map(extract_member, file_members)
+                else:
+                    for item in file_members:
+                        extract_member(item)
+        except zipfile.BadZipFile as e:
+            raise InvalidPayloadError(f'Input payload is not a valid .zip file: {e}') from e
+
+        return extracted_size, len(members)
+
+    def stream_output_payload(self, payload_id: str, timings: Optional[RequestTimings] = None,
+                              output_format: str = OUTPUT_FORMAT_ZIP) -> StreamingResponse:
+        """Returns the output payload directory as a .zip file which is compressed while it is streamed,
+        or as an uncompressed .tar file
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
+            output_format (str, optional): Either `zip` or `tar`. Defaults to `zip`.
+
+        Returns:
+            StreamingResponse: Asynchronous object for FastAPI to stream a compressed .zip or uncompressed .tar
+            folder with the output payload from running the MONAI Application Package
+        """
+        abs_output_path = os.path.join(self._host_path, payload_id, self._output_path)
+
+        if (output_format == OUTPUT_FORMAT_TAR):
+            logger.info(f'Returning stream of {abs_output_path} as {OUTPUT_TAR_NAME}')
+            return StreamingResponse(self.__measure_output(self.__generate_output_tar(abs_output_path), None),
+                                     media_type='application/x-tar',
+                                     headers={'Content-Disposition': f'attachment; filename="{OUTPUT_TAR_NAME}"'})
+
+        logger.info(f'Returning stream of {abs_output_path} as {OUTPUT_ZIP_NAME}')
+        return StreamingResponse(self.__measure_output(self.__generate_output_zip(abs_output_path), timings),
+                                 media_type='application/zip',
+                                 headers={'Content-Disposition': f'attachment; filename="{OUTPUT_ZIP_NAME}"'})
+
+    def get_output_archive_path(self, payload_id: str) -> str:
+        """Returns absolute path of the output payload .zip file written by `write_output_payload`
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+
+        Returns:
+            str: Absolute path of the .zip file
+        """
+        return os.path.join(self._host_path, payload_id, OUTPUT_ZIP_NAME)
+
+    def write_output_payload(self, payload_id: str, timings: Optional[RequestTimings] = None) -> str:
+        """Compresses output payload directory into a .zip file in the payload directory
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
+            timings (Optional[RequestTimings], optional): Timings of the request. Defaults to None.
+
+        Returns:
+            str: Absolute path of the .zip file
+        """
+        abs_output_path = os.path.join(self._host_path, payload_id, self._output_path)
+        abs_zip_path = self.get_output_archive_path(payload_id)
+
+        with open(abs_zip_path, 'wb') as f:
+            for data in self.__measure_output(self.__generate_output_zip(abs_output_path), timings):
+                f.write(data)
+
+        return abs_zip_path
+
+    def stream_output_archive(self, payload_id: str) -> FileResponse:
+        """Returns the .zip file written by `write_output_payload` as FileResponse object
+
+        Args:
+            payload_id (str): Identifier of the payload directory within the shared volume
 
         Returns:
             FileResponse: Asynchronous object for FastAPI to stream compressed .zip folder with
             the output payload from running the MONAI Application Package
         """
-        abs_output_path = os.path.join(self._host_path, self._output_path)
-        abs_zip_path = os.path.join(self._host_path, 'output.zip')
+        abs_zip_path = self.get_output_archive_path(payload_id)
+
+        logger.info(f'Returning stream of {abs_zip_path}')
+        return FileResponse(abs_zip_path, media_type='application/zip', filename=OUTPUT_ZIP_NAME)
+
+    @staticmethod
+    def __measure_output(chunks: Iterator[bytes], timings: Optional[RequestTimings]) -> Iterator[bytes]:
+        # Only the time spent producing chunks is compression time, not the time the consumer takes to send them.
+        compress_seconds = 0.0
+        size = 0
+        start = time.monotonic()
+        for data in chunks:
+            compress_seconds += time.monotonic() - start
+            size += len(data)
+            yield data
+            start = time.monotonic()
+        compress_seconds += time.monotonic() - start
+
+        if timings is not None:
+            timings.record(PHASE_COMPRESS, compress_seconds)
+        record_payload_size(PAYLOAD_OUTPUT, size)
+
+    def __generate_output_zip(self, abs_output_path: str) -> Iterator[bytes]:
+        # The .zip file is written as a stream of chunks, so that at most one chunk of compressed data
+        # is held in memory and nothing is written to disk.
+        compression = zipfile.ZIP_DEFLATED if self._output_compression_level > 0 else zipfile.ZIP_STORED
+        members = self.__list_output_members(abs_output_path, compression)
+        if self._codec is not None:
+            chunks = self._codec.write_members(members, self._output_compression_level)
+        else:
+            chunks = write_members(members, self._output_compression_level)
+
+        for data in chunks:
+            yield data
+
+        logger.info(f'Compressed {abs_output_path} into {OUTPUT_ZIP_NAME}')
 
-        # Compress output payload directory into .zip file in root payload directory
-        with zipfile.ZipFile(abs_zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for root_dir, dirs, files in os.walk(abs_output_path):
-                for file in files:
-                    zip_file.write(os.path.join(root_dir, file),
-                                   os.path.relpath(os.path.join(root_dir, file),
-                                   os.path.join(abs_output_path, '..')))
+    @staticmethod
+    def __generate_output_tar(abs_output_path: str) -> Iterator[bytes]:
+        # Headers and file content are yielded as they are, without a buffer, since nothing is compressed.
+        # Members are named like those of the .zip file, under the name of the output directory.
+        for root_dir, dirs, files in os.walk(abs_output_path):
+            for file in files:
+                file_path = os.path.join(root_dir, file)
+                tar_info = tarfile.TarInfo(os.path.relpath(file_path, os.path.join(abs_output_path, '..')))
+                with open(file_path, 'rb') as src:
+                    stat = os.fstat(src.fileno())
+                    tar_info.size = stat.st_size
+                    tar_info.mtime = int(stat.st_mtime)
+                    tar_info.mode = stat.st_mode & 0o777
+                    yield tar_info.tobuf(tarfile.PAX_FORMAT)
+
+                    remaining = tar_info.size
+                    while remaining > 0:
+                        chunk = src.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise IOError(f'Output file {file_path} was truncated while it was streamed')
+                        remaining -= len(chunk)
+                        yield chunk
+
+                padding = -tar_info.size % tarfile.BLOCKSIZE
+                if padding:
+                    yield tarfile.NUL * padding
+
+        logger.info(f'Streamed {abs_output_path} as {OUTPUT_TAR_NAME}')
+
+        # End of archive marker.
+        yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+    def __list_output_members(self, abs_output_path: str, compression: int) -> Iterator[Tuple[str, zipfile.ZipInfo]]:
+        for root_dir, dirs, files in os.walk(abs_output_path):
+            for file in files:
+                file_path = os.path.join(root_dir, file)
+                zip_info = zipfile.ZipInfo.from_file(
+                    file_path, os.path.relpath(file_path, os.path.join(abs_output_path, '..')))
 
-            logger.info(f'Compressed {abs_output_path} into {abs_zip_path}')
+                # Files which are already compressed are stored as they are.
+                if file.lower().endswith(COMPRESSED_FILE_EXTENSIONS):
+                    zip_info.compress_type = zipfile.ZIP_STORED
+                else:
+                    zip_info.compress_type = compression
 
-        # Move compressed .zip into output payload directory
-        target_zip_path = os.path.join(abs_output_path, 'output.zip')
-        shutil.move(abs_zip_path, target_zip_path)
+                yield file_path, zip_info
+
+    def discard_directory_content(self, dir_path: str):
+        """Cleans contents of a directory, but does not delete directory itself. With a reaper, the contents
+        are moved into its trash directory and deleted in the background.
+
+        Args:
+            dir_path (str): Path to of directory to be cleaned
+        """
+        if self._reaper is None:
+            PayloadProvider.clean_directory(dir_path)
+            return
 
-        # Return stream of resulting .zip file using the FastAPI FileResponse object
-        logger.info(f'Returning stream of {target_zip_path}')
-        return FileResponse(target_zip_path)
+        # The trash directory of the reaper may be inside the directory, such as when it is the host path.
+        trash_path = self._reaper.trash_path
+        exclude = [os.path.basename(trash_path)] if os.path.dirname(trash_path) == os.path.normpath(dir_path) else []
+        self._reaper.discard_content(dir_path, exclude)
 
     @staticmethod
     def clean_directory(dir_path: str):
@@ -0,0 +1,316 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from threading import Condition, Event, Thread
+from typing import Optional
+
+from monaiinference.handler.kubernetes import (WARM_POD_CONTROL_SUB_PATH, WARM_POD_DONE_FILE, WARM_POD_READY_FILE,
+                                               WARM_POD_STARTED_FILE, WARM_POD_TRIGGER_FILE, KubernetesHandler,
+                                               PodStatus)
+from monaiinference.handler.metrics import POD_START_WARM, record_pod_start
+from monaiinference.handler.payload import PayloadProvider
+
+CONTROL_POLLING_TIME = 0.1
+PHASE_POLLING_TIME = 1
+WAIT_TIME_FOR_WARM_POD_STARTUP = 300
+WARM_POD_PREFIX = "warm"
+
+logger = logging.getLogger('MIS_Pool')
+
+
+class WarmPod:
+    """Class that defines object to store the state of a pre-started MAP pod"""
+
+    def __init__(self, payload_id: str):
+        """Constructor of the WarmPod class
+
+        Args:
+            payload_id (str): Identifier of the payload directory mounted by the pod
+        """
+        self.payload_id = payload_id
+        self.runs = 0
+        self.idle_since = time.monotonic()
+        # Time the pod was last handed out to an inference request.
+        self.acquired_at = None
+
+
+class WarmPodPool:
+    """Class that keeps a pool of pre-started MAP pods which block on a trigger file
+    and hands them out to inference requests."""
+
+    def __init__(self, kubernetes_handler: KubernetesHandler, payload_provider: PayloadProvider,
+                 size: int, max_reuse: int, idle_ttl: float):
+        """Constructor of the WarmPodPool class
+
+        Args:
+            kubernetes_handler (KubernetesHandler): Handler used to create and delete pods
+            payload_provider (PayloadProvider): Provider of the payload directories of the pods
+            size (int): Number of pre-started pods kept in the pool
+            max_reuse (int): Number of runs after which a pod is replaced, 0 for no limit
+            idle_ttl (float): Time in seconds after which an idle pod is deleted, 0 for no limit
+        """
+        self._kubernetes_handler = kubernetes_handler
+        self._payload_provider = payload_provider
+        self._size = size
+        self._max_reuse = max_reuse
+        self._idle_ttl = idle_ttl
+
+        self._condition = Condition()
+        self._idle = deque()
+        self._busy = set()
+        self._starting = 0
+        self._stopped = Event()
+
+        self._hits = 0
+        self._misses = 0
+
+    def start(self):
+        """Start the pods of the pool and the thread which retires idle pods."""
+        self.__replenish()
+        Thread(target=self.__retire_idle_pods, daemon=True).start()
+
+    def shutdown(self):
+        """Stop the pool and delete all of its pods."""
+        self._stopped.set()
+        with self._condition:
+            pods = list(self._idle) + list(self._busy)
+            self._idle.clear()
+            self._busy.clear()
+
+        for pod in pods:
+            self.__delete_pod(pod, False)
+
+    @property
+    def idle_pods(self) -> int:
+        with self._condition:
+            return len(self._idle)
+
+    @property
+    def stats(self) -> dict:
+        """Statistics of the pool, including the number of requests which did and did not find an idle pod."""
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "busy": len(self._busy),
+                "starting": self._starting,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+    def acquire(self) -> Optional[WarmPod]:
+        """Take an idle pod out of the pool.
+
+        Returns:
+            Optional[WarmPod]: Idle pod, None if no pod is idle and the request has to use a new pod.
+        """
+        with self._condition:
+            # Most recently used pods are handed out first, so that surplus pods can reach the idle TTL.
+            pod = self._idle.pop() if self._idle else None
+            if pod is not None:
+                self._busy.add(pod)
+                self._hits += 1
+                pod.acquired_at = time.monotonic()
+            else:
+                self._misses += 1
+
+        if pod is None:
+            logger.info('No idle warm pod available')
+            self.__replenish()
+        else:
+            logger.info(f'Acquired warm pod {pod.payload_id}')
+
+        return pod
+
+    def run(self, pod: WarmPod, input_size: Optional[int] = None) -> PodStatus:
+        """Trigger a run of the MAP in a warm pod and wait until it completes or it times out.
+
+        Args:
+            pod (WarmPod): Pod acquired from the pool, with its input payload uploaded
+            input_size (Optional[int], optional): Size in bytes of the input payload, from which the
+            running timeout is derived in adaptive mode. Defaults to None.
+
+        Returns:
+            PodStatus: Enum which denotes the status of the run.
+        """
+        control_path = self.__control_path(pod.payload_id)
+        run = str(pod.runs + 1)
+
+        # Write trigger atomically, so that the pod never reads a partial run number.
+        trigger_path = os.path.join(control_path, WARM_POD_TRIGGER_FILE)
+        with open(f'{trigger_path}.tmp', 'w') as f:
+            f.write(run)
+        os.replace(f'{trigger_path}.tmp', trigger_path)
+
+        started_path = os.path.join(control_path, WARM_POD_STARTED_FILE)
+        done_path = os.path.join(control_path, WARM_POD_DONE_FILE)
+        start_time = time.monotonic()
+        deadline = start_time + self._kubernetes_handler.running_timeout(input_size)
+        next_phase_check = time.monotonic() + PHASE_POLLING_TIME
+        status = PodStatus.Running
+        started = False
+
+        while (time.monotonic() < deadline):
+            # The pod writes the run number once it picks up the trigger, which ends the start of a warm pod.
+            if not started and os.path.exists(started_path):
+                with open(started_path) as f:
+                    started = f.read().strip() == run
+                if started:
+                    record_pod_start(POD_START_WARM, time.monotonic() - (pod.acquired_at or start_time))
+
+            if os.path.exists(done_path):
+                with open(done_path) as f:
+                    done = f.read().split()
+                if (len(done) == 2 and done[0] == run):
+                    status = PodStatus.Succeeded if done[1] == "0" else PodStatus.Failed
+                    break
+
+            # The pod itself is checked at a lower rate, to detect pods which died during the run.
+            if (time.monotonic() >= next_phase_check):
+                phase = self._kubernetes_handler.get_kubernetes_pod_phase(pod.payload_id)
+                if (phase in ("Succeeded", "Failed")):
+                    logger.warning(f'Warm pod {pod.payload_id} exited during run {run}')
+                    status = PodStatus.Failed
+                    break
+                next_phase_check = time.monotonic() + PHASE_POLLING_TIME
+
+            time.sleep(CONTROL_POLLING_TIME)
+
+        if (status is PodStatus.Succeeded):
+            self._kubernetes_handler.record_run_time(time.monotonic() - start_time, input_size)
+        elif (status is PodStatus.Running):
+            self._kubernetes_handler.record_run_timeout(time.monotonic() - start_time, input_size)
+        logger.info(f'Warm pod {pod.payload_id} run {run} status is {status}')
+
+        return status
+
+    def release(self, pod: WarmPod, status: PodStatus):
+        """Return a pod to the pool, or replace it if it can not be reused.
+
+        Args:
+            pod (WarmPod): Pod acquired from the pool
+            status (PodStatus): Status of the last run of the pod
+        """
+        pod.runs += 1
+        recycle = (status is not PodStatus.Succeeded or
+                   (self._max_reuse > 0 and pod.runs >= self._max_reuse))
+
+        if not recycle:
+            # The input and output of the last request do not stay on the volume while the pod is idle.
+            try:
+                self._payload_provider.discard_input_payload(pod.payload_id)
+                self._payload_provider.discard_output_payload(pod.payload_id)
+            except Exception as e:
+                logger.error(f'Failed to clean warm pod {pod.payload_id}, recycling it: {e}')
+                recycle = True
+
+        with self._condition:
+            self._busy.discard(pod)
+            if not recycle and not self._stopped.is_set():
+                pod.idle_since = time.monotonic()
+                self._idle.append(pod)
+                self._condition.notify_all()
+                return
+
+        logger.info(f'Recycling warm pod {pod.payload_id} after {pod.runs} run(s)')
+        # A pod whose run timed out is killed right away, so that its resources are freed for its replacement.
+        Thread(target=self.__delete_pod, args=(pod, True, status is PodStatus.Running), daemon=True).start()
+
+    def __control_path(self, payload_id: str) -> str:
+        return os.path.join(self._payload_provider.get_payload_path(payload_id), WARM_POD_CONTROL_SUB_PATH)
+
+    def __replenish(self):
+        # Start as many pods as needed to bring the pool back to its size.
+        with self._condition:
+            if self._stopped.is_set():
+                return
+            missing = self._size - len(self._idle) - len(self._busy) - self._starting
+            self._starting += max(missing, 0)
+
+        for _ in range(missing):
+            Thread(target=self.__start_pod, daemon=True).start()
+
+    def __start_pod(self):
+        pod = WarmPod(f'{WARM_POD_PREFIX}-{uuid.uuid4().hex}')
+        control_path = Path(self.__control_path(pod.payload_id))
+        started = False
+
+        try:
+            control_path.mkdir(parents=True, exist_ok=True)
+            os.chmod(control_path, 0o777)
+            self._payload_provider.discard_directory_content(str(control_path))
+            self._payload_provider.prepare_payload_directory(pod.payload_id)
+
+            self._kubernetes_handler.create_kubernetes_pod(pod.payload_id, warm=True)
+            started = self.__wait_for_pod(pod)
+        except Exception as e:
+            logger.error(e, exc_info=True)
+
+        with self._condition:
+            self._starting -= 1
+            if started and not self._stopped.is_set():
+                pod.idle_since = time.monotonic()
+                self._idle.append(pod)
+                self._condition.notify_all()
+                logger.info(f'Warm pod {pod.payload_id} is ready')
+                return
+
+        self.__delete_pod(pod, False)
+
+    def __wait_for_pod(self, pod: WarmPod) -> bool:
+        # Wait until the pod reports through its control directory that it is waiting for a trigger.
+        ready_path = os.path.join(self.__control_path(pod.payload_id), WARM_POD_READY_FILE)
+        deadline = time.monotonic() + WAIT_TIME_FOR_WARM_POD_STARTUP
+
+        while (time.monotonic() < deadline and not self._stopped.is_set()):
+            if os.path.exists(ready_path):
+                return True
+
+            phase = self._kubernetes_handler.get_kubernetes_pod_phase(pod.payload_id)
+            if (phase in ("Succeeded", "Failed")):
+                logger.warning(f'Warm pod {pod.payload_id} exited during startup')
+                return False
+
+            time.sleep(PHASE_POLLING_TIME)
+
+        logger.warning(f'Warm pod {pod.payload_id} did not start within {WAIT_TIME_FOR_WARM_POD_STARTUP} seconds')
+        return False
+
+    def __delete_pod(self, pod: WarmPod, replace: bool, force: bool = False):
+        # The payload directory holds the control files and the last input and output of the pod.
+        try:
+            self._kubernetes_handler.delete_kubernetes_pod(pod.payload_id, force=force)
+        finally:
+            self._payload_provider.delete_payload(pod.payload_id)
+        if replace:
+            self.__replenish()
+
+    def __retire_idle_pods(self):
+        # Delete pods idle for longer than the idle TTL, they are started again on the next miss.
+        while not self._stopped.wait(PHASE_POLLING_TIME):
+            if (self._idle_ttl <= 0):
+                continue
+
+            now = time.monotonic()
+            with self._condition:
+                expired = [pod for pod in self._idle if now - pod.idle_since > self._idle_ttl]
+                for pod in expired:
+                    self._idle.remove(pod)
+
+            for pod in expired:
+                logger.info(f'Deleting warm pod {pod.payload_id} idle for more than {self._idle_ttl} seconds')
+                self.__delete_pod(pod, False)
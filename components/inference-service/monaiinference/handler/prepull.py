@@ -0,0 +1,271 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set
+
+from kubernetes import client
+from kubernetes.client import models
+from kubernetes.client.rest import ApiException
+
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.kubernetes import (API_VERSION_FOR_PODS, DEFAULT_NAMESPACE, HTTP_STATUS_CONFLICT,
+                                               IF_NOT_PRESENT, POD, POD_NAME, RESTART_POLICY_NEVER,
+                                               TERMINAL_WAITING_REASONS, map_pods_on_node)
+from monaiinference.handler.reconcile import ResourceOwner
+
+HTTP_STATUS_NOT_FOUND = 404
+PREPULL_CONTAINER_NAME = "pull"
+PREPULL_POD_TYPE = "monai-pull"
+# Pre-pull pods only pull the image, their container exits right away if it starts at all.
+PREPULL_RESOURCES = {"cpu": "10m", "memory": "32Mi"}
+# Time in seconds between checks of the nodes, and between checks of pre-pull pods while images are pulled.
+REFRESH_INTERVAL = 60
+PULL_CHECK_INTERVAL = 2
+UNSCHEDULABLE_TAINT_EFFECTS = ("NoSchedule", "NoExecute")
+
+logger = logging.getLogger('MIS_PrePull')
+
+
+class ImagePrePuller:
+    """Class that pulls the images of MAPs onto the nodes which can run their pods, before inference requests
+    need them. A pre-pull pod is bound to each eligible node which does not hold the image yet, and the nodes
+    which hold it are tracked, so that MAP pods prefer them and readiness waits until one of them exists."""
+
+    def __init__(self, kubernetes_core_client: client.CoreV1Api, refresh_interval: float = REFRESH_INTERVAL,
+                 owner: Optional[ResourceOwner] = None):
+        """Constructor of the ImagePrePuller class
+
+        Args:
+            kubernetes_core_client (client.CoreV1Api): Kubernetes client used to list nodes and create pods
+            refresh_interval (float, optional): Time in seconds between checks of the nodes, which picks up
+            new nodes and images removed from nodes. Defaults to 60.
+            owner (Optional[ResourceOwner], optional): Owner whose labels are stamped on the pre-pull pods, and
+            which tracks them until they are deleted, so that pods left behind are found by its reconciler.
+            Defaults to None.
+        """
+        self._kubernetes_core_client = kubernetes_core_client
+        self._refresh_interval = refresh_interval
+        self._owner = owner
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopped = Event()
+        # MAP image to the configuration of a MAP which runs it, and to the nodes which hold it.
+        self._images: Dict[str, ServerConfig] = {}
+        self._ready_nodes: Dict[str, Set[str]] = {}
+
+    def start(self):
+        """Start pulling the images of the tracked MAPs."""
+        Thread(target=self.__run, name='MIS_PrePull', daemon=True).start()
+
+    def shutdown(self):
+        """Stop pulling images."""
+        self._stopped.set()
+        self._wakeup.set()
+
+    def set_images(self, configs: List[ServerConfig]):
+        """Pull the images of MAPs onto the nodes which can run their pods. Images of MAPs which are no longer
+        in the list are no longer pulled onto new nodes.
+
+        Args:
+            configs (List[ServerConfig]): Configurations of the MAPs
+        """
+        images = {config.map_urn: config for config in configs}
+        with self._lock:
+            added = set(images) - set(self._images)
+            self._images = images
+            self._ready_nodes = {urn: self._ready_nodes.get(urn, set()) for urn in images}
+
+        for urn in sorted(added):
+            logger.info(f'Pre-pulling image {urn}')
+        if added:
+            self._wakeup.set()
+
+    def ready_nodes(self, urn: str) -> List[str]:
+        """Returns the names of the nodes which hold an image
+
+        Args:
+            urn (str): Image of a MAP
+
+        Returns:
+            List[str]: Names of the nodes
+        """
+        with self._lock:
+            return sorted(self._ready_nodes.get(urn, ()))
+
+    def is_ready(self, urn: str) -> bool:
+        """Returns whether an image is held by at least one node, or is not tracked
+
+        Args:
+            urn (str): Image of a MAP
+
+        Returns:
+            bool: True if a MAP pod of the image can start without pulling it
+        """
+        with self._lock:
+            return urn not in self._ready_nodes or bool(self._ready_nodes[urn])
+
+    def __run(self):
+        while not self._stopped.is_set():
+            pulling = False
+            try:
+                pulling = self.__refresh()
+            except Exception as e:
+                logger.error(f'Failed to pre-pull images: {e}', exc_info=True)
+
+            self._wakeup.wait(PULL_CHECK_INTERVAL if pulling else self._refresh_interval)
+            self._wakeup.clear()
+
+    def __refresh(self) -> bool:
+        # Updates the nodes which hold each image, and creates pre-pull pods for the eligible nodes which do not.
+        # Returns whether pre-pull pods are still pulling.
+        with self._lock:
+            images = dict(self._images)
+        if not images:
+            return False
+
+        nodes = self._kubernetes_core_client.list_node().items
+        pods = self._kubernetes_core_client.list_namespaced_pod(
+            DEFAULT_NAMESPACE, label_selector=f'pod-type={PREPULL_POD_TYPE}').items
+        pods = {pod.metadata.name: pod for pod in pods
+                if (pod.metadata.labels or {}).get("pod-type") == PREPULL_POD_TYPE}
+
+        pulling = False
+        for urn, config in images.items():
+            with self._lock:
+                previously_ready = set(self._ready_nodes.get(urn, ()))
+            ready = set()
+            for node in nodes:
+                node_name = node.metadata.name
+                if not self.__is_eligible(node, config):
+                    continue
+                # Nodes list a limited number of images, a node which has pulled the image stays ready while it exists.
+                if node_name in previously_ready or self.__holds_image(node, urn):
+                    ready.add(node_name)
+                    continue
+
+                pod_name = self.__pod_name(node_name, urn)
+                pod = pods.get(pod_name)
+                if pod is None:
+                    self.__create_pod(pod_name, node_name, urn)
+                    pulling = True
+                elif self.__is_pulled(pod):
+                    # The node may not list the image until its status is next reported.
+                    ready.add(node_name)
+                    self.__delete_pod(pod_name)
+                elif self.__is_failed(pod):
+                    logger.warning(f'Failed to pull image {urn} onto node {node_name}, retrying later')
+                    self.__delete_pod(pod_name)
+                else:
+                    pulling = True
+
+            with self._lock:
+                if urn not in self._ready_nodes:
+                    continue
+                added = ready - self._ready_nodes[urn]
+                self._ready_nodes[urn] = ready
+            if added:
+                logger.info(f'Image {urn} is ready on nodes {sorted(added)}')
+
+        return pulling
+
+    @staticmethod
+    def __is_eligible(node: models.V1Node, config: ServerConfig) -> bool:
+        # Nodes which MAP pods can not be scheduled on, for lack of capacity or tolerations, are not pulled onto.
+        taints = (node.spec.taints if node.spec is not None else None) or []
+        if any(taint.effect in UNSCHEDULABLE_TAINT_EFFECTS for taint in taints):
+            return False
+        return map_pods_on_node(node, config) > 0
+
+    @staticmethod
+    def __holds_image(node: models.V1Node, urn: str) -> bool:
+        # Nodes report images under fully qualified names, such as `docker.io/library/name:tag` for `name:tag`.
+        images = (node.status.images if node.status is not None else None) or []
+        return any(name == urn or name.endswith('/' + urn) for image in images for name in (image.names or []))
+
+    @staticmethod
+    def __is_pulled(pod: models.V1Pod) -> bool:
+        # A container which has started or terminated, successfully or not, has had its image pulled.
+        for container_status in (pod.status.container_statuses if pod.status is not None else None) or []:
+            state = container_status.state
+            if state is not None and (state.running is not None or state.terminated is not None):
+                return True
+        return False
+
+    @staticmethod
+    def __is_failed(pod: models.V1Pod) -> bool:
+        if pod.status is None:
+            return False
+        if pod.status.phase == "Failed" and not pod.status.container_statuses:
+            return True
+        for container_status in pod.status.container_statuses or []:
+            waiting = container_status.state.waiting if container_status.state is not None else None
+            if waiting is not None and waiting.reason in TERMINAL_WAITING_REASONS:
+                return True
+        return False
+
+    @staticmethod
+    def __pod_name(node_name: str, urn: str) -> str:
+        # Node names and images may be too long for a pod name, and images contain invalid characters.
+        return f'{POD_NAME}-pull-{hashlib.sha256(f"{node_name}/{urn}".encode()).hexdigest()[:16]}'
+
+    def __create_pod(self, pod_name: str, node_name: str, urn: str):
+        # Pre-pull pods are owned like the pods of a payload named after the pod.
+        labels = self._owner.labels(pod_name) if self._owner is not None else {}
+        pod = models.V1Pod(
+            api_version=API_VERSION_FOR_PODS,
+            kind=POD,
+            metadata=models.V1ObjectMeta(
+                name=pod_name,
+                labels={
+                    **labels,
+                    "pod-name": pod_name,
+                    "pod-type": PREPULL_POD_TYPE
+                }
+            ),
+            spec=models.V1PodSpec(
+                # Bound to the node directly, the pod must land on that node rather than wherever it fits.
+                node_name=node_name,
+                restart_policy=RESTART_POLICY_NEVER,
+                containers=[
+                    models.V1Container(
+                        name=PREPULL_CONTAINER_NAME,
+                        image=urn,
+                        image_pull_policy=IF_NOT_PRESENT,
+                        command=["/bin/sh", "-c", "exit 0"],
+                        resources=models.V1ResourceRequirements(limits=PREPULL_RESOURCES,
+                                                                requests=PREPULL_RESOURCES),
+                    )
+                ]
+            )
+        )
+
+        if self._owner is not None:
+            self._owner.track(pod_name)
+        try:
+            self._kubernetes_core_client.create_namespaced_pod(namespace=DEFAULT_NAMESPACE, body=pod)
+            logger.info(f'Pulling image {urn} onto node {node_name} with pod {pod_name}')
+        except ApiException as e:
+            if (e.status != HTTP_STATUS_CONFLICT):
+                if self._owner is not None:
+                    self._owner.untrack(pod_name)
+                raise
+
+    def __delete_pod(self, pod_name: str):
+        try:
+            self._kubernetes_core_client.delete_namespaced_pod(name=pod_name, namespace=DEFAULT_NAMESPACE)
+        except ApiException as e:
+            if (e.status != HTTP_STATUS_NOT_FOUND):
+                raise
+        if self._owner is not None:
+            self._owner.untrack(pod_name)
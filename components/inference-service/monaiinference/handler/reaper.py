@@ -0,0 +1,166 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from queue import Queue
+from threading import Event, Thread
+from typing import Iterable
+
+# Niceness of the reaper thread. On Linux, the I/O priority of a thread without an explicit
+# I/O priority follows its niceness, so the deletions yield disk time to inference requests.
+REAPER_NICENESS = 19
+
+logger = logging.getLogger('MIS_Reaper')
+
+
+class PayloadReaper:
+    """Class that deletes payload directories in the background. Directories are renamed into a trash
+    directory on the same volume, which is atomic and takes constant time however many files they hold,
+    and a background thread deletes the content of the trash directory at low priority."""
+
+    def __init__(self, trash_path: str, max_deletes_per_second: int = 0):
+        """Constructor of the PayloadReaper class
+
+        Args:
+            trash_path (str): Absolute path of trash directory, on the same volume as the discarded directories
+            max_deletes_per_second (int, optional): Maximum number of files and directories deleted per second,
+            0 for no limit. Defaults to 0.
+        """
+        self._trash_path = trash_path
+        self._max_deletes_per_second = max_deletes_per_second
+        self._queue = Queue()
+        self._stopped = Event()
+        self._thread = None
+
+        os.makedirs(self._trash_path, exist_ok=True)
+
+    @property
+    def trash_path(self) -> str:
+        return self._trash_path
+
+    @property
+    def backlog(self) -> int:
+        """Number of discarded entries of the trash directory which are not deleted yet."""
+        # Entries are counted until their deletion is done, rather than until it starts.
+        return self._queue.unfinished_tasks
+
+    def start(self):
+        """Start deleting the content of the trash directory, including the entries left over by a previous run."""
+        for f in os.listdir(self._trash_path):
+            self._queue.put(os.path.join(self._trash_path, f))
+
+        self._thread = Thread(target=self.__reap, name='MIS_Reaper', daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """Stop deleting. Entries which are not deleted yet are deleted after the next start."""
+        self._stopped.set()
+        self._queue.put(None)
+
+    def discard(self, path: str):
+        """Move a file or directory into the trash directory. Paths which can not be renamed, for example
+        because they are on another volume, are deleted right away.
+
+        Args:
+            path (str): Absolute path of the file or directory
+        """
+        self.discard_all([path])
+
+    def discard_content(self, dir_path: str, exclude: Iterable[str] = ()):
+        """Move the content of a directory into the trash directory, but not the directory itself,
+        which may be mounted into a pod.
+
+        Args:
+            dir_path (str): Absolute path of the directory
+            exclude (Iterable[str], optional): Names of entries of the directory which are kept. Defaults to ().
+        """
+        excluded = set(exclude)
+        self.discard_all([os.path.join(dir_path, f) for f in os.listdir(dir_path) if f not in excluded])
+
+    def discard_all(self, paths: Iterable[str]):
+        """Move several files or directories into one entry of the trash directory.
+
+        Args:
+            paths (Iterable[str]): Absolute paths of the files or directories
+        """
+        paths = [path for path in paths if os.path.lexists(path)]
+        if not paths:
+            return
+
+        trash_entry = os.path.join(self._trash_path, uuid.uuid4().hex)
+        os.mkdir(trash_entry)
+        for path in paths:
+            try:
+                os.rename(path, os.path.join(trash_entry, uuid.uuid4().hex))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f'Deleting {path} synchronously, it can not be moved into the trash directory: {e}')
+                PayloadReaper.__delete(path)
+
+        self._queue.put(trash_entry)
+
+    def __reap(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), REAPER_NICENESS)
+        except (AttributeError, OSError) as e:
+            logger.warning(f'Unable to lower the priority of the reaper thread: {e}')
+
+        while not self._stopped.is_set():
+            trash_entry = self._queue.get()
+            if trash_entry is None:
+                self._queue.task_done()
+                break
+
+            try:
+                if self._max_deletes_per_second > 0:
+                    self.__delete_throttled(trash_entry)
+                else:
+                    PayloadReaper.__delete(trash_entry)
+            except Exception as e:
+                logger.error(f'Failed to delete {trash_entry}: {e}', exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def __delete_throttled(self, trash_entry: str):
+        # Deletes bottom up, sleeping whenever the deletions of the current second have been used up.
+        window_start = time.monotonic()
+        deletes = 0
+        for root_dir, dirs, files in os.walk(trash_entry, topdown=False):
+            for name in files + dirs:
+                if self._stopped.is_set():
+                    return
+
+                path = os.path.join(root_dir, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+
+                deletes += 1
+                if deletes >= self._max_deletes_per_second:
+                    time.sleep(max(window_start + 1 - time.monotonic(), 0))
+                    window_start = time.monotonic()
+                    deletes = 0
+
+        os.rmdir(trash_entry)
+
+    @staticmethod
+    def __delete(path: str):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.lexists(path):
+            os.remove(path)
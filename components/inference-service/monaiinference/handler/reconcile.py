@@ -0,0 +1,248 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import re
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Set
+
+from kubernetes import client
+from kubernetes.client import models
+from kubernetes.client.rest import ApiException
+
+from monaiinference.handler import metrics
+
+DEFAULT_OWNER_ID = "monai-inference-service"
+DEFAULT_RECONCILE_INTERVAL = 300
+HTTP_STATUS_NOT_FOUND = 404
+INSTANCE_LABEL = "monai.io/instance"
+# Label values are at most 63 characters, alphanumeric at both ends, with '-', '_' and '.' in between.
+LABEL_VALUE_PATTERN = re.compile(r'^[A-Za-z0-9]([-A-Za-z0-9_.]{0,61}[A-Za-z0-9])?$')
+OWNER_LABEL = "monai.io/owner"
+PAYLOAD_LABEL = "monai.io/payload-id"
+RECONCILE_WORKERS = 8
+SERVICE_ACCOUNT_NAMESPACE_PATH = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+
+logger = logging.getLogger('MIS_Reconciler')
+
+
+def default_instance_id() -> str:
+    """Returns the identifier of this instance of MONAI Inference Service, which is the name of its pod when
+    it runs in Kubernetes.
+
+    Returns:
+        str: Host name, truncated to a valid label value
+    """
+    return (os.environ.get("HOSTNAME") or socket.gethostname())[:63].strip('-_.')
+
+
+class ResourceOwner:
+    """Class that defines the identity stamped as labels on the pods, Persistent Volumes and Persistent Volume
+    Claims created by MONAI Inference Service, and tracks the payloads whose resources are in use. It is shared
+    by the Kubernetes handlers of all MAPs."""
+
+    def __init__(self, owner_id: str, instance_id: str):
+        """Constructor of the ResourceOwner class
+
+        Args:
+            owner_id (str): Identifier shared by all instances of one deployment, such as its Helm release
+            instance_id (str): Identifier of this instance, which is the name of its pod in Kubernetes
+        """
+        self.owner_id = owner_id
+        self.instance_id = instance_id
+        self._payload_ids: Set[str] = set()
+        self._lock = Lock()
+
+    @property
+    def label_selector(self) -> str:
+        return f'{OWNER_LABEL}={self.owner_id}'
+
+    def labels(self, payload_id: Optional[str] = None) -> Dict[str, str]:
+        """Returns the labels of a resource
+
+        Args:
+            payload_id (Optional[str], optional): Identifier of the payload the resource is created for.
+            Defaults to None for resources shared by all payloads, which are not reconciled.
+
+        Returns:
+            Dict[str, str]: Owner, instance and payload labels
+        """
+        labels = {OWNER_LABEL: self.owner_id, INSTANCE_LABEL: self.instance_id}
+        if payload_id is not None:
+            labels[PAYLOAD_LABEL] = payload_id
+        return labels
+
+    def track(self, payload_id: str):
+        """Mark the resources of a payload as in use, before they are created."""
+        with self._lock:
+            self._payload_ids.add(payload_id)
+
+    def untrack(self, payload_id: str):
+        """Mark the resources of a payload as no longer in use, once they are deleted."""
+        with self._lock:
+            self._payload_ids.discard(payload_id)
+
+    def is_tracked(self, payload_id: str) -> bool:
+        with self._lock:
+            return payload_id in self._payload_ids
+
+
+class ResourceReconciler:
+    """Class that deletes the pods, Persistent Volumes and Persistent Volume Claims of an owner which are no
+    longer in use, such as those left behind by an instance which crashed during a request, or whose deletion
+    failed. Resources of each kind are listed by their owner label in one call, and deleted in parallel.
+
+    Stale resources only hold capacity, they do not conflict with new ones: the pods and volumes of jobs, batches,
+    shards and warm pods are all named after identifiers derived from `uuid4`, which differ across runs and
+    instances."""
+
+    def __init__(self, kubernetes_core_client: client.CoreV1Api, owner: ResourceOwner, namespace: str,
+                 interval: float = DEFAULT_RECONCILE_INTERVAL, instance_namespace: Optional[str] = None):
+        """Constructor of the ResourceReconciler class
+
+        Args:
+            kubernetes_core_client (client.CoreV1Api): Client of the Kubernetes core API
+            owner (ResourceOwner): Owner whose resources are reconciled
+            namespace (str): Namespace of the pods and Persistent Volume Claims
+            interval (float, optional): Time in seconds between reconciliations after the one at startup,
+            0 to only reconcile at startup. Defaults to 300.
+            instance_namespace (Optional[str], optional): Namespace of the pods of the instances of MONAI Inference
+            Service. Defaults to the namespace of the service account, or `namespace` outside of Kubernetes.
+        """
+        self._kubernetes_core_client = kubernetes_core_client
+        self._owner = owner
+        self._namespace = namespace
+        self._interval = interval
+        self._instance_namespace = instance_namespace or self.__service_account_namespace() or namespace
+        self._stopped = Event()
+        self._lock = Lock()
+        self._reconciled = False
+        self._last_run = None
+        self._deleted: Dict[str, int] = {}
+
+    @property
+    def stats(self) -> dict:
+        """Time of the last reconciliation, and number of resources deleted since startup by kind."""
+        with self._lock:
+            return {"reconciled": self._reconciled, "lastRun": self._last_run, "deleted": dict(self._deleted)}
+
+    def start(self):
+        """Start reconciling in the background, first right away and then every interval."""
+        Thread(target=self.__run, name='MIS_Reconciler', daemon=True).start()
+
+    def shutdown(self):
+        """Stop reconciling."""
+        self._stopped.set()
+
+    def reconcile(self) -> Dict[str, int]:
+        """Delete the resources of the owner which are no longer in use: those of an instance whose pod no
+        longer exists, and those of this instance whose payload is not tracked. Pods are deleted first, then
+        the claims and volumes they mounted.
+
+        Returns:
+            Dict[str, int]: Number of resources deleted by kind
+        """
+        selector = self._owner.label_selector
+        pods = self._kubernetes_core_client.list_namespaced_pod(self._namespace, label_selector=selector).items
+        claims = self._kubernetes_core_client.list_namespaced_persistent_volume_claim(
+            self._namespace, label_selector=selector).items
+        volumes = self._kubernetes_core_client.list_persistent_volume(label_selector=selector).items
+
+        live_instances: Dict[str, bool] = {}
+        deleted = {
+            "Pod": self.__delete_all(
+                [pod.metadata.name for pod in pods if self.__is_stale(pod.metadata, live_instances)],
+                lambda name: self._kubernetes_core_client.delete_namespaced_pod(
+                    name=name, namespace=self._namespace, grace_period_seconds=0)),
+            "PersistentVolumeClaim": self.__delete_all(
+                [claim.metadata.name for claim in claims if self.__is_stale(claim.metadata, live_instances)],
+                lambda name: self._kubernetes_core_client.delete_namespaced_persistent_volume_claim(
+                    name=name, namespace=self._namespace)),
+            "PersistentVolume": self.__delete_all(
+                [volume.metadata.name for volume in volumes if self.__is_stale(volume.metadata, live_instances)],
+                lambda name: self._kubernetes_core_client.delete_persistent_volume(name=name)),
+        }
+
+        with self._lock:
+            self._reconciled = True
+            self._last_run = time.time()
+            for kind, count in deleted.items():
+                self._deleted[kind] = self._deleted.get(kind, 0) + count
+        for kind, count in deleted.items():
+            metrics.RECONCILED_RESOURCES.labels(kind).inc(count)
+        if any(deleted.values()):
+            logger.info(f'Deleted stale resources {deleted}')
+        return deleted
+
+    def __run(self):
+        while not self._stopped.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f'Failed to reconcile resources: {e}', exc_info=True)
+            if self._interval <= 0 or self._stopped.wait(self._interval):
+                break
+
+    def __is_stale(self, metadata: models.V1ObjectMeta, live_instances: Dict[str, bool]) -> bool:
+        # Resources shared by all payloads, such as the shared payload volume, are adopted rather than deleted.
+        labels = metadata.labels or {}
+        payload_id = labels.get(PAYLOAD_LABEL)
+        if payload_id is None or labels.get(OWNER_LABEL) != self._owner.owner_id:
+            return False
+
+        instance_id = labels.get(INSTANCE_LABEL)
+        if instance_id == self._owner.instance_id:
+            return not self._owner.is_tracked(payload_id)
+        if instance_id not in live_instances:
+            live_instances[instance_id] = self.__is_instance_alive(instance_id)
+        return not live_instances[instance_id]
+
+    def __is_instance_alive(self, instance_id: Optional[str]) -> bool:
+        # Another instance, such as the previous pod during a rolling update, keeps its resources while it runs.
+        if not instance_id:
+            return False
+        try:
+            self._kubernetes_core_client.read_namespaced_pod(name=instance_id, namespace=self._instance_namespace)
+        except ApiException as e:
+            if (e.status == HTTP_STATUS_NOT_FOUND):
+                return False
+            raise
+        return True
+
+    @staticmethod
+    def __delete_all(names: List[str], delete: Callable[[str], None]) -> int:
+        def delete_one(name: str) -> int:
+            try:
+                delete(name)
+            except ApiException as e:
+                if (e.status == HTTP_STATUS_NOT_FOUND):
+                    return 0
+                logger.error(f'Failed to delete {name}: {e}')
+                return 0
+            logger.info(f'Deleted stale {name}')
+            return 1
+
+        if not names:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(RECONCILE_WORKERS, len(names))) as executor:
+            return sum(executor.map(delete_one, names))
+
+    @staticmethod
+    def __service_account_namespace() -> Optional[str]:
+        try:
+            with open(SERVICE_ACCOUNT_NAMESPACE_PATH) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
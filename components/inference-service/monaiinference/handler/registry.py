@@ -0,0 +1,293 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import re
+from threading import Lock
+from typing import Callable, List, Optional, Tuple
+
+import yaml
+
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.jobs import Job, JobManager
+from monaiinference.handler.modelcache import CHECKSUM_PATTERN
+
+MAP_NAME_PATTERN = re.compile(r'^[a-z0-9]([-a-z0-9]{0,61}[a-z0-9])?$')
+
+# Keys of a MAP entry of the registry file and of the admin endpoint, as (key, type, required).
+MAP_CONFIG_KEYS = [
+    ("urn", str, True),
+    ("entrypoint", str, True),
+    ("cpu", int, True),
+    ("memory", int, True),
+    ("gpu", int, True),
+    ("inputPath", str, True),
+    ("outputPath", str, True),
+    ("modelPath", str, False),
+    ("modelSource", str, False),
+    ("modelChecksum", str, False),
+    ("timeout", (int, float), False),
+    ("pendingTimeout", (int, float), False),
+    ("multiCase", bool, False),
+]
+
+logger = logging.getLogger('MIS_Registry')
+
+
+class MapRegistryError(Exception):
+    """Raised when a MAP configuration is invalid."""
+
+
+class MapConflictError(MapRegistryError):
+    """Raised when a MAP is registered under a name in use, or unregistered while it runs inference requests."""
+
+
+def parse_map_config(entry: dict, payload_host_path: str) -> ServerConfig:
+    """Builds the configuration of a MAP from an entry of the registry file, and validates it
+    against the same limits as the command line arguments of the default MAP.
+
+    Args:
+        entry (dict): MAP entry with the keys of `MAP_CONFIG_KEYS`
+        payload_host_path (str): Host path of payload directory, shared by all MAPs
+
+    Returns:
+        ServerConfig: Configuration of the MAP
+
+    Raises:
+        MapRegistryError: If the entry is missing a key, has a key of the wrong type or a value out of range.
+    """
+    if not isinstance(entry, dict):
+        raise MapRegistryError(f'MAP configuration must be a mapping, provided value is \"{entry}\"')
+
+    unknown_keys = set(entry) - {key for key, _, _ in MAP_CONFIG_KEYS}
+    if unknown_keys:
+        raise MapRegistryError(f'Unknown MAP configuration keys {sorted(unknown_keys)}')
+
+    for key, key_type, required in MAP_CONFIG_KEYS:
+        value = entry.get(key)
+        if value is None:
+            if required:
+                raise MapRegistryError(f'MAP configuration is missing \"{key}\"')
+        elif not isinstance(value, key_type) or (isinstance(value, bool) and key_type is not bool):
+            raise MapRegistryError(f'MAP {key} value has the wrong type, provided value is \"{value}\"')
+
+    if (entry["cpu"] < 1):
+        raise MapRegistryError(f'MAP cpu value can not be less than 1, provided value is \"{entry["cpu"]}\"')
+    if (entry["gpu"] < 0):
+        raise MapRegistryError(f'MAP gpu value can not be less than 0, provided value is \"{entry["gpu"]}\"')
+    if (entry["memory"] < 256):
+        raise MapRegistryError(f'MAP memory value can not be less than 256, provided value is \"{entry["memory"]}\"')
+    if (entry.get("timeout") is not None and entry["timeout"] <= 0):
+        raise MapRegistryError(f'MAP timeout value must be greater than 0, provided value is \"{entry["timeout"]}\"')
+    if (entry.get("pendingTimeout") is not None and entry["pendingTimeout"] <= 0):
+        raise MapRegistryError(f'MAP pending timeout value must be greater than 0, '
+                               f'provided value is \"{entry["pendingTimeout"]}\"')
+    if (entry.get("modelChecksum") and not CHECKSUM_PATTERN.match(entry["modelChecksum"])):
+        raise MapRegistryError(f'MAP model checksum value must be a SHA-256 checksum, '
+                               f'provided value is \"{entry["modelChecksum"]}\"')
+    if (entry.get("modelChecksum") and not entry.get("modelSource")):
+        raise MapRegistryError(f'MAP model checksum value requires a model source, '
+                               f'provided value is \"{entry["modelChecksum"]}\"')
+    if (entry.get("modelSource") and not entry.get("modelPath")):
+        raise MapRegistryError(f'MAP model source value requires a model path, '
+                               f'provided value is \"{entry["modelSource"]}\"')
+
+    return ServerConfig(entry["urn"], entry["entrypoint"].split(' '), entry["cpu"], entry["memory"], entry["gpu"],
+                        entry["inputPath"], entry["outputPath"], entry.get("modelPath") or None, payload_host_path,
+                        entry.get("timeout"), entry.get("multiCase", False), entry.get("pendingTimeout"),
+                        entry.get("modelSource") or None, entry.get("modelChecksum") or None)
+
+
+def map_config_to_dict(config: ServerConfig) -> dict:
+    """Returns the configuration of a MAP in the format of an entry of the registry file
+
+    Args:
+        config (ServerConfig): Configuration of the MAP
+
+    Returns:
+        dict: MAP entry with the keys of `MAP_CONFIG_KEYS`
+    """
+    return {
+        "urn": config.map_urn,
+        "entrypoint": ' '.join(config.map_entrypoint),
+        "cpu": config.map_cpu,
+        "memory": config.map_memory,
+        "gpu": config.map_gpu,
+        "inputPath": config.map_input_path,
+        "outputPath": config.map_output_path,
+        "modelPath": config.map_model_path,
+        "modelSource": config.map_model_source,
+        "modelChecksum": config.map_model_checksum,
+        "timeout": config.map_timeout,
+        "pendingTimeout": config.map_pending_timeout,
+        "multiCase": config.map_multi_case,
+    }
+
+
+class MapRegistry:
+    """Class that keeps the MAPs served by MONAI Inference Service, each with its own job manager.
+    Job managers of all MAPs share the request scheduler, so that MAPs draw from one concurrency budget."""
+
+    def __init__(self, job_manager_factory: Callable[[ServerConfig], JobManager], payload_host_path: str,
+                 default_map_name: str, default_job_manager: JobManager):
+        """Constructor of the MapRegistry class
+
+        Args:
+            job_manager_factory (Callable[[ServerConfig], JobManager]): Creates the job manager of a MAP
+            from its configuration
+            payload_host_path (str): Host path of payload directory, shared by all MAPs
+            default_map_name (str): Name of the MAP configured through the command line arguments,
+            which serves inference requests without a MAP name and can not be unregistered
+            default_job_manager (JobManager): Job manager of the default MAP
+        """
+        if not MAP_NAME_PATTERN.match(default_map_name):
+            raise MapRegistryError(f'MAP name must be a lowercase RFC 1123 label, '
+                                   f'provided value is \"{default_map_name}\"')
+
+        self._job_manager_factory = job_manager_factory
+        self._payload_host_path = payload_host_path
+        self._default_map_name = default_map_name
+        self._job_managers = {default_map_name: default_job_manager}
+        self._lock = Lock()
+
+    @property
+    def default_map_name(self) -> str:
+        return self._default_map_name
+
+    def load(self, path: str) -> List[str]:
+        """Register the MAPs of a registry file. The file is a YAML or JSON document with a `maps` mapping
+        from MAP name to MAP entry.
+
+        Args:
+            path (str): Path of the registry file
+
+        Returns:
+            List[str]: Names of the registered MAPs
+        """
+        with open(path) as f:
+            document = yaml.safe_load(f) or {}
+
+        maps = document.get("maps") if isinstance(document, dict) else None
+        if not isinstance(maps, dict):
+            raise MapRegistryError(f'MAP registry file {path} must contain a \"maps\" mapping')
+
+        for name, entry in maps.items():
+            self.register(str(name), parse_map_config(entry, self._payload_host_path))
+
+        return list(maps)
+
+    def register(self, name: str, config: ServerConfig, replace: bool = False) -> JobManager:
+        """Register a MAP and start its job manager.
+
+        Args:
+            name (str): Name of the MAP, used in the path of its endpoints
+            config (ServerConfig): Configuration of the MAP
+            replace (bool, optional): Replace a MAP registered under the same name,
+            if it has no unfinished jobs. Defaults to False.
+
+        Returns:
+            JobManager: Job manager of the MAP
+
+        Raises:
+            MapRegistryError: If the name is invalid.
+            MapConflictError: If the name is in use and can not be replaced.
+        """
+        if not MAP_NAME_PATTERN.match(name):
+            raise MapRegistryError(f'MAP name must be a lowercase RFC 1123 label, provided value is \"{name}\"')
+
+        with self._lock:
+            previous = self._job_managers.get(name)
+            if previous is not None:
+                if not replace:
+                    raise MapConflictError(f'MAP {name} is already registered')
+                self.__check_removable(name, previous)
+
+            job_manager = self._job_manager_factory(config)
+            job_manager.start()
+            self._job_managers[name] = job_manager
+
+        if previous is not None:
+            previous.shutdown()
+        logger.info(f'MAP {name} registered with URN {config.map_urn}')
+
+        return job_manager
+
+    def unregister(self, name: str) -> bool:
+        """Unregister a MAP and shut down its job manager, deleting the results of its finished jobs.
+
+        Args:
+            name (str): Name of the MAP
+
+        Returns:
+            bool: True if the MAP was unregistered, False if it does not exist.
+
+        Raises:
+            MapConflictError: If the MAP is the default MAP or has unfinished jobs.
+        """
+        with self._lock:
+            job_manager = self._job_managers.get(name)
+            if job_manager is None:
+                return False
+            self.__check_removable(name, job_manager)
+            del self._job_managers[name]
+
+        job_manager.shutdown()
+        logger.info(f'MAP {name} unregistered')
+
+        return True
+
+    def get(self, name: str) -> Optional[JobManager]:
+        """Look up the job manager of a MAP.
+
+        Args:
+            name (str): Name of the MAP
+
+        Returns:
+            Optional[JobManager]: Job manager of the MAP, None if it does not exist.
+        """
+        with self._lock:
+            return self._job_managers.get(name)
+
+    def items(self) -> List[Tuple[str, JobManager]]:
+        """Returns the registered MAPs
+
+        Returns:
+            List[Tuple[str, JobManager]]: Name and job manager of each MAP, in order of registration
+        """
+        with self._lock:
+            return list(self._job_managers.items())
+
+    def find_job(self, job_id: str) -> Optional[Tuple[JobManager, Job]]:
+        """Look up a job of any MAP.
+
+        Args:
+            job_id (str): Identifier of the job
+
+        Returns:
+            Optional[Tuple[JobManager, Job]]: The job and the job manager which runs it,
+            None if it does not exist or has been evicted.
+        """
+        for _, job_manager in self.items():
+            job = job_manager.get(job_id)
+            if job is not None:
+                return job_manager, job
+        return None
+
+    def shutdown(self):
+        """Shut down the job managers of all MAPs."""
+        for _, job_manager in self.items():
+            job_manager.shutdown()
+
+    def __check_removable(self, name: str, job_manager: JobManager):
+        if (name == self._default_map_name):
+            raise MapConflictError(f'MAP {name} is the default MAP and can not be replaced or unregistered')
+        if (job_manager.unfinished_jobs > 0):
+            raise MapConflictError(f'MAP {name} has {job_manager.unfinished_jobs} unfinished jobs')
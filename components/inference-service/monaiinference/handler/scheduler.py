@@ -0,0 +1,325 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import List, Optional
+
+# Weight of the latest slot hold time in the moving average of hold times.
+HOLD_TIME_SMOOTHING = 0.2
+# Priority class of requests which do not name one, when no priority classes are configured.
+DEFAULT_PRIORITY_CLASS_NAME = "routine"
+
+logger = logging.getLogger('MIS_Scheduler')
+
+
+class SchedulerError(Exception):
+    """Base class for errors raised when a request can not be scheduled."""
+
+
+class QueueFullError(SchedulerError):
+    """Raised when the wait queue of the scheduler has reached its maximum size."""
+
+
+class QueueTimeoutError(SchedulerError):
+    """Raised when a queued request does not obtain a slot within the wait timeout."""
+
+
+class PriorityClass:
+    """Class that defines a named priority of inference requests. Queued requests of higher levels obtain
+    a slot first, and the MAP pods of a class may be given a Kubernetes priority class."""
+
+    def __init__(self, name: str, level: float, pod_priority_class_name: Optional[str] = None):
+        """Constructor of the PriorityClass class
+
+        Args:
+            name (str): Name of the class, which requests refer to
+            level (float): Priority of the requests of the class, higher levels are scheduled first
+            pod_priority_class_name (Optional[str], optional): Kubernetes PriorityClass of the MAP pods
+            of the requests of the class, None to leave it unset. Defaults to None.
+        """
+        self.name = name
+        self.level = level
+        self.pod_priority_class_name = pod_priority_class_name
+
+
+class _Waiter:
+    """Queue entry of a thread waiting for a slot."""
+
+    def __init__(self, rank: tuple):
+        # Waiters of the lowest rank obtain a slot first.
+        self.rank = rank
+        self.displaced = False
+
+    def notify(self):
+        # Threads are woken up through the condition of the scheduler.
+        pass
+
+
+class _AsyncWaiter(_Waiter):
+    """Queue entry of a coroutine waiting for a slot, woken up through its event loop."""
+
+    def __init__(self, rank: tuple, loop: asyncio.AbstractEventLoop):
+        super().__init__(rank)
+        self.loop = loop
+        self.wakeup = None
+
+    def notify(self):
+        # Must be called with the lock of the scheduler held.
+        if self.wakeup is not None:
+            self.loop.call_soon_threadsafe(self.__set_wakeup, self.wakeup)
+            self.wakeup = None
+
+    @staticmethod
+    def __set_wakeup(wakeup: asyncio.Future):
+        if not wakeup.done():
+            wakeup.set_result(None)
+
+
+class RequestScheduler:
+    """Class that hands out a bounded number of execution slots to inference requests.
+    Requests beyond capacity wait in a bounded queue ordered by priority, in FIFO order within a priority.
+    The priority of a waiting request grows with the time it has waited, so that no request starves."""
+
+    def __init__(self, max_slots: int, max_queue_size: int, queue_timeout: float, priority_aging: float = 0):
+        """Constructor of the RequestScheduler class
+
+        Args:
+            max_slots (int): Maximum number of inference requests executed in parallel
+            max_queue_size (int): Maximum number of requests waiting for a free slot
+            queue_timeout (float): Maximum time in seconds a request waits for a free slot
+            priority_aging (float, optional): Priority levels gained per second by a waiting request. Defaults to 0.
+        """
+        self._condition = Condition()
+        self._free_slots = deque(range(max_slots))
+        self._waiters: List[_Waiter] = []
+        self._sequence = itertools.count()
+        self._max_slots = max_slots
+        self._max_queue_size = max_queue_size
+        self._queue_timeout = queue_timeout
+        self._priority_aging = priority_aging
+        self._acquired_at = {}
+        self._mean_hold_time = None
+
+    @property
+    def max_slots(self) -> int:
+        return self._max_slots
+
+    @property
+    def max_queue_size(self) -> int:
+        return self._max_queue_size
+
+    @property
+    def queue_timeout(self) -> float:
+        return self._queue_timeout
+
+    @property
+    def mean_hold_time(self) -> Optional[float]:
+        """Moving average of the time in seconds requests hold a slot, None until the first slot is released."""
+        with self._condition:
+            return self._mean_hold_time
+
+    @property
+    def queue_depth(self) -> int:
+        with self._condition:
+            return len(self._waiters)
+
+    @property
+    def in_flight(self) -> int:
+        with self._condition:
+            return self._max_slots - len(self._free_slots)
+
+    def waiting_ahead(self, priority: float = 0) -> int:
+        """Returns the number of queued requests which would obtain a slot before a new request
+
+        Args:
+            priority (float, optional): Priority level of the new request. Defaults to 0.
+
+        Returns:
+            int: Number of queued requests ranked ahead of the new request
+        """
+        with self._condition:
+            rank = self.__rank(priority, time.monotonic())
+            return sum(1 for waiter in self._waiters if waiter.rank[0] <= rank[0])
+
+    def acquire(self, priority: float = 0) -> int:
+        """Acquire a free slot, waiting in priority order if all slots are in use.
+
+        Args:
+            priority (float, optional): Priority level of the request, higher levels obtain a slot first.
+            Defaults to 0.
+
+        Returns:
+            int: Index of the acquired slot.
+
+        Raises:
+            QueueFullError: If the wait queue is full of requests of higher priority, or if the request
+            was displaced from the full queue by a request of higher priority.
+            QueueTimeoutError: If no slot became free within the wait timeout.
+        """
+        with self._condition:
+            if not self._waiters and self._free_slots:
+                return self.__take_slot()
+
+            deadline = time.monotonic() + self._queue_timeout
+            ticket = _Waiter(self.__rank(priority, time.monotonic()))
+            self.__enqueue(ticket)
+
+            try:
+                # Only the request at the head of the queue may take a freed slot.
+                while not (self.__head() is ticket and self._free_slots):
+                    if ticket.displaced:
+                        raise QueueFullError('Request was displaced from the full queue by a request of '
+                                             'higher priority')
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise QueueTimeoutError(
+                            f'Request did not obtain a slot within {self._queue_timeout} seconds')
+                    self._condition.wait(remaining)
+
+                return self.__take_slot()
+            finally:
+                self.__dequeue(ticket)
+
+    def try_acquire(self) -> Optional[int]:
+        """Acquire a free slot without waiting. Slots are not taken while requests are queued for them.
+
+        Returns:
+            Optional[int]: Index of the acquired slot, None if no slot is free or requests are queued.
+        """
+        with self._condition:
+            if not self._waiters and self._free_slots:
+                return self.__take_slot()
+            return None
+
+    async def acquire_async(self, priority: float = 0) -> int:
+        """Acquire a free slot like `acquire`, waiting in the same queue as a coroutine instead of a thread.
+
+        Args:
+            priority (float, optional): Priority level of the request, higher levels obtain a slot first.
+            Defaults to 0.
+
+        Returns:
+            int: Index of the acquired slot.
+
+        Raises:
+            QueueFullError: If the wait queue is full of requests of higher priority, or if the request
+            was displaced from the full queue by a request of higher priority.
+            QueueTimeoutError: If no slot became free within the wait timeout.
+        """
+        with self._condition:
+            if not self._waiters and self._free_slots:
+                return self.__take_slot()
+
+            deadline = time.monotonic() + self._queue_timeout
+            waiter = _AsyncWaiter(self.__rank(priority, time.monotonic()), asyncio.get_running_loop())
+            self.__enqueue(waiter)
+
+        try:
+            while True:
+                with self._condition:
+                    if (self.__head() is waiter and self._free_slots):
+                        return self.__take_slot()
+                    if waiter.displaced:
+                        raise QueueFullError('Request was displaced from the full queue by a request of '
+                                             'higher priority')
+                    # Created under the lock, so that a slot released after the check still wakes up the waiter.
+                    wakeup = waiter.wakeup = waiter.loop.create_future()
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise QueueTimeoutError(f'Request did not obtain a slot within {self._queue_timeout} seconds')
+                try:
+                    await asyncio.wait_for(wakeup, remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._condition:
+                waiter.wakeup = None
+                self.__dequeue(waiter)
+
+    def release(self, slot: int):
+        """Return a slot to the scheduler.
+
+        Args:
+            slot (int): Index of the slot returned by `acquire`
+        """
+        with self._condition:
+            acquired_at = self._acquired_at.pop(slot, None)
+            if acquired_at is not None:
+                hold_time = time.monotonic() - acquired_at
+                self._mean_hold_time = hold_time if self._mean_hold_time is None else (
+                    HOLD_TIME_SMOOTHING * hold_time + (1 - HOLD_TIME_SMOOTHING) * self._mean_hold_time)
+            self._free_slots.append(slot)
+            self.__notify_waiters()
+
+    @contextmanager
+    def slot(self):
+        """Context manager which acquires a slot and releases it on exit.
+
+        Yields:
+            int: Index of the acquired slot.
+        """
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def __take_slot(self) -> int:
+        # Must be called with the lock held.
+        slot = self._free_slots.popleft()
+        self._acquired_at[slot] = time.monotonic()
+        return slot
+
+    def __rank(self, priority: float, queued_at: float) -> tuple:
+        # The aged priority `priority + priority_aging * (now - queued_at)` of all waiters grows alike, so waiters
+        # are ordered by `priority - priority_aging * queued_at`, which does not change while they wait.
+        return (-(priority - self._priority_aging * queued_at), next(self._sequence))
+
+    def __head(self) -> _Waiter:
+        # Must be called with the lock held.
+        return min(self._waiters, key=lambda waiter: waiter.rank)
+
+    def __enqueue(self, waiter: _Waiter):
+        # Must be called with the lock held. A full queue makes room by displacing its lowest ranked request,
+        # if the new request is ranked ahead of it.
+        if len(self._waiters) >= self._max_queue_size:
+            lowest = max(self._waiters, key=lambda queued: queued.rank, default=None)
+            if lowest is None or lowest.rank < waiter.rank:
+                raise QueueFullError(f'Request queue is full ({self._max_queue_size} requests waiting)')
+
+            lowest.displaced = True
+            self._waiters.remove(lowest)
+            # No longer in the queue, the displaced request is woken up on its own.
+            lowest.notify()
+            self._condition.notify_all()
+            logger.info('Request displaced from the full queue by a request of higher priority')
+
+        self._waiters.append(waiter)
+        logger.info(f'Request queued, {len(self._waiters)} request(s) waiting for a slot')
+
+    def __dequeue(self, waiter: _Waiter):
+        # Must be called with the lock held. The head of the queue may have changed, wake up remaining waiters.
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        self.__notify_waiters()
+
+    def __notify_waiters(self):
+        # Must be called with the lock held. Wakes up waiting threads and coroutines to check the head of the queue.
+        self._condition.notify_all()
+        for waiter in self._waiters:
+            waiter.notify()
@@ -0,0 +1,70 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List, Optional, Tuple
+
+# Each top-level entry of the input payload, such as the directory of a series, goes to one shard as a whole.
+SHARD_RULE_SUBDIRECTORY = "subdirectory"
+# Files of the input payload are spread across shards individually, keeping their relative paths.
+SHARD_RULE_SIZE = "size"
+SHARD_RULES = (SHARD_RULE_SUBDIRECTORY, SHARD_RULE_SIZE)
+
+
+class ShardPolicy:
+    """Class that defines when and how the input payload of an inference request is split into shards,
+    each run by its own MAP pod in parallel, and how often the pod of a failed shard is retried."""
+
+    def __init__(self, max_shards: int, rule: str = SHARD_RULE_SUBDIRECTORY, min_input_size: int = 0,
+                 max_retries: int = 0):
+        """Constructor of the ShardPolicy class
+
+        Args:
+            max_shards (int): Maximum number of shards, and MAP pods, of one request
+            rule (str, optional): Either `subdirectory` or `size`. Defaults to `subdirectory`.
+            min_input_size (int, optional): Minimum size in Megabytes of the extracted input payload of a
+            request to split it. Defaults to 0.
+            max_retries (int, optional): Number of times the pod of a failed shard is run again. Defaults to 0.
+        """
+        self.max_shards = max_shards
+        self.rule = rule
+        self.min_input_size = min_input_size * 1024 * 1024
+        self.max_retries = max_retries
+
+    def applies(self, input_size: Optional[int]) -> bool:
+        """Returns whether the input payload of a request is split into shards
+
+        Args:
+            input_size (Optional[int]): Size in bytes of the extracted input payload
+
+        Returns:
+            bool: True if the request may run in more than one MAP pod
+        """
+        return self.max_shards > 1 and (input_size or 0) >= self.min_input_size
+
+    @staticmethod
+    def balance(units: List[Tuple[str, int]], shard_count: int) -> List[Tuple[List[str], int]]:
+        """Distributes units of an input payload across shards, so that the shards are of similar size.
+        The largest units are assigned first, each to the shard which is the smallest so far.
+
+        Args:
+            units (List[Tuple[str, int]]): Relative path and size in bytes of each unit
+            shard_count (int): Number of shards
+
+        Returns:
+            List[Tuple[List[str], int]]: Relative paths of the units and total size of each shard
+        """
+        shards = [([], 0) for _ in range(min(shard_count, len(units)))]
+        for path, size in sorted(units, key=lambda unit: (-unit[1], unit[0])):
+            index = min(range(len(shards)), key=lambda i: shards[i][1])
+            shards[index][0].append(path)
+            shards[index] = (shards[index][0], shards[index][1] + size)
+
+        return shards
@@ -0,0 +1,125 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+from collections import deque
+from threading import Lock
+from typing import Dict, Optional
+
+# Number of most recent run times kept per input size bucket.
+RUN_TIME_WINDOW = 200
+# Number of run times of a bucket needed before its deadline is derived from them.
+MIN_RUN_TIME_SAMPLES = 20
+# Lower bound in seconds of a derived deadline, so that a MAP which usually returns
+# right away is not killed by the jitter of pod status reports.
+MIN_ADAPTIVE_TIMEOUT = 5
+# Input sizes within a factor of 4 of each other share a bucket, starting from inputs of 1 MB or less.
+SIZE_BUCKET_BASE = 4
+SIZE_BUCKET_UNIT = 1024 * 1024
+
+
+class AdaptiveTimeout:
+    """Class that keeps a rolling window of the run times of a MAP per input size bucket, and derives
+    the time a MAP pod is given to run from a high percentile of the run times of its bucket.
+
+    Runs which time out are kept as censored run times at their deadline, which is a lower bound of the time
+    they needed. Once a bucket holds more censored run times than fall beyond the percentile, the percentile
+    is unknown and the bucket falls back to the configured timeout, until runs which complete within it have
+    replaced the censored run times in the window."""
+
+    def __init__(self, percentile: float, factor: float):
+        """Constructor of the AdaptiveTimeout class
+
+        Args:
+            percentile (float): Percentile of the run times, between 0 and 100, which the deadline is derived from
+            factor (float): Factor the percentile is multiplied by, which leaves room for slower runs
+        """
+        self._percentile = percentile
+        self._factor = factor
+        self._lock = Lock()
+        # Run times of each bucket, along with whether the run timed out.
+        self._run_times: Dict[int, deque] = {}
+
+    @staticmethod
+    def size_bucket(input_size: Optional[int]) -> int:
+        """Returns the bucket of an input size, 0 for inputs of unknown size or of 1 MB or less
+
+        Args:
+            input_size (Optional[int]): Size in bytes of the extracted input payload
+
+        Returns:
+            int: Index of the bucket
+        """
+        if not input_size or input_size <= SIZE_BUCKET_UNIT:
+            return 0
+        return int(math.log(input_size / SIZE_BUCKET_UNIT, SIZE_BUCKET_BASE)) + 1
+
+    def record(self, seconds: float, input_size: Optional[int] = None):
+        """Record the run time of a MAP pod which completed successfully.
+
+        Args:
+            seconds (float): Time in seconds the MAP pod was running
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+        """
+        self.__append(seconds, False, input_size)
+
+    def record_timeout(self, seconds: float, input_size: Optional[int] = None):
+        """Record the run time of a MAP pod which was still running at its deadline.
+
+        Args:
+            seconds (float): Time in seconds the MAP pod was running until it timed out
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+        """
+        self.__append(seconds, True, input_size)
+
+    def timeout(self, input_size: Optional[int] = None) -> Optional[float]:
+        """Returns the time in seconds a MAP pod is given to run
+
+        Args:
+            input_size (Optional[int], optional): Size in bytes of the input payload of the run. Defaults to None.
+
+        Returns:
+            Optional[float]: Deadline derived from the run times of the bucket of the input size, None
+            while the bucket holds fewer than `MIN_RUN_TIME_SAMPLES` run times, or too many runs which timed out.
+        """
+        return self.__bucket_timeout(AdaptiveTimeout.size_bucket(input_size))
+
+    @property
+    def stats(self) -> dict:
+        """Number of run times and derived deadline of each input size bucket."""
+        with self._lock:
+            buckets = {bucket: (len(run_times), sum(1 for _, timed_out in run_times if timed_out))
+                       for bucket, run_times in self._run_times.items()}
+
+        return {str(bucket): {"samples": samples, "timedOut": timed_out, "timeout": self.__bucket_timeout(bucket)}
+                for bucket, (samples, timed_out) in sorted(buckets.items())}
+
+    def __append(self, seconds: float, timed_out: bool, input_size: Optional[int]):
+        bucket = AdaptiveTimeout.size_bucket(input_size)
+        with self._lock:
+            self._run_times.setdefault(bucket, deque(maxlen=RUN_TIME_WINDOW)).append((seconds, timed_out))
+
+    def __bucket_timeout(self, bucket: int) -> Optional[float]:
+        with self._lock:
+            run_times = sorted(self._run_times.get(bucket, ()))
+
+        if len(run_times) < MIN_RUN_TIME_SAMPLES:
+            return None
+
+        # Runs which timed out needed longer than their deadline. Beyond the share of runs above the percentile,
+        # the percentile itself may lie above their deadline, so no deadline is derived.
+        timed_out = sum(1 for _, censored in run_times if censored)
+        if (timed_out > len(run_times) * (100 - self._percentile) / 100):
+            return None
+
+        index = min(int(math.ceil(len(run_times) * self._percentile / 100)) - 1, len(run_times) - 1)
+        seconds, _ = run_times[max(index, 0)]
+        return max(seconds * self._factor, MIN_ADAPTIVE_TIMEOUT)
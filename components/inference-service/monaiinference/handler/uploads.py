@@ -0,0 +1,365 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+import time
+import uuid
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+from monaiinference.handler.payload import PayloadTooLargeError
+from monaiinference.handler.reaper import PayloadReaper
+
+DEFAULT_FILENAME = "input.zip"
+EXPIRY_INTERVAL = 5
+MEGABYTE = 1024 * 1024
+UPLOAD_FILE_SUFFIX = ".part"
+
+logger = logging.getLogger('MIS_Uploads')
+
+
+class UploadError(Exception):
+    """Raised when a chunked upload can not be created, written or committed."""
+
+
+class UploadNotFoundError(UploadError):
+    """Raised when an upload session does not exist, or has expired or been committed."""
+
+
+class UploadConflictError(UploadError):
+    """Raised when an upload session is committed before all of its chunks are received, or is written while
+    it is committed."""
+
+
+class InvalidChunkError(UploadError):
+    """Raised when a chunk has an index out of range, the wrong size or does not match its checksum."""
+
+
+class UploadLimitError(UploadError):
+    """Raised when the maximum number of open upload sessions is reached."""
+
+
+class UploadSession:
+    """Class that defines object to store the state of a chunked upload of an input payload"""
+
+    def __init__(self, session_id: str, path: str, size: int, chunk_size: int, filename: str,
+                 content_type: Optional[str]):
+        """Constructor of the UploadSession class
+
+        Args:
+            session_id (str): Identifier of the session
+            path (str): Path of the file the chunks are written into, at their offset
+            size (int): Size in bytes of the input payload file
+            chunk_size (int): Size in bytes of each chunk, except the last one
+            filename (str): Name of the input payload file, whose extension tells a .zip from a .tar file
+            content_type (Optional[str]): Content type of the input payload file
+        """
+        self.session_id = session_id
+        self.path = path
+        self.size = size
+        self.chunk_size = chunk_size
+        self.filename = filename
+        self.content_type = content_type
+        self.chunk_count = max((size + chunk_size - 1) // chunk_size, 1)
+        self.received = set()
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+        # Chunks being written, the session is neither committed nor expired while there are any.
+        self.writes = 0
+        self.committed = False
+
+    def chunk_length(self, index: int) -> int:
+        """Returns the expected size in bytes of a chunk
+
+        Args:
+            index (int): Index of the chunk
+
+        Returns:
+            int: Size in bytes, which is smaller than the chunk size for the last chunk
+        """
+        return min(self.chunk_size, self.size - index * self.chunk_size)
+
+    def received_ranges(self) -> List[Tuple[int, int]]:
+        """Returns the byte ranges of the input payload file which have been received, as [start, end) offsets
+
+        Returns:
+            List[Tuple[int, int]]: Ranges in increasing order, adjacent chunks are merged into one range.
+        """
+        ranges = []
+        for index in sorted(self.received):
+            start = index * self.chunk_size
+            end = start + self.chunk_length(index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+
+        return ranges
+
+    def to_dict(self) -> dict:
+        """Returns the state of the session, including the received byte ranges and the missing chunks."""
+        return {
+            "id": self.session_id,
+            "size": self.size,
+            "chunk_size": self.chunk_size,
+            "chunks": self.chunk_count,
+            "filename": self.filename,
+            "created_at": self.created_at,
+            "received_bytes": sum(self.chunk_length(index) for index in self.received),
+            "received_ranges": [list(r) for r in self.received_ranges()],
+            "missing_chunks": [index for index in range(self.chunk_count) if index not in self.received],
+        }
+
+
+class UploadManager:
+    """Class that receives input payloads in numbered chunks, which may be sent concurrently, in any order and
+    again after a dropped connection. Each chunk is verified against its SHA-256 checksum and written at its
+    offset of a file in the payload volume, so that the file is complete without being assembled once all
+    chunks are received. Sessions which are neither written nor committed within their TTL are discarded."""
+
+    def __init__(self, upload_path: str, chunk_size: int, max_sessions: int, ttl: float,
+                 max_size: int = 0, reaper: Optional[PayloadReaper] = None):
+        """Constructor of the UploadManager class
+
+        Args:
+            upload_path (str): Absolute path of the directory of the files of upload sessions
+            chunk_size (int): Size in Megabytes of each chunk, except the last one of a file
+            max_sessions (int): Maximum number of open upload sessions
+            ttl (float): Time in seconds after the last chunk of a session after which it is discarded
+            max_size (int, optional): Maximum size in Megabytes of an input payload file, 0 for no limit.
+            Defaults to 0.
+            reaper (Optional[PayloadReaper], optional): Reaper which deletes the files of discarded sessions in
+            the background. Defaults to None, in which case files are deleted right away.
+        """
+        self._upload_path = upload_path
+        self._chunk_size = chunk_size * MEGABYTE
+        self._max_sessions = max_sessions
+        self._ttl = ttl
+        self._max_size = max_size * MEGABYTE
+        self._reaper = reaper
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = Lock()
+        self._stopped = Event()
+
+        # Files of sessions of a previous run are removed along with the other leftovers of the payload volume.
+        os.makedirs(self._upload_path, exist_ok=True)
+
+    @property
+    def chunk_size(self) -> int:
+        return self._chunk_size
+
+    def start(self):
+        """Start discarding expired upload sessions."""
+        Thread(target=self.__expire, name='MIS_Uploads', daemon=True).start()
+
+    def shutdown(self):
+        """Stop discarding expired upload sessions."""
+        self._stopped.set()
+
+    def create(self, size: int, filename: Optional[str] = None, content_type: Optional[str] = None) -> UploadSession:
+        """Create an upload session, with a file of the size of the input payload file.
+
+        Args:
+            size (int): Size in bytes of the input payload file
+            filename (Optional[str], optional): Name of the input payload file. Defaults to `input.zip`.
+            content_type (Optional[str], optional): Content type of the input payload file. Defaults to None.
+
+        Returns:
+            UploadSession: The new session
+
+        Raises:
+            InvalidChunkError: If the size is not positive.
+            PayloadTooLargeError: If the size exceeds the maximum size of an input payload file.
+            UploadLimitError: If the maximum number of open upload sessions is reached.
+        """
+        if (size <= 0):
+            raise InvalidChunkError(f'Upload size must be greater than 0, provided value is \"{size}\"')
+        if (self._max_size > 0 and size > self._max_size):
+            raise PayloadTooLargeError(f'Upload of {size} bytes exceeds {self._max_size // MEGABYTE} MB')
+
+        session_id = uuid.uuid4().hex
+        session = UploadSession(session_id, os.path.join(self._upload_path, session_id + UPLOAD_FILE_SUFFIX),
+                                size, self._chunk_size, os.path.basename(filename or '') or DEFAULT_FILENAME,
+                                content_type)
+        with self._lock:
+            if (len(self._sessions) >= self._max_sessions):
+                raise UploadLimitError(f'Maximum number of {self._max_sessions} open uploads is reached')
+            self._sessions[session_id] = session
+
+        # The file is sparse, chunks fill it in any order without moving the chunks received before.
+        with open(session.path, 'wb') as f:
+            f.truncate(size)
+
+        logger.info(f'Upload {session_id} of {size} bytes created with {session.chunk_count} chunks')
+        return session
+
+    def get(self, session_id: str) -> UploadSession:
+        """Returns an open upload session
+
+        Args:
+            session_id (str): Identifier of the session
+
+        Returns:
+            UploadSession: The session
+
+        Raises:
+            UploadNotFoundError: If the session does not exist.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise UploadNotFoundError(f'Upload {session_id} does not exist')
+            return session
+
+    def status(self, session_id: str) -> dict:
+        """Returns the state of an open upload session, including its received byte ranges and missing chunks
+
+        Args:
+            session_id (str): Identifier of the session
+
+        Returns:
+            dict: State of the session
+        """
+        session = self.get(session_id)
+        with self._lock:
+            return session.to_dict()
+
+    def write_chunk(self, session_id: str, index: int, data: bytes, checksum: str) -> dict:
+        """Verify a chunk against its checksum and write it at its offset of the file of an upload session.
+        A chunk which was received before is overwritten.
+
+        Args:
+            session_id (str): Identifier of the session
+            index (int): Index of the chunk, from 0
+            data (bytes): Content of the chunk
+            checksum (str): Hexadecimal SHA-256 checksum of the chunk
+
+        Returns:
+            dict: State of the session
+
+        Raises:
+            UploadNotFoundError: If the session does not exist.
+            UploadConflictError: If the session is being committed.
+            InvalidChunkError: If the index is out of range, or the chunk has the wrong size or checksum.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise UploadNotFoundError(f'Upload {session_id} does not exist')
+            if session.committed:
+                raise UploadConflictError(f'Upload {session_id} is committed')
+            if (index < 0 or index >= session.chunk_count):
+                raise InvalidChunkError(f'Chunk index must be between 0 and {session.chunk_count - 1}, '
+                                        f'provided value is \"{index}\"')
+            if (len(data) != session.chunk_length(index)):
+                raise InvalidChunkError(f'Chunk {index} must be {session.chunk_length(index)} bytes, '
+                                        f'received {len(data)} bytes')
+            session.writes += 1
+            session.last_activity = time.monotonic()
+
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            if (digest != (checksum or '').lower()):
+                raise InvalidChunkError(f'Chunk {index} has checksum {digest}, expected {checksum}')
+
+            # Chunks are written through their own file object, so that concurrent chunks do not share an offset.
+            with open(session.path, 'r+b') as f:
+                f.seek(index * session.chunk_size)
+                f.write(data)
+        finally:
+            with self._lock:
+                session.writes -= 1
+                session.last_activity = time.monotonic()
+
+        with self._lock:
+            session.received.add(index)
+            return session.to_dict()
+
+    def commit(self, session_id: str) -> UploadSession:
+        """Close an upload session whose chunks have all been received, so that its file is extracted as an
+        input payload. The file must be released through `discard` once it has been extracted.
+
+        Args:
+            session_id (str): Identifier of the session
+
+        Returns:
+            UploadSession: The committed session
+
+        Raises:
+            UploadNotFoundError: If the session does not exist.
+            UploadConflictError: If chunks are missing or still being written.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise UploadNotFoundError(f'Upload {session_id} does not exist')
+            if session.committed:
+                raise UploadConflictError(f'Upload {session_id} is already committed')
+            missing = session.chunk_count - len(session.received)
+            if missing > 0:
+                raise UploadConflictError(f'Upload {session_id} is missing {missing} chunks')
+            if session.writes > 0:
+                raise UploadConflictError(f'Upload {session_id} has chunks being written')
+            session.committed = True
+
+        logger.info(f'Upload {session_id} committed')
+        return session
+
+    def reopen(self, session: UploadSession):
+        """Reopen a committed upload session whose input payload was not accepted, for example because the
+        request queue was full, so that it can be committed again without sending its chunks again.
+
+        Args:
+            session (UploadSession): Committed session
+        """
+        with self._lock:
+            if self._sessions.get(session.session_id) is session:
+                session.committed = False
+                session.last_activity = time.monotonic()
+
+    def discard(self, session_id: str) -> bool:
+        """Delete an upload session and its file.
+
+        Args:
+            session_id (str): Identifier of the session
+
+        Returns:
+            bool: False if the session does not exist.
+        """
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+
+        if self._reaper is not None:
+            self._reaper.discard(session.path)
+        else:
+            try:
+                os.remove(session.path)
+            except OSError as e:
+                logger.error(e, exc_info=True)
+
+        logger.info(f'Upload {session_id} discarded')
+        return True
+
+    def __expire(self):
+        while not self._stopped.wait(EXPIRY_INTERVAL):
+            now = time.monotonic()
+            with self._lock:
+                expired = [session.session_id for session in self._sessions.values()
+                           if (not session.committed and session.writes == 0 and
+                               now - session.last_activity > self._ttl)]
+
+            for session_id in expired:
+                logger.info(f'Upload {session_id} expired')
+                self.discard(session_id)
@@ -10,22 +10,59 @@
 # limitations under the License.
 
 import argparse
+import asyncio
 import logging
-from threading import Lock
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
 
 import uvicorn
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import Body, FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from kubernetes import config
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from kubernetes import client, config
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.datastructures import Headers
 from starlette.middleware import Middleware
 from starlette.routing import Host
 
+from monaiinference.handler.admission import AdmissionController, AdmissionRejectedError, ClusterCapacity
+from monaiinference.handler.batching import BatchCollector
+from monaiinference.handler.cache import ResultCache
+from monaiinference.handler.codec import ParallelZipCodec
 from monaiinference.handler.config import ServerConfig
-from monaiinference.handler.kubernetes import KubernetesHandler, PodStatus
-from monaiinference.handler.payload import PayloadProvider
+from monaiinference.handler.jobs import Job, JobManager, JobPhase
+from monaiinference.handler import metrics
+from monaiinference.handler.kubernetes import (DEFAULT_NAMESPACE, POD_WATCH_MODE_POLL, POD_WATCH_MODE_WATCH,
+                                               VOLUME_LIFECYCLE_PER_REQUEST, VOLUME_LIFECYCLE_SHARED,
+                                               WAIT_TIME_FOR_POD_COMPLETION, WAIT_TIME_FOR_POD_PENDING,
+                                               KubernetesHandler)
+from monaiinference.handler.modelcache import CHECKSUM_PATTERN, ModelCache
+from monaiinference.handler.payload import (OUTPUT_FORMAT_TAR, OUTPUT_FORMAT_ZIP, TAR_CONTENT_TYPES, InputReference,
+                                            InputStream, InvalidPayloadError, PayloadProvider, PayloadTooLargeError)
+from monaiinference.handler.pool import WarmPodPool
+from monaiinference.handler.prepull import ImagePrePuller
+from monaiinference.handler.reconcile import (DEFAULT_OWNER_ID, DEFAULT_RECONCILE_INTERVAL, LABEL_VALUE_PATTERN,
+                                              ResourceOwner, ResourceReconciler, default_instance_id)
+from monaiinference.handler.reaper import PayloadReaper
+from monaiinference.handler.registry import (MapConflictError, MapRegistry, MapRegistryError, map_config_to_dict,
+                                             parse_map_config)
+from monaiinference.handler.scheduler import DEFAULT_PRIORITY_CLASS_NAME, PriorityClass, RequestScheduler
+from monaiinference.handler.sharding import SHARD_RULE_SUBDIRECTORY, SHARD_RULES, ShardPolicy
+from monaiinference.handler.timeouts import AdaptiveTimeout
+from monaiinference.handler.uploads import (UploadConflictError, UploadError, UploadLimitError, UploadManager,
+                                            UploadNotFoundError)
 
 MIS_HOST = "0.0.0.0"
+RESULT_CACHE_DIRECTORY = "result-cache"
+TRASH_DIRECTORY = ".trash"
+UPLOAD_DIRECTORY = ".uploads"
+CHUNK_CHECKSUM_HEADER = "X-Chunk-Checksum"
+CLIENT_ID_HEADER = "X-Client-ID"
+# Endpoints which upload an input payload and run an inference request, subject to admission control.
+INFERENCE_PATH_PATTERN = re.compile(r'^/(?:upload/|jobs|uploads/[^/]+/commit|'
+                                    r'maps/(?P<map_name>[^/]+)/(?:infer|jobs|uploads/[^/]+/commit))$')
 
 logging_config = {
     'version': 1, 'disable_existing_loggers': True,
@@ -40,29 +77,57 @@ logging_config = {
                 'uvicorn.access': {'handlers': ['access'], 'level': 'INFO', 'propagate': False},
                 'MIS_Main': {'handlers': ['default'], 'level': 'INFO'},
                 'MIS_Payload': {'handlers': ['default'], 'level': 'INFO'},
-                'MIS_Kubernetes': {'handlers': ['default'], 'level': 'INFO'}
+                'MIS_Kubernetes': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Scheduler': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Pool': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Jobs': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Cache': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Metrics': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Registry': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Batching': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Reaper': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Admission': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_PrePull': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_ModelCache': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Uploads': {'handlers': ['default'], 'level': 'INFO'},
+                'MIS_Reconciler': {'handlers': ['default'], 'level': 'INFO'}
                 },
 }
 
 logger = logging.getLogger('MIS_Main')
-app = FastAPI(
-    middleware=[
-        Middleware(
-            CORSMiddleware,
-            allow_origins=["*"],
-            allow_credentials=True,
-            allow_methods=["*"],
-            allow_headers=["*"],
-        )
-    ],
-)
-request_mutex = Lock()
 
 
-def main():
-    """Driver method that parses arguements and intializes providers
+def parse_priority_class(value: str) -> PriorityClass:
+    """Parses a priority class given as `name:level[:pod priority class name]`
+
+    Args:
+        value (str): Value of a `--priority-class` argument
+
+    Returns:
+        PriorityClass: The priority class
+    """
+    fields = value.split(':')
+    try:
+        if (len(fields) not in (2, 3) or not fields[0]):
+            raise ValueError()
+        return PriorityClass(fields[0], float(fields[1]), fields[2] if len(fields) == 3 and fields[2] else None)
+    except ValueError:
+        raise Exception(f'Priority class value must be name:level[:pod priority class name], '
+                        f'provided value is \"{value}\"')
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses and validates the arguments of MONAI Inference Service
+
+    Args:
+        argv (Optional[List[str]], optional): Arguments to parse. Defaults to the command line arguments.
+
+    Returns:
+        argparse.Namespace: Parsed arguments
     """
     parser = argparse.ArgumentParser()
+    parser.add_argument('--map-name', type=str, required=False, default="default",
+                        help="Name of the MAP configured through the --map-* arguments in the MAP registry")
     parser.add_argument('--map-urn', type=str, required=True,
                         help="MAP Container <image>:<tag> to de deployed for inference")
     parser.add_argument('--map-entrypoint', type=str, required=True,
@@ -77,12 +142,138 @@ def main():
                         help="Output directory path of MAP Container")
     parser.add_argument('--map-model-path', type=str, required=False,
                         help="Model directory path of MAP Container")
+    parser.add_argument('--map-model-source', type=str, required=False,
+                        help="Path or URL of the model file of MAP Container, fetched into the model cache and "
+                        "mounted read-only at the model path, .zip and .tar files are extracted")
+    parser.add_argument('--map-model-checksum', type=str, required=False,
+                        help="SHA-256 checksum the model file of MAP Container is verified against")
+    parser.add_argument('--map-timeout', type=float, required=False, default=WAIT_TIME_FOR_POD_COMPLETION,
+                        help="Maximum time in seconds a MAP pod is given to run an inference request once started")
+    parser.add_argument('--map-pending-timeout', type=float, required=False, default=WAIT_TIME_FOR_POD_PENDING,
+                        help="Maximum time in seconds a MAP pod is given to be scheduled and pull its image")
+    parser.add_argument('--map-multi-case', action='store_true',
+                        help="MAP Container processes several inference requests in one run, each in a sub-directory "
+                        "of its input and output directory named after the request")
+    parser.add_argument('--map-registry', type=str, required=False,
+                        help="Path of a YAML or JSON file of additional MAPs served next to the default MAP")
+    parser.add_argument('--map-admin', action='store_true',
+                        help="Enable the endpoints which register and unregister MAPs at runtime")
+    parser.add_argument('--map-prepull', action='store_true',
+                        help="Pull the images of MAPs onto the nodes which can run them at startup and whenever "
+                        "a MAP is registered, and report readiness once an image is held by a node")
     parser.add_argument('--payload-host-path', type=str, required=True,
                         help="Host path of payload directory")
+    parser.add_argument('--input-root', type=str, action='append', default=[],
+                        help="Host path under which directories may be referenced as input payloads instead of "
+                        "being uploaded, can be given multiple times")
     parser.add_argument('--port', type=int, required=False, default=8000,
                         help="Host port of MONAI Inference Service")
+    parser.add_argument('--max-input-size', type=int, required=False, default=0,
+                        help="Maximum total size in Megabytes of an extracted input payload, 0 for no limit")
+    parser.add_argument('--max-input-files', type=int, required=False, default=0,
+                        help="Maximum number of files in an input payload .zip file, 0 for no limit")
+    parser.add_argument('--payload-workers', type=int, required=False, default=4,
+                        help="Maximum number of input payloads extracted in parallel, "
+                        "further uploads wait without holding a thread")
+    parser.add_argument('--payload-codec-workers', type=int, required=False, default=1,
+                        help="Number of threads which extract and compress the files of one payload in parallel, "
+                        "1 processes files one at a time")
+    parser.add_argument('--payload-reap-rate', type=int, required=False, default=0,
+                        help="Maximum number of discarded payload files deleted per second in the background, "
+                        "0 for no limit")
+    parser.add_argument('--max-upload-sessions', type=int, required=False, default=16,
+                        help="Maximum number of open chunked uploads, 0 disables chunked uploads")
+    parser.add_argument('--upload-chunk-size', type=int, required=False, default=8,
+                        help="Size in Megabytes of each chunk of a chunked upload, except the last one")
+    parser.add_argument('--upload-session-ttl', type=float, required=False, default=3600,
+                        help="Time in seconds after the last chunk of a chunked upload after which it is discarded")
+    parser.add_argument('--output-compression-level', type=int, required=False, default=6,
+                        choices=range(0, 10), metavar="[0-9]",
+                        help="DEFLATE compression level of the output payload .zip file, 0 stores files uncompressed")
+    parser.add_argument('--max-concurrent-requests', type=int, required=False, default=1,
+                        help="Maximum number of inference requests serviced in parallel, "
+                        "0 derives it from the MAP resource limits and the cluster node capacity")
+    parser.add_argument('--max-queued-requests', type=int, required=False, default=16,
+                        help="Maximum number of inference requests waiting for a free slot")
+    parser.add_argument('--queue-timeout', type=float, required=False, default=60,
+                        help="Maximum time in seconds an inference request waits for a free slot")
+    parser.add_argument('--priority-class', type=str, action='append', default=[],
+                        help="Priority class of inference requests as name:level[:pod priority class name], "
+                        "requests of higher levels obtain a slot first, can be given multiple times")
+    parser.add_argument('--default-priority-class', type=str, required=False, default=DEFAULT_PRIORITY_CLASS_NAME,
+                        help="Priority class of inference requests which do not name one")
+    parser.add_argument('--priority-aging', type=float, required=False, default=1.0,
+                        help="Priority levels gained per second by a queued inference request, "
+                        "so that requests of low priority do not starve")
+    parser.add_argument('--admission-control', action='store_true',
+                        help="Reject inference requests before their upload when they can not be serviced in time, "
+                        "with a Retry-After header")
+    parser.add_argument('--max-upload-size-in-flight', type=int, required=False, default=0,
+                        help="Maximum total size in Megabytes of input payloads uploaded in parallel under "
+                        "admission control, 0 for no limit")
+    parser.add_argument('--max-client-share', type=float, required=False, default=1.0,
+                        help="Maximum fraction of the request slots and queue held by the requests of one client "
+                        "under admission control")
+    parser.add_argument('--result-ttl', type=float, required=False, default=300,
+                        help="Time in seconds after which a finished inference job and its result are deleted")
+    parser.add_argument('--result-cache-size', type=int, required=False, default=0,
+                        help="Maximum total size in Megabytes of cached inference results, 0 disables the cache")
+    parser.add_argument('--result-cache-ttl', type=float, required=False, default=3600,
+                        help="Time in seconds after which a cached inference result expires, 0 for no limit")
+    parser.add_argument('--result-cache-path', type=str, required=False,
+                        help="Path of the directory of cached inference results, "
+                        "defaults to a sub-directory of the payload host path")
+    parser.add_argument('--model-cache-path', type=str, required=False,
+                        help="Host path of the directory of cached MAP models, mounted by MONAI Inference Service "
+                        "at the same path, required by MAPs with a model source")
+    parser.add_argument('--model-cache-size', type=int, required=False, default=0,
+                        help="Maximum total size in Megabytes of cached MAP models, unused models are evicted in "
+                        "least recently used order, 0 for no limit")
+    parser.add_argument('--owner-id', type=str, required=False, default=DEFAULT_OWNER_ID,
+                        help="Identifier labelled on the MAP pods, Persistent Volumes and Persistent Volume Claims "
+                        "created by MONAI Inference Service, such as its Helm release, so that stale ones are deleted")
+    parser.add_argument('--reconcile-interval', type=float, required=False, default=DEFAULT_RECONCILE_INTERVAL,
+                        help="Time in seconds between deletions of stale MAP pods, Persistent Volumes and "
+                        "Persistent Volume Claims after the one at startup, 0 to only delete them at startup")
+    parser.add_argument('--pod-watch-mode', type=str, required=False, default=POD_WATCH_MODE_WATCH,
+                        choices=[POD_WATCH_MODE_WATCH, POD_WATCH_MODE_POLL],
+                        help="Follow MAP pod status through the Kubernetes watch API, or poll it every second")
+    parser.add_argument('--adaptive-timeout-percentile', type=float, required=False, default=0,
+                        help="Percentile of the run times of a MAP, per input size, from which the time a MAP pod "
+                        "is given to run is derived, 0 disables adaptive timeouts")
+    parser.add_argument('--adaptive-timeout-factor', type=float, required=False, default=2.0,
+                        help="Factor the percentile of the run times is multiplied by under adaptive timeouts")
+    parser.add_argument('--volume-lifecycle', type=str, required=False, default=VOLUME_LIFECYCLE_PER_REQUEST,
+                        choices=[VOLUME_LIFECYCLE_PER_REQUEST, VOLUME_LIFECYCLE_SHARED],
+                        help="Create a Persistent Volume and Persistent Volume Claim for each MAP pod, "
+                        "or share one across all MAP pods provisioned at startup")
+    parser.add_argument('--volume-claim-name', type=str, required=False,
+                        help="Existing Persistent Volume Claim on the payload host path shared by MAP pods, "
+                        "instead of provisioning one")
+    parser.add_argument('--batch-max-size', type=int, required=False, default=1,
+                        help="Maximum number of inference requests run by one MAP pod, for MAPs which process "
+                        "several requests in one run, 1 disables batching")
+    parser.add_argument('--batch-max-wait', type=int, required=False, default=50,
+                        help="Maximum time in milliseconds an inference request waits for further requests to batch")
+    parser.add_argument('--shard-max', type=int, required=False, default=1,
+                        help="Maximum number of MAP pods the input payload of an inference request is split across, "
+                        "using request slots which are free, 1 disables sharding")
+    parser.add_argument('--shard-rule', type=str, required=False, default=SHARD_RULE_SUBDIRECTORY,
+                        choices=SHARD_RULES,
+                        help="Rule which splits an input payload into shards, either by top-level entry or by file")
+    parser.add_argument('--shard-min-input-size', type=int, required=False, default=0,
+                        help="Minimum size in Megabytes of an extracted input payload to split it into shards")
+    parser.add_argument('--shard-retries', type=int, required=False, default=1,
+                        help="Number of times the MAP pod of a failed shard is run again before the request fails")
+    parser.add_argument('--warm-pool-size', type=int, required=False, default=0,
+                        help="Number of pre-started MAP pods kept ready for inference requests, 0 disables the pool")
+    parser.add_argument('--warm-pool-max-reuse', type=int, required=False, default=0,
+                        help="Number of inference requests after which a pre-started MAP pod is replaced, "
+                        "0 for no limit")
+    parser.add_argument('--warm-pool-idle-ttl', type=float, required=False, default=0,
+                        help="Time in seconds after which an idle pre-started MAP pod is deleted, 0 for no limit")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if (args.map_cpu < 1):
         raise Exception(f'MAP cpu value can not be less than 1, provided value is \"{args.map_cpu}\"')
@@ -90,69 +281,875 @@ def main():
         raise Exception(f'MAP gpu value can not be less than 0, provided value is \"{args.map_gpu}\"')
     if (args.map_memory < 256):
         raise Exception(f'MAP memory value can not be less than 256, provided value is \"{args.map_memory}\"')
+    if (args.map_timeout <= 0):
+        raise Exception(f'MAP timeout value must be greater than 0, provided value is \"{args.map_timeout}\"')
+    if (args.map_pending_timeout <= 0):
+        raise Exception(f'MAP pending timeout value must be greater than 0, '
+                        f'provided value is \"{args.map_pending_timeout}\"')
+    if (args.adaptive_timeout_percentile < 0 or args.adaptive_timeout_percentile > 100):
+        raise Exception(f'Adaptive timeout percentile value must be between 0 and 100, '
+                        f'provided value is \"{args.adaptive_timeout_percentile}\"')
+    if (args.adaptive_timeout_factor < 1):
+        raise Exception(f'Adaptive timeout factor value can not be less than 1, '
+                        f'provided value is \"{args.adaptive_timeout_factor}\"')
+    for input_root in args.input_root:
+        if not os.path.isabs(input_root):
+            raise Exception(f'Input root value must be an absolute path, provided value is \"{input_root}\"')
+    if (args.max_input_size < 0):
+        raise Exception(f'Maximum input size value can not be less than 0, provided value is \"{args.max_input_size}\"')
+    if (args.max_input_files < 0):
+        raise Exception(f'Maximum input files value can not be less than 0, '
+                        f'provided value is \"{args.max_input_files}\"')
+    if (args.payload_workers < 1):
+        raise Exception(f'Payload workers value can not be less than 1, provided value is \"{args.payload_workers}\"')
+    if (args.payload_reap_rate < 0):
+        raise Exception(f'Payload reap rate value can not be less than 0, '
+                        f'provided value is \"{args.payload_reap_rate}\"')
+    if (args.max_upload_sessions < 0):
+        raise Exception(f'Maximum upload sessions value can not be less than 0, '
+                        f'provided value is \"{args.max_upload_sessions}\"')
+    if (args.upload_chunk_size < 1):
+        raise Exception(f'Upload chunk size value can not be less than 1, '
+                        f'provided value is \"{args.upload_chunk_size}\"')
+    if (args.upload_session_ttl <= 0):
+        raise Exception(f'Upload session TTL value must be greater than 0, '
+                        f'provided value is \"{args.upload_session_ttl}\"')
+    if (args.payload_codec_workers < 1):
+        raise Exception(f'Payload codec workers value can not be less than 1, '
+                        f'provided value is \"{args.payload_codec_workers}\"')
+    if (args.max_concurrent_requests < 0):
+        raise Exception(f'Maximum concurrent requests value can not be less than 0, '
+                        f'provided value is \"{args.max_concurrent_requests}\"')
+    if (args.max_queued_requests < 0):
+        raise Exception(f'Maximum queued requests value can not be less than 0, '
+                        f'provided value is \"{args.max_queued_requests}\"')
+    args.priority_class = ([parse_priority_class(value) for value in args.priority_class] or
+                           [PriorityClass(args.default_priority_class, 0)])
+    priority_class_names = [priority_class.name for priority_class in args.priority_class]
+    if (len(set(priority_class_names)) != len(priority_class_names)):
+        raise Exception(f'Priority class names must be unique, provided values are \"{priority_class_names}\"')
+    if (args.default_priority_class not in priority_class_names):
+        raise Exception(f'Default priority class must be one of the priority classes, '
+                        f'provided value is \"{args.default_priority_class}\"')
+    if (args.priority_aging < 0):
+        raise Exception(f'Priority aging value can not be less than 0, provided value is \"{args.priority_aging}\"')
+    if (args.max_upload_size_in_flight < 0):
+        raise Exception(f'Maximum upload size in flight value can not be less than 0, '
+                        f'provided value is \"{args.max_upload_size_in_flight}\"')
+    if (args.max_client_share <= 0 or args.max_client_share > 1):
+        raise Exception(f'Maximum client share value must be greater than 0 and at most 1, '
+                        f'provided value is \"{args.max_client_share}\"')
+    if (args.result_cache_size < 0):
+        raise Exception(f'Result cache size value can not be less than 0, '
+                        f'provided value is \"{args.result_cache_size}\"')
+    if (args.map_model_checksum and not CHECKSUM_PATTERN.match(args.map_model_checksum)):
+        raise Exception(f'MAP model checksum value must be a SHA-256 checksum, '
+                        f'provided value is \"{args.map_model_checksum}\"')
+    if (args.map_model_checksum and not args.map_model_source):
+        raise Exception(f'MAP model checksum value requires a model source, '
+                        f'provided value is \"{args.map_model_checksum}\"')
+    if (args.map_model_source and not args.map_model_path):
+        raise Exception(f'MAP model source value requires a model path, '
+                        f'provided value is \"{args.map_model_source}\"')
+    if (args.map_model_source and not args.model_cache_path):
+        raise Exception(f'MAP model source value requires a model cache path, '
+                        f'provided value is \"{args.map_model_source}\"')
+    if (args.model_cache_path and not os.path.isabs(args.model_cache_path)):
+        raise Exception(f'Model cache path value must be an absolute path, '
+                        f'provided value is \"{args.model_cache_path}\"')
+    if (args.model_cache_size < 0):
+        raise Exception(f'Model cache size value can not be less than 0, provided value is \"{args.model_cache_size}\"')
+    if not LABEL_VALUE_PATTERN.match(args.owner_id):
+        raise Exception(f'Owner ID value must be a valid Kubernetes label value, provided value is \"{args.owner_id}\"')
+    if (args.reconcile_interval < 0):
+        raise Exception(f'Reconcile interval value can not be less than 0, '
+                        f'provided value is \"{args.reconcile_interval}\"')
+    if (args.batch_max_size < 1):
+        raise Exception(f'Batch max size value can not be less than 1, provided value is \"{args.batch_max_size}\"')
+    if (args.batch_max_wait < 0):
+        raise Exception(f'Batch max wait value can not be less than 0, provided value is \"{args.batch_max_wait}\"')
+    if (args.shard_max < 1):
+        raise Exception(f'Shard max value can not be less than 1, provided value is \"{args.shard_max}\"')
+    if (args.shard_min_input_size < 0):
+        raise Exception(f'Shard min input size value can not be less than 0, '
+                        f'provided value is \"{args.shard_min_input_size}\"')
+    if (args.shard_retries < 0):
+        raise Exception(f'Shard retries value can not be less than 0, provided value is \"{args.shard_retries}\"')
+    if (args.warm_pool_size < 0):
+        raise Exception(f'Warm pool size value can not be less than 0, provided value is \"{args.warm_pool_size}\"')
+
+    return args
 
-    config.load_incluster_config()
+
+def create_app(args: argparse.Namespace, kubernetes_core_client: Optional[client.CoreV1Api] = None) -> FastAPI:
+    """Intializes providers and creates the FastAPI application of MONAI Inference Service
+
+    Args:
+        args (argparse.Namespace): Arguments returned by `parse_args`
+        kubernetes_core_client (Optional[client.CoreV1Api], optional): Client of the Kubernetes core API.
+        Defaults to a client created from the loaded Kubernetes configuration.
+
+    Returns:
+        FastAPI: Application which serves the REST endpoints of MONAI Inference Service
+    """
+    app = FastAPI(
+        middleware=[
+            Middleware(
+                CORSMiddleware,
+                allow_origins=["*"],
+                allow_credentials=True,
+                allow_methods=["*"],
+                allow_headers=["*"],
+            )
+        ],
+    )
 
     service_config = ServerConfig(args.map_urn, args.map_entrypoint.split(' '), args.map_cpu,
                                   args.map_memory, args.map_gpu, args.map_input_path,
-                                  args.map_output_path, args.map_model_path, args.payload_host_path)
-    kubernetes_handler = KubernetesHandler(service_config)
+                                  args.map_output_path, args.map_model_path, args.payload_host_path,
+                                  args.map_timeout, args.map_multi_case, args.map_pending_timeout,
+                                  args.map_model_source or None, args.map_model_checksum or None)
+    kubernetes_core_client = kubernetes_core_client or client.CoreV1Api()
+    # Models are kept across restarts, unlike payloads and cached results, since they are costly to fetch.
+    model_cache = ModelCache(args.model_cache_path, args.model_cache_size) if args.model_cache_path else None
+
+    def create_adaptive_timeout() -> Optional[AdaptiveTimeout]:
+        # Run times are kept per MAP, since MAPs differ in the work they do per input.
+        if (args.adaptive_timeout_percentile > 0):
+            return AdaptiveTimeout(args.adaptive_timeout_percentile, args.adaptive_timeout_factor)
+        return None
+
+    # Resources of all MAPs carry the same owner, so that one reconciler finds those left behind by any of them.
+    resource_owner = ResourceOwner(args.owner_id, default_instance_id())
+    reconciler = ResourceReconciler(kubernetes_core_client, resource_owner, DEFAULT_NAMESPACE, args.reconcile_interval)
+    image_prepuller = ImagePrePuller(kubernetes_core_client, owner=resource_owner) if args.map_prepull else None
+    ready_nodes = image_prepuller.ready_nodes if image_prepuller is not None else None
+    kubernetes_handler = KubernetesHandler(service_config, args.pod_watch_mode, args.volume_lifecycle,
+                                           args.volume_claim_name or None, kubernetes_core_client, ready_nodes,
+                                           create_adaptive_timeout(), model_cache, resource_owner)
+    # One codec is shared by the payloads of all MAPs, so that parallel payloads do not multiply its threads.
+    codec = ParallelZipCodec(args.payload_codec_workers) if args.payload_codec_workers > 1 else None
+    # Payloads are moved into the trash directory, so that requests do not wait for their files to be deleted.
+    reaper = PayloadReaper(os.path.join(args.payload_host_path, TRASH_DIRECTORY), args.payload_reap_rate)
+    reaper.start()
+    metrics.TRASH_BACKLOG.set_function(lambda: reaper.backlog)
     payload_provider = PayloadProvider(args.payload_host_path,
                                        args.map_input_path,
-                                       args.map_output_path)
+                                       args.map_output_path,
+                                       args.max_input_size,
+                                       args.max_input_files,
+                                       args.output_compression_level,
+                                       codec=codec,
+                                       reaper=reaper,
+                                       input_roots=args.input_root)
+    # Chunks are written into the payload volume, so that a committed upload is extracted without being copied.
+    upload_manager = None
+    if (args.max_upload_sessions > 0):
+        upload_manager = UploadManager(os.path.join(args.payload_host_path, UPLOAD_DIRECTORY),
+                                       args.upload_chunk_size, args.max_upload_sessions, args.upload_session_ttl,
+                                       args.max_input_size, reaper)
+
+    max_concurrent_requests = args.max_concurrent_requests
+    if (max_concurrent_requests == 0):
+        max_concurrent_requests = kubernetes_handler.get_max_concurrent_pods()
+    scheduler = RequestScheduler(max_concurrent_requests, args.max_queued_requests, args.queue_timeout,
+                                 args.priority_aging)
+    metrics.QUEUE_DEPTH.set_function(lambda: scheduler.queue_depth)
+    metrics.IN_FLIGHT.set_function(lambda: scheduler.in_flight)
+
+    warm_pool = None
+    if (args.warm_pool_size > 0):
+        warm_pool = WarmPodPool(kubernetes_handler, payload_provider, args.warm_pool_size,
+                                args.warm_pool_max_reuse, args.warm_pool_idle_ttl)
+
+    result_cache = None
+    if (args.result_cache_size > 0):
+        result_cache_path = args.result_cache_path or os.path.join(args.payload_host_path, RESULT_CACHE_DIRECTORY)
+        result_cache = ResultCache(result_cache_path, args.result_cache_size, args.result_cache_ttl, reaper)
+
+    def create_batch_collector(map_config: ServerConfig) -> Optional[BatchCollector]:
+        # Batching stays off for MAPs which process one inference request per run.
+        if (args.batch_max_size > 1 and map_config.map_multi_case):
+            return BatchCollector(args.batch_max_size, args.batch_max_wait / 1000)
+        return None
+
+    def create_shard_policy(batch_collector: Optional[BatchCollector]) -> Optional[ShardPolicy]:
+        # MAPs which batch requests run several inputs in one pod, rather than one input in several pods.
+        if (args.shard_max > 1 and batch_collector is None):
+            return ShardPolicy(args.shard_max, args.shard_rule, args.shard_min_input_size, args.shard_retries)
+        return None
+
+    batch_collector = create_batch_collector(service_config)
+    job_manager = JobManager(kubernetes_handler, payload_provider, scheduler, warm_pool, args.result_ttl,
+                             result_cache, batch_collector, create_shard_policy(batch_collector))
+
+    def create_job_manager(map_config: ServerConfig) -> JobManager:
+        # MAPs of the registry share the payload volume, scheduler, result cache and model cache of the default MAP.
+        if (map_config.map_model_source and model_cache is None):
+            raise MapRegistryError(f'MAP model source value requires a model cache path, '
+                                   f'provided value is \"{map_config.map_model_source}\"')
+        map_kubernetes_handler = KubernetesHandler(map_config, args.pod_watch_mode, args.volume_lifecycle,
+                                                   args.volume_claim_name or None, kubernetes_core_client,
+                                                   ready_nodes, create_adaptive_timeout(), model_cache,
+                                                   resource_owner)
+        map_payload_provider = PayloadProvider(args.payload_host_path,
+                                               map_config.map_input_path,
+                                               map_config.map_output_path,
+                                               args.max_input_size,
+                                               args.max_input_files,
+                                               args.output_compression_level,
+                                               clean_host_path=False,
+                                               codec=codec,
+                                               reaper=reaper,
+                                               input_roots=args.input_root)
+        map_batch_collector = create_batch_collector(map_config)
+        return JobManager(map_kubernetes_handler, map_payload_provider, scheduler, None, args.result_ttl,
+                          result_cache, map_batch_collector, create_shard_policy(map_batch_collector))
+
+    map_registry = MapRegistry(create_job_manager, args.payload_host_path, args.map_name, job_manager)
+
+    def update_prepulled_images():
+        # Images of unregistered or replaced MAPs are no longer pulled onto new nodes.
+        if image_prepuller is not None:
+            image_prepuller.set_images([map_job_manager.kubernetes_handler.config
+                                        for _, map_job_manager in map_registry.items()])
+        # Models of unregistered or replaced MAPs are no longer warmed, and are evicted once the cache is full.
+        if model_cache is not None:
+            model_cache.set_models([map_job_manager.kubernetes_handler.config
+                                    for _, map_job_manager in map_registry.items()])
+
+    def find_job_manager(map_name: str) -> JobManager:
+        map_job_manager = map_registry.get(map_name)
+        if map_job_manager is None:
+            raise HTTPException(status_code=404, detail=f'MAP {map_name} does not exist')
+        return map_job_manager
+
+    priority_classes = {priority_class.name: priority_class for priority_class in args.priority_class}
+
+    def find_priority_class(name: Optional[str]) -> PriorityClass:
+        priority_class = priority_classes.get(name or args.default_priority_class)
+        if priority_class is None:
+            raise HTTPException(status_code=400, detail=f'Priority class must be one of {sorted(priority_classes)}, '
+                                f'provided value is "{name}"')
+        return priority_class
+
+    payload_executor = ThreadPoolExecutor(max_workers=args.payload_workers, thread_name_prefix='MIS_Payload')
+
+    admission_controller = None
+    if args.admission_control:
+        cluster_capacity = ClusterCapacity(kubernetes_handler.kubernetes_core_client)
+        admission_controller = AdmissionController(scheduler, cluster_capacity, args.max_upload_size_in_flight,
+                                                   args.max_client_share)
+
+        @app.middleware("http")
+        async def admit_request(request: Request, call_next) -> Response:
+            # Runs before the request body is read, so that rejected requests do not upload their payload.
+            match = INFERENCE_PATH_PATTERN.match(request.url.path)
+            map_job_manager = map_registry.get(match.group("map_name") or args.map_name) if (
+                request.method == "POST" and match is not None) else None
+            if map_job_manager is None:
+                return await call_next(request)
+
+            client_id = request.headers.get(CLIENT_ID_HEADER) or (request.client.host if request.client else "")
+            # Unknown priority classes are rejected by the endpoint.
+            priority_class = priority_classes.get(request.query_params.get("priority") or args.default_priority_class)
+            try:
+                ticket = admission_controller.admit(client_id, int(request.headers.get("content-length") or 0),
+                                                    map_job_manager.kubernetes_handler.config,
+                                                    map_job_manager.idle_warm_pods,
+                                                    priority_class.level if priority_class is not None else 0)
+            except AdmissionRejectedError as e:
+                return JSONResponse(status_code=e.status_code, content={"detail": str(e)},
+                                    headers={"Retry-After": str(e.retry_after)})
+
+            request.state.admission_ticket = ticket
+            try:
+                return await call_next(request)
+            finally:
+                ticket.release()
+
+        app.router.add_event_handler("startup", cluster_capacity.start)
+        app.router.add_event_handler("shutdown", cluster_capacity.shutdown)
+
+    async def read_input_payload(request: Request, file: Optional[UploadFile]) -> Union[UploadFile, InputStream,
+                                                                                        InputReference]:
+        # Besides multipart uploads, the body may be a .tar stream extracted as it is received,
+        # or a JSON reference to a directory under one of the input roots.
+        if file is not None:
+            return file
+
+        content_type = request.headers.get("content-type", "").split(';')[0].strip().lower()
+        if content_type in TAR_CONTENT_TYPES:
+            return InputStream(request.stream(), asyncio.get_running_loop())
+        if content_type == "application/json":
+            try:
+                body = await request.json()
+            except ValueError:
+                raise HTTPException(status_code=400, detail='Input reference is not valid JSON')
+            if not isinstance(body, dict) or not isinstance(body.get("path"), str):
+                raise HTTPException(status_code=400, detail='Input reference must be an object with a "path" string')
+            return InputReference(body["path"])
+
+        raise HTTPException(status_code=400, detail='Input payload must be a multipart file upload, '
+                            'an application/x-tar body or an application/json input reference')
+
+    def check_output_format(output: str) -> str:
+        if output not in (OUTPUT_FORMAT_ZIP, OUTPUT_FORMAT_TAR):
+            raise HTTPException(status_code=400, detail=f'Output format must be {OUTPUT_FORMAT_ZIP} or '
+                                f'{OUTPUT_FORMAT_TAR}, provided value is "{output}"')
+        return output
+
+    async def submit_job(job_manager: JobManager, file: Optional[UploadFile], request: Request,
+                         priority: Optional[str]) -> Job:
+        priority_class = find_priority_class(priority)
+        try:
+            job = await job_manager.submit_async(await read_input_payload(request, file), payload_executor,
+                                                 priority_class)
+        except InvalidPayloadError as e:
+            logger.info(f'Request rejected: {e}')
+            raise HTTPException(status_code=400, detail=str(e))
+        except PayloadTooLargeError as e:
+            logger.info(f'Request rejected: {e}')
+            raise HTTPException(status_code=413, detail=str(e))
+
+        # Admitted requests count against admission control until their job has finished.
+        ticket = getattr(request.state, "admission_ticket", None)
+        if ticket is not None:
+            ticket.upload_finished()
+            job_manager.add_done_callback(job, ticket.hold())
+        return job
+
+    def find_job(job_id: str) -> Tuple[JobManager, Job]:
+        found = map_registry.find_job(job_id)
+        if found is None:
+            raise HTTPException(status_code=404, detail=f'Job {job_id} does not exist')
+        return found
+
+    async def run_job(job_manager: JobManager, file: Optional[UploadFile], request: Request,
+                      output: str, priority: Optional[str]) -> StreamingResponse:
+        # Waiting requests hold neither a thread of the event loop executor nor of the payload executor.
+        output = check_output_format(output)
+        return await finish_job(job_manager, await submit_job(job_manager, file, request, priority), output)
+
+    async def finish_job(job_manager: JobManager, job: Job, output: str) -> StreamingResponse:
+        await job_manager.wait(job)
+
+        if (job.phase is not JobPhase.Succeeded):
+            await asyncio.get_running_loop().run_in_executor(payload_executor, job_manager.delete, job)
+            headers = None
+            if (admission_controller is not None and job.status_code == 503):
+                headers = {"Retry-After": str(admission_controller.retry_after())}
+            raise HTTPException(status_code=job.status_code, detail=job.detail, headers=headers)
+
+        return job_manager.stream_result(job, delete_job=True, output_format=output)
 
     @app.post("/upload/")
-    def upload_file(file: UploadFile = File(...)) -> FileResponse:
+    async def upload_file(request: Request, file: Optional[UploadFile] = File(None),
+                          output: str = OUTPUT_FORMAT_ZIP, priority: Optional[str] = None) -> StreamingResponse:
         """Defines REST POST Endpoint for Uploading input payloads.
-        Will trigger inference job sequentially after uploading payload
+        Will trigger inference job of the default MAP after uploading payload, and wait for it to complete
 
         Args:
-            file (UploadFile, optional): .zip file provided by user to be moved
-            and extracted in shared volume directory for input payloads. Defaults to File(...).
+            request (Request): HTTP request, which carries its admission
+            file (Optional[UploadFile], optional): .zip or .tar file provided by user to be moved
+            and extracted in shared volume directory for input payloads. Defaults to File(None), in which case
+            the body is read as a .tar stream or as a JSON reference to a directory under an input root.
+            output (str, optional): Format of the output payload, `zip` or uncompressed `tar`. Defaults to `zip`.
+            priority (Optional[str], optional): Priority class of the request. Defaults to the default priority class.
 
         Returns:
-            FileResponse: Asynchronous object for FastAPI to stream compressed .zip folder with
+            StreamingResponse: Asynchronous object for FastAPI to stream a compressed .zip or .tar folder with
             the output payload from running the MONAI Application Package
         """
         logger.info("/upload/ Request Received")
-        if not request_mutex.acquire(False):
-            logger.info("Request rejected as MIS is currently servicing another request")
-            raise HTTPException(
-                status_code=500,
-                detail="Request timed out since MAP container's pod was in pending state after timeout")
-        else:
-            logger.info("Acquired resource lock")
+        return await run_job(job_manager, file, request, output, priority)
 
-        try:
-            payload_provider.upload_input_payload(file)
-            kubernetes_handler.create_kubernetes_pod()
+    @app.post("/maps/{map_name}/infer")
+    async def infer(map_name: str, request: Request, file: Optional[UploadFile] = File(None),
+                    output: str = OUTPUT_FORMAT_ZIP, priority: Optional[str] = None) -> StreamingResponse:
+        """Defines REST POST Endpoint for Uploading input payloads of a registered MAP.
+        Will trigger inference job of the MAP after uploading payload, and wait for it to complete
+
+        Args:
+            map_name (str): Name of the MAP
+            request (Request): HTTP request, which carries its admission
+            file (Optional[UploadFile], optional): .zip or .tar file provided by user to be moved
+            and extracted in shared volume directory for input payloads. Defaults to File(None), in which case
+            the body is read as a .tar stream or as a JSON reference to a directory under an input root.
+            output (str, optional): Format of the output payload, `zip` or uncompressed `tar`. Defaults to `zip`.
+            priority (Optional[str], optional): Priority class of the request. Defaults to the default priority class.
+
+        Returns:
+            StreamingResponse: Asynchronous object for FastAPI to stream a compressed .zip or .tar folder with
+            the output payload from running the MONAI Application Package
+        """
+        logger.info(f'/maps/{map_name}/infer Request Received')
+        return await run_job(find_job_manager(map_name), file, request, output, priority)
+
+    @app.post("/jobs", status_code=202)
+    async def create_job(request: Request, file: Optional[UploadFile] = File(None),
+                         priority: Optional[str] = None) -> dict:
+        """Defines REST POST Endpoint for submitting an inference job.
+        Returns as soon as the input payload is uploaded and the job is queued
+
+        Args:
+            request (Request): HTTP request, which carries its admission
+            file (Optional[UploadFile], optional): .zip or .tar file provided by user to be moved
+            and extracted in shared volume directory for input payloads. Defaults to File(None), in which case
+            the body is read as a .tar stream or as a JSON reference to a directory under an input root.
+            priority (Optional[str], optional): Priority class of the request. Defaults to the default priority class.
 
+        Returns:
+            dict: Identifier, phase and timing information of the job
+        """
+        logger.info("/jobs Request Received")
+        return (await submit_job(job_manager, file, request, priority)).to_dict()
+
+    @app.post("/maps/{map_name}/jobs", status_code=202)
+    async def create_map_job(map_name: str, request: Request, file: Optional[UploadFile] = File(None),
+                             priority: Optional[str] = None) -> dict:
+        """Defines REST POST Endpoint for submitting an inference job of a registered MAP.
+        Returns as soon as the input payload is uploaded and the job is queued
+
+        Args:
+            map_name (str): Name of the MAP
+            request (Request): HTTP request, which carries its admission
+            file (Optional[UploadFile], optional): .zip or .tar file provided by user to be moved
+            and extracted in shared volume directory for input payloads. Defaults to File(None), in which case
+            the body is read as a .tar stream or as a JSON reference to a directory under an input root.
+            priority (Optional[str], optional): Priority class of the request. Defaults to the default priority class.
+
+        Returns:
+            dict: Identifier, phase and timing information of the job
+        """
+        logger.info(f'/maps/{map_name}/jobs Request Received')
+        return (await submit_job(find_job_manager(map_name), file, request, priority)).to_dict()
+
+    if upload_manager is not None:
+        def raise_upload_error(e: UploadError):
+            status_code = 400
+            if isinstance(e, UploadNotFoundError):
+                status_code = 404
+            elif isinstance(e, UploadConflictError):
+                status_code = 409
+            elif isinstance(e, UploadLimitError):
+                status_code = 429
+            raise HTTPException(status_code=status_code, detail=str(e))
+
+        async def commit_upload(job_manager: JobManager, upload_id: str, request: Request, wait: bool, output: str,
+                                priority: Optional[str]) -> Response:
+            # Parameters are checked before the upload is committed, so that their errors leave it open.
+            output = check_output_format(output)
+            find_priority_class(priority)
             try:
-                pod_status = kubernetes_handler.watch_kubernetes_pod()
+                session = upload_manager.commit(upload_id)
+            except UploadError as e:
+                raise_upload_error(e)
+
+            # The file of the session is extracted in place, like a spooled multipart upload.
+            file = UploadFile(file=open(session.path, 'rb'), filename=session.filename,
+                              headers=Headers({"content-type": session.content_type or "application/zip"}))
+            try:
+                job = await submit_job(job_manager, file, request, priority)
+            except HTTPException as e:
+                # Only invalid payloads are deleted, others can be committed again without sending their chunks.
+                if e.status_code not in (400, 413):
+                    upload_manager.reopen(session)
+                raise
+            except Exception:
+                upload_manager.reopen(session)
+                raise
             finally:
-                kubernetes_handler.delete_kubernetes_pod()
-
-            if (pod_status is PodStatus.Pending):
-                logger.error("Request timed out since MAP container's pod was in pending state after timeout")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Request timed out since MAP container's pod was in pending state after timeout")
-            elif (pod_status is PodStatus.Running):
-                logger.error("Request timed out since MAP container's pod was in running state after timeout")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Request timed out since MAP container's pod was in running state after timeout")
-            elif (pod_status is PodStatus.Failed):
-                logger.info("Request failed since MAP container's pod failed")
-                raise HTTPException(status_code=500, detail="Request failed since MAP container's pod failed")
-            elif (pod_status is PodStatus.Succeeded):
-                logger.info("MAP container's pod completed")
-                return payload_provider.stream_output_payload()
-        except Exception as e:
-            logging.error(e, exc_info=True)
-        finally:
-            logger.info("Releasing resource lock")
-            request_mutex.release()
+                file.file.close()
+                if session.committed:
+                    upload_manager.discard(upload_id)
+
+            if wait:
+                return await finish_job(job_manager, job, output)
+            return JSONResponse(status_code=202, content=job.to_dict())
+
+        @app.post("/uploads", status_code=201)
+        def create_upload(entry: dict = Body(...)) -> dict:
+            """Defines REST POST Endpoint for starting a chunked upload of an input payload.
+            Chunks of the size returned are sent to `/uploads/{upload_id}/chunks/{index}`, the last one with
+            the remainder of the file
+
+            Args:
+                entry (dict): `size` in bytes of the .zip or .tar file, and its optional `filename`
+                and `contentType`
+
+            Returns:
+                dict: Identifier, chunk size and number of chunks of the upload
+            """
+            size = entry.get("size")
+            if not isinstance(size, int) or isinstance(size, bool):
+                raise HTTPException(status_code=400, detail='Upload must be an object with a "size" integer')
+            try:
+                session = upload_manager.create(size, entry.get("filename"), entry.get("contentType"))
+            except PayloadTooLargeError as e:
+                raise HTTPException(status_code=413, detail=str(e))
+            except UploadError as e:
+                raise_upload_error(e)
+            return session.to_dict()
+
+        @app.put("/uploads/{upload_id}/chunks/{index}")
+        async def upload_chunk(upload_id: str, index: int, request: Request) -> dict:
+            """Defines REST PUT Endpoint for sending one chunk of a chunked upload.
+            Chunks may be sent concurrently and in any order, and a chunk sent again replaces the previous one
+
+            Args:
+                upload_id (str): Identifier of the upload
+                index (int): Index of the chunk, from 0
+                request (Request): HTTP request, whose body is the chunk and whose `X-Chunk-Checksum` header
+                is its hexadecimal SHA-256 checksum
+
+            Returns:
+                dict: Received byte ranges and missing chunks of the upload
+            """
+            data = await request.body()
+            try:
+                # Chunks are hashed and written in the payload executor, so that they do not block the event loop.
+                return await asyncio.get_running_loop().run_in_executor(
+                    payload_executor, upload_manager.write_chunk, upload_id, index, data,
+                    request.headers.get(CHUNK_CHECKSUM_HEADER, ""))
+            except UploadError as e:
+                raise_upload_error(e)
+
+        @app.get("/uploads/{upload_id}")
+        def get_upload_status(upload_id: str) -> dict:
+            """Defines REST GET Endpoint for the state of a chunked upload, so that an interrupted upload
+            resumes with its missing chunks
+
+            Args:
+                upload_id (str): Identifier of the upload
+
+            Returns:
+                dict: Received byte ranges and missing chunks of the upload
+            """
+            try:
+                return upload_manager.status(upload_id)
+            except UploadError as e:
+                raise_upload_error(e)
+
+        @app.delete("/uploads/{upload_id}")
+        def delete_upload(upload_id: str) -> dict:
+            """Defines REST DELETE Endpoint for abandoning a chunked upload.
+
+            Args:
+                upload_id (str): Identifier of the upload
+
+            Returns:
+                dict: Identifier of the deleted upload
+            """
+            if not upload_manager.discard(upload_id):
+                raise HTTPException(status_code=404, detail=f'Upload {upload_id} does not exist')
+            return {"id": upload_id}
+
+        @app.post("/uploads/{upload_id}/commit")
+        async def commit(upload_id: str, request: Request, wait: bool = False, output: str = OUTPUT_FORMAT_ZIP,
+                         priority: Optional[str] = None) -> Response:
+            """Defines REST POST Endpoint for running the default MAP on a chunked upload whose chunks have
+            all been received. The upload is extracted as an input payload and deleted
+
+            Args:
+                upload_id (str): Identifier of the upload
+                request (Request): HTTP request, which carries its admission
+                wait (bool, optional): Wait for the job and stream its output payload, like `/upload/`,
+                instead of returning the queued job, like `/jobs`. Defaults to False.
+                output (str, optional): Format of the output payload when waiting, `zip` or uncompressed `tar`.
+                Defaults to `zip`.
+                priority (Optional[str], optional): Priority class of the request. Defaults to the default
+                priority class.
+
+            Returns:
+                Response: Identifier, phase and timing information of the job, or its output payload when waiting
+            """
+            logger.info(f'/uploads/{upload_id}/commit Request Received')
+            return await commit_upload(job_manager, upload_id, request, wait, output, priority)
+
+        @app.post("/maps/{map_name}/uploads/{upload_id}/commit")
+        async def commit_map(map_name: str, upload_id: str, request: Request, wait: bool = False,
+                             output: str = OUTPUT_FORMAT_ZIP, priority: Optional[str] = None) -> Response:
+            """Defines REST POST Endpoint for running a registered MAP on a chunked upload whose chunks have
+            all been received. The upload is extracted as an input payload and deleted
+
+            Args:
+                map_name (str): Name of the MAP
+                upload_id (str): Identifier of the upload
+                request (Request): HTTP request, which carries its admission
+                wait (bool, optional): Wait for the job and stream its output payload, like `/maps/{map_name}/infer`,
+                instead of returning the queued job. Defaults to False.
+                output (str, optional): Format of the output payload when waiting, `zip` or uncompressed `tar`.
+                Defaults to `zip`.
+                priority (Optional[str], optional): Priority class of the request. Defaults to the default
+                priority class.
+
+            Returns:
+                Response: Identifier, phase and timing information of the job, or its output payload when waiting
+            """
+            logger.info(f'/maps/{map_name}/uploads/{upload_id}/commit Request Received')
+            return await commit_upload(find_job_manager(map_name), upload_id, request, wait, output, priority)
+
+    @app.get("/jobs/{job_id}")
+    def get_job_status(job_id: str) -> dict:
+        """Defines REST GET Endpoint for the phase and timing information of an inference job.
+
+        Args:
+            job_id (str): Identifier of the job
+
+        Returns:
+            dict: Identifier, phase and timing information of the job
+        """
+        _, job = find_job(job_id)
+        return job.to_dict()
+
+    @app.get("/jobs/{job_id}/result")
+    def get_job_result(job_id: str, output: str = OUTPUT_FORMAT_ZIP) -> StreamingResponse:
+        """Defines REST GET Endpoint for the result of a succeeded inference job.
+        The result is deleted once it has been streamed
+
+        Args:
+            job_id (str): Identifier of the job
+            output (str, optional): Format of the output payload, `zip` or uncompressed `tar`. Defaults to `zip`.
+
+        Returns:
+            StreamingResponse: Asynchronous object for FastAPI to stream a compressed .zip or .tar folder with
+            the output payload from running the MONAI Application Package
+        """
+        output = check_output_format(output)
+        job_manager, job = find_job(job_id)
+        if not job.done.is_set():
+            raise HTTPException(status_code=409, detail=f'Job {job_id} has not completed')
+        if (job.phase is not JobPhase.Succeeded):
+            raise HTTPException(status_code=409, detail=job.detail)
+
+        response = job_manager.stream_result(job, output_format=output)
+        if response is None:
+            raise HTTPException(status_code=410, detail=f'Result of job {job_id} has already been retrieved')
+
+        return response
+
+    @app.delete("/jobs/{job_id}")
+    def delete_job(job_id: str) -> dict:
+        """Defines REST DELETE Endpoint for cancelling an inference job.
+        Deletes the MAP pod of the job if it is running, and the payload of the job
+
+        Args:
+            job_id (str): Identifier of the job
+
+        Returns:
+            dict: Identifier, phase and timing information of the job
+        """
+        job_manager, _ = find_job(job_id)
+        job = job_manager.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f'Job {job_id} does not exist')
+        return job.to_dict()
+
+    @app.get("/maps")
+    def list_maps() -> dict:
+        """Defines REST GET Endpoint for the MAPs served by MONAI Inference Service.
+
+        Returns:
+            dict: Name of the default MAP, and the configuration, number of unfinished jobs and,
+            with adaptive timeouts, the run times learned per input size bucket of each MAP
+        """
+        def describe(map_job_manager: JobManager) -> dict:
+            handler = map_job_manager.kubernetes_handler
+            description = {**map_config_to_dict(handler.config), "unfinishedJobs": map_job_manager.unfinished_jobs}
+            if handler.adaptive_timeout is not None:
+                description["runTimes"] = handler.adaptive_timeout.stats
+            return description
+
+        return {
+            "default": map_registry.default_map_name,
+            "maps": {name: describe(map_job_manager) for name, map_job_manager in map_registry.items()},
+        }
+
+    if args.map_admin:
+        @app.put("/maps/{map_name}")
+        def register_map(map_name: str, entry: dict = Body(...)) -> dict:
+            """Defines REST PUT Endpoint for registering a MAP, or replacing a MAP without unfinished jobs.
+
+            Args:
+                map_name (str): Name of the MAP
+                entry (dict): Configuration of the MAP, in the format of an entry of the MAP registry file
+
+            Returns:
+                dict: Configuration of the MAP
+            """
+            try:
+                map_config = parse_map_config(entry, args.payload_host_path)
+                map_registry.register(map_name, map_config, replace=True)
+                update_prepulled_images()
+            except MapConflictError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            except MapRegistryError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return map_config_to_dict(map_config)
+
+        @app.delete("/maps/{map_name}")
+        def unregister_map(map_name: str) -> dict:
+            """Defines REST DELETE Endpoint for unregistering a MAP without unfinished jobs.
+            Deletes the results of its finished jobs
+
+            Args:
+                map_name (str): Name of the MAP
+
+            Returns:
+                dict: Name of the unregistered MAP
+            """
+            try:
+                if not map_registry.unregister(map_name):
+                    raise HTTPException(status_code=404, detail=f'MAP {map_name} does not exist')
+            except MapConflictError as e:
+                raise HTTPException(status_code=409, detail=str(e))
+            update_prepulled_images()
+            return {"name": map_name}
+
+    @app.get("/live")
+    def get_liveness() -> dict:
+        """Defines REST GET Endpoint for the liveness of MONAI Inference Service, which is live as soon as it
+        serves requests.
+
+        Returns:
+            dict: Liveness of the service
+        """
+        return {"live": True}
+
+    @app.get("/ready")
+    def get_readiness() -> dict:
+        """Defines REST GET Endpoint for the readiness of MONAI Inference Service. With image pre-pull,
+        the service is not ready until the image of the default MAP is held by at least one node. With a model
+        source, the service is not ready until the model of the default MAP is cached. Readiness does not wait for
+        stale resources of a previous run to be deleted.
+
+        Returns:
+            dict: Readiness of the service, and the nodes which hold the image of the default MAP
+        """
+        urn = kubernetes_handler.config.map_urn
+        if image_prepuller is not None and not image_prepuller.is_ready(urn):
+            raise HTTPException(status_code=503, detail=f'Image {urn} has not been pulled onto any node')
+        if model_cache is not None and not model_cache.is_cached(kubernetes_handler.config):
+            raise HTTPException(status_code=503, detail=f'Model {kubernetes_handler.config.map_model_source} '
+                                'has not been cached')
+        return {"ready": True, "imageNodes": image_prepuller.ready_nodes(urn) if image_prepuller else None,
+                "reconciled": reconciler.stats["reconciled"]}
+
+    @app.get("/metrics")
+    def get_metrics() -> Response:
+        """Defines REST GET Endpoint for metrics in the Prometheus text format, including
+        histograms of the duration of each phase of inference requests.
+
+        Returns:
+            Response: Current values of all metrics
+        """
+        return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+    if result_cache is not None:
+        @app.get("/cache/")
+        def cache_stats() -> dict:
+            """Defines REST GET Endpoint for the statistics of the inference result cache,
+            including hit and miss counters.
+
+            Returns:
+                dict: Statistics of the inference result cache
+            """
+            return result_cache.stats
+
+        @app.delete("/cache/")
+        def purge_cache() -> dict:
+            """Defines REST DELETE Endpoint for removing all cached inference results.
+
+            Returns:
+                dict: Statistics of the inference result cache
+            """
+            result_cache.purge()
+            return result_cache.stats
+
+    if model_cache is not None:
+        @app.get("/model-cache/")
+        def model_cache_stats() -> dict:
+            """Defines REST GET Endpoint for the statistics of the MAP model cache,
+            including hit and miss counters.
+
+            Returns:
+                dict: Statistics of the MAP model cache
+            """
+            return model_cache.stats
+
+        @app.delete("/model-cache/")
+        def purge_model_cache() -> dict:
+            """Defines REST DELETE Endpoint for removing all cached MAP models which are not in use.
+
+            Returns:
+                dict: Statistics of the MAP model cache
+            """
+            model_cache.purge()
+            return model_cache.stats
+
+    kubernetes_handler.provision_volume()
+    # Stale resources are deleted in the background, requests are accepted meanwhile.
+    app.router.add_event_handler("shutdown", reconciler.shutdown)
+    reconciler.start()
+    app.router.add_event_handler("shutdown", map_registry.shutdown)
+    app.router.add_event_handler("shutdown", lambda: payload_executor.shutdown(wait=False))
+    app.router.add_event_handler("shutdown", reaper.shutdown)
+    if codec is not None:
+        app.router.add_event_handler("shutdown", codec.shutdown)
+    if upload_manager is not None:
+        app.router.add_event_handler("shutdown", upload_manager.shutdown)
+        upload_manager.start()
+    job_manager.start()
+    if args.map_registry:
+        map_registry.load(args.map_registry)
+    if image_prepuller is not None or model_cache is not None:
+        update_prepulled_images()
+    if image_prepuller is not None:
+        app.router.add_event_handler("shutdown", image_prepuller.shutdown)
+        image_prepuller.start()
+    if model_cache is not None:
+        app.router.add_event_handler("shutdown", model_cache.shutdown)
+        model_cache.start()
+
+    if warm_pool is not None:
+        @app.get("/pool/")
+        def pool_stats() -> dict:
+            """Defines REST GET Endpoint for the statistics of the warm pod pool,
+            including the latency of acquiring a pre-started MAP pod.
+
+            Returns:
+                dict: Statistics of the warm pod pool
+            """
+            return warm_pool.stats
+
+        app.router.add_event_handler("shutdown", warm_pool.shutdown)
+        warm_pool.start()
+
+    # Registered last, so that the volume is only released once all MAP pods have been deleted.
+    app.router.add_event_handler("shutdown", kubernetes_handler.release_volume)
+
+    app.state.kubernetes_handler = kubernetes_handler
+    app.state.scheduler = scheduler
+    app.state.job_manager = job_manager
+    app.state.map_registry = map_registry
+    app.state.warm_pool = warm_pool
+    app.state.result_cache = result_cache
+    app.state.model_cache = model_cache
+    app.state.upload_manager = upload_manager
+    app.state.resource_owner = resource_owner
+    app.state.reconciler = reconciler
+    app.state.admission_controller = admission_controller
+
+    return app
+
+
+def main():
+    """Driver method that parses arguements and intializes providers
+    """
+    args = parse_args()
+    config.load_incluster_config()
+    app = create_app(args)
 
     print(f'MAP URN: \"{args.map_urn}\"')
     print(f'MAP entrypoint: \"{args.map_entrypoint}\"')
@@ -162,9 +1159,59 @@ def main():
     print(f'MAP input path: \"{args.map_input_path}\"')
     print(f'MAP output path: \"{args.map_output_path}\"')
     print(f'MAP model path: \"{args.map_model_path}\"')
+    print(f'MAP model source: \"{args.map_model_source}\"')
+    print(f'MAP model checksum: \"{args.map_model_checksum}\"')
+    print(f'MAP name: \"{args.map_name}\"')
+    print(f'MAP timeout: \"{args.map_timeout}\"')
+    print(f'MAP pending timeout: \"{args.map_pending_timeout}\"')
+    print(f'MAP multi case: \"{args.map_multi_case}\"')
+    print(f'MAP registry: \"{args.map_registry}\"')
+    print(f'MAP admin: \"{args.map_admin}\"')
+    print(f'MAP pre-pull: \"{args.map_prepull}\"')
     print(f'payload host path: \"{args.payload_host_path}\"')
+    print(f'input roots: \"{args.input_root}\"')
     print(f'MIS host: \"{MIS_HOST}\"')
     print(f'MIS port: \"{args.port}\"')
+    print(f'MIS max input size: \"{args.max_input_size}\"')
+    print(f'MIS max input files: \"{args.max_input_files}\"')
+    print(f'MIS payload workers: \"{args.payload_workers}\"')
+    print(f'MIS payload codec workers: \"{args.payload_codec_workers}\"')
+    print(f'MIS payload reap rate: \"{args.payload_reap_rate}\"')
+    print(f'MIS max upload sessions: \"{args.max_upload_sessions}\"')
+    print(f'MIS upload chunk size: \"{args.upload_chunk_size}\"')
+    print(f'MIS upload session TTL: \"{args.upload_session_ttl}\"')
+    print(f'MIS output compression level: \"{args.output_compression_level}\"')
+    print(f'MIS max concurrent requests: \"{app.state.scheduler.max_slots}\"')
+    print(f'MIS max queued requests: \"{args.max_queued_requests}\"')
+    print(f'MIS queue timeout: \"{args.queue_timeout}\"')
+    print(f'MIS priority classes: \"{[(c.name, c.level, c.pod_priority_class_name) for c in args.priority_class]}\"')
+    print(f'MIS default priority class: \"{args.default_priority_class}\"')
+    print(f'MIS priority aging: \"{args.priority_aging}\"')
+    print(f'MIS admission control: \"{args.admission_control}\"')
+    print(f'MIS max upload size in flight: \"{args.max_upload_size_in_flight}\"')
+    print(f'MIS max client share: \"{args.max_client_share}\"')
+    print(f'MIS result TTL: \"{args.result_ttl}\"')
+    print(f'MIS result cache size: \"{args.result_cache_size}\"')
+    print(f'MIS result cache TTL: \"{args.result_cache_ttl}\"')
+    print(f'MIS model cache path: \"{args.model_cache_path}\"')
+    print(f'MIS model cache size: \"{args.model_cache_size}\"')
+    print(f'MIS owner ID: \"{args.owner_id}\"')
+    print(f'MIS instance ID: \"{app.state.resource_owner.instance_id}\"')
+    print(f'MIS reconcile interval: \"{args.reconcile_interval}\"')
+    print(f'MIS pod watch mode: \"{args.pod_watch_mode}\"')
+    print(f'MIS adaptive timeout percentile: \"{args.adaptive_timeout_percentile}\"')
+    print(f'MIS adaptive timeout factor: \"{args.adaptive_timeout_factor}\"')
+    print(f'MIS volume lifecycle: \"{args.volume_lifecycle}\"')
+    print(f'MIS volume claim name: \"{args.volume_claim_name}\"')
+    print(f'MIS batch max size: \"{args.batch_max_size}\"')
+    print(f'MIS batch max wait: \"{args.batch_max_wait}\"')
+    print(f'MIS shard max: \"{args.shard_max}\"')
+    print(f'MIS shard rule: \"{args.shard_rule}\"')
+    print(f'MIS shard min input size: \"{args.shard_min_input_size}\"')
+    print(f'MIS shard retries: \"{args.shard_retries}\"')
+    print(f'MIS warm pool size: \"{args.warm_pool_size}\"')
+    print(f'MIS warm pool max reuse: \"{args.warm_pool_max_reuse}\"')
+    print(f'MIS warm pool idle TTL: \"{args.warm_pool_idle_ttl}\"')
 
     uvicorn.run(app, host=MIS_HOST, port=args.port, log_config=logging_config)
 
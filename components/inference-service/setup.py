@@ -35,10 +35,11 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://docs.nvidia.com/clara/deploy/",
     install_requires=install_requires,
-    packages=setuptools.find_packages('.'),
+    packages=setuptools.find_packages('.', exclude=['benchmarks', 'benchmarks.*']),
     entry_points={
         'console_scripts': [
-            'mis = monaiinference.main:main'
+            'mis = monaiinference.main:main',
+            'mis-client = monaiinference.client:main'
         ]
     },
     classifiers=[
@@ -0,0 +1,75 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import time
+import zipfile
+from typing import Callable, Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_kubernetes import FakeCoreV1Api
+from monaiinference.main import create_app, parse_args
+
+# Arguments of the default MAP, which the fake Kubernetes API runs without a cluster.
+MAP_ARGS = ['--map-urn', 'monai/test-map:0.1', '--map-entrypoint', 'python -m app', '--map-cpu', '1',
+            '--map-memory', '256', '--map-gpu', '0', '--map-input-path', '/var/monai/input',
+            '--map-output-path', '/var/monai/output']
+WAIT_TIME = 10
+
+
+def make_zip(files: Dict[str, bytes]) -> bytes:
+    """Returns a .zip file holding the given files, keyed on their path."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        for name, data in files.items():
+            zip_file.writestr(name, data)
+    return buffer.getvalue()
+
+
+def read_zip(data: bytes) -> List[str]:
+    """Returns the sorted names of the files of a .zip file."""
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        return sorted(info.filename for info in zip_file.infolist() if not info.is_dir())
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = WAIT_TIME):
+    """Waits until a condition holds, and fails the test if it does not within the timeout."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            pytest.fail('Condition did not hold in time')
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fake(tmp_path) -> FakeCoreV1Api:
+    """Fake Kubernetes core API whose MAP pods write one output file into their payload directory."""
+    return FakeCoreV1Api(str(tmp_path), pending_seconds=0.01, running_seconds=0.05)
+
+
+@pytest.fixture
+def create_client(tmp_path, fake):
+    """Factory of test clients of MONAI Inference Service applications, served against the fake Kubernetes API
+    with the given additional arguments. Applications are shut down at the end of the test."""
+    clients = []
+
+    def create(*argv: str) -> TestClient:
+        args = parse_args(MAP_ARGS + ['--payload-host-path', str(tmp_path)] + list(argv))
+        test_client = TestClient(create_app(args, fake))
+        test_client.__enter__()
+        clients.append(test_client)
+        return test_client
+
+    yield create
+    for test_client in clients:
+        test_client.__exit__(None, None, None)
@@ -0,0 +1,95 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from conftest import make_zip, wait_until
+from monaiinference.handler.admission import AdmissionController, AdmissionRejectedError
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.scheduler import RequestScheduler
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+CONFIG = ServerConfig('monai/test-map:0.1', ['python', '-m', 'app'], 1, 256, 0, '/var/monai/input',
+                      '/var/monai/output', '/var/monai/models', '/tmp')
+
+
+def submit(client, client_id: str = "client"):
+    return client.post('/jobs', headers={"X-Client-ID": client_id},
+                       files={'file': ('in.zip', INPUT, 'application/zip')})
+
+
+def test_full_queue_is_rejected_before_upload(create_client, fake):
+    fake.running_seconds = 2
+    client = create_client('--admission-control', '--max-concurrent-requests', '1', '--max-queued-requests', '0')
+    job = submit(client)
+    assert job.status_code == 202
+
+    # The first job holds the only request slot until it has finished.
+    response = submit(client)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert fake.calls['create_namespaced_pod'] == 1
+
+    client.delete(f'/jobs/{job.json()["id"]}')
+    wait_until(lambda: submit(client).status_code == 202)
+
+
+def test_client_exceeding_its_share_is_rejected(create_client, fake):
+    fake.running_seconds = 2
+    client = create_client('--admission-control', '--max-concurrent-requests', '2', '--max-queued-requests', '0',
+                           '--max-client-share', '0.5')
+    assert submit(client, "greedy").status_code == 202
+
+    response = submit(client, "greedy")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    # Other clients keep their share.
+    assert submit(client, "other").status_code == 202
+
+
+def test_requests_of_other_endpoints_are_not_admitted(create_client, fake):
+    fake.running_seconds = 2
+    client = create_client('--admission-control', '--max-concurrent-requests', '1', '--max-queued-requests', '0')
+    job = submit(client).json()
+    assert submit(client).status_code == 503
+    # Requests which do not upload an input payload are served while the queue is full.
+    assert client.get(f'/jobs/{job["id"]}').status_code == 200
+    assert client.get('/jobs/unknown').status_code == 404
+
+
+def test_rejections_carry_default_retry_after_until_requests_complete():
+    controller = AdmissionController(RequestScheduler(1, 1, 60), None)
+
+    first = controller.admit("client", 0, CONFIG)
+    second = controller.admit("client", 0, CONFIG)
+    with pytest.raises(AdmissionRejectedError) as rejection:
+        controller.admit("client", 0, CONFIG)
+    assert rejection.value.status_code == 503
+    # Until a request has completed, clients retry after the default delay.
+    assert rejection.value.retry_after == 5
+
+    for ticket in (first, second):
+        ticket.upload_finished()
+        ticket.release()
+    assert controller.stats["clients"] == {}
+
+
+def test_upload_size_in_flight_is_limited():
+    controller = AdmissionController(RequestScheduler(4, 4, 60), None, max_upload_size=1)
+
+    ticket = controller.admit("client", 1024 * 1024, CONFIG)
+    with pytest.raises(AdmissionRejectedError) as rejection:
+        controller.admit("client", 1, CONFIG)
+    assert rejection.value.status_code == 503
+
+    # The payload of an admitted request no longer counts once it is uploaded.
+    ticket.upload_finished()
+    controller.admit("client", 1, CONFIG)
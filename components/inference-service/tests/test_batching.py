@@ -0,0 +1,121 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+
+from conftest import make_zip, read_zip, wait_until
+from monaiinference.handler.batching import BatchCollector
+
+BATCH_ARGS = ('--map-multi-case', '--batch-max-size', '3')
+
+
+def submit(client, index: int) -> str:
+    data = make_zip({f'{index}.dcm': b'a' * 100})
+    response = client.post('/jobs', files={'file': ('in.zip', data, 'application/zip')})
+    assert response.status_code == 202
+    return response.json()["id"]
+
+
+def wait_for_jobs(client, job_ids: list) -> list:
+    def finished():
+        return all(client.get(f'/jobs/{job_id}').json()["phase"] in ("Succeeded", "Failed") for job_id in job_ids)
+
+    wait_until(finished)
+    return [client.get(f'/jobs/{job_id}').json() for job_id in job_ids]
+
+
+@pytest.fixture
+def fake(fake):
+    fake.multi_case = True
+    return fake
+
+
+def test_requests_within_window_share_one_pod(create_client, fake):
+    client = create_client(*BATCH_ARGS, '--batch-max-wait', '500')
+    job_ids = [submit(client, i) for i in range(3)]
+
+    jobs = wait_for_jobs(client, job_ids)
+    assert [job["phase"] for job in jobs] == ["Succeeded"] * 3
+    assert fake.calls['create_namespaced_pod'] == 1
+    # Each caller receives the output sub-directory of its own request.
+    for job_id in job_ids:
+        assert read_zip(client.get(f'/jobs/{job_id}/result').content) == ['output/output-0.bin']
+
+
+def test_full_batch_runs_without_waiting_for_the_window(create_client, fake):
+    client = create_client(*BATCH_ARGS, '--batch-max-wait', '60000')
+    jobs = wait_for_jobs(client, [submit(client, i) for i in range(3)])
+    assert [job["phase"] for job in jobs] == ["Succeeded"] * 3
+    assert fake.calls['create_namespaced_pod'] == 1
+
+
+def test_single_request_runs_once_window_closes(create_client, fake):
+    client = create_client(*BATCH_ARGS, '--batch-max-wait', '50')
+    response = client.post('/upload/', files={'file': ('in.zip', make_zip({'1.dcm': b'a'}), 'application/zip')})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+
+
+def test_failed_pod_fails_all_requests_of_its_batch(create_client, fake):
+    fake.failure_rate = 1
+    client = create_client(*BATCH_ARGS, '--batch-max-wait', '500')
+    jobs = wait_for_jobs(client, [submit(client, i) for i in range(2)])
+    assert [job["phase"] for job in jobs] == ["Failed"] * 2
+    assert fake.calls['create_namespaced_pod'] == 1
+
+
+def test_batch_is_awaited_without_a_thread():
+    collector = BatchCollector(3, 60)
+
+    async def collect():
+        # The request which opens the batch waits on the event loop, which keeps running other coroutines.
+        leader = asyncio.ensure_future(collector.join_async("a"))
+        await asyncio.sleep(0.05)
+        assert not leader.done()
+
+        assert await collector.join_async("b") is None
+        # The last request may join from a thread, such as one of the synchronous API.
+        await asyncio.get_running_loop().run_in_executor(None, collector.join, "c")
+        return await asyncio.wait_for(leader, 5)
+
+    assert asyncio.run(collect()) == ["a", "b", "c"]
+
+
+def test_awaited_batch_closes_once_window_passes():
+    collector = BatchCollector(3, 0.05)
+
+    async def collect():
+        batch = await collector.join_async("a")
+        # The closed batch is not joined, the next request opens a new one.
+        return batch, await collector.join_async("b")
+
+    assert asyncio.run(collect()) == (["a"], ["b"])
+
+
+def test_cancelled_batch_is_closed():
+    collector = BatchCollector(2, 60)
+
+    async def collect():
+        leader = asyncio.ensure_future(collector.join_async("a"))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        # The next request opens a new batch rather than joining the cancelled one.
+        next_leader = asyncio.ensure_future(collector.join_async("b"))
+        await asyncio.sleep(0.01)
+        assert await collector.join_async("c") is None
+        return await asyncio.wait_for(next_leader, 5)
+
+    assert asyncio.run(collect()) == ["b", "c"]
@@ -0,0 +1,145 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import time
+
+from conftest import make_zip, read_zip, wait_until
+from monaiinference.handler.cache import ResultCache
+from monaiinference.handler.reaper import PayloadReaper
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+IMAGE_ID = "docker-pullable://monai/test-map@sha256:" + "0" * 64
+
+
+def infer(client, data: bytes = INPUT):
+    response = client.post('/upload/', files={'file': ('in.zip', data, 'application/zip')})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+    return response
+
+
+def test_same_input_is_answered_from_cache(create_client, fake):
+    client = create_client('--result-cache-size', '10')
+    infer(client)
+    infer(client)
+    assert fake.calls['create_namespaced_pod'] == 1
+    assert client.get('/cache/').json()["hits"] == 1
+
+    # Another input misses the cache.
+    infer(client, make_zip({'series/2.dcm': b'b' * 100}))
+    assert fake.calls['create_namespaced_pod'] == 2
+
+
+def test_cached_job_completes_without_pod(create_client, fake):
+    client = create_client('--result-cache-size', '10')
+    infer(client)
+    job = client.post('/jobs', files={'file': ('in.zip', INPUT, 'application/zip')}).json()
+    assert job["phase"] == "Succeeded"
+    assert job["cached"] is True
+    assert read_zip(client.get(f'/jobs/{job["id"]}/result').content) == ['output/output-0.bin']
+    assert fake.calls['create_namespaced_pod'] == 1
+
+
+def test_purge_invalidates_cached_results(create_client, fake):
+    client = create_client('--result-cache-size', '10')
+    infer(client)
+    stats = client.delete('/cache/').json()
+    assert stats["entries"] == 0 and stats["size_bytes"] == 0
+
+    infer(client)
+    assert fake.calls['create_namespaced_pod'] == 2
+
+
+def test_expired_results_are_not_served(create_client, fake):
+    client = create_client('--result-cache-size', '10', '--result-cache-ttl', '0.1')
+    infer(client)
+    time.sleep(0.2)
+    infer(client)
+    assert fake.calls['create_namespaced_pod'] == 2
+
+
+def test_maps_with_different_models_do_not_share_results(create_client, fake, tmp_path):
+    client = create_client('--result-cache-size', '10', '--map-admin',
+                           '--model-cache-path', str(tmp_path / "models"))
+    for name in ("a", "b"):
+        model_path = tmp_path / f'model-{name}.zip'
+        model_path.write_bytes(make_zip({'weights.ts': name.encode()}))
+        response = client.put(f'/maps/{name}', json={
+            "urn": "monai/test-map:0.1", "entrypoint": "python -m app", "cpu": 1, "memory": 256, "gpu": 0,
+            "inputPath": "/var/monai/input", "outputPath": "/var/monai/output", "modelPath": "/var/monai/models",
+            "modelSource": str(model_path)})
+        assert response.status_code == 200
+
+    def infer_with(name: str, data: bytes):
+        response = client.post(f'/maps/{name}/infer', files={'file': ('in.zip', data, 'application/zip')})
+        assert response.status_code == 200
+
+    # Results are cached once the image of a MAP is known, which another input to the second MAP resolves.
+    infer_with("a", INPUT)
+    infer_with("b", make_zip({'series/2.dcm': b'b' * 100}))
+    assert fake.calls['create_namespaced_pod'] == 2
+
+    # Both MAPs run the same image and entrypoint, but the same input yields a different result with each model.
+    infer_with("b", INPUT)
+    assert fake.calls['create_namespaced_pod'] == 3
+    infer_with("a", INPUT)
+    infer_with("b", INPUT)
+    assert fake.calls['create_namespaced_pod'] == 3
+    assert client.get('/cache/').json()["hits"] == 2
+
+
+def test_key_depends_on_map_image_and_model():
+    key = ResultCache.make_key("digest", "monai/map:1", IMAGE_ID, ["python", "-m", "app"])
+    assert key is not None
+    assert ResultCache.make_key("digest", "monai/map:1", IMAGE_ID, ["python", "-m", "app"]) == key
+    assert ResultCache.make_key("other", "monai/map:1", IMAGE_ID, ["python", "-m", "app"]) != key
+    assert ResultCache.make_key("digest", "monai/map:2", IMAGE_ID, ["python", "-m", "app"]) != key
+    assert ResultCache.make_key("digest", "monai/map:1", IMAGE_ID + "1", ["python", "-m", "app"]) != key
+    assert ResultCache.make_key("digest", "monai/map:1", IMAGE_ID, ["python", "-m", "other"]) != key
+    assert ResultCache.make_key("digest", "monai/map:1", IMAGE_ID, ["python", "-m", "app"], "model.zip") != key
+    assert ResultCache.make_key("digest", "monai/map:1", IMAGE_ID, ["python", "-m", "app"], "model.zip",
+                                "0" * 64) != ResultCache.make_key("digest", "monai/map:1", IMAGE_ID,
+                                                                  ["python", "-m", "app"], "model.zip", "1" * 64)
+    # Results are not cached until the image the urn resolved to is known.
+    assert ResultCache.make_key("digest", "monai/map:1", None, ["python", "-m", "app"]) is None
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), 1, 0)
+    for key in ("a", "b", "c"):
+        source_path = tmp_path / f'{key}.zip'
+        source_path.write_bytes(b'\0' * (400 * 1024))
+        cache.store(key, str(source_path))
+        if key == "b":
+            assert cache.lookup("a", str(tmp_path / "a-hit.zip"))
+
+    assert cache.stats["entries"] == 2
+    assert cache.lookup("a", str(tmp_path / "a-hit-2.zip"))
+    assert not cache.lookup("b", str(tmp_path / "b-hit.zip"))
+    assert cache.lookup("c", str(tmp_path / "c-hit.zip"))
+
+
+def test_results_of_previous_run_are_deleted_in_background(tmp_path):
+    cache_path = tmp_path / "cache"
+    os.makedirs(cache_path)
+    (cache_path / "stale.zip").write_bytes(b'stale')
+    reaper = PayloadReaper(str(tmp_path / ".trash"))
+
+    cache = ResultCache(str(cache_path), 1, 0, reaper)
+    assert os.listdir(cache_path) == []
+    assert cache.stats["entries"] == 0
+    # The previous results wait in the trash until the reaper runs.
+    assert reaper.backlog == 1
+
+    reaper.start()
+    wait_until(lambda: reaper.backlog == 0 and not os.listdir(tmp_path / ".trash"))
+    reaper.shutdown()
@@ -0,0 +1,246 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Callable, Optional
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from conftest import make_zip, read_zip
+from monaiinference import client as mis_client
+from monaiinference.client import AsyncInferenceClient, ClientError, InferenceClient
+
+MEGABYTE = 1024 * 1024
+URL = 'http://mis:8000'
+# Headers which describe the body as it was sent, rather than the body forwarded.
+BODY_HEADERS = ('content-length', 'transfer-encoding', 'host')
+
+
+class AppTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Transport which serves the requests of a client with an in-process MIS application. A hook may answer
+    a request instead, such as with a rejection, or delay it before it is served."""
+
+    def __init__(self, app_client: TestClient,
+                 hook: Optional[Callable[[httpx.Request, bytes], Optional[httpx.Response]]] = None):
+        self.app_client = app_client
+        self.hook = hook
+        self.requests = []
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        return self.__handle(request, request.read())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        content = await request.aread()
+        return await asyncio.get_running_loop().run_in_executor(None, self.__handle, request, content)
+
+    def __handle(self, request: httpx.Request, content: bytes) -> httpx.Response:
+        self.requests.append(f'{request.method} {request.url.path}')
+        response = self.hook(request, content) if self.hook is not None else None
+        if response is not None:
+            return response
+
+        headers = {name: value for name, value in request.headers.items() if name not in BODY_HEADERS}
+        response = self.app_client.request(request.method, request.url.path, params=request.url.params,
+                                           content=content, headers=headers)
+        headers = {name: value for name, value in response.headers.items() if name not in BODY_HEADERS}
+        return httpx.Response(response.status_code, headers=headers, content=response.content)
+
+
+def run_client(mode: str, transport: AppTransport, call: Callable, **kwargs):
+    """Runs a call on a synchronous or asynchronous client, and returns its result, with the results of
+    `infer_many` as a list."""
+    if mode == "sync":
+        with InferenceClient(URL, transport=transport, **kwargs) as client:
+            result = call(client)
+            return list(result) if inspect.isgenerator(result) else result
+
+    async def run():
+        async with AsyncInferenceClient(URL, transport=transport, **kwargs) as client:
+            result = call(client)
+            return [item async for item in result] if inspect.isasyncgen(result) else await result
+
+    return asyncio.run(run())
+
+
+def reject(status_code: int, times: int, path: str = '/upload/', retry_after: Optional[str] = "0"):
+    """Hook which rejects the first requests to a path."""
+    rejected = []
+
+    def hook(request: httpx.Request, content: bytes) -> Optional[httpx.Response]:
+        if request.url.path != path or len(rejected) >= times:
+            return None
+        rejected.append(request)
+        headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        return httpx.Response(status_code, headers=headers, json={"detail": "Rejected"})
+
+    return hook
+
+
+@pytest.fixture(params=["sync", "async"])
+def mode(request) -> str:
+    return request.param
+
+
+@pytest.fixture
+def app_client(create_client):
+    return create_client('--upload-chunk-size', '1', '--max-upload-sessions', '2')
+
+
+@pytest.fixture
+def study(tmp_path):
+    path = tmp_path / "studies" / "study"
+    path.mkdir(parents=True)
+    (path / "1.dcm").write_bytes(b'a' * 100)
+    (path / "series").mkdir()
+    (path / "series" / "2.dcm").write_bytes(os.urandom(1000))
+    return str(path)
+
+
+@pytest.fixture(autouse=True)
+def retry_backoff(monkeypatch):
+    monkeypatch.setattr(mis_client, 'RETRY_BACKOFF', 0.01)
+
+
+@pytest.mark.parametrize("input_format", ["tar", "zip"])
+def test_directory_is_streamed_and_output_written(mode, app_client, study, tmp_path, input_format):
+    transport = AppTransport(app_client)
+    output_path = str(tmp_path / "outputs" / "study.zip")
+
+    result = run_client(mode, transport, lambda client: client.infer(study, output_path), input_format=input_format)
+    assert result.succeeded and result.retries == 0
+    assert result.content_type == 'application/zip'
+    assert result.sent_bytes > 1100
+    assert result.received_bytes == os.path.getsize(output_path)
+    with open(output_path, 'rb') as f:
+        assert read_zip(f.read()) == ['output/output-0.bin']
+    assert transport.requests == ['POST /upload/']
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_rejected_request_is_sent_again_after_retry_after(mode, app_client, study, tmp_path, status_code):
+    transport = AppTransport(app_client, reject(status_code, 2, retry_after="0.2"))
+
+    result = run_client(mode, transport, lambda client: client.infer(study, str(tmp_path / "study.zip")))
+    assert result.succeeded and result.retries == 2
+    assert result.seconds >= 0.4
+    # The body of each attempt is sent in full again.
+    assert transport.requests == ['POST /upload/'] * 3
+
+
+def test_rejection_without_retry_after_backs_off(mode, app_client, study, tmp_path):
+    transport = AppTransport(app_client, reject(503, 1, retry_after=None))
+
+    result = run_client(mode, transport, lambda client: client.infer(study, str(tmp_path / "study.zip")))
+    assert result.succeeded and result.retries == 1
+
+
+def test_requests_are_sent_again_at_most_max_retries_times(mode, app_client, study, tmp_path):
+    transport = AppTransport(app_client, reject(503, 10))
+
+    with pytest.raises(ClientError) as error:
+        run_client(mode, transport, lambda client: client.infer(study, str(tmp_path / "study.zip")), max_retries=2)
+    assert error.value.status_code == 503
+    assert "Rejected" in str(error.value)
+    assert len(transport.requests) == 3
+
+
+def test_other_errors_are_not_retried(mode, app_client, study, tmp_path):
+    transport = AppTransport(app_client, reject(400, 10))
+
+    with pytest.raises(ClientError) as error:
+        run_client(mode, transport, lambda client: client.infer(study, str(tmp_path / "study.zip")))
+    assert error.value.status_code == 400
+    assert len(transport.requests) == 1
+
+
+@pytest.fixture
+def large_study(tmp_path) -> str:
+    # Three chunks of 1 MB, the last one shorter.
+    path = tmp_path / "large.zip"
+    path.write_bytes(make_zip({'series/1.dcm': os.urandom(2 * MEGABYTE + MEGABYTE // 2)}))
+    return str(path)
+
+
+def test_large_file_is_sent_in_chunks(mode, app_client, large_study, tmp_path):
+    failing_path = []
+
+    def hook(request: httpx.Request, content: bytes) -> Optional[httpx.Response]:
+        # A chunk whose request fails is sent again.
+        if request.url.path.endswith('/chunks/1') and not failing_path:
+            failing_path.append(request.url.path)
+            return httpx.Response(500)
+        return None
+
+    transport = AppTransport(app_client, hook)
+    output_path = str(tmp_path / "large-output.zip")
+
+    result = run_client(mode, transport, lambda client: client.infer(large_study, output_path),
+                        chunked_upload_size=1)
+    assert result.succeeded
+    assert result.sent_bytes == os.path.getsize(large_study)
+    with open(output_path, 'rb') as f:
+        assert read_zip(f.read()) == ['output/output-0.bin']
+
+    upload_id = failing_path[0].split('/')[2]
+    assert transport.requests[0] == 'POST /uploads'
+    assert sorted(transport.requests[1:-1]) == [f'PUT /uploads/{upload_id}/chunks/{index}' for index in (0, 1, 1, 2)]
+    assert transport.requests[-1] == f'POST /uploads/{upload_id}/commit'
+    # The upload is gone once committed.
+    assert app_client.get(f'/uploads/{upload_id}').status_code == 404
+
+
+@pytest.mark.parametrize("failing_path", ['/chunks/2', '/commit'])
+def test_failed_chunked_upload_is_discarded(mode, app_client, large_study, tmp_path, failing_path):
+    def hook(request: httpx.Request, content: bytes) -> Optional[httpx.Response]:
+        if request.url.path.endswith(failing_path):
+            return httpx.Response(409, json={"detail": "Conflict"})
+        return None
+
+    transport = AppTransport(app_client, hook)
+
+    with pytest.raises(ClientError) as error:
+        run_client(mode, transport, lambda client: client.infer(large_study, str(tmp_path / "output.zip")),
+                   chunked_upload_size=1)
+    assert error.value.status_code == 409
+
+    upload_id = transport.requests[1].split('/')[2]
+    assert f'DELETE /uploads/{upload_id}' in transport.requests
+    assert transport.requests.count(f'POST /uploads/{upload_id}/commit') == (failing_path == '/commit')
+    assert app_client.get(f'/uploads/{upload_id}').status_code == 404
+
+
+def test_results_are_returned_in_completion_order(mode, app_client, tmp_path):
+    paths = {}
+    for name in ("slow", "fast"):
+        paths[name] = str(tmp_path / f'{name}.zip')
+        with open(paths[name], 'wb') as f:
+            f.write(make_zip({f'{name}.dcm': b'a' * 100}))
+    invalid_path = str(tmp_path / "notes.txt")
+
+    def hook(request: httpx.Request, content: bytes) -> Optional[httpx.Response]:
+        if b'filename="slow.zip"' in content:
+            time.sleep(0.5)
+        return None
+
+    requests = [(paths["slow"], str(tmp_path / "slow-output.zip")), (paths["fast"], str(tmp_path / "fast-output.zip")),
+                (invalid_path, str(tmp_path / "invalid-output.zip"))]
+    results = run_client(mode, AppTransport(app_client, hook), lambda client: client.infer_many(requests),
+                         max_in_flight=3)
+
+    # A request which fails does not stop the others, and carries its error.
+    invalid, = [result for result in results if not result.succeeded]
+    assert invalid.input_path == invalid_path and "must be a directory" in invalid.error
+    assert [result.input_path for result in results if result.succeeded] == [paths["fast"], paths["slow"]]
@@ -0,0 +1,91 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import zipfile
+from typing import Dict
+
+import pytest
+
+from monaiinference.handler import codec
+from monaiinference.handler.codec import ParallelZipCodec, ZipStreamWriter, write_members
+
+MEGABYTE = 1024 * 1024
+FILES = {
+    'empty.dcm': b'',
+    'small.dcm': b'a' * 100,
+    # Spans several chunks, partly incompressible.
+    'series/large.dcm': os.urandom(MEGABYTE) + b'b' * (2 * MEGABYTE + 17),
+    'image.png': os.urandom(1000),
+    'séries/ünïcode.dcm': b'c' * 10,
+}
+
+
+@pytest.fixture(params=[1, 3], ids=['sequential', 'parallel'])
+def write(request):
+    if request.param == 1:
+        yield write_members
+    else:
+        parallel_codec = ParallelZipCodec(request.param)
+        yield parallel_codec.write_members
+        parallel_codec.shutdown()
+
+
+def write_zip(write, tmp_path, files: Dict[str, bytes], compress_level: int = 6) -> bytes:
+    members = []
+    for name, data in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        zip_info = zipfile.ZipInfo.from_file(path, name)
+        zip_info.compress_type = zipfile.ZIP_STORED if name.endswith('.png') else zipfile.ZIP_DEFLATED
+        members.append((str(path), zip_info))
+    return b''.join(write(members, compress_level))
+
+
+def test_members_are_written_as_valid_zip(write, tmp_path):
+    data = write_zip(write, tmp_path, FILES)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        assert zip_file.testzip() is None
+        assert {name: zip_file.read(name) for name in zip_file.namelist()} == FILES
+        assert zip_file.getinfo('image.png').compress_type == zipfile.ZIP_STORED
+        large = zip_file.getinfo('series/large.dcm')
+        assert large.compress_type == zipfile.ZIP_DEFLATED
+        assert large.compress_size < large.file_size
+        # Permissions of the files are kept.
+        assert large.external_attr >> 16 == os.stat(tmp_path / 'series/large.dcm').st_mode
+
+
+def test_compression_level_is_applied(write, tmp_path):
+    files = {'text.dcm': b''.join(b'%d,' % i for i in range(200000))}
+    fast = write_zip(write, tmp_path, files, compress_level=1)
+    best = write_zip(write, tmp_path, files, compress_level=9)
+    assert len(best) < len(fast)
+
+
+def test_zip64_fields_are_written_beyond_the_limit(write, tmp_path, monkeypatch):
+    # With a lower limit, members, their offsets and the central directory all need ZIP64 fields.
+    monkeypatch.setattr(codec, 'ZIP64_LIMIT', 1000)
+    data = write_zip(write, tmp_path, FILES)
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        assert zip_file.testzip() is None
+        assert {name: zip_file.read(name) for name in zip_file.namelist()} == FILES
+    assert b'PK\x06\x06' in data[-200:]
+
+
+def test_unsupported_compression_is_rejected():
+    zip_info = zipfile.ZipInfo('1.dcm')
+    zip_info.compress_type = zipfile.ZIP_BZIP2
+    with pytest.raises(ValueError):
+        ZipStreamWriter().start_member(zip_info)
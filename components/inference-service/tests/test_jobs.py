@@ -0,0 +1,101 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import tarfile
+
+from conftest import make_zip, read_zip, wait_until
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+
+
+def submit(client, path: str = '/jobs', **params):
+    return client.post(path, params=params, files={'file': ('in.zip', INPUT, 'application/zip')})
+
+
+def wait_for_job(client, job_id: str) -> dict:
+    wait_until(lambda: client.get(f'/jobs/{job_id}').json()["phase"] not in ("Queued", "Pending", "Running"))
+    return client.get(f'/jobs/{job_id}').json()
+
+
+def test_upload_returns_the_output_payload(create_client, fake):
+    client = create_client()
+    response = submit(client, '/upload/')
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert read_zip(response.content) == ['output/output-0.bin']
+    # The pod, its volume and its claim are deleted once the request has returned.
+    assert fake.calls['delete_namespaced_pod'] == fake.calls['create_namespaced_pod'] == 1
+    assert not fake.list_namespaced_pod('default').items
+
+
+def test_upload_returns_tar_output_payload(create_client):
+    response = submit(create_client(), '/upload/', output='tar')
+    assert response.status_code == 200
+    with tarfile.open(fileobj=io.BytesIO(response.content)) as tar:
+        assert [member.name for member in tar.getmembers() if member.isfile()] == ['output/output-0.bin']
+
+
+def test_job_result_is_retrieved_once(create_client):
+    client = create_client()
+    response = submit(client)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["phase"] == "Queued"
+    assert job["priority"] == "routine"
+
+    job = wait_for_job(client, job["id"])
+    assert job["phase"] == "Succeeded"
+    assert job["result_retrieved"] is False
+
+    result = client.get(f'/jobs/{job["id"]}/result')
+    assert result.status_code == 200
+    assert read_zip(result.content) == ['output/output-0.bin']
+    assert client.get(f'/jobs/{job["id"]}').json()["result_retrieved"] is True
+    assert client.get(f'/jobs/{job["id"]}/result').status_code == 410
+
+
+def test_result_of_unfinished_job_is_a_conflict(create_client, fake):
+    fake.running_seconds = 2
+    client = create_client()
+    job = submit(client).json()
+    assert client.get(f'/jobs/{job["id"]}/result').status_code == 409
+
+    cancelled = client.delete(f'/jobs/{job["id"]}')
+    assert cancelled.status_code == 200
+    assert cancelled.json()["phase"] == "Cancelled"
+    # The job is deleted along with its pod.
+    assert client.get(f'/jobs/{job["id"]}').status_code == 404
+    wait_until(lambda: not fake.list_namespaced_pod('default').items)
+
+
+def test_failed_job_reports_its_pod_status(create_client, fake):
+    fake.failure_rate = 1
+    client = create_client()
+    job = wait_for_job(client, submit(client).json()["id"])
+    assert job["phase"] == "Failed"
+    assert client.get(f'/jobs/{job["id"]}/result').status_code == 409
+    assert submit(client, '/upload/').status_code == 500
+
+
+def test_unknown_jobs_and_priorities_are_rejected(create_client):
+    client = create_client()
+    assert client.get('/jobs/unknown').status_code == 404
+    assert client.get('/jobs/unknown/result').status_code == 404
+    assert client.delete('/jobs/unknown').status_code == 404
+    assert submit(client, priority='unknown').status_code == 400
+    assert submit(client, '/upload/', output='rar').status_code == 400
+
+
+def test_invalid_payload_is_rejected(create_client):
+    client = create_client()
+    response = client.post('/jobs', files={'file': ('in.zip', b'not a zip file', 'application/zip')})
+    assert response.status_code == 400
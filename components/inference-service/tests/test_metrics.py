@@ -0,0 +1,104 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from conftest import make_zip
+from monaiinference.handler.metrics import (PHASE_EXTRACT, PHASE_POD_CREATE, PHASE_POD_DELETE, PHASE_POD_PENDING,
+                                            PHASE_POD_RUNNING, PHASE_QUEUE, RequestTimings, log_request)
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+# Phases of a request run by a new MAP pod, which are over by the time the response starts.
+REQUEST_PHASES = [PHASE_EXTRACT, PHASE_QUEUE, PHASE_POD_CREATE, PHASE_POD_PENDING, PHASE_POD_RUNNING,
+                  PHASE_POD_DELETE]
+
+
+def phase_count(phase: str) -> float:
+    return REGISTRY.get_sample_value('mis_phase_duration_seconds_count', {"phase": phase}) or 0
+
+
+def parse_server_timing(value: str) -> dict:
+    phases = {}
+    for entry in value.split(", "):
+        phase, _, duration = entry.partition(";dur=")
+        phases[phase] = float(duration)
+    return phases
+
+
+def test_repeated_phases_are_added_up():
+    before = phase_count("test_phase")
+    timings = RequestTimings()
+    timings.record("test_phase", 0.25)
+    timings.record("other_phase", 0.5)
+    timings.record("test_phase", 0.125)
+
+    assert timings.to_dict() == {"test_phase": 0.375, "other_phase": 0.5}
+    assert timings.server_timing() == "test_phase;dur=375.0, other_phase;dur=500.0"
+    # Each recording is an observation of the histogram.
+    assert phase_count("test_phase") == before + 2
+
+
+def test_shared_timings_are_not_observed():
+    before = phase_count("shared_phase")
+    timings = RequestTimings(observe=False)
+    with timings.phase("shared_phase"):
+        pass
+
+    assert list(timings.to_dict()) == ["shared_phase"]
+    assert phase_count("shared_phase") == before
+
+
+def test_request_records_its_phases(create_client):
+    client = create_client()
+    before = {phase: phase_count(phase) for phase in REQUEST_PHASES}
+
+    response = client.post('/upload/', files={'file': ('in.zip', INPUT, 'application/zip')})
+    assert response.status_code == 200
+
+    # The header lists the phases in the order they ran.
+    phases = parse_server_timing(response.headers['Server-Timing'])
+    assert list(phases) == REQUEST_PHASES
+    assert all(duration >= 0 for duration in phases.values())
+    assert phases[PHASE_POD_RUNNING] >= 50
+    assert {phase: phase_count(phase) - before[phase] for phase in REQUEST_PHASES} == \
+        {phase: 1 for phase in REQUEST_PHASES}
+
+
+def test_metrics_are_served_in_prometheus_text_format(create_client):
+    client = create_client()
+    assert client.post('/upload/', files={'file': ('in.zip', INPUT, 'application/zip')}).status_code == 200
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain')
+    families = {family.name: family for family in text_string_to_metric_families(response.text)}
+    assert families['mis_phase_duration_seconds'].type == 'histogram'
+    assert families['mis_requests'].type == 'counter'
+    assert families['mis_queue_depth'].type == 'gauge'
+    assert {sample.labels["phase"] for sample in families['mis_phase_duration_seconds'].samples} >= \
+        set(REQUEST_PHASES)
+    assert families['mis_queue_depth'].samples[0].value == 0
+
+
+def test_request_is_logged_as_one_line(caplog):
+    timings = RequestTimings(observe=False)
+    timings.record(PHASE_EXTRACT, 0.0012345678)
+
+    with caplog.at_level(logging.INFO, logger='MIS_Metrics'):
+        log_request("request", "Succeeded", timings, status_code=200)
+
+    record, = caplog.records
+    assert json.loads(record.getMessage()) == {"request_id": "request", "outcome": "Succeeded",
+                                               "phases": {PHASE_EXTRACT: 0.001235}, "status_code": 200}
@@ -0,0 +1,145 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from conftest import make_zip
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.modelcache import ModelCache, ModelCacheError
+
+KILOBYTE = 1024
+
+
+def model_config(source_path, checksum: str = None) -> ServerConfig:
+    # Models are fetched from file:// URLs, which are read like remote sources.
+    return ServerConfig('monai/test-map:0.1', ['python', '-m', 'app'], 1, 256, 0, '/var/monai/input',
+                        '/var/monai/output', '/var/monai/models', '/tmp', map_model_source=source_path.as_uri(),
+                        map_model_checksum=checksum)
+
+
+def write_source(path, data: bytes):
+    path.write_bytes(data)
+    return path
+
+
+def cache_contents(cache_path) -> list:
+    return sorted(os.listdir(cache_path))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    path = tmp_path / "sources"
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "cache"
+
+
+def test_model_is_fetched_once_and_extracted(sources, cache_path):
+    data = make_zip({'model/weights.ts': b'a' * 100, 'config.json': b'{}'})
+    config = model_config(write_source(sources / "model.zip", data), hashlib.sha256(data).hexdigest())
+    cache = ModelCache(str(cache_path), 0)
+
+    model_path = cache.acquire(config)
+    assert sorted(os.listdir(model_path)) == ['config.json', 'model']
+    assert cache.acquire(config) == model_path
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 1
+    assert cache.stats["in_use"] == 1
+
+
+def test_model_not_matching_its_checksum_is_rejected(sources, cache_path):
+    config = model_config(write_source(sources / "model.ts", b'tampered'), "0" * 64)
+    cache = ModelCache(str(cache_path), 0)
+
+    with pytest.raises(ModelCacheError, match="checksum"):
+        cache.acquire(config)
+    # Nothing of the download is kept.
+    assert not cache.is_cached(config)
+    assert cache_contents(cache_path) == []
+
+
+def test_least_recently_used_models_not_in_use_are_evicted(sources, cache_path):
+    # Each model takes 600 KB of a 1 MB cache.
+    configs = {name: model_config(write_source(sources / f'{name}.ts', name.encode() * 600 * KILOBYTE))
+               for name in "abc"}
+    cache = ModelCache(str(cache_path), 1)
+
+    cache.acquire(configs["a"])
+    cache.acquire(configs["b"])
+    cache.release(configs["b"])
+    # The least recently used model is in use, so the next one is evicted instead, and the cache stays
+    # above its budget until the model in use is released.
+    cache.acquire(configs["c"])
+    assert [cache.is_cached(configs[name]) for name in "abc"] == [True, False, True]
+    assert cache.stats["size_bytes"] == 1200 * KILOBYTE
+
+    cache.release(configs["a"])
+    assert [cache.is_cached(configs[name]) for name in "abc"] == [False, False, True]
+    assert cache.stats["size_bytes"] == 600 * KILOBYTE
+
+
+def make_tar(name: str, data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def make_escaping_zip(name: str, data: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_file:
+        # A ZipInfo keeps the member name as given, `writestr` with a name would strip its leading dots.
+        zip_file.writestr(zipfile.ZipInfo(name), data)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("file_name, data", [
+    ("model.zip", make_escaping_zip('../../evil.ts', b'evil')),
+    ("model.tar.gz", make_tar('../../evil.ts', b'evil')),
+])
+def test_archive_member_outside_of_model_directory_is_rejected(sources, cache_path, tmp_path, file_name, data):
+    config = model_config(write_source(sources / file_name, data))
+    cache = ModelCache(str(cache_path), 0)
+
+    with pytest.raises(ModelCacheError, match="outside of its root"):
+        cache.acquire(config)
+    assert not list(tmp_path.rglob('evil.ts'))
+    assert cache_contents(cache_path) == []
+
+
+def test_cached_models_are_loaded_after_restart(sources, cache_path):
+    config = model_config(write_source(sources / "model.ts", b'a' * 100))
+    cache = ModelCache(str(cache_path), 0)
+    model_path = cache.acquire(config)
+    cache.release(config)
+
+    # Leftovers of an interrupted fetch and model directories without metadata are removed.
+    (cache_path / ".tmp-partial").mkdir()
+    (cache_path / "orphan").mkdir()
+
+    restarted = ModelCache(str(cache_path), 0)
+    assert restarted.is_cached(config)
+    assert restarted.acquire(config) == model_path
+    assert restarted.stats["hits"] == 1 and restarted.stats["misses"] == 0
+    assert restarted.stats["size_bytes"] == 100
+    assert ".tmp-partial" not in cache_contents(cache_path)
+    assert "orphan" not in cache_contents(cache_path)
@@ -0,0 +1,223 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import tarfile
+import zipfile
+from typing import Dict
+
+import pytest
+from fastapi import UploadFile
+
+from conftest import make_zip, read_zip
+from monaiinference.handler.payload import (InputReference, InvalidPayloadError, PayloadProvider,
+                                            PayloadTooLargeError)
+
+MEGABYTE = 1024 * 1024
+PAYLOAD_ID = "payload"
+
+
+def make_tar(members: Dict[str, bytes], links: Dict[str, str] = None) -> bytes:
+    # Builds a .tar file of regular files, and of symbolic links to the given targets.
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        for name, target in (links or {}).items():
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.SYMTYPE
+            info.linkname = target
+            tar.addfile(info)
+    return buffer.getvalue()
+
+
+def upload(provider: PayloadProvider, data: bytes, filename: str) -> int:
+    return provider.upload_input_payload(PAYLOAD_ID, UploadFile(file=io.BytesIO(data), filename=filename))
+
+
+@pytest.fixture
+def provider(tmp_path) -> PayloadProvider:
+    return PayloadProvider(str(tmp_path), "input", "output", max_input_size=1, max_input_files=3)
+
+
+def input_files(tmp_path) -> list:
+    input_path = tmp_path / PAYLOAD_ID / "input"
+    return sorted(str(path.relative_to(input_path)) for path in input_path.rglob('*') if path.is_file())
+
+
+def test_zip_is_extracted_into_the_input_directory(provider, tmp_path):
+    size = upload(provider, make_zip({'series/1.dcm': b'a' * 10, '2.dcm': b'b' * 5}), 'in.zip')
+    assert size == 15
+    assert input_files(tmp_path) == ['2.dcm', 'series/1.dcm']
+    assert (tmp_path / PAYLOAD_ID / "output").is_dir()
+
+
+@pytest.mark.parametrize("name", ['../evil.dcm', 'series/../../evil.dcm', '/etc/evil.dcm'])
+def test_zip_slip_is_rejected_before_extraction(provider, tmp_path, name):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as zip_file:
+        zip_file.writestr('first.dcm', b'a')
+        # A ZipInfo keeps the member name as given, `write` would strip its leading slash and dots.
+        zip_file.writestr(zipfile.ZipInfo(name), b'evil')
+
+    with pytest.raises(InvalidPayloadError):
+        upload(provider, data.getvalue(), 'in.zip')
+    assert not (tmp_path / 'evil.dcm').exists()
+    assert input_files(tmp_path) == []
+
+
+def test_zip_extraction_size_is_limited_by_bytes_written(provider, tmp_path):
+    with pytest.raises(PayloadTooLargeError):
+        upload(provider, make_zip({'large.dcm': b'\0' * (MEGABYTE + 1)}), 'in.zip')
+    assert input_files(tmp_path) == []
+
+
+def test_zip_member_count_is_limited(provider):
+    with pytest.raises(PayloadTooLargeError):
+        upload(provider, make_zip({f'{i}.dcm': b'a' for i in range(4)}), 'in.zip')
+
+
+def test_invalid_zip_is_rejected(provider):
+    with pytest.raises(InvalidPayloadError):
+        upload(provider, b'not a zip file', 'in.zip')
+
+
+def test_tar_is_extracted_into_the_input_directory(provider, tmp_path):
+    size = upload(provider, make_tar({'series/1.dcm': b'a' * 10}), 'in.tar')
+    assert size == 10
+    assert input_files(tmp_path) == ['series/1.dcm']
+
+
+@pytest.mark.parametrize("target", ['/etc/passwd', '../outside', 'inside.dcm'])
+def test_tar_links_are_rejected(provider, tmp_path, target):
+    with pytest.raises(InvalidPayloadError):
+        upload(provider, make_tar({'inside.dcm': b'a'}, {'link.dcm': target}), 'in.tar')
+    assert not (tmp_path / PAYLOAD_ID / "input" / "link.dcm").exists()
+
+
+def test_tar_path_traversal_is_rejected(provider, tmp_path):
+    with pytest.raises(InvalidPayloadError):
+        upload(provider, make_tar({'../evil.dcm': b'evil'}), 'in.tar')
+    assert not (tmp_path / 'evil.dcm').exists()
+
+
+def test_tar_extraction_size_is_limited(provider, tmp_path):
+    with pytest.raises(PayloadTooLargeError):
+        upload(provider, make_tar({'large.dcm': b'\0' * (MEGABYTE + 1)}), 'in.tar')
+    assert input_files(tmp_path) == []
+
+
+def test_tar_member_count_is_limited(provider):
+    with pytest.raises(PayloadTooLargeError):
+        upload(provider, make_tar({f'{i}.dcm': b'a' for i in range(4)}), 'in.tar')
+
+
+def make_tar_with_directory(first: str, second: str) -> bytes:
+    # Builds a .tar file of the directory `a` and of the file `a`, in the given order.
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for kind in (first, second):
+            info = tarfile.TarInfo('a')
+            if kind == 'dir':
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = 1
+                tar.addfile(info, io.BytesIO(b'a'))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("data, filename", [
+    (make_tar({'a': b'a', 'a/b': b'b'}), 'in.tar'),
+    (make_tar_with_directory('dir', 'file'), 'in.tar'),
+    (make_zip({'a': b'a', 'a/b': b'b'}), 'in.zip'),
+    (make_zip({'a/b': b'b', 'a': b'a'}), 'in.zip'),
+], ids=['tar-file-then-nested-file', 'tar-directory-then-file', 'zip-file-then-nested-file',
+        'zip-nested-file-then-file'])
+def test_conflicting_members_are_rejected(provider, data, filename):
+    # A file and a directory of the same name can not both be created.
+    with pytest.raises(InvalidPayloadError, match="can not be created"):
+        upload(provider, data, filename)
+
+
+def test_conflicting_members_are_a_client_error(create_client):
+    client = create_client()
+    response = client.post('/upload/', files={'file': ('in.tar', make_tar({'a': b'a', 'a/b': b'b'}),
+                                                       'application/x-tar')})
+    assert response.status_code == 400
+
+
+def test_output_payload_is_written_as_zip(provider, tmp_path):
+    provider.prepare_payload_directory(PAYLOAD_ID)
+    output_path = tmp_path / PAYLOAD_ID / "output"
+    (output_path / "result.json").write_bytes(b'{}')
+    os.makedirs(output_path / "masks")
+    (output_path / "masks" / "1.nii").write_bytes(b'mask')
+
+    with open(provider.write_output_payload(PAYLOAD_ID), 'rb') as f:
+        assert read_zip(f.read()) == ['output/masks/1.nii', 'output/result.json']
+
+
+def test_input_references_are_confined_to_input_roots(tmp_path):
+    root = tmp_path / "studies"
+    os.makedirs(root / "study")
+    (root / "study" / "1.dcm").write_bytes(b'a' * 7)
+    os.symlink(tmp_path, root / "escape")
+    os.makedirs(tmp_path / "payloads")
+    provider = PayloadProvider(str(tmp_path / "payloads"), "input", "output", input_roots=[str(root)])
+
+    assert provider.resolve_input_reference(InputReference(str(root / "study"))) == (str(root / "study"), 7)
+    for path in (str(tmp_path), str(root / "escape"), "study", str(root / "study" / "1.dcm")):
+        with pytest.raises(InvalidPayloadError):
+            provider.resolve_input_reference(InputReference(path))
+
+
+def write_shard_outputs(provider: PayloadProvider, tmp_path, outputs: Dict[str, Dict[str, bytes]]) -> list:
+    # Writes the output files of each shard, keyed on the identifier of the shard.
+    for shard_id, files in outputs.items():
+        provider.prepare_payload_directory(shard_id)
+        for name, data in files.items():
+            output_file = tmp_path / shard_id / "output" / name
+            os.makedirs(output_file.parent, exist_ok=True)
+            output_file.write_bytes(data)
+    provider.prepare_payload_directory(PAYLOAD_ID)
+    return list(outputs)
+
+
+def output_files(tmp_path) -> Dict[str, bytes]:
+    output_path = tmp_path / PAYLOAD_ID / "output"
+    return {str(path.relative_to(output_path)): path.read_bytes()
+            for path in sorted(output_path.rglob('*')) if path.is_file()}
+
+
+def test_shard_outputs_are_merged(provider, tmp_path):
+    shard_ids = write_shard_outputs(provider, tmp_path, {
+        "shard-a": {'series-1/mask.nii': b'1', 'series-1/report.json': b'r'},
+        "shard-b": {'series-2/mask.nii': b'2', 'series-1/extra.json': b'e'}})
+
+    assert provider.merge_output_payloads(shard_ids, PAYLOAD_ID)
+    assert output_files(tmp_path) == {'series-1/extra.json': b'e', 'series-1/mask.nii': b'1',
+                                      'series-1/report.json': b'r', 'series-2/mask.nii': b'2'}
+
+
+@pytest.mark.parametrize("second", [{'result.json': b'2'}, {'result.json/mask.nii': b'2'}])
+def test_colliding_shard_outputs_are_kept_per_shard(provider, tmp_path, second):
+    shard_ids = write_shard_outputs(provider, tmp_path, {
+        "shard-a": {'result.json': b'1', 'masks/1.nii': b'm'}, "shard-b": dict(second, **{'masks/2.nii': b'n'})})
+
+    assert not provider.merge_output_payloads(shard_ids, PAYLOAD_ID)
+    # Nothing is merged once outputs collide, each shard keeps its own layout.
+    expected = {'shard-0/result.json': b'1', 'shard-0/masks/1.nii': b'm', 'shard-1/masks/2.nii': b'n'}
+    expected.update({f'shard-1/{name}': data for name, data in second.items()})
+    assert output_files(tmp_path) == expected
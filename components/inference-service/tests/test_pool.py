@@ -0,0 +1,131 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from conftest import MAP_ARGS, make_zip, read_zip, wait_until
+from monaiinference.handler.reconcile import PAYLOAD_LABEL
+from monaiinference.main import create_app, parse_args
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+WARM_POD_PAYLOAD_PATTERN = re.compile(r'^warm-[0-9a-f]{32}$')
+
+
+def infer(client):
+    response = client.post('/upload/', files={'file': ('in.zip', INPUT, 'application/zip')})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+
+
+def test_requests_run_in_idle_warm_pods(create_client, fake):
+    client = create_client('--warm-pool-size', '1')
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+
+    infer(client)
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    infer(client)
+
+    stats = client.get('/pool/').json()
+    assert stats["hits"] == 2 and stats["misses"] == 0
+    # Both requests ran in the pod started with the pool.
+    assert fake.calls['create_namespaced_pod'] == 1
+
+
+def test_used_up_warm_pods_are_replaced_under_random_names(create_client, fake):
+    client = create_client('--warm-pool-size', '1', '--warm-pool-max-reuse', '1')
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    first_ids = {pod.metadata.labels[PAYLOAD_LABEL] for pod in fake.list_namespaced_pod('default').items}
+
+    infer(client)
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    payload_ids = {pod.metadata.labels[PAYLOAD_LABEL] for pod in fake.list_namespaced_pod('default').items}
+
+    assert len(first_ids) == len(payload_ids) == 1
+    assert first_ids != payload_ids
+    # Payload identifiers, which name the pods and their payload directories, are random rather than counted.
+    assert all(WARM_POD_PAYLOAD_PATTERN.match(payload_id) for payload_id in first_ids | payload_ids)
+
+
+def warm_payload_ids(fake) -> set:
+    return {pod.metadata.labels[PAYLOAD_LABEL] for pod in fake.list_namespaced_pod('default').items}
+
+
+def test_idle_warm_pods_keep_no_payload(create_client, fake, tmp_path):
+    client = create_client('--warm-pool-size', '1')
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    infer(client)
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+
+    payload_id, = warm_payload_ids(fake)
+    # Input and output directories are named after the paths they are mounted at in the MAP container.
+    assert os.listdir(tmp_path / payload_id / "var/monai/input") == []
+    assert os.listdir(tmp_path / payload_id / "var/monai/output") == []
+
+
+def test_payload_of_recycled_warm_pod_is_deleted(create_client, fake, tmp_path):
+    client = create_client('--warm-pool-size', '1', '--warm-pool-max-reuse', '1')
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    payload_id, = warm_payload_ids(fake)
+    assert (tmp_path / payload_id).is_dir()
+
+    infer(client)
+    wait_until(lambda: not (tmp_path / payload_id).exists())
+
+
+def test_payload_of_retired_warm_pod_is_deleted(create_client, fake, tmp_path):
+    client = create_client('--warm-pool-size', '1', '--warm-pool-idle-ttl', '0.5')
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    payload_id, = warm_payload_ids(fake)
+
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 0)
+    wait_until(lambda: not (tmp_path / payload_id).exists())
+    assert not fake.list_namespaced_pod('default').items
+
+
+def test_payloads_of_warm_pods_are_deleted_at_shutdown(fake, tmp_path):
+    args = parse_args(MAP_ARGS + ['--payload-host-path', str(tmp_path), '--warm-pool-size', '2'])
+    with TestClient(create_app(args, fake)) as client:
+        wait_until(lambda: client.get('/pool/').json()["idle"] == 2)
+        payload_ids = warm_payload_ids(fake)
+
+    assert len(payload_ids) == 2
+    assert not any((tmp_path / payload_id).exists() for payload_id in payload_ids)
+
+
+def test_miss_falls_back_to_a_new_pod(create_client, fake):
+    fake.pending_seconds = 0.5
+    client = create_client('--warm-pool-size', '1')
+    # The pool pod is still starting, so the request creates a pod of its own.
+    infer(client)
+    assert client.get('/pool/').json()["misses"] == 1
+
+
+def pod_starts(start: str) -> float:
+    return REGISTRY.get_sample_value('mis_pod_start_seconds_count', {"start": start}) or 0
+
+
+def test_warm_and_cold_pod_starts_are_exported(create_client, fake):
+    fake.pending_seconds = 0.5
+    client = create_client('--warm-pool-size', '1')
+    cold, warm = pod_starts("cold"), pod_starts("warm")
+
+    # The first request misses the starting pool pod, the second one runs in the pool pod once it is idle.
+    infer(client)
+    wait_until(lambda: client.get('/pool/').json()["idle"] == 1)
+    infer(client)
+
+    assert pod_starts("cold") == cold + 1
+    assert pod_starts("warm") == warm + 1
+    assert 'mis_pod_start_seconds_bucket{le="0.5",start="warm"}' in client.get('/metrics').text
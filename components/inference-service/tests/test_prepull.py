@@ -0,0 +1,128 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import List, Optional
+
+import pytest
+from kubernetes.client import models
+
+from benchmarks.fake_kubernetes import FakeCoreV1Api
+from conftest import wait_until
+from monaiinference.handler import prepull
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.kubernetes import DEFAULT_NAMESPACE
+from monaiinference.handler.prepull import PREPULL_POD_TYPE, ImagePrePuller
+from monaiinference.handler.reconcile import OWNER_LABEL, PAYLOAD_LABEL, ResourceOwner, ResourceReconciler
+
+URN = 'monai/test-map:0.1'
+CONFIG = ServerConfig(URN, ['python', '-m', 'app'], 4, 1024, 0, '/var/monai/input', '/var/monai/output',
+                      '/var/monai/models', '/tmp')
+
+
+def make_node(name: str, cpu: str = "64", taint: Optional[str] = None, images: List[str] = ()) -> models.V1Node:
+    taints = [models.V1Taint(key="dedicated", effect=taint)] if taint is not None else None
+    return models.V1Node(
+        metadata=models.V1ObjectMeta(name=name),
+        spec=models.V1NodeSpec(taints=taints),
+        status=models.V1NodeStatus(allocatable={"cpu": cpu, "memory": "256Gi"},
+                                   images=[models.V1ContainerImage(names=[image]) for image in images]))
+
+
+class ClusterCoreV1Api(FakeCoreV1Api):
+    """Fake Kubernetes core API with the given nodes, which records the node each pod is bound to."""
+
+    def __init__(self, host_path: str, nodes: List[models.V1Node], pending_seconds: float = 0.01, **kwargs):
+        super().__init__(host_path, pending_seconds=pending_seconds, running_seconds=0.01, **kwargs)
+        self.nodes = nodes
+        self.bound_nodes = []
+
+    def list_node(self, **kwargs):
+        return models.V1NodeList(items=self.nodes)
+
+    def create_namespaced_pod(self, namespace: str, body: models.V1Pod, **kwargs):
+        # The fake runs all pods on its own node.
+        self.bound_nodes.append(body.spec.node_name)
+        super().create_namespaced_pod(namespace, body, **kwargs)
+
+
+def prepull_pods(api: FakeCoreV1Api) -> list:
+    return api.list_namespaced_pod(DEFAULT_NAMESPACE, label_selector=f'pod-type={PREPULL_POD_TYPE}').items
+
+
+@pytest.fixture(autouse=True)
+def pull_check_interval(monkeypatch):
+    monkeypatch.setattr(prepull, 'PULL_CHECK_INTERVAL', 0.01)
+
+
+@pytest.fixture
+def start_prepuller():
+    prepullers = []
+
+    def start(api: FakeCoreV1Api, **kwargs) -> ImagePrePuller:
+        prepuller = ImagePrePuller(api, **kwargs)
+        prepuller.start()
+        prepuller.set_images([CONFIG])
+        prepullers.append(prepuller)
+        return prepuller
+
+    yield start
+    for prepuller in prepullers:
+        prepuller.shutdown()
+
+
+def test_image_is_pulled_onto_eligible_nodes(tmp_path, start_prepuller):
+    api = ClusterCoreV1Api(str(tmp_path), [
+        make_node("missing-1"),
+        make_node("missing-2"),
+        make_node("holding", images=[f'docker.io/{URN}']),
+        make_node("tainted", taint="NoSchedule"),
+        make_node("preferring", taint="PreferNoSchedule"),
+        make_node("small", cpu="2"),
+    ])
+    prepuller = start_prepuller(api)
+    assert not prepuller.is_ready(URN)
+
+    wait_until(lambda: prepuller.ready_nodes(URN) == ["holding", "missing-1", "missing-2", "preferring"])
+    # One pod is created for each eligible node which does not hold the image, and deleted once it has pulled it.
+    assert sorted(api.bound_nodes) == ["missing-1", "missing-2", "preferring"]
+    wait_until(lambda: not prepull_pods(api))
+    assert api.calls['delete_namespaced_pod'] == 3
+    assert prepuller.is_ready(URN)
+    assert prepuller.is_ready('monai/untracked-map:0.1')
+
+
+def test_failed_pull_is_deleted_and_retried(tmp_path, start_prepuller):
+    api = ClusterCoreV1Api(str(tmp_path), [make_node("node")], image_pull_back_off_rate=1)
+    prepuller = start_prepuller(api, refresh_interval=0.01)
+
+    wait_until(lambda: api.calls.get('create_namespaced_pod', 0) >= 2)
+    assert api.calls['delete_namespaced_pod'] >= 1
+    assert prepuller.ready_nodes(URN) == []
+    assert not prepuller.is_ready(URN)
+
+
+def test_prepull_pods_left_behind_are_reconciled(tmp_path, start_prepuller):
+    # Pods stay pending, as if the image was still pulled when the instance stopped.
+    api = ClusterCoreV1Api(str(tmp_path), [make_node("node")], pending_seconds=60)
+    owner = ResourceOwner("release", "instance")
+    prepuller = start_prepuller(api, refresh_interval=60, owner=owner)
+
+    wait_until(lambda: prepull_pods(api))
+    prepuller.shutdown()
+    pod, = prepull_pods(api)
+    assert pod.metadata.labels[OWNER_LABEL] == "release"
+    assert pod.metadata.labels[PAYLOAD_LABEL] == pod.metadata.name
+
+    # Pods in use are kept, while those of a restarted instance, which does not track them, are deleted.
+    assert ResourceReconciler(api, owner, DEFAULT_NAMESPACE).reconcile()["Pod"] == 0
+    restarted = ResourceOwner("release", "instance")
+    assert ResourceReconciler(api, restarted, DEFAULT_NAMESPACE).reconcile()["Pod"] == 1
+    assert not prepull_pods(api)
@@ -0,0 +1,147 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import errno
+import os
+import time
+
+import pytest
+
+from conftest import make_zip, wait_until
+from monaiinference.handler.reaper import PayloadReaper
+
+
+def make_payload(path, files: int = 3):
+    (path / "input" / "series").mkdir(parents=True)
+    for i in range(files):
+        (path / "input" / "series" / f'{i}.dcm').write_bytes(b'a' * 100)
+    return path
+
+
+def count_files(path) -> int:
+    return sum(len(files) for _, _, files in os.walk(path))
+
+
+@pytest.fixture
+def trash_path(tmp_path):
+    return tmp_path / ".trash"
+
+
+@pytest.fixture
+def reapers():
+    started = []
+    yield started
+    for reaper in started:
+        reaper.shutdown()
+
+
+def test_discarded_directory_is_renamed_then_deleted(tmp_path, trash_path, reapers):
+    reaper = PayloadReaper(str(trash_path))
+    payload = make_payload(tmp_path / "payload")
+
+    # The directory is gone as soon as it is discarded, and waits in the trash until the reaper runs.
+    reaper.discard(str(payload))
+    assert not payload.exists()
+    entry, = os.listdir(trash_path)
+    assert count_files(trash_path / entry) == 3
+    assert reaper.backlog == 1
+
+    reaper.start()
+    reapers.append(reaper)
+    wait_until(lambda: reaper.backlog == 0)
+    assert os.listdir(trash_path) == []
+
+
+def test_content_is_discarded_but_directory_and_excluded_entries_are_kept(tmp_path, trash_path):
+    reaper = PayloadReaper(str(trash_path))
+    payload = make_payload(tmp_path / "payload")
+    (payload / "output").mkdir()
+    (payload / "keep.json").write_bytes(b'{}')
+
+    reaper.discard_content(str(payload), exclude=["keep.json"])
+    assert sorted(os.listdir(payload)) == ["keep.json"]
+    # The content of the directory is moved into one entry.
+    entry, = os.listdir(trash_path)
+    assert len(os.listdir(trash_path / entry)) == 2
+
+    # Discarding missing paths or an empty directory does not create entries.
+    (tmp_path / "empty").mkdir()
+    reaper.discard(str(tmp_path / "missing"))
+    reaper.discard_content(str(tmp_path / "empty"))
+    assert reaper.backlog == 1
+
+
+def test_leftovers_of_previous_run_are_deleted_at_startup(trash_path, reapers):
+    # Entries of a reaper which stopped before deleting them, some of them partly deleted.
+    make_payload(trash_path / "entry-1")
+    make_payload(trash_path / "entry-2", files=0)
+    (trash_path / "file.dcm").write_bytes(b'a')
+
+    reaper = PayloadReaper(str(trash_path))
+    reaper.start()
+    reapers.append(reaper)
+    wait_until(lambda: reaper.backlog == 0)
+    assert os.listdir(trash_path) == []
+
+
+def test_deletes_are_throttled(tmp_path, trash_path, reapers):
+    # 20 files and 3 directories are deleted at 10 per second.
+    reaper = PayloadReaper(str(trash_path), max_deletes_per_second=10)
+    reaper.start()
+    reapers.append(reaper)
+    start = time.monotonic()
+    reaper.discard(str(make_payload(tmp_path / "payload", files=20)))
+
+    # The entry counts as backlog until it is fully deleted.
+    wait_until(lambda: count_files(trash_path) < 20)
+    assert reaper.backlog == 1
+    wait_until(lambda: reaper.backlog == 0)
+    assert time.monotonic() - start >= 2
+    assert os.listdir(trash_path) == []
+
+
+def test_entries_not_deleted_at_shutdown_are_deleted_after_restart(tmp_path, trash_path):
+    reaper = PayloadReaper(str(trash_path), max_deletes_per_second=1)
+    reaper.start()
+    reaper.discard(str(make_payload(tmp_path / "payload", files=10)))
+    wait_until(lambda: count_files(trash_path) < 10)
+    reaper.shutdown()
+    time.sleep(1.1)
+    assert count_files(trash_path) > 0
+
+    restarted = PayloadReaper(str(trash_path))
+    restarted.start()
+    wait_until(lambda: restarted.backlog == 0)
+    restarted.shutdown()
+    assert os.listdir(trash_path) == []
+
+
+def test_path_which_can_not_be_renamed_is_deleted_right_away(tmp_path, trash_path, monkeypatch):
+    def rename(source, destination):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    reaper = PayloadReaper(str(trash_path))
+    payload = make_payload(tmp_path / "payload")
+    monkeypatch.setattr(os, 'rename', rename)
+
+    reaper.discard(str(payload))
+    assert not payload.exists()
+
+
+def test_request_payloads_are_moved_into_the_trash(create_client, tmp_path):
+    client = create_client('--payload-reap-rate', '1')
+    response = client.post('/upload/', files={'file': ('in.zip', make_zip({'1.dcm': b'a'}), 'application/zip')})
+    assert response.status_code == 200
+
+    # The payload directory is gone from the payload volume once the response is sent, and its files are
+    # deleted later, one per second.
+    wait_until(lambda: sorted(os.listdir(tmp_path)) == ['.trash', '.uploads'])
+    assert count_files(tmp_path / ".trash") > 0
@@ -0,0 +1,70 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Dict
+
+from kubernetes.client import models
+
+from monaiinference.handler.reconcile import (INSTANCE_LABEL, OWNER_LABEL, PAYLOAD_LABEL, ResourceOwner,
+                                              ResourceReconciler)
+
+NAMESPACE = "default"
+
+
+def create_pod(fake, name: str, labels: Dict[str, str]):
+    # Pods without volumes are run by the fake like pre-pull pods, which leave no output behind.
+    container = models.V1Container(name="map", image="monai/test-map:0.1")
+    fake.create_namespaced_pod(NAMESPACE, models.V1Pod(metadata=models.V1ObjectMeta(name=name, labels=labels),
+                                                       spec=models.V1PodSpec(containers=[container])))
+
+
+def create_claim(fake, name: str, labels: Dict[str, str]):
+    fake.create_namespaced_persistent_volume_claim(
+        NAMESPACE, models.V1PersistentVolumeClaim(metadata=models.V1ObjectMeta(name=name, labels=labels)))
+
+
+def names(items) -> list:
+    return sorted(item.metadata.name for item in items)
+
+
+def test_stale_resources_are_deleted(fake):
+    owner = ResourceOwner("mis", "mis-new")
+    owner.track("tracked")
+    # The previous instance has exited, another instance still runs.
+    create_pod(fake, "mis-live", {})
+
+    create_pod(fake, "dead-pod", owner.labels("dead") | {INSTANCE_LABEL: "mis-old"})
+    create_pod(fake, "live-pod", owner.labels("live") | {INSTANCE_LABEL: "mis-live"})
+    create_pod(fake, "tracked-pod", owner.labels("tracked"))
+    create_pod(fake, "untracked-pod", owner.labels("untracked"))
+    create_pod(fake, "other-pod", {OWNER_LABEL: "other", INSTANCE_LABEL: "mis-old", PAYLOAD_LABEL: "other"})
+    create_claim(fake, "dead-claim", owner.labels("dead") | {INSTANCE_LABEL: "mis-old"})
+    # The shared payload volume carries no payload label.
+    create_claim(fake, "shared-claim", owner.labels() | {INSTANCE_LABEL: "mis-old"})
+    create_claim(fake, "unlabelled-claim", {})
+
+    deleted = ResourceReconciler(fake, owner, NAMESPACE).reconcile()
+
+    assert deleted == {"Pod": 2, "PersistentVolumeClaim": 1, "PersistentVolume": 0}
+    assert names(fake.list_namespaced_pod(NAMESPACE).items) == [
+        "live-pod", "mis-live", "other-pod", "tracked-pod"]
+    assert names(fake.list_namespaced_persistent_volume_claim(NAMESPACE).items) == [
+        "shared-claim", "unlabelled-claim"]
+
+
+def test_resources_of_instance_without_name_are_deleted(fake):
+    owner = ResourceOwner("mis", "mis-new")
+    create_claim(fake, "claim", {OWNER_LABEL: "mis", PAYLOAD_LABEL: "payload"})
+
+    reconciler = ResourceReconciler(fake, owner, NAMESPACE)
+    assert reconciler.reconcile()["PersistentVolumeClaim"] == 1
+    assert reconciler.stats["deleted"]["PersistentVolumeClaim"] == 1
+    assert reconciler.stats["reconciled"] is True
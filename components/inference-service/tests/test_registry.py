@@ -0,0 +1,167 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from conftest import make_zip, read_zip, wait_until
+from monaiinference.handler.registry import (MapConflictError, MapRegistry, MapRegistryError, map_config_to_dict,
+                                             parse_map_config)
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+ENTRY = {
+    "urn": "monai/other-map:0.2",
+    "entrypoint": "python -m other",
+    "cpu": 2,
+    "memory": 512,
+    "gpu": 0,
+    "inputPath": "/input",
+    "outputPath": "/output",
+}
+
+
+class FakeJobManager:
+    """Job manager which only records whether it was started and shut down."""
+
+    def __init__(self, config=None):
+        self.config = config
+        self.unfinished_jobs = 0
+        self.started = False
+        self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def shutdown(self):
+        self.stopped = True
+
+
+def test_entry_is_parsed_into_map_config():
+    config = parse_map_config({**ENTRY, "timeout": 30, "multiCase": True}, "/payloads")
+    assert config.map_entrypoint == ["python", "-m", "other"]
+    assert config.payload_host_path == "/payloads"
+    assert map_config_to_dict(config) == {**ENTRY, "modelPath": None, "modelSource": None, "modelChecksum": None,
+                                          "timeout": 30, "pendingTimeout": None, "multiCase": True}
+
+
+@pytest.mark.parametrize("changes, message", [
+    ({"cpu": None}, "missing"),
+    ({"cpu": "2"}, "wrong type"),
+    ({"cpu": True}, "wrong type"),
+    ({"multiCase": "yes"}, "wrong type"),
+    ({"replicas": 2}, "Unknown"),
+    ({"cpu": 0}, "cpu value can not be less than 1"),
+    ({"gpu": -1}, "gpu value can not be less than 0"),
+    ({"memory": 255}, "memory value can not be less than 256"),
+    ({"timeout": 0}, "timeout value must be greater than 0"),
+    ({"pendingTimeout": -1}, "pending timeout value must be greater than 0"),
+    ({"modelPath": "/models", "modelSource": "model.ts", "modelChecksum": "abc"}, "SHA-256"),
+    ({"modelChecksum": "0" * 64}, "requires a model source"),
+    ({"modelSource": "model.ts"}, "requires a model path"),
+])
+def test_invalid_entries_are_rejected(changes, message):
+    entry = {key: value for key, value in {**ENTRY, **changes}.items() if value is not None}
+    with pytest.raises(MapRegistryError, match=message):
+        parse_map_config(entry, "/payloads")
+
+
+def test_maps_are_registered_and_unregistered():
+    default = FakeJobManager()
+    registry = MapRegistry(FakeJobManager, "/payloads", "default", default)
+    config = parse_map_config(ENTRY, "/payloads")
+
+    other = registry.register("other", config)
+    assert other.started and other.config is config
+    assert [name for name, _ in registry.items()] == ["default", "other"]
+    with pytest.raises(MapConflictError):
+        registry.register("other", config)
+    with pytest.raises(MapRegistryError):
+        registry.register("Not_A_Label", config)
+
+    replacement = registry.register("other", config, replace=True)
+    assert other.stopped and registry.get("other") is replacement
+
+    assert registry.unregister("other") is True
+    assert replacement.stopped and registry.get("other") is None
+    assert registry.unregister("other") is False
+
+
+def test_default_map_and_maps_with_unfinished_jobs_are_kept():
+    default = FakeJobManager()
+    registry = MapRegistry(FakeJobManager, "/payloads", "default", default)
+    config = parse_map_config(ENTRY, "/payloads")
+
+    with pytest.raises(MapConflictError, match="default MAP"):
+        registry.register("default", config, replace=True)
+    with pytest.raises(MapConflictError, match="default MAP"):
+        registry.unregister("default")
+
+    busy = registry.register("busy", config)
+    busy.unfinished_jobs = 1
+    with pytest.raises(MapConflictError, match="unfinished jobs"):
+        registry.register("busy", config, replace=True)
+    with pytest.raises(MapConflictError, match="unfinished jobs"):
+        registry.unregister("busy")
+    assert registry.get("busy") is busy and not busy.stopped
+
+
+def test_admin_endpoints_register_and_unregister_maps(create_client):
+    client = create_client('--map-admin')
+
+    response = client.put('/maps/other', json=ENTRY)
+    assert response.status_code == 200
+    assert response.json()["urn"] == ENTRY["urn"]
+    assert client.get('/maps').json()["maps"]["other"]["unfinishedJobs"] == 0
+
+    assert client.put('/maps/other', json={**ENTRY, "cpu": 0}).status_code == 400
+    assert client.put('/maps/other', json={**ENTRY, "replicas": 2}).status_code == 400
+    assert client.put('/maps/Other', json=ENTRY).status_code == 400
+    assert client.put('/maps/default', json=ENTRY).status_code == 409
+    assert client.delete('/maps/default').status_code == 409
+
+    assert client.delete('/maps/other').status_code == 200
+    assert client.delete('/maps/other').status_code == 404
+    assert sorted(client.get('/maps').json()["maps"]) == ["default"]
+
+
+def test_admin_endpoints_are_disabled_by_default(create_client):
+    client = create_client()
+    assert client.put('/maps/other', json=ENTRY).status_code == 404
+
+
+def test_requests_are_routed_to_the_job_manager_of_their_map(create_client, fake):
+    fake.running_seconds = 1
+    client = create_client('--map-admin')
+    assert client.put('/maps/other', json=ENTRY).status_code == 200
+
+    job = client.post('/maps/other/jobs', files={'file': ('in.zip', INPUT, 'application/zip')}).json()
+    wait_until(lambda: fake.list_namespaced_pod('default').items)
+    pod, = fake.list_namespaced_pod('default').items
+    assert pod.spec.containers[0].image == ENTRY["urn"]
+
+    # A MAP which runs a job is neither replaced nor unregistered.
+    assert client.get('/maps').json()["maps"]["other"]["unfinishedJobs"] == 1
+    assert client.put('/maps/other', json=ENTRY).status_code == 409
+    assert client.delete('/maps/other').status_code == 409
+
+    wait_until(lambda: client.get(f'/jobs/{job["id"]}').json()["phase"] == "Succeeded")
+    assert client.delete('/maps/other').status_code == 200
+    assert client.post('/maps/other/infer', files={'file': ('in.zip', INPUT, 'application/zip')}).status_code == 404
+
+
+def test_default_map_is_served_by_name_and_without_name(create_client, fake):
+    client = create_client('--map-admin')
+    assert client.put('/maps/other', json=ENTRY).status_code == 200
+
+    response = client.post('/maps/default/infer', files={'file': ('in.zip', INPUT, 'application/zip')})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+    assert client.post('/upload/', files={'file': ('in.zip', INPUT, 'application/zip')}).status_code == 200
+    assert fake.calls['create_namespaced_pod'] == 2
@@ -0,0 +1,141 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from threading import Thread
+from typing import List
+
+import pytest
+
+from conftest import wait_until
+from monaiinference.handler.scheduler import QueueFullError, QueueTimeoutError, RequestScheduler
+
+
+def queue_request(scheduler: RequestScheduler, name: str, priority: float, order: List[str],
+                  errors: List[Exception]) -> Thread:
+    # Acquires a slot in the background, records the name of the request once it has one and releases it.
+    def run():
+        try:
+            slot = scheduler.acquire(priority)
+        except Exception as e:
+            errors.append(e)
+            return
+        order.append(name)
+        scheduler.release(slot)
+
+    queued = scheduler.queue_depth
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    wait_until(lambda: scheduler.queue_depth > queued or errors)
+    return thread
+
+
+def test_free_slots_are_taken_without_waiting():
+    scheduler = RequestScheduler(2, 0, 1)
+    slots = {scheduler.acquire(), scheduler.acquire()}
+    assert slots == {0, 1}
+    assert scheduler.in_flight == 2
+    assert scheduler.try_acquire() is None
+
+    scheduler.release(0)
+    assert scheduler.try_acquire() == 0
+
+
+def test_queued_requests_obtain_slots_by_priority_then_fifo():
+    scheduler = RequestScheduler(1, 10, 10)
+    slot = scheduler.acquire()
+    order, errors = [], []
+    threads = [queue_request(scheduler, name, priority, order, errors)
+               for name, priority in (("routine", 0), ("stat", 100), ("high", 50), ("stat-2", 100))]
+
+    scheduler.release(slot)
+    for thread in threads:
+        thread.join(5)
+
+    assert not errors
+    assert order == ["stat", "stat-2", "high", "routine"]
+
+
+def test_aging_lets_old_requests_of_low_priority_overtake_new_ones():
+    # A request gains 1000 levels per second, so that one queued 0.2 seconds earlier outranks 100 more levels.
+    scheduler = RequestScheduler(1, 10, 10, priority_aging=1000)
+    slot = scheduler.acquire()
+    order, errors = [], []
+    threads = [queue_request(scheduler, "old", 0, order, errors)]
+    time.sleep(0.2)
+    threads.append(queue_request(scheduler, "new", 100, order, errors))
+
+    scheduler.release(slot)
+    for thread in threads:
+        thread.join(5)
+
+    assert not errors
+    assert order == ["old", "new"]
+
+
+def test_full_queue_displaces_its_lowest_priority_request():
+    scheduler = RequestScheduler(1, 1, 10)
+    slot = scheduler.acquire()
+    order, errors = [], []
+    low = queue_request(scheduler, "low", 0, order, errors)
+    high = queue_request(scheduler, "high", 100, order, errors)
+
+    low.join(5)
+    assert len(errors) == 1 and isinstance(errors[0], QueueFullError)
+    assert scheduler.queue_depth == 1
+
+    # A request which does not outrank any queued request is rejected instead.
+    with pytest.raises(QueueFullError):
+        scheduler.acquire(50)
+
+    scheduler.release(slot)
+    high.join(5)
+    assert order == ["high"]
+
+
+def test_queued_request_times_out():
+    scheduler = RequestScheduler(1, 1, 0.1)
+    scheduler.acquire()
+    with pytest.raises(QueueTimeoutError):
+        scheduler.acquire()
+    assert scheduler.queue_depth == 0
+
+
+def test_async_and_thread_waiters_share_the_queue():
+    scheduler = RequestScheduler(1, 10, 10)
+    slot = scheduler.acquire()
+    order, errors = [], []
+    thread = queue_request(scheduler, "thread", 0, order, errors)
+
+    async def acquire_high():
+        high_slot = await scheduler.acquire_async(100)
+        order.append("coroutine")
+        scheduler.release(high_slot)
+
+    async def run():
+        task = asyncio.ensure_future(acquire_high())
+        while scheduler.queue_depth < 2:
+            await asyncio.sleep(0.01)
+        scheduler.release(slot)
+        await task
+
+    asyncio.run(run())
+    thread.join(5)
+    assert order == ["coroutine", "thread"]
+
+
+def test_mean_hold_time_follows_released_slots():
+    scheduler = RequestScheduler(1, 0, 1)
+    assert scheduler.mean_hold_time is None
+    with scheduler.slot():
+        time.sleep(0.05)
+    assert scheduler.mean_hold_time >= 0.05
@@ -0,0 +1,78 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from conftest import make_zip, read_zip, wait_until
+
+SERIES = make_zip({f'series-{i}/1.dcm': b'a' * 100 * (i + 1) for i in range(4)})
+SHARD_ARGS = ('--max-concurrent-requests', '4', '--shard-max', '4')
+
+
+def infer(client, data: bytes = SERIES, path: str = '/upload/'):
+    return client.post(path, files={'file': ('in.zip', data, 'application/zip')})
+
+
+def test_input_is_split_across_free_slots(create_client, fake):
+    fake.multi_case = True
+    client = create_client(*SHARD_ARGS)
+    response = infer(client)
+    assert response.status_code == 200
+    assert read_zip(response.content) == [f'output/series-{i}/output-0.bin' for i in range(4)]
+    assert fake.calls['create_namespaced_pod'] == 4
+
+
+def test_job_reports_its_shards(create_client, fake):
+    fake.multi_case = True
+    client = create_client(*SHARD_ARGS, '--shard-max', '2')
+    job = infer(client, path='/jobs').json()
+    wait_until(lambda: client.get(f'/jobs/{job["id"]}').json()["phase"] == "Succeeded")
+    assert client.get(f'/jobs/{job["id"]}').json()["shards"] == 2
+    assert read_zip(client.get(f'/jobs/{job["id"]}/result').content) == [
+        f'output/series-{i}/output-0.bin' for i in range(4)]
+
+
+def test_colliding_outputs_are_kept_per_shard(create_client, fake):
+    # Without multi-case, the MAP writes output-0.bin into the output directory of every shard.
+    client = create_client(*SHARD_ARGS, '--shard-max', '2')
+    response = infer(client)
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/shard-0/output-0.bin', 'output/shard-1/output-0.bin']
+    assert fake.calls['create_namespaced_pod'] == 2
+
+
+def test_small_input_is_not_split(create_client, fake):
+    fake.multi_case = True
+    client = create_client(*SHARD_ARGS, '--shard-min-input-size', '1')
+    assert infer(client).status_code == 200
+    assert fake.calls['create_namespaced_pod'] == 1
+
+
+def test_sharding_only_takes_free_slots(create_client, fake):
+    fake.multi_case = True
+    fake.running_seconds = 1
+    client = create_client(*SHARD_ARGS)
+    # An input of a single series can not be split, its job holds one slot while it runs.
+    busy = infer(client, make_zip({'series-0/1.dcm': b'a'}), '/jobs').json()
+    wait_until(lambda: client.get(f'/jobs/{busy["id"]}').json()["phase"] == "Running")
+
+    job = infer(client, path='/jobs').json()
+    wait_until(lambda: client.get(f'/jobs/{job["id"]}').json()["phase"] == "Succeeded")
+    assert client.get(f'/jobs/{job["id"]}').json()["shards"] == 3
+    assert client.get(f'/jobs/{busy["id"]}').json()["shards"] == 0
+
+
+def test_failed_shard_is_retried_then_fails_the_request(create_client, fake):
+    fake.multi_case = True
+    fake.failure_rate = 1
+    client = create_client(*SHARD_ARGS, '--shard-retries', '1')
+    assert infer(client).status_code == 500
+    # A shard fails for good only once its pod has been run again.
+    assert fake.calls['create_namespaced_pod'] > 4
+    wait_until(lambda: not fake.list_namespaced_pod('default').items)
@@ -0,0 +1,71 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from monaiinference.handler.timeouts import (MIN_ADAPTIVE_TIMEOUT, MIN_RUN_TIME_SAMPLES, RUN_TIME_WINDOW,
+                                             AdaptiveTimeout)
+
+MEGABYTE = 1024 * 1024
+
+
+def test_deadline_is_derived_once_enough_runs_completed():
+    timeouts = AdaptiveTimeout(95, 2)
+    for seconds in range(1, MIN_RUN_TIME_SAMPLES):
+        timeouts.record(seconds * 10)
+    assert timeouts.timeout() is None
+
+    timeouts.record(MIN_RUN_TIME_SAMPLES * 10)
+    # The 95th percentile of 10, 20, ... 200 seconds is 190 seconds.
+    assert timeouts.timeout() == 380
+
+
+def test_deadline_has_a_lower_bound():
+    timeouts = AdaptiveTimeout(95, 2)
+    for _ in range(MIN_RUN_TIME_SAMPLES):
+        timeouts.record(0.1)
+    assert timeouts.timeout() == MIN_ADAPTIVE_TIMEOUT
+
+
+def test_input_sizes_have_their_own_deadline():
+    timeouts = AdaptiveTimeout(95, 1)
+    for _ in range(MIN_RUN_TIME_SAMPLES):
+        timeouts.record(10, MEGABYTE)
+        timeouts.record(100, 64 * MEGABYTE)
+    assert timeouts.timeout(MEGABYTE // 2) == 10
+    assert timeouts.timeout(70 * MEGABYTE) == 100
+    assert timeouts.timeout(1024 * MEGABYTE) is None
+
+
+def test_timed_out_runs_fall_back_to_configured_timeout():
+    timeouts = AdaptiveTimeout(95, 1)
+    for _ in range(MIN_RUN_TIME_SAMPLES):
+        timeouts.record(10)
+    assert timeouts.timeout() == 10
+
+    # One timed out run of 21 is within the 5% of runs beyond the 95th percentile, which it does not move.
+    timeouts.record_timeout(10)
+    assert timeouts.timeout() == 10
+
+    # Once more runs time out than lie beyond the percentile, the deadline is not known anymore.
+    timeouts.record_timeout(10)
+    assert timeouts.timeout() is None
+    assert timeouts.stats["0"]["timedOut"] == 2
+
+
+def test_deadline_recovers_once_timed_out_runs_leave_the_window():
+    timeouts = AdaptiveTimeout(95, 1)
+    for _ in range(MIN_RUN_TIME_SAMPLES):
+        timeouts.record_timeout(10)
+    assert timeouts.timeout() is None
+
+    for _ in range(RUN_TIME_WINDOW):
+        timeouts.record(30)
+    assert timeouts.timeout() == 30
+    assert timeouts.stats["0"] == {"samples": RUN_TIME_WINDOW, "timedOut": 0, "timeout": 30}
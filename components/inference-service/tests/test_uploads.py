@@ -0,0 +1,128 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+
+import pytest
+
+from conftest import make_zip, read_zip, wait_until
+from monaiinference.handler.uploads import InvalidChunkError, UploadConflictError, UploadManager
+
+MEGABYTE = 1024 * 1024
+# Three chunks of 1 MB, the last one shorter.
+INPUT = make_zip({'series/1.dcm': os.urandom(2 * MEGABYTE + MEGABYTE // 2)})
+
+
+def chunk(index: int) -> bytes:
+    return INPUT[index * MEGABYTE:(index + 1) * MEGABYTE]
+
+
+def put_chunk(client, upload_id: str, index: int, data: bytes = None, checksum: str = None):
+    data = chunk(index) if data is None else data
+    return client.put(f'/uploads/{upload_id}/chunks/{index}', content=data,
+                      headers={"X-Chunk-Checksum": checksum or hashlib.sha256(data).hexdigest()})
+
+
+@pytest.fixture
+def client(create_client):
+    return create_client('--upload-chunk-size', '1', '--max-upload-sessions', '2')
+
+
+def test_chunks_are_received_out_of_order_and_committed(client, fake):
+    response = client.post('/uploads', json={"size": len(INPUT), "filename": "study.zip"})
+    assert response.status_code == 201
+    upload = response.json()
+    assert upload["chunks"] == 3
+    assert upload["chunk_size"] == MEGABYTE
+
+    for index in (2, 0):
+        assert put_chunk(client, upload["id"], index).status_code == 200
+    status = client.get(f'/uploads/{upload["id"]}').json()
+    assert status["missing_chunks"] == [1]
+    assert status["received_ranges"] == [[0, MEGABYTE], [2 * MEGABYTE, len(INPUT)]]
+
+    # An upload is not committed while chunks are missing, and stays open.
+    assert client.post(f'/uploads/{upload["id"]}/commit').status_code == 409
+
+    # A chunk sent again, such as after a dropped connection, replaces the previous one.
+    assert put_chunk(client, upload["id"], 1).status_code == 200
+    assert put_chunk(client, upload["id"], 1).json()["missing_chunks"] == []
+
+    response = client.post(f'/uploads/{upload["id"]}/commit', params={"wait": "true"})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+    assert fake.calls['create_namespaced_pod'] == 1
+    # A committed upload is deleted once it is extracted.
+    assert client.get(f'/uploads/{upload["id"]}').status_code == 404
+
+
+def test_committed_upload_runs_as_job(client):
+    upload = client.post('/uploads', json={"size": len(INPUT)}).json()
+    for index in range(upload["chunks"]):
+        put_chunk(client, upload["id"], index)
+
+    response = client.post(f'/uploads/{upload["id"]}/commit')
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    wait_until(lambda: client.get(f'/jobs/{job_id}').json()["phase"] == "Succeeded")
+    assert read_zip(client.get(f'/jobs/{job_id}/result').content) == ['output/output-0.bin']
+
+
+def test_invalid_chunks_are_rejected(client):
+    upload = client.post('/uploads', json={"size": len(INPUT)}).json()
+    assert put_chunk(client, upload["id"], 0, checksum="0" * 64).status_code == 400
+    assert put_chunk(client, upload["id"], 0, data=chunk(0)[:-1]).status_code == 400
+    assert put_chunk(client, upload["id"], 3, data=b'a').status_code == 400
+    assert put_chunk(client, "unknown", 0).status_code == 404
+    assert client.get(f'/uploads/{upload["id"]}').json()["missing_chunks"] == [0, 1, 2]
+
+
+def test_uploads_are_limited_and_deleted(client):
+    uploads = [client.post('/uploads', json={"size": len(INPUT)}).json() for _ in range(2)]
+    assert client.post('/uploads', json={"size": len(INPUT)}).status_code == 429
+    assert client.post('/uploads', json={"size": 0}).status_code == 400
+    assert client.post('/uploads', json={"filename": "study.zip"}).status_code == 400
+
+    assert client.delete(f'/uploads/{uploads[0]["id"]}').status_code == 200
+    assert client.delete(f'/uploads/{uploads[0]["id"]}').status_code == 404
+    assert client.post('/uploads', json={"size": len(INPUT)}).status_code == 201
+
+
+def test_invalid_commit_parameters_leave_upload_open(client):
+    upload = client.post('/uploads', json={"size": len(INPUT)}).json()
+    for index in range(upload["chunks"]):
+        put_chunk(client, upload["id"], index)
+
+    assert client.post(f'/uploads/{upload["id"]}/commit', params={"priority": "unknown"}).status_code == 400
+    assert client.post(f'/uploads/{upload["id"]}/commit', params={"output": "rar"}).status_code == 400
+    assert client.get(f'/uploads/{upload["id"]}').status_code == 200
+
+
+def test_expired_sessions_are_discarded(tmp_path):
+    manager = UploadManager(str(tmp_path), 1, 1, 0)
+    session = manager.create(10)
+    data = b'a' * 10
+    manager.write_chunk(session.session_id, 0, data, hashlib.sha256(data).hexdigest())
+    with pytest.raises(InvalidChunkError):
+        manager.write_chunk(session.session_id, 0, data, "0" * 64)
+
+    committed = manager.commit(session.session_id)
+    with pytest.raises(UploadConflictError):
+        manager.write_chunk(session.session_id, 0, data, hashlib.sha256(data).hexdigest())
+    with open(committed.path, 'rb') as f:
+        assert f.read() == data
+
+    # A reopened session expires like any other once it is idle for longer than its TTL.
+    manager.reopen(committed)
+    manager.start()
+    wait_until(lambda: not os.path.exists(committed.path), timeout=15)
+    manager.shutdown()
@@ -0,0 +1,148 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from kubernetes.client import models
+from kubernetes.client.rest import ApiException
+
+from conftest import make_zip, read_zip
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.kubernetes import (DEFAULT_NAMESPACE, PERSISTENT_VOLUME_CLAIM_NAME,
+                                               PERSISTENT_VOLUME_NAME, VOLUME_LIFECYCLE_SHARED, KubernetesHandler)
+from monaiinference.handler.reconcile import PAYLOAD_LABEL
+
+INPUT = make_zip({'series/1.dcm': b'a' * 100})
+CONFIG = ServerConfig('monai/test-map:0.1', ['python', '-m', 'app'], 1, 256, 0, '/var/monai/input',
+                      '/var/monai/output', '/var/monai/models', '/tmp')
+
+
+@pytest.fixture
+def created_pods(fake, monkeypatch) -> list:
+    """Pods created through the fake Kubernetes API, which are deleted once their request is done."""
+    pods = []
+    create = fake.create_namespaced_pod
+
+    def record(namespace: str, body: models.V1Pod, **kwargs):
+        pods.append(body)
+        create(namespace, body, **kwargs)
+
+    monkeypatch.setattr(fake, 'create_namespaced_pod', record)
+    return pods
+
+
+def volume_names(fake) -> list:
+    return [volume.metadata.name for volume in fake.list_persistent_volume().items]
+
+
+def claim_names(fake) -> list:
+    return [claim.metadata.name for claim in fake.list_namespaced_persistent_volume_claim(DEFAULT_NAMESPACE).items]
+
+
+def create_volume(fake):
+    fake.create_persistent_volume(models.V1PersistentVolume(metadata=models.V1ObjectMeta(name=PERSISTENT_VOLUME_NAME)))
+
+
+def create_claim(fake):
+    fake.create_namespaced_persistent_volume_claim(DEFAULT_NAMESPACE, models.V1PersistentVolumeClaim(
+        metadata=models.V1ObjectMeta(name=PERSISTENT_VOLUME_CLAIM_NAME)))
+
+
+def infer(client):
+    response = client.post('/upload/', files={'file': ('in.zip', INPUT, 'application/zip')})
+    assert response.status_code == 200
+    assert read_zip(response.content) == ['output/output-0.bin']
+
+
+def test_shared_volume_is_created_once_and_mounted_by_sub_path(create_client, fake, created_pods):
+    client = create_client('--volume-lifecycle', 'shared')
+    assert volume_names(fake) == [PERSISTENT_VOLUME_NAME]
+    assert claim_names(fake) == [PERSISTENT_VOLUME_CLAIM_NAME]
+
+    infer(client)
+    infer(client)
+    assert fake.calls['create_persistent_volume'] == 1
+    assert fake.calls['create_namespaced_persistent_volume_claim'] == 1
+
+    # Each pod mounts its own payload directory of the shared claim.
+    sub_paths = []
+    for pod in created_pods:
+        assert pod.spec.volumes[0].persistent_volume_claim.claim_name == PERSISTENT_VOLUME_CLAIM_NAME
+        payload_id = pod.metadata.labels[PAYLOAD_LABEL]
+        mounts = [mount for mount in pod.spec.containers[0].volume_mounts if mount.sub_path]
+        assert len(mounts) == 2 and all(mount.sub_path.startswith(f'{payload_id}/') for mount in mounts)
+        sub_paths.extend(mount.sub_path for mount in mounts)
+    assert len(set(sub_paths)) == 4
+
+    # The volume and claim created at startup are deleted at shutdown.
+    client.__exit__(None, None, None)
+    assert volume_names(fake) == [] and claim_names(fake) == []
+
+
+def test_existing_shared_volume_is_adopted_and_kept(create_client, fake, created_pods):
+    # Left behind by a previous run, or created by another instance.
+    create_volume(fake)
+    create_claim(fake)
+    client = create_client('--volume-lifecycle', 'shared')
+    infer(client)
+
+    assert fake.calls['create_persistent_volume'] == 2
+    assert fake.calls['create_namespaced_persistent_volume_claim'] == 2
+    client.__exit__(None, None, None)
+    assert volume_names(fake) == [PERSISTENT_VOLUME_NAME]
+    assert claim_names(fake) == [PERSISTENT_VOLUME_CLAIM_NAME]
+
+
+def test_only_created_part_of_shared_volume_is_deleted(fake):
+    create_volume(fake)
+    handler = KubernetesHandler(CONFIG, volume_lifecycle=VOLUME_LIFECYCLE_SHARED, kubernetes_core_client=fake)
+
+    handler.provision_volume()
+    assert claim_names(fake) == [PERSISTENT_VOLUME_CLAIM_NAME]
+    handler.release_volume()
+    assert volume_names(fake) == [PERSISTENT_VOLUME_NAME]
+    assert claim_names(fake) == []
+
+
+def test_volume_is_deleted_when_claim_can_not_be_created(fake, monkeypatch):
+    def create_claim(namespace: str, body: models.V1PersistentVolumeClaim, **kwargs):
+        raise ApiException(status=403, reason="Forbidden")
+
+    monkeypatch.setattr(fake, 'create_namespaced_persistent_volume_claim', create_claim)
+    handler = KubernetesHandler(CONFIG, volume_lifecycle=VOLUME_LIFECYCLE_SHARED, kubernetes_core_client=fake)
+
+    with pytest.raises(ApiException):
+        handler.provision_volume()
+    assert volume_names(fake) == []
+
+
+def test_named_claim_is_adopted_without_provisioning(create_client, fake, created_pods):
+    client = create_client('--volume-lifecycle', 'shared', '--volume-claim-name', 'payloads')
+    infer(client)
+
+    assert fake.calls['read_namespaced_persistent_volume_claim'] == 1
+    assert 'create_persistent_volume' not in fake.calls
+    assert 'create_namespaced_persistent_volume_claim' not in fake.calls
+    pod, = created_pods
+    assert pod.spec.volumes[0].persistent_volume_claim.claim_name == 'payloads'
+    client.__exit__(None, None, None)
+    assert 'delete_namespaced_persistent_volume_claim' not in fake.calls
+
+
+def test_per_request_volumes_are_created_and_deleted_with_their_pod(create_client, fake, created_pods):
+    client = create_client()
+    assert volume_names(fake) == []
+    infer(client)
+    infer(client)
+
+    assert fake.calls['create_persistent_volume'] == 2
+    assert fake.calls['create_namespaced_persistent_volume_claim'] == 2
+    assert len({pod.spec.volumes[0].persistent_volume_claim.claim_name for pod in created_pods}) == 2
+    assert volume_names(fake) == [] and claim_names(fake) == []
@@ -0,0 +1,143 @@
+# Copyright 2021 MONAI Consortium
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from collections import deque
+from typing import List, Optional
+
+import pytest
+from kubernetes.client import ApiClient, models
+from kubernetes.client.rest import ApiException
+
+from monaiinference.handler.config import ServerConfig
+from monaiinference.handler.kubernetes import (POD_NAME, POD_WATCH_MODE_POLL, POD_WATCH_MODE_WATCH,
+                                               TERMINAL_WAITING_REASONS, KubernetesHandler, PodStatus)
+
+PAYLOAD_ID = "payload"
+CONFIG = ServerConfig('monai/test-map:0.1', ['python', '-m', 'app'], 1, 256, 0, '/var/monai/input',
+                      '/var/monai/output', '/var/monai/models', '/tmp', map_timeout=5, map_pending_timeout=5)
+
+
+def make_pod(phase: str, resource_version: str, waiting_reason: Optional[str] = None) -> models.V1Pod:
+    state = models.V1ContainerState(waiting=models.V1ContainerStateWaiting(reason=waiting_reason))
+    container_statuses = [models.V1ContainerStatus(name="map", image="monai/test-map:0.1", image_id="",
+                                                   ready=False, restart_count=0, state=state)]
+    return models.V1Pod(metadata=models.V1ObjectMeta(name=f'{POD_NAME}-{PAYLOAD_ID}',
+                                                     resource_version=resource_version),
+                        status=models.V1PodStatus(phase=phase, container_statuses=container_statuses))
+
+
+def gone() -> tuple:
+    # Sent by the API server in place of events when the requested resource version is too old.
+    return ("ERROR", {"kind": "Status", "code": 410, "reason": "Expired", "message": "too old resource version"})
+
+
+class ScriptedResponse:
+    """Response of a watch request, which sends scripted events and then ends."""
+
+    def __init__(self, events: List[tuple]):
+        self._events = events
+
+    def stream(self, amt=None, decode_content=False):
+        for event_type, event_object in self._events:
+            if isinstance(event_object, models.V1Pod):
+                event_object = ApiClient().sanitize_for_serialization(event_object)
+            yield (json.dumps({"type": event_type, "object": event_object}) + "\n").encode('utf-8')
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class ScriptedCoreV1Api:
+    """Core API whose watch requests are answered by scripted responses, one per request, or fail with an
+    exception. Reads of the pod return the given pod."""
+
+    def __init__(self, responses: list, pod: Optional[models.V1Pod] = None):
+        self.responses = deque(responses)
+        self.pod = pod
+        self.watch_requests = []
+        self.reads = 0
+
+    def list_namespaced_pod(self, namespace: str, **kwargs):
+        """List or watch pods
+
+        :return: V1PodList
+        """
+        # The return type in the docstring above is read by `kubernetes.watch.Watch` to deserialize events.
+        self.watch_requests.append(kwargs)
+        response = self.responses.popleft() if self.responses else []
+        if isinstance(response, Exception):
+            raise response
+        return ScriptedResponse(response)
+
+    def read_namespaced_pod(self, name: str, namespace: str, **kwargs) -> models.V1Pod:
+        self.reads += 1
+        return self.pod
+
+
+def watch(api: ScriptedCoreV1Api, mode: str = POD_WATCH_MODE_WATCH) -> tuple:
+    statuses = []
+    handler = KubernetesHandler(CONFIG, mode, kubernetes_core_client=api)
+    return handler.watch_kubernetes_pod(PAYLOAD_ID, statuses.append), statuses
+
+
+def test_watch_resumes_from_last_resource_version():
+    # The first watch ends early, such as when the API server closes it, before the pod has completed.
+    api = ScriptedCoreV1Api([
+        [("ADDED", make_pod("Pending", "1")), ("MODIFIED", make_pod("Running", "2"))],
+        [("MODIFIED", make_pod("Succeeded", "3"))],
+    ])
+
+    assert watch(api) == (PodStatus.Succeeded, [PodStatus.Running, PodStatus.Succeeded])
+    assert "resource_version" not in api.watch_requests[0]
+    assert api.watch_requests[1]["resource_version"] == "2"
+    assert api.watch_requests[1]["field_selector"] == f'metadata.name={POD_NAME}-{PAYLOAD_ID}'
+
+
+def test_watch_restarts_from_current_state_after_gone():
+    # The pod completes while the watch is down, and the resumed watch is told its resource version is gone.
+    api = ScriptedCoreV1Api([
+        [("ADDED", make_pod("Running", "1"))],
+        [gone()],
+        [("ADDED", make_pod("Succeeded", "7"))],
+    ])
+
+    # The completion is seen in the current state of the pod listed by the restarted watch.
+    assert watch(api) == (PodStatus.Succeeded, [PodStatus.Running, PodStatus.Succeeded])
+    assert api.watch_requests[1]["resource_version"] == "1"
+    assert "resource_version" not in api.watch_requests[2]
+    assert api.reads == 0
+
+
+def test_failing_watch_falls_back_to_reading_the_pod():
+    api = ScriptedCoreV1Api([ApiException(status=403, reason="Forbidden")], make_pod("Succeeded", "4"))
+
+    assert watch(api) == (PodStatus.Succeeded, [PodStatus.Succeeded])
+    assert api.reads == 1
+
+
+def test_deleted_pod_fails():
+    api = ScriptedCoreV1Api([[("ADDED", make_pod("Running", "1")), ("DELETED", make_pod("Running", "2"))]])
+    assert watch(api) == (PodStatus.Failed, [PodStatus.Running])
+
+
+@pytest.mark.parametrize("mode", [POD_WATCH_MODE_WATCH, POD_WATCH_MODE_POLL])
+@pytest.mark.parametrize("reason", TERMINAL_WAITING_REASONS)
+def test_pod_waiting_for_terminal_reason_ends_watch(mode, reason):
+    pod = make_pod("Pending", "1", reason)
+    api = ScriptedCoreV1Api([[("ADDED", pod)]], pod)
+
+    # The pod is reported as terminal in the status it is stuck in, rather than waited for until timeout.
+    assert watch(api, mode) == (PodStatus.Pending, [])
+    assert len(api.watch_requests) == (1 if mode == POD_WATCH_MODE_WATCH else 0)